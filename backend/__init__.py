@@ -5,13 +5,20 @@ from backend.controllers.api import api_bp
 from backend.controllers.views import views_bp
 
 
-def create_app():
+def create_app(servidor: bool = True):
+    """
+    Cria o app. Com `servidor=False` (ex.: o processo pai do reloader do
+    Werkzeug, que só vigia os arquivos e reinicia o filho), o XMLService e
+    o agendador não são criados: só quem serve os requests grava e disputa
+    a liderança das tarefas exclusivas.
+    """
     app = Flask(
         __name__,
         template_folder="../frontend/templates",
         static_folder="../frontend/static",
     )
     app.config.from_object(Config)
+    app.config["SERVIDOR"] = servidor
 
     app.register_blueprint(api_bp)
     app.register_blueprint(views_bp)
@@ -11,8 +11,126 @@ class Config:
     XML_SCHEMA_PATH = os.path.join(XML_DIR, "hidroponia.xsd")
     XML_DATA_PATH = os.path.join(XML_DIR, "hidroponia.xml")
 
-    # arquivo de leituras pendentes (fila offline)
+    # validação XSD nas escritas:
+    #   "incremental" -> valida só os elementos novos (leitura, comando...)
+    #   "completa"    -> valida o documento inteiro a cada escrita
+    XML_VALIDATION_MODE = "incremental"
+
+    # no modo incremental, intervalo (segundos) entre validações completas
+    XML_FULL_VALIDATION_INTERVAL = 300
+
+    # histórico (leituras + comandos) em segmentos por dia
+    XML_SEGMENTS_DIR = os.path.join(XML_DIR, "segmentos")
+    XML_SEGMENT_SCHEMA_PATH = os.path.join(XML_DIR, "segmentos.xsd")
+
+    # quantidade máxima de registros por segmento (quebra antes do fim do dia)
+    XML_SEGMENT_MAX_RECORDS = 2000
+
+    # segmentos mantidos parseados em memória (LRU); os do dia atual não saem
+    XML_SEGMENT_CACHE_MAX = 16
+
+    # journal (write-ahead log) do histórico: as escritas só fazem append
+    # no journal; o checkpoint incorpora os lotes aos segmentos depois
+    XML_JOURNAL_ENABLED = True
+    XML_JOURNAL_PATH = os.path.join(XML_SEGMENTS_DIR, "journal.log")
+
+    # checkpoint a cada N segundos, ou antes se houver N registros pendentes
+    XML_JOURNAL_CHECKPOINT_INTERVAL = 5.0
+    XML_JOURNAL_CHECKPOINT_RECORDS = 5000
+
+    # escritor único: tamanho da fila (acima disso as escritas são recusadas),
+    # tarefas executadas por rodada e espera máxima (segundos) de quem escreve
+    XML_WRITE_QUEUE_SIZE = 1000
+    XML_WRITE_BATCH_MAX = 256
+    XML_WRITE_TIMEOUT = 30
+
+    # retenção: registros com mais de N dias saem dos segmentos para o
+    # arquivo morto (segmentos compactados com gzip, ainda válidos pelo XSD),
+    # numa tarefa em segundo plano a cada N segundos. Do período arquivado
+    # ficam em memória só os agregados das larguras abaixo. None desativa
+    XML_RETENTION_DAYS = 180
+    XML_RETENTION_INTERVAL = 3600
+    XML_RETENTION_ROLLUPS = ("1h", "1d")
+    XML_ARCHIVE_DIR = os.path.join(XML_DIR, "arquivo")
+
+    # travas (flock) e contadores de versão compartilhados entre processos,
+    # para vários workers (ex.: gunicorn -w N) usarem os mesmos arquivos
+    XML_LOCK_DIR = os.path.join(XML_DIR, "travas")
+    XML_VERSION_PATH = os.path.join(XML_LOCK_DIR, "versoes.bin")
+
+    # deduplicação na entrada: registros com o mesmo sensor/atuador, instante
+    # e valor/ação dentro desta janela (segundos) são ignorados
+    XML_DEDUP_WINDOW = 24 * 3600
+    XML_DEDUP_MAX_KEYS = 200000
+
+    # cópia colunar das leituras (binária, via mmap) para análises;
+    # refeita a partir do histórico XML se divergir dele
+    XML_COLUMNAR_DIR = os.path.join(XML_DIR, "colunar")
+
+    # agregados por bucket (1m, 5m, 1h, 1d): quantos dias de cada largura
+    # ficam em memória, contados da leitura mais recente (None = tudo), e
+    # checkpoint periódico, para a inicialização só agregar o que veio depois
+    XML_ROLLUPS_RETENTION = {"1m": 2, "5m": 14, "1h": None, "1d": None}
+    XML_ROLLUPS_PATH = os.path.join(XML_COLUMNAR_DIR, "agregados.bin")
+    XML_ROLLUPS_CHECKPOINT_INTERVAL = 300
+
+    # estatísticas por sensor (EWMA, variância, taxa de variação) e anomalias;
+    # o estado vai para um checkpoint pequeno a cada intervalo (segundos)
+    XML_STATS_PATH = os.path.join(XML_COLUMNAR_DIR, "estatisticas.txt")
+    XML_STATS_CHECKPOINT_INTERVAL = 60
+    XML_STATS_ALPHA = 0.1  # peso da leitura nova na EWMA
+    XML_STATS_Z = 3.0  # desvio: leitura a mais de Z desvios-padrão da EWMA
+    XML_STATS_HORIZON = 3600  # tendencia: cruza a faixa em menos disso (segundos)
+    XML_STATS_MIN_SAMPLES = 10  # leituras antes de sinalizar anomalias
+    XML_STATS_MAX_EVENTS = 256  # anomalias recentes guardadas por sensor
+
+    # quando outro processo muda uma faixa, o índice de alertas é refeito
+    # pelo agendador (acordado pela consulta que percebe a mudança, ou no
+    # máximo a cada intervalo, em segundos)
+    XML_ALERTS_RECLASSIFY_INTERVAL = 60
+
+    # últimas leituras guardadas em memória por sensor (GET /api/sensores/estado)
+    XML_RECENTES_POR_SENSOR = 512
+
+    # banda morta do controle dos atuadores, em fração da largura da faixa:
+    # só pede ligar/desligar quando a leitura passa do limite mais que isso
+    XML_CONTROL_DEADBAND = 0.02
+
+    # fila offline de leituras pendentes (log append-only em segmentos)
+    XML_PENDING_DIR = os.path.join(XML_DIR, "pendentes")
+    XML_PENDING_SEGMENT_BYTES = 1024 * 1024
+
+    # tamanho máximo da fila; acima disso as leituras mais antigas são descartadas
+    XML_PENDING_MAX_BYTES = 64 * 1024 * 1024
+
+    # leituras por lote ao sincronizar a fila com o histórico
+    XML_PENDING_SYNC_BATCH = 1000
+
+    # formato antigo da fila (importado para XML_PENDING_DIR na inicialização)
     XML_PENDING_PATH = os.path.join(XML_DIR, "leituras_pendentes.xml")
 
+    # máximo de leituras aceitas por requisição em POST /api/leituras/lote
+    API_LOTE_MAX_LEITURAS = 10000
+
+    # máximo de itens por página nas listagens (GET /api/leituras?limit=...)
+    API_LISTA_LIMITE_MAX = 1000
+
+    # respostas guardadas para reenvios com o cabeçalho Idempotency-Key
+    # (num log compartilhado entre os processos)
+    API_IDEMPOTENCY_TTL = 24 * 3600
+    API_IDEMPOTENCY_MAX_KEYS = 10000
+    # quanto tempo um lote pode ficar "em andamento" (se o processo cair
+    # no meio, a chave fica livre depois disso)
+    API_IDEMPOTENCY_LEASE = 60
+    API_IDEMPOTENCY_PATH = os.path.join(XML_LOCK_DIR, "idempotencia.log")
+
     # chave de autenticação dos "dispositivos" (gateway/simulador)
     DEVICE_API_KEY = "DEVICE-KEY"
+
+    # agendador do servidor: simulação e sincronização da fila offline a
+    # cada N segundos (None desliga), num único processo (o que tiver a
+    # trava); o jitter sorteia cada execução em ±fração do intervalo
+    SCHEDULER_SIMULATION_INTERVAL = 10
+    SCHEDULER_SYNC_INTERVAL = 10
+    SCHEDULER_JITTER = 0.1
+    SCHEDULER_LEADER_PATH = os.path.join(XML_LOCK_DIR, "agendador.lock")
@@ -1,13 +1,37 @@
-from datetime import datetime
+import atexit
+from datetime import datetime, timezone
 from functools import wraps
+from itertools import chain
 
 from flask import Blueprint, jsonify, request, Response
 
 from backend.config import Config
-from backend.services.xml_service import XMLService
+from backend.services import binary_frame
+from backend.services.export import blocos_json_lista, selecionar_colunas
+from backend.services.pagination import decodificar_cursor
+from backend.services.sensor_stats import ANOMALIAS
+from backend.services.writer import FilaEscritaCheia
+from backend.services.xml_service import ItemInvalido, XMLService
 
 api_bp = Blueprint("api", __name__)
-xml_service = XMLService()
+
+# criado ao registrar o blueprint (create_app), e não na importação,
+# pois a inicialização pode migrar os arquivos de dados
+xml_service: XMLService = None
+
+
+@api_bp.record_once
+def init_xml_service(state):
+    global xml_service
+    if not state.app.config["SERVIDOR"]:
+        return  # processo que não serve requests (ver create_app)
+    xml_service = XMLService()
+    # a ingestão (simulação e fila offline) roda no agendador do servidor
+    xml_service.agendar_ingestao(
+        Config.SCHEDULER_SIMULATION_INTERVAL, Config.SCHEDULER_SYNC_INTERVAL
+    )
+    # checkpoint final do journal ao encerrar o processo
+    atexit.register(xml_service.fechar)
 
 
 # helper de autenticação de dispositivo
@@ -22,6 +46,79 @@ def require_device_auth(f):
     return wrapper
 
 
+def _parse_dt(s: str) -> datetime:
+    """ISO 8601, ou apenas a data 'YYYY-MM-DD' (meia-noite UTC)."""
+    if len(s) == 10:
+        return datetime.fromisoformat(s + "T00:00:00+00:00")
+    dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+
+
+STATUS_LEITURA = ("dentro", "abaixo", "acima", "sem-faixa")
+
+
+def _parametros_periodo() -> dict:
+    """desde e ate (opcionais). Lança ValueError com a mensagem para o cliente."""
+    parametros = {}
+    for nome in ("desde", "ate"):
+        valor = request.args.get(nome)
+        if valor:
+            try:
+                parametros[nome] = _parse_dt(valor)
+            except ValueError:
+                raise ValueError(f"Parâmetro '{nome}' inválido. Use ISO 8601.") from None
+    return parametros
+
+
+def _parametros_lista(status_validos: tuple = STATUS_LEITURA) -> dict:
+    """
+    Filtros comuns das listagens do histórico: desde, ate, limit, cursor
+    e status (um de `status_validos`). Lança ValueError com a mensagem
+    para o cliente.
+    """
+    parametros = _parametros_periodo()
+
+    limite = request.args.get("limit")
+    if limite is not None:
+        if not limite.isdigit() or int(limite) < 1:
+            raise ValueError("Parâmetro 'limit' deve ser um inteiro positivo.")
+        parametros["limite"] = min(int(limite), Config.API_LISTA_LIMITE_MAX)
+
+    cursor = request.args.get("cursor")
+    if cursor:
+        parametros["cursor"] = decodificar_cursor(cursor)
+        parametros.setdefault("limite", Config.API_LISTA_LIMITE_MAX)
+
+    status = request.args.get("status")
+    if status is not None:
+        if status not in status_validos:
+            raise ValueError(f"Parâmetro 'status' deve ser um de: {', '.join(status_validos)}.")
+        parametros["status"] = status
+    return parametros
+
+
+def _pagina(itens: list, proximo) -> Response:
+    """Página como array JSON; o cursor da próxima vai no cabeçalho X-Next-Cursor."""
+    resposta = jsonify(itens)
+    if proximo:
+        resposta.headers["X-Next-Cursor"] = proximo
+    return resposta
+
+
+def _lista_streaming(itens) -> Response:
+    """
+    Listagem completa (sem limit nem cursor) como array JSON em streaming:
+    os itens saem do gerador na ordem do armazém, sem montar a lista.
+    """
+    blocos = blocos_json_lista(itens)
+    try:
+        # o primeiro bloco sai antes da resposta: erros até aí ainda viram 500
+        primeiro = next(blocos)
+    except Exception as e:
+        return jsonify({"error": f"Erro ao listar: {str(e)}"}), 500
+    return Response(chain([primeiro], blocos), mimetype="application/json")
+
+
 # SENSORES 
 
 @api_bp.get("/api/sensores")
@@ -30,6 +127,40 @@ def api_listar_sensores():
     return jsonify(sensores)
 
 
+@api_bp.get("/api/sensores/estado")
+def api_estado_sensores():
+    """Última leitura e status de cada sensor (buffer em memória)."""
+    return jsonify(xml_service.estado_sensores())
+
+
+@api_bp.get("/api/sensores/<sensor_id>/recentes")
+def api_leituras_recentes(sensor_id):
+    """
+    Últimas leituras do sensor, da mais recente para a mais antiga.
+    Query param opcional: limit.
+    """
+    limite = request.args.get("limit")
+    if limite is not None and (not limite.isdigit() or int(limite) < 1):
+        return jsonify({"error": "Parâmetro 'limit' deve ser um inteiro positivo."}), 400
+
+    recentes = xml_service.leituras_recentes(sensor_id, int(limite) if limite else None)
+    if recentes is None:
+        return jsonify({"error": "Sensor não cadastrado."}), 404
+    return jsonify(recentes)
+
+
+@api_bp.get("/api/sensores/<sensor_id>/estatisticas")
+def api_estatisticas_sensor(sensor_id):
+    """
+    Estatísticas correntes do sensor (média, desvio-padrão, EWMA, taxa de
+    variação) e anomalias sinalizadas (desvio, tendencia).
+    """
+    estatisticas = xml_service.estatisticas_sensor(sensor_id)
+    if estatisticas is None:
+        return jsonify({"error": "Sensor não cadastrado."}), 404
+    return jsonify(estatisticas)
+
+
 @api_bp.post("/api/sensores")
 def api_cadastrar_sensor():
     data = request.json or {}
@@ -40,6 +171,7 @@ def api_cadastrar_sensor():
                 "tipo": data["tipo"],
                 "modelo": data.get("modelo"),
                 "localizacao": data.get("localizacao"),
+                "lote": data.get("lote"),
             }
         )
         return jsonify({"message": "Sensor cadastrado com sucesso."}), 201
@@ -47,6 +179,8 @@ def api_cadastrar_sensor():
         return jsonify({"error": "Campos obrigatórios: id, tipo."}), 400
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
+    except FilaEscritaCheia as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": f"Erro ao salvar XML: {str(e)}"}), 500
 
@@ -56,6 +190,8 @@ def api_limpar_sensores():
     try:
         xml_service.limpar_sensores()
         return jsonify({"message": "Sensores limpos no XML."})
+    except FilaEscritaCheia as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": f"Erro ao limpar sensores: {str(e)}"}), 500
 
@@ -72,10 +208,14 @@ def api_listar_atuadores():
 def api_cadastrar_atuador():
     data = request.json or {}
     try:
+        controla = data.get("controla") or []
+        if not isinstance(controla, list) or not all(isinstance(s, str) for s in controla):
+            return jsonify({"error": "Campo 'controla' deve ser uma lista de IDs de sensores."}), 400
         xml_service.cadastrar_atuador(
             {
                 "id": data["id"],
                 "tipo": data["tipo"],
+                "controla": controla,
             }
         )
         return jsonify({"message": "Atuador cadastrado com sucesso."}), 201
@@ -83,6 +223,8 @@ def api_cadastrar_atuador():
         return jsonify({"error": "Campos obrigatórios: id, tipo."}), 400
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
+    except FilaEscritaCheia as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": f"Erro ao salvar XML: {str(e)}"}), 500
 
@@ -92,18 +234,79 @@ def api_limpar_atuadores():
     try:
         xml_service.limpar_atuadores()
         return jsonify({"message": "Atuadores limpos no XML."})
+    except FilaEscritaCheia as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": f"Erro ao limpar atuadores: {str(e)}"}), 500
 
+# FAIXAS IDEAIS
+
+@api_bp.get("/api/faixas")
+def api_listar_faixas():
+    """Faixas configuradas e a faixa efetiva de cada sensor."""
+    return jsonify(xml_service.listar_faixas())
+
+
+@api_bp.post("/api/faixas")
+def api_definir_faixa():
+    """
+    Corpo: { sensorId, minimo, maximo } (um sensor), { tipo, lote, minimo,
+    maximo } (um tipo num lote) ou { tipo, minimo, maximo } (um tipo).
+    Substitui a faixa que houver para o mesmo alvo.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Corpo deve ser um objeto JSON."}), 400
+    try:
+        xml_service.definir_faixa(data)
+        return jsonify({"message": "Faixa configurada."}), 201
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except FilaEscritaCheia as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": f"Erro ao salvar XML: {str(e)}"}), 500
+
+
+@api_bp.delete("/api/faixas")
+def api_limpar_faixas():
+    """Remove as faixas configuradas (voltam as padrão de cada tipo)."""
+    try:
+        xml_service.limpar_faixas()
+        return jsonify({"message": "Faixas configuradas removidas."})
+    except FilaEscritaCheia as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": f"Erro ao limpar faixas: {str(e)}"}), 500
+
+
 # HISTÓRICO DE COMANDOS 
 
 @api_bp.get("/api/atuadores/comandos")
 def api_listar_comandos():
     """
-    Lista o histórico de comandos de todos os atuadores.
+    Lista o histórico de comandos dos atuadores, do mais recente ao mais antigo.
+    Query params opcionais: atuadorId, tipo, acao, desde, ate, limit, cursor.
+    Havendo mais itens, o cabeçalho X-Next-Cursor traz o cursor da próxima página.
+    Sem limit nem cursor, a lista completa sai em streaming.
     """
-    comandos = xml_service.listar_comandos()
-    return jsonify(comandos)
+    try:
+        parametros = _parametros_lista()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if "status" in parametros:
+        return jsonify({"error": "Parâmetro 'status' não se aplica a comandos."}), 400
+
+    filtros = {
+        "atuador": request.args.get("atuadorId"),
+        "tipo": request.args.get("tipo"),
+        "acao": request.args.get("acao"),
+    }
+    if "limite" not in parametros:
+        return _lista_streaming(xml_service.iterar_comandos(**filtros, **parametros))
+
+    comandos, proximo = xml_service.consultar_comandos(**filtros, **parametros)
+    return _pagina(comandos, proximo)
 
 
 @api_bp.delete("/api/atuadores/comandos")
@@ -114,6 +317,8 @@ def api_limpar_comandos():
     try:
         xml_service.limpar_historico_comandos()
         return jsonify({"message": "Histórico de comandos dos atuadores limpo no XML."})
+    except FilaEscritaCheia as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": f"Erro ao limpar histórico de comandos: {str(e)}"}), 500
 
@@ -122,8 +327,127 @@ def api_limpar_comandos():
 
 @api_bp.get("/api/leituras")
 def api_listar_leituras():
-    leituras = xml_service.listar_leituras()
-    return jsonify(leituras)
+    """
+    Lista as leituras, da mais recente para a mais antiga.
+    Query params opcionais: sensorId, tipo, status (dentro/abaixo/acima/sem-faixa),
+    desde, ate, limit, cursor. Havendo mais itens, o cabeçalho X-Next-Cursor
+    traz o cursor da próxima página. Sem limit nem cursor, a lista completa
+    sai em streaming.
+    """
+    try:
+        parametros = _parametros_lista()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    filtros = {"sensor": request.args.get("sensorId"), "tipo": request.args.get("tipo")}
+    if "limite" not in parametros:
+        return _lista_streaming(xml_service.iterar_leituras(**filtros, **parametros))
+
+    leituras, proximo = xml_service.consultar_leituras(**filtros, **parametros)
+    return _pagina(leituras, proximo)
+
+
+@api_bp.get("/api/leituras/agregado")
+def api_agregar_leituras():
+    """
+    Mínimo, máximo, média, quantidade e último valor por bucket, por sensor.
+    Query params: bucket (1m, 5m, 1h ou 1d); opcionais: sensorId, desde, ate.
+    """
+    try:
+        parametros = _parametros_periodo()
+        agregados = xml_service.agregar_leituras(
+            request.args.get("bucket", ""), sensor=request.args.get("sensorId"), **parametros
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(agregados)
+
+
+@api_bp.post("/api/leituras/lote")
+@require_device_auth
+def api_registrar_leituras_lote():
+    """
+    Corpo: lista de leituras, ou {"leituras": [...], "idempotencyKey"?}, cada uma
+      { sensorId, dataHora, valor, unidade? }
+    ou, com Content-Type application/x-hidroponia-frame, um ou mais
+    quadros binários (ver services/binary_frame.py).
+    Itens inválidos são rejeitados individualmente; os demais são gravados.
+    Um campo com tipo JSON errado (ex.: sensorId lista) recusa o lote
+    inteiro com 400 e o índice do item.
+
+    Com o cabeçalho Idempotency-Key (ou "idempotencyKey" no corpo), um
+    reenvio do mesmo lote recebe a resposta original sem gravar de novo.
+    """
+    binario = request.mimetype == binary_frame.CONTENT_TYPE
+    data = None if binario else request.get_json(silent=True)
+
+    chave = request.headers.get("Idempotency-Key")
+    if chave is None and isinstance(data, dict):
+        chave = data.get("idempotencyKey")
+    if not chave:
+        corpo, status = _registrar_lote(data, binario)
+        return jsonify(corpo), status
+
+    anterior = xml_service.idempotencia.iniciar(str(chave))
+    if anterior is xml_service.idempotencia.EM_ANDAMENTO:
+        return jsonify({"error": "Lote com esta chave ainda em processamento."}), 409
+    if anterior is not None:
+        corpo, status = anterior
+        return jsonify(corpo), status, {"Idempotent-Replay": "true"}
+
+    try:
+        corpo, status = _registrar_lote(data, binario)
+    except Exception:
+        # libera a chave para o reenvio não ficar preso em 409
+        xml_service.idempotencia.cancelar(str(chave))
+        raise
+    if status == 200:
+        xml_service.idempotencia.concluir(str(chave), (corpo, status))
+    else:
+        xml_service.idempotencia.cancelar(str(chave))
+    return jsonify(corpo), status
+
+
+def _registrar_lote(data, binario: bool) -> tuple[dict, int]:
+    if binario:
+        return _registrar_quadros(request.get_data())
+
+    if isinstance(data, dict):
+        data = data.get("leituras")
+    if not isinstance(data, list):
+        return {"error": "Envie uma lista de leituras."}, 400
+    if len(data) > Config.API_LOTE_MAX_LEITURAS:
+        return {"error": f"Máximo de {Config.API_LOTE_MAX_LEITURAS} leituras por lote."}, 413
+
+    try:
+        resultados = xml_service.registrar_leituras_lote(data)
+    except ItemInvalido as e:
+        return {"error": str(e), "indice": e.indice}, 400
+    except FilaEscritaCheia as e:
+        return {"error": str(e)}, 503
+    except Exception as e:
+        return {"error": f"Erro ao salvar leituras: {str(e)}"}, 500
+
+    aceitas = sum(1 for r in resultados if r["aceita"])
+    return {
+        "aceitas": aceitas,
+        "duplicadas": sum(1 for r in resultados if r.get("duplicada")),
+        "rejeitadas": len(resultados) - aceitas,
+        "resultados": resultados,
+    }, 200
+
+
+def _registrar_quadros(dados: bytes) -> tuple[dict, int]:
+    if binary_frame.contar_registros(dados) > Config.API_LOTE_MAX_LEITURAS:
+        return {"error": f"Máximo de {Config.API_LOTE_MAX_LEITURAS} leituras por lote."}, 413
+    try:
+        return xml_service.registrar_quadros(dados), 200
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    except FilaEscritaCheia as e:
+        return {"error": str(e)}, 503
+    except Exception as e:
+        return {"error": f"Erro ao salvar leituras: {str(e)}"}, 500
 
 
 @api_bp.delete("/api/leituras")
@@ -131,14 +455,47 @@ def api_limpar_leituras():
     try:
         xml_service.limpar_leituras()
         return jsonify({"message": "Histórico de leituras limpo no XML."})
+    except FilaEscritaCheia as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": f"Erro ao limpar leituras: {str(e)}"}), 500
 
 
 @api_bp.get("/api/alertas")
 def api_listar_alertas():
-    alertas = xml_service.listar_alertas()
-    return jsonify(alertas)
+    """
+    Leituras fora da faixa e anomalias recentes por sensor (campo
+    "anomalia"), intercaladas por instante. Mesmos parâmetros de GET
+    /api/leituras; status=abaixo/acima só os fora da faixa,
+    status=desvio/tendencia só as anomalias.
+    """
+    try:
+        parametros = _parametros_lista(STATUS_LEITURA + ANOMALIAS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    filtros = {"sensor": request.args.get("sensorId"), "tipo": request.args.get("tipo")}
+    if "limite" not in parametros:
+        return _lista_streaming(xml_service.iterar_alertas(**filtros, **parametros))
+
+    alertas, proximo = xml_service.consultar_alertas(**filtros, **parametros)
+    return _pagina(alertas, proximo)
+
+
+@api_bp.get("/api/alertas/episodios")
+def api_listar_episodios():
+    """
+    Episódios de alerta (sequências de leituras fora da faixa), do mais
+    recente ao mais antigo. Query params opcionais: sensorId, aberto (true/false).
+    """
+    aberto = request.args.get("aberto")
+    if aberto not in (None, "true", "false"):
+        return jsonify({"error": "Parâmetro 'aberto' deve ser true ou false."}), 400
+    episodios = xml_service.listar_episodios(
+        sensor=request.args.get("sensorId"),
+        abertos=None if aberto is None else aberto == "true",
+    )
+    return jsonify(episodios)
 
 
 # SIMULAÇÃO (gateway) 
@@ -149,6 +506,8 @@ def api_simulacao_tick():
     try:
         novas = xml_service.simular_ciclo()
         return jsonify({"novasLeituras": novas})
+    except FilaEscritaCheia as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": f"Erro na simulação: {str(e)}"}), 500
 
@@ -159,19 +518,42 @@ def api_sync_pendentes():
     try:
         qtd = xml_service.sincronizar_pendentes()
         return jsonify({"sincronizadas": qtd})
+    except FilaEscritaCheia as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": f"Erro na sincronização: {str(e)}"}), 500
 
 
-# EXPORTAÇÃO XML (RF8) 
+@api_bp.get("/api/pendentes/metricas")
+def api_metricas_pendentes():
+    return jsonify(xml_service.metricas_pendentes())
+
+
+@api_bp.get("/api/agendador/metricas")
+def api_metricas_agendador():
+    """Execuções, falhas, estouros e duração de cada tarefa periódica do servidor."""
+    return jsonify(xml_service.metricas_agendador())
+
+
+# EXPORTAÇÃO (RF8) 
+
+TIPOS_EXPORTACAO = {
+    "xml": "application/xml",
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
 
-@api_bp.get("/api/exportar/xml")
-def api_exportar_xml():
+
+@api_bp.get("/api/exportar")
+@api_bp.get("/api/exportar/xml", defaults={"formato": "xml"})
+def api_exportar(formato=None):
     """
     Query params:
       inicio=2025-10-24T00:00:00Z
       fim=2025-10-24T23:59:59Z
     ou apenas data 'YYYY-MM-DD'.
+    Opcionais: formato=xml|csv|ndjson (em /api/exportar; padrão xml),
+    compressao=gzip, sensorId e, para csv/ndjson, colunas=sensorId,dataHora,...
     """
     inicio_str = request.args.get("inicio")
     fim_str = request.args.get("fim")
@@ -179,29 +561,44 @@ def api_exportar_xml():
     if not inicio_str or not fim_str:
         return jsonify({"error": "Parâmetros 'inicio' e 'fim' são obrigatórios."}), 400
 
-    def parse_dt(s: str) -> datetime:
-        # se vier só data (YYYY-MM-DD)
-        if len(s) == 10:
-            return datetime.fromisoformat(s + "T00:00:00+00:00")
-        return datetime.fromisoformat(s.replace("Z", "+00:00"))
-
     try:
-        dt_inicio = parse_dt(inicio_str)
-        dt_fim = parse_dt(fim_str)
+        dt_inicio = _parse_dt(inicio_str)
+        dt_fim = _parse_dt(fim_str)
     except Exception:
         return jsonify({"error": "Formato de data inválido. Use ISO 8601."}), 400
 
     if dt_inicio > dt_fim:
         return jsonify({"error": "Data inicial não pode ser maior que a final."}), 400
 
+    formato = formato or request.args.get("formato", "xml")
+    compressao = request.args.get("compressao") or None
+    colunas = request.args.get("colunas")
     try:
-        xml_bytes = xml_service.exportar_leituras_filtradas(dt_inicio, dt_fim)
-        return Response(
-            xml_bytes,
-            mimetype="application/xml",
-            headers={
-                "Content-Disposition": "attachment; filename=leituras_filtradas.xml"
-            },
+        blocos = xml_service.exportar_leituras(
+            dt_inicio,
+            dt_fim,
+            formato=formato,
+            sensor=request.args.get("sensorId"),
+            colunas=selecionar_colunas(colunas) if colunas else None,
+            compressao=compressao,
         )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        # o primeiro bloco sai antes da resposta: erros até aí ainda viram 500
+        primeiro = next(blocos)
     except Exception as e:
-        return jsonify({"error": f"Erro ao exportar XML: {str(e)}"}), 500
+        return jsonify({"error": f"Erro ao exportar {formato.upper()}: {str(e)}"}), 500
+
+    nome = f"leituras_filtradas.{formato}"
+    mimetype = TIPOS_EXPORTACAO[formato]
+    if compressao == "gzip":
+        nome, mimetype = nome + ".gz", "application/gzip"
+
+    # resposta em streaming (chunked), bloco a bloco
+    return Response(
+        chain([primeiro], blocos),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={nome}"},
+    )
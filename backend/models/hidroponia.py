@@ -11,6 +11,7 @@ class Sensor:
     unidade: str
     modelo: Optional[str] = None
     localizacao: Optional[str] = None
+    lote: Optional[str] = None
 
 
 @dataclass
@@ -0,0 +1,143 @@
+"""
+Controle dos atuadores: de que sensores cada um depende (rotas_controle) e
+que comandos um ciclo de leituras pede, a partir do último comando de cada
+atuador (ControleAtuadores).
+"""
+
+import threading
+from typing import Iterable, NamedTuple, Optional
+
+from lxml import etree
+
+from backend.services.thresholds import TabelaFaixas
+from backend.services.time_index import tempo_elemento
+
+LIGAR, DESLIGAR = "ligar", "desligar"
+# estado do atuador depois de cada ação
+ESTADOS = {LIGAR: "ligado", DESLIGAR: "desligado"}
+
+
+class UltimoComando(NamedTuple):
+    tempo: int
+    dataHora: str
+    acao: str
+
+
+def rotas_controle(root: etree._Element) -> dict[str, list[str]]:
+    """
+    sensor -> atuadores que ele aciona, pelos <controla sensorRef> de cada
+    atuador. Sensores sem nenhum <controla> acionam o primeiro atuador
+    (como antes do mapeamento existir).
+    """
+    atuadores = list(root.iterfind("atuadores/atuador"))
+    rotas: dict[str, list[str]] = {}
+    for a in atuadores:
+        for c in a.iterfind("controla"):
+            rotas.setdefault(c.get("sensorRef"), []).append(a.get("id"))
+    if atuadores:
+        padrao = [atuadores[0].get("id")]
+        for s in root.iterfind("sensores/sensor"):
+            rotas.setdefault(s.get("id"), padrao)
+    return rotas
+
+
+class ControleAtuadores:
+    """
+    Decide os comandos de um ciclo a partir das leituras, com o último
+    comando de cada atuador guardado em memória (O(1) por atuador, sem
+    percorrer o histórico):
+      - cada leitura é encaminhada só aos atuadores que controlam o
+        sensor (rotas_controle);
+      - com banda morta: pede "ligar" abaixo de mínimo - banda e
+        "desligar" acima de máximo + banda, sendo banda uma fração
+        (`banda`) da largura da faixa; dentro disso não pede nada;
+      - por histerese, o atuador mantém o estado até um pedido contrário;
+      - os pedidos do ciclo são agrupados por atuador: pedidos opostos se
+        anulam e só sai comando quando a ação muda o estado atual.
+
+    Os comandos gravados neste processo chegam por `registrar`; quando
+    outro processo grava ou apaga comandos, o estado é substituído pelo
+    do histórico (`carregar`).
+    """
+
+    def __init__(self, banda: float = 0.0):
+        self.banda = banda
+        self._ultimos: dict[str, UltimoComando] = {}
+        self._documento = None
+        self._rotas: dict[str, list[str]] = {}
+        self._lock = threading.Lock()
+
+    # Helpers internos
+
+    def _pedido(self, tabela: TabelaFaixas, sensor: str, valor: float) -> Optional[str]:
+        faixa = tabela.faixa(sensor)
+        if faixa is None:
+            return None
+        minimo, maximo = float(faixa.minimo), float(faixa.maximo)
+        margem = self.banda * (maximo - minimo)
+        if valor < minimo - margem:
+            return LIGAR
+        if valor > maximo + margem:
+            return DESLIGAR
+        return None
+
+    # API
+
+    def rotas(self, documento: etree._ElementTree) -> dict[str, list[str]]:
+        """rotas_controle do XML principal, refeitas só quando ele muda (outro snapshot)."""
+        with self._lock:
+            if documento is not self._documento:
+                self._rotas = rotas_controle(documento.getroot())
+                self._documento = documento
+            return self._rotas
+
+    def decidir(
+        self,
+        documento: etree._ElementTree,
+        tabela: TabelaFaixas,
+        leituras: Iterable[tuple[str, float]],
+    ) -> dict[str, str]:
+        """Ações do ciclo por atuador, só as que mudam o estado: {atuador: acao}."""
+        rotas = self.rotas(documento)
+        pedidos: dict[str, set] = {}
+        for sensor, valor in leituras:
+            acao = self._pedido(tabela, sensor, valor)
+            if acao is None:
+                continue
+            for atuador in rotas.get(sensor, ()):
+                pedidos.setdefault(atuador, set()).add(acao)
+
+        decisoes = {}
+        with self._lock:
+            for atuador, acoes in pedidos.items():
+                if len(acoes) != 1:
+                    continue  # pedidos opostos no mesmo ciclo: mantém o estado
+                acao = acoes.pop()
+                ultimo = self._ultimos.get(atuador)
+                if ultimo is None or ultimo.acao != acao:
+                    decisoes[atuador] = acao
+        return decisoes
+
+    def registrar(self, comandos: Iterable[etree._Element]) -> None:
+        """Comandos gravados no histórico; fica o mais recente de cada atuador."""
+        with self._lock:
+            for c in comandos:
+                self._guardar(c.get("atuadorRef"), tempo_elemento(c), c.findtext("dataHora"), c.findtext("acao"))
+
+    def carregar(self, ultimos: Iterable[tuple[str, int, str, str]]) -> None:
+        """Substitui o estado todo pelos últimos comandos dados: (atuador, instante, dataHora, acao)."""
+        novos = {atuador: UltimoComando(tempo, data_hora, acao) for atuador, tempo, data_hora, acao in ultimos}
+        with self._lock:
+            self._ultimos = novos
+
+    def _guardar(self, atuador: str, tempo: int, data_hora: str, acao: str) -> None:
+        ultimo = self._ultimos.get(atuador)
+        if ultimo is None or tempo >= ultimo.tempo:
+            self._ultimos[atuador] = UltimoComando(tempo, data_hora, acao)
+
+    def ultimo(self, atuador: str) -> Optional[UltimoComando]:
+        return self._ultimos.get(atuador)
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._ultimos.clear()
@@ -0,0 +1,288 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+from typing import Collection, Iterator, NamedTuple, Optional
+
+from backend.services.columnar import Colunas, np
+from backend.services.thresholds import ABAIXO, ACIMA, DENTRO, SEM_FAIXA, STATUS, TabelaFaixas
+
+_CODIGOS = {STATUS[ABAIXO]: ABAIXO, STATUS[ACIMA]: ACIMA}
+
+
+class Alerta(NamedTuple):
+    """Leitura fora da faixa ideal, como guardada no índice."""
+
+    tempo: int
+    sensor: str
+    valor: float
+    status: str
+
+
+class Episodio(NamedTuple):
+    """
+    Sequência de leituras de um sensor fora da faixa, do mesmo lado. `fim`
+    é o instante da leitura que a encerrou (None enquanto aberto); `extremo`
+    é o pior valor (o menor, abaixo; o maior, acima).
+    """
+
+    sensor: str
+    status: str
+    inicio: int
+    fim: Optional[int]
+    leituras: int
+    extremo: float
+
+    @property
+    def aberto(self) -> bool:
+        return self.fim is None
+
+
+class IndiceAlertas:
+    """
+    Alertas materializados: cada leitura é classificada uma única vez
+    (TabelaFaixas, em lote), quando entra no armazém colunar, e só as fora
+    da faixa ficam no índice
+    (arrays paralelos em ordem de instante, só com append; atrasadas
+    entram na posição certa). Listar alertas custa proporcional aos
+    alertas do intervalo, não às leituras.
+
+    Junto, os episódios por sensor: um abre na primeira leitura fora da
+    faixa e fecha na próxima dentro dela (ou vira outro, se passar para o
+    lado oposto). Seguem a ordem de chegada; leituras atrasadas entram no
+    índice mas não reabrem episódios.
+
+    Como os Rollups, acompanha o armazém colunar: leituras de outros
+    processos entram na próxima sincronização e, se o armazém for refeito,
+    o índice também é. Se a faixa de algum sensor já visto mudar, o índice
+    segue com a tabela anterior e fica `desatualizado`. A reclassificação
+    de todas as leituras vem de `refeito`, que monta um índice novo para
+    ser trocado pelo atual, sem que as consultas esperem por ela.
+    """
+
+    def __init__(self):
+        self._tempos = array("q")
+        self._sensores = array("i")
+        self._valores = array("d")
+        self._codigos = array("b")
+        self._nomes: list[str] = []
+
+        # sensor -> [status, inicio, leituras, extremo]
+        self._abertos: dict[str, list] = {}
+        self._fechados: list[Episodio] = []
+        # instante da última leitura vista de cada sensor (episódios)
+        self._ultimas: dict[str, int] = {}
+
+        self._lidas = 0
+        self._geracao = None
+        self._tabela: Optional[TabelaFaixas] = None
+        # tabela recusada por mudar a faixa de sensores já vistos (ver refeito)
+        self._recusada: Optional[TabelaFaixas] = None
+        # índice do sensor no armazém colunar -> índice na tabela de faixas
+        self._traducao: list[int] = []
+        # instante mínimo mantido (ver podar)
+        self._corte: Optional[int] = None
+        self._lock = threading.Lock()
+
+    # Helpers internos
+
+    def _limpar(self) -> None:
+        for coluna in self._colunas():
+            del coluna[:]
+        self._abertos.clear()
+        self._fechados.clear()
+        self._ultimas.clear()
+        self._traducao = []
+        self._lidas = 0
+
+    def _colunas(self) -> tuple:
+        return self._tempos, self._sensores, self._valores, self._codigos
+
+    def _intercalar(self, atrasadas: list[tuple]) -> None:
+        """
+        Põe as linhas atrasadas (tempo, sensor, valor, código) na posição
+        certa de uma vez: uma passada pelas colunas, em vez de um insert
+        (que desloca tudo depois dele) por linha. No mesmo instante, as
+        que já estavam e, entre as atrasadas, a ordem de chegada vêm antes.
+        """
+        atrasadas.sort(key=itemgetter(0))
+        colunas = self._colunas()
+        novas = tuple(array(c.typecode) for c in colunas)
+        anterior = 0
+        for linha in atrasadas:
+            i = bisect_right(self._tempos, linha[0], anterior)
+            for nova, coluna, v in zip(novas, colunas, linha):
+                nova.extend(coluna[anterior:i])
+                nova.append(v)
+            anterior = i
+        for nova, coluna in zip(novas, colunas):
+            nova.extend(coluna[anterior:])
+            coluna[:] = nova
+
+    def _trocar_tabela(self, tabela: TabelaFaixas) -> None:
+        """
+        Nova tabela de faixas. Se a faixa de um sensor já visto mudou, ela
+        é recusada: a reclassificação fica para `refeito`.
+        """
+        if self._tabela is not None and any(
+            _limites(self._tabela, nome) != _limites(tabela, nome) for nome in self._nomes
+        ):
+            self._recusada = tabela
+            return
+        self._tabela, self._recusada = tabela, None
+        self._traducao = []
+
+    def _episodio(self, sensor: str, tempo: int, valor: float, status: Optional[str]) -> None:
+        ultima = self._ultimas.get(sensor)
+        if ultima is not None and tempo < ultima:
+            return
+        self._ultimas[sensor] = tempo
+
+        aberto = self._abertos.get(sensor)
+        if aberto is not None and aberto[0] != status:
+            del self._abertos[sensor]
+            self._fechados.append(Episodio(sensor, aberto[0], aberto[1], tempo, aberto[2], aberto[3]))
+            aberto = None
+        if status is None:
+            return
+        if aberto is None:
+            self._abertos[sensor] = [status, tempo, 1, valor]
+            return
+        aberto[2] += 1
+        aberto[3] = min(aberto[3], valor) if status == "abaixo" else max(aberto[3], valor)
+
+    # API
+
+    def sincronizar(self, colunas: Colunas, tabela: TabelaFaixas) -> int:
+        """
+        Classifica as linhas do armazém colunar ainda não vistas pela
+        tabela de faixas. Retorna quantos alertas entraram no índice.
+        """
+        with self._lock:
+            if colunas.geracao != self._geracao or len(colunas) < self._lidas:
+                self._limpar()
+                self._geracao = colunas.geracao
+            if tabela is not self._tabela and tabela is not self._recusada:
+                self._trocar_tabela(tabela)
+            tabela = self._tabela
+            self._nomes = colunas.nomes
+            self._traducao.extend(tabela.indice(n) for n in colunas.nomes[len(self._traducao):])
+            inicio, fim = self._lidas, len(colunas)
+            if fim == inicio:
+                return 0
+
+            tempos, sensores, valores = (
+                colunas.tempos[inicio:fim], colunas.sensores[inicio:fim], colunas.valores[inicio:fim]
+            )
+            if np is not None:
+                indices = np.asarray(self._traducao, dtype=np.intp)[sensores]
+            else:
+                indices = [self._traducao[s] for s in sensores]
+            codigos = tabela.classificar(valores, indices)
+
+            novos = 0
+            atrasadas = []
+            for tempo, sensor, valor, codigo in zip(tempos, sensores, valores, codigos):
+                if codigo == SEM_FAIXA or (self._corte is not None and tempo < self._corte):
+                    continue
+                tempo, sensor, valor, codigo = int(tempo), int(sensor), float(valor), int(codigo)
+                self._episodio(self._nomes[sensor], tempo, valor, None if codigo == DENTRO else STATUS[codigo])
+                if codigo == DENTRO:
+                    continue
+                if not self._tempos or tempo >= self._tempos[-1]:
+                    for coluna, v in zip(self._colunas(), (tempo, sensor, valor, codigo)):
+                        coluna.append(v)
+                else:
+                    atrasadas.append((tempo, sensor, valor, codigo))
+                novos += 1
+            if atrasadas:
+                self._intercalar(atrasadas)
+            self._lidas = fim
+            return novos
+
+    @property
+    def desatualizado(self) -> bool:
+        """True se a faixa de algum sensor mudou e o índice ainda não foi refeito."""
+        return self._recusada is not None
+
+    def refeito(self, colunas: Colunas, tabela: TabelaFaixas) -> "IndiceAlertas":
+        """
+        Índice novo, com todas as leituras classificadas pela `tabela` (e o
+        mesmo corte da retenção), para substituir este. Montado sem o lock
+        deste: as consultas continuam no atual enquanto isso.
+        """
+        novo = IndiceAlertas()
+        novo._corte = self._corte
+        novo.sincronizar(colunas, tabela)
+        return novo
+
+    def podar(self, antes: int) -> None:
+        """
+        Descarta os alertas e episódios encerrados anteriores a `antes`
+        (epoch ms); leituras antigas sincronizadas depois também não os
+        refazem. Serve à retenção, como Rollups.podar.
+        """
+        with self._lock:
+            self._corte = max(antes, self._corte if self._corte is not None else antes)
+            i = bisect_left(self._tempos, self._corte)
+            for coluna in self._colunas():
+                del coluna[:i]
+            self._fechados = [e for e in self._fechados if e.fim >= self._corte]
+
+    def percorrer(
+        self,
+        inicio: Optional[int] = None,
+        fim: Optional[int] = None,
+        sensores: Optional[Collection[str]] = None,
+        status: Optional[Collection[str]] = None,
+    ) -> Iterator[Alerta]:
+        """
+        Alertas com inicio <= instante <= fim (epoch ms), do mais recente ao
+        mais antigo, opcionalmente só de `sensores` e `status`. O trecho é
+        copiado na chamada; a montagem dos itens é preguiçosa.
+        """
+        with self._lock:
+            i = bisect_left(self._tempos, inicio) if inicio is not None else 0
+            j = bisect_right(self._tempos, fim) if fim is not None else len(self._tempos)
+            trecho = [c[i:j] for c in self._colunas()]
+            nomes = self._nomes
+
+        permitidos = None if sensores is None else set(sensores)
+        aceitos = None if status is None else {_CODIGOS[s] for s in status if s in _CODIGOS}
+        return self._alertas(*trecho, nomes, permitidos, aceitos)
+
+    @staticmethod
+    def _alertas(tempos, indices, valores, codigos, nomes, permitidos, aceitos) -> Iterator[Alerta]:
+        for k in range(len(tempos) - 1, -1, -1):
+            if aceitos is not None and codigos[k] not in aceitos:
+                continue
+            sensor = nomes[indices[k]]
+            if permitidos is not None and sensor not in permitidos:
+                continue
+            yield Alerta(tempos[k], sensor, valores[k], STATUS[codigos[k]])
+
+    def episodios(self, sensor: Optional[str] = None, abertos: Optional[bool] = None) -> list[Episodio]:
+        """
+        Episódios (abertos e encerrados), do mais recente ao mais antigo
+        pelo início, opcionalmente de um sensor ou só abertos/encerrados.
+        """
+        with self._lock:
+            lista = []
+            if abertos is not False:
+                lista.extend(
+                    Episodio(s, a[0], a[1], None, a[2], a[3]) for s, a in self._abertos.items()
+                )
+            if abertos is not True:
+                lista.extend(self._fechados)
+        if sensor is not None:
+            lista = [e for e in lista if e.sensor == sensor]
+        lista.sort(key=lambda e: e.inicio, reverse=True)
+        return lista
+
+    def __len__(self) -> int:
+        return len(self._tempos)
+
+
+def _limites(tabela: TabelaFaixas, sensor: str) -> Optional[tuple]:
+    faixa = tabela.faixa(sensor)
+    return (faixa.minimo, faixa.maximo) if faixa is not None else None
@@ -0,0 +1,244 @@
+import copy
+import gzip
+import heapq
+import os
+from datetime import datetime
+from itertools import chain
+from operator import itemgetter
+from typing import Collection, Iterator, Optional
+
+from lxml import etree
+
+from backend.services.time_index import REFERENCIAS, epoch_ms, tempo_elemento
+from backend.services.xml_cache import CacheDocumento
+from backend.services.xml_utils import (
+    escrever_xml,
+    formatar_data_hora,
+    parse_data_hora,
+    sincronizar_diretorio,
+)
+
+MANIFESTO = "manifesto.xml"
+
+SUFIXO = ".xml.gz"
+
+# atributos que identificam o conteúdo de um segmento arquivado
+ATRIBUTOS_CONTEUDO = ("dia", "inicio", "fim", "leituras", "comandos")
+
+# elementos do histórico dentro de um segmento
+REGISTROS = ("leitura", "comando")
+
+
+class ArquivoHistorico:
+    """
+    Arquivo morto do histórico: segmentos retirados do armazém pela
+    retenção, guardados compactados (gzip) e ainda válidos pelo
+    segmentos.xsd. Um manifesto próprio, no mesmo formato do armazém,
+    lista cada arquivo com o segmento de origem, os limites de tempo e as
+    contagens; as consultas só descompactam os arquivos do intervalo.
+    Cada arquivo é gravado com os registros em ordem de dataHora, para
+    ser lido em streaming.
+
+    As escritas acontecem sob a trava de escrita do ArmazemSegmentos (ver
+    ArmazemSegmentos.arquivar); as leituras usam o cache do manifesto.
+    """
+
+    def __init__(self, diretorio: str, schema: etree.XMLSchema, parser: etree.XMLParser):
+        self.diretorio = diretorio
+        self.schema = schema
+        self.parser = parser
+        self.manifesto_path = os.path.join(diretorio, MANIFESTO)
+
+        os.makedirs(diretorio, exist_ok=True)
+        if not os.path.exists(self.manifesto_path):
+            escrever_xml(etree.ElementTree(etree.Element("manifesto")), self.manifesto_path)
+        self._manifesto = CacheDocumento(self.manifesto_path, parser, validar=schema.assertValid)
+
+    # Helpers internos
+
+    def _path(self, arquivo: str) -> str:
+        return os.path.join(self.diretorio, arquivo)
+
+    def _nome_livre(self, manifesto: etree._Element, origem: str) -> str:
+        """Nome para o arquivo de `origem` (o armazém reaproveita nomes de segmentos)."""
+        usados = {e.get("arquivo") for e in manifesto.iterfind("entrada")}
+        base = origem[: -len(".xml")] if origem.endswith(".xml") else origem
+        nome, n = base + SUFIXO, 0
+        while nome in usados:
+            n += 1
+            nome = f"{base}-{n}{SUFIXO}"
+        return nome
+
+    def _gravar_gzip(self, tree: etree._ElementTree, arquivo: str) -> None:
+        path = self._path(arquivo)
+        with open(path + ".tmp", "wb") as f:
+            with gzip.GzipFile(filename="", mode="wb", fileobj=f, mtime=0) as gz:
+                tree.write(gz, encoding="utf-8", xml_declaration=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def _em_ordem(tree: etree._ElementTree) -> etree._ElementTree:
+        """
+        O segmento com os registros de cada contêiner em ordem de dataHora
+        (estável); registros atrasados fazem uma cópia reordenada.
+        """
+        conteineres = [[tempo_elemento(el) for el in c] for c in tree.getroot()]
+        if all(t == sorted(t) for t in conteineres):
+            return tree
+        tree = copy.deepcopy(tree)
+        for conteiner in tree.getroot():
+            conteiner[:] = sorted(conteiner, key=tempo_elemento)
+        return tree
+
+    def _ler(self, arquivo: str) -> etree._ElementTree:
+        with gzip.open(self._path(arquivo), "rb") as f:
+            return etree.parse(f, parser=self.parser)
+
+    def _salvar_manifesto(self, manifesto: etree._ElementTree) -> None:
+        self.schema.assertValid(manifesto)
+        escrever_xml(manifesto, self.manifesto_path)
+        self._manifesto.instalar(manifesto)
+
+    # API
+
+    def guardar(self, segmentos: list[tuple[etree._Element, etree._ElementTree]]) -> None:
+        """
+        Arquiva segmentos, dados como (entrada do manifesto do armazém,
+        árvore). Primeiro os arquivos, depois o manifesto: se o armazém cair
+        antes de retirar os segmentos, o próximo arquivamento do mesmo
+        segmento (mesmo conteúdo) não o duplica.
+        """
+        manifesto = self._manifesto.copia()
+        root = manifesto.getroot()
+        novas = 0
+        for entrada, tree in segmentos:
+            origem = entrada.get("arquivo")
+            repetida = any(
+                e.get("origem") == origem
+                and all(e.get(a) == entrada.get(a) for a in ATRIBUTOS_CONTEUDO)
+                for e in root.iterfind("entrada")
+            )
+            if repetida:
+                continue
+            tree = self._em_ordem(tree)
+            self.schema.assertValid(tree)
+            arquivo = self._nome_livre(root, origem)
+            self._gravar_gzip(tree, arquivo)
+            etree.SubElement(
+                root,
+                "entrada",
+                arquivo=arquivo,
+                **{a: entrada.get(a) for a in ATRIBUTOS_CONTEUDO},
+                origem=origem,
+            )
+            novas += 1
+        if novas:
+            sincronizar_diretorio(self.diretorio)
+            self._salvar_manifesto(manifesto)
+
+    def entradas(
+        self, inicio: Optional[datetime] = None, fim: Optional[datetime] = None
+    ) -> list[dict]:
+        """Arquivos que intersectam [inicio, fim]: {arquivo, origem, dia, inicio, fim, leituras, comandos}."""
+        selecionadas = []
+        for e in self._manifesto.snapshot().getroot().iterfind("entrada"):
+            if fim is not None and parse_data_hora(e.get("inicio")) > fim:
+                continue
+            if inicio is not None and parse_data_hora(e.get("fim")) < inicio:
+                continue
+            item = {"arquivo": e.get("arquivo"), "origem": e.get("origem")}
+            item.update({a: e.get(a) for a in ATRIBUTOS_CONTEUDO})
+            item["leituras"], item["comandos"] = int(item["leituras"]), int(item["comandos"])
+            selecionadas.append(item)
+        return selecionadas
+
+    def total(self, campo: str) -> int:
+        """Total de "leituras" ou "comandos" arquivados."""
+        return sum(e[campo] for e in self.entradas())
+
+    def percorrer(
+        self,
+        tag: str,
+        inicio: Optional[datetime] = None,
+        fim: Optional[datetime] = None,
+        refs: Optional[Collection[str]] = None,
+    ) -> Iterator[tuple[int, etree._Element]]:
+        """
+        Pares (instante em epoch ms, elemento `tag`) arquivados em [inicio,
+        fim], opcionalmente só das referências `refs`, em ordem de
+        dataHora. Só os arquivos do intervalo são lidos, um de cada vez e
+        em streaming (iterparse; cada arquivo já está em ordem): os
+        elementos vistos saem da árvore e a leitura de um arquivo para no
+        primeiro registro depois de `fim`. Arquivos com períodos que se
+        sobrepõem são intercalados entre si; os demais, encadeados.
+        """
+        inicio_ms = epoch_ms(inicio) if inicio is not None else None
+        fim_ms = epoch_ms(fim) if fim is not None else None
+        refs = None if refs is None else set(refs)
+        atributo = REFERENCIAS[tag]
+
+        def trecho(arquivo: str):
+            with gzip.open(self._path(arquivo), "rb") as f:
+                for _, el in etree.iterparse(
+                    f, events=("end",), tag=REGISTROS, resolve_entities=False, no_network=True
+                ):
+                    # o outro tipo de registro também sai, para a árvore não crescer
+                    el.getparent().remove(el)
+                    if el.tag != tag or (refs is not None and el.get(atributo) not in refs):
+                        continue
+                    tempo = tempo_elemento(el)
+                    if fim_ms is not None and tempo > fim_ms:
+                        break
+                    if inicio_ms is not None and tempo < inicio_ms:
+                        continue
+                    el.tail = None
+                    yield tempo, el
+
+        def grupo(arquivos: list):
+            if len(arquivos) == 1:
+                return trecho(arquivos[0])
+            return heapq.merge(*(trecho(a) for a in arquivos), key=itemgetter(0))
+
+        # arquivos em ordem de início, agrupados enquanto os períodos se sobrepõem
+        campo = "leituras" if tag == "leitura" else "comandos"
+        grupos, fim_grupo = [], None
+        for e in sorted(
+            (e for e in self.entradas(inicio, fim) if e[campo]),
+            key=lambda e: parse_data_hora(e["inicio"]),
+        ):
+            if grupos and parse_data_hora(e["inicio"]) <= fim_grupo:
+                grupos[-1].append(e["arquivo"])
+                fim_grupo = max(fim_grupo, parse_data_hora(e["fim"]))
+            else:
+                grupos.append([e["arquivo"]])
+                fim_grupo = parse_data_hora(e["fim"])
+        return chain.from_iterable(grupo(arquivos) for arquivos in grupos)
+
+    def remover(self, conteiner: str) -> None:
+        """
+        Apaga "leituras" ou "comandos" de todos os arquivos (sob a trava
+        de escrita do armazém); arquivos que ficarem vazios somem.
+        """
+        manifesto = self._manifesto.copia()
+        root = manifesto.getroot()
+        apagar = []
+        for entrada in list(root.iterfind("entrada")):
+            if entrada.get(conteiner) == "0":
+                continue
+            tree = self._ler(entrada.get("arquivo"))
+            seg_root = tree.getroot()
+            seg_root.remove(seg_root.find(conteiner))
+            if not len(seg_root):
+                root.remove(entrada)
+                apagar.append(entrada.get("arquivo"))
+                continue
+            restantes = [parse_data_hora(d.text) for d in seg_root.iterfind("*/*/dataHora")]
+            self._gravar_gzip(tree, entrada.get("arquivo"))
+            entrada.set("inicio", formatar_data_hora(min(restantes)))
+            entrada.set("fim", formatar_data_hora(max(restantes)))
+            entrada.set(conteiner, "0")
+        self._salvar_manifesto(manifesto)
+        for arquivo in apagar:
+            os.remove(self._path(arquivo))
@@ -0,0 +1,196 @@
+"""
+Quadro binário compacto para envio de leituras pelos gateways.
+
+Layout (little-endian):
+
+    cabeçalho   "HFR1" | u32 comprimento | u8 escala | u16 n_sensores | u32 n_registros
+    sensores    n_sensores x (u8 tamanho | id em UTF-8)
+    índices     n_registros x u16   (posição do sensor no dicionário)
+    tempos      n_registros x i64   (epoch em milissegundos, UTC)
+    valores     n_registros x i32   (valor * 10^escala)
+
+`comprimento` conta os bytes depois do próprio campo, então vários quadros
+podem ser concatenados num mesmo corpo. As três colunas são lidas de uma vez
+com `array`, sem montar um dict por leitura.
+"""
+
+import struct
+import sys
+from array import array
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Iterable, Iterator, NamedTuple
+
+from backend.services.columnar import np
+
+MAGICO = b"HFR1"
+CONTENT_TYPE = "application/x-hidroponia-frame"
+
+_PREFIXO = struct.Struct("<4sI")
+_CABECALHO = struct.Struct("<BHI")
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# escala máxima aceita (casas decimais)
+ESCALA_MAXIMA = 9
+# tipos little-endian das colunas, para vetores NumPy
+_DTYPES = {"H": "<u2", "q": "<i8", "i": "<i4"}
+
+
+class Quadro(NamedTuple):
+    escala: int
+    sensores: list[str]
+    indices: array
+    tempos: array
+    valores: array
+
+
+def _coluna(tipo: str, dados: memoryview, inicio: int, n: int) -> tuple[array, int]:
+    col = array(tipo)
+    fim = inicio + n * col.itemsize
+    if fim > len(dados):
+        raise ValueError("Quadro binário truncado.")
+    col.frombytes(dados[inicio:fim])
+    if sys.byteorder != "little":
+        col.byteswap()
+    return col, fim
+
+
+def decodificar_quadros(dados: bytes) -> Iterator[Quadro]:
+    """
+    Lê os quadros concatenados em `dados`.
+    Lança ValueError se algum estiver malformado.
+    """
+    buf = memoryview(dados)
+    pos = 0
+    while pos < len(buf):
+        if len(buf) - pos < _PREFIXO.size + _CABECALHO.size:
+            raise ValueError("Quadro binário truncado.")
+        magico, comprimento = _PREFIXO.unpack_from(buf, pos)
+        if magico != MAGICO:
+            raise ValueError("Quadro binário inválido (assinatura).")
+        pos += _PREFIXO.size
+        fim_quadro = pos + comprimento
+        if fim_quadro > len(buf):
+            raise ValueError("Quadro binário truncado.")
+        quadro = buf[:fim_quadro]
+
+        escala, n_sensores, n_registros = _CABECALHO.unpack_from(quadro, pos)
+        if escala > ESCALA_MAXIMA:
+            raise ValueError(f"Escala inválida no quadro: {escala}")
+        pos += _CABECALHO.size
+
+        sensores = []
+        for _ in range(n_sensores):
+            if pos >= fim_quadro:
+                raise ValueError("Quadro binário truncado.")
+            tamanho = quadro[pos]
+            pos += 1
+            if pos + tamanho > fim_quadro:
+                raise ValueError("Quadro binário truncado.")
+            sensores.append(bytes(quadro[pos : pos + tamanho]).decode("utf-8"))
+            pos += tamanho
+
+        indices, pos = _coluna("H", quadro, pos, n_registros)
+        tempos, pos = _coluna("q", quadro, pos, n_registros)
+        valores, pos = _coluna("i", quadro, pos, n_registros)
+        if pos != fim_quadro:
+            raise ValueError("Comprimento do quadro não confere com o conteúdo.")
+        if n_registros and max(indices) >= n_sensores:
+            raise ValueError("Índice de sensor fora do dicionário.")
+
+        yield Quadro(escala, sensores, indices, tempos, valores)
+
+
+def contar_registros(dados: bytes) -> int:
+    """Soma n_registros dos quadros lendo só os cabeçalhos."""
+    total = 0
+    pos = 0
+    while pos + _PREFIXO.size + _CABECALHO.size <= len(dados):
+        magico, comprimento = _PREFIXO.unpack_from(dados, pos)
+        if magico != MAGICO:
+            break
+        total += _CABECALHO.unpack_from(dados, pos + _PREFIXO.size)[2]
+        pos += _PREFIXO.size + comprimento
+    return total
+
+
+def epoch_ms_para_datetime(ms: int) -> datetime:
+    """Lança OverflowError se estiver fora da faixa de datetime."""
+    return _EPOCH + timedelta(milliseconds=ms)
+
+
+def valor_para_texto(valor: int, escala: int) -> str:
+    """Inteiro escalado -> texto xs:decimal (sem notação científica)."""
+    return format(Decimal(valor).scaleb(-escala), "f")
+
+
+# Codificador de referência (testes, simulador, gateways em Python)
+
+def codificar_quadro(leituras: Iterable, escala: int = 2) -> bytes:
+    """
+    Monta um quadro a partir de tuplas (sensorId, dataHora, valor), em que
+    dataHora é datetime (sem fuso = UTC) ou epoch em milissegundos e valor
+    é número/Decimal, arredondado para `escala` casas.
+    """
+    if not 0 <= escala <= ESCALA_MAXIMA:
+        raise ValueError(f"Escala deve estar entre 0 e {ESCALA_MAXIMA}.")
+
+    posicoes: dict[str, int] = {}
+    indices, tempos, valores = array("H"), array("q"), array("i")
+    fator = Decimal(10) ** escala
+
+    for sensor_id, data_hora, valor in leituras:
+        if sensor_id not in posicoes:
+            if len(posicoes) >= 0xFFFF:
+                raise ValueError("Sensores demais em um quadro.")
+            posicoes[sensor_id] = len(posicoes)
+        indices.append(posicoes[sensor_id])
+
+        if isinstance(data_hora, datetime):
+            if data_hora.tzinfo is None:
+                data_hora = data_hora.replace(tzinfo=timezone.utc)
+            data_hora = (data_hora - _EPOCH) // timedelta(milliseconds=1)
+        tempos.append(int(data_hora))
+
+        escalado = int((Decimal(str(valor)) * fator).to_integral_value())
+        if not -(2**31) <= escalado < 2**31:
+            raise ValueError(f"Valor fora da faixa para escala {escala}: {valor}")
+        valores.append(escalado)
+
+    return codificar_colunas(list(posicoes), indices, tempos, valores, escala)
+
+
+def codificar_colunas(sensores: list, indices, tempos, valores, escala: int = 2) -> bytes:
+    """
+    Monta um quadro direto das colunas, sem passar por uma tupla por
+    leitura (gerador de carga): `sensores` é o dicionário de IDs e
+    indices/tempos/valores, sequências do mesmo tamanho (array ou vetor
+    NumPy) com a posição no dicionário, o epoch em milissegundos e o valor
+    já multiplicado por 10^escala.
+    """
+    if not 0 <= escala <= ESCALA_MAXIMA:
+        raise ValueError(f"Escala deve estar entre 0 e {ESCALA_MAXIMA}.")
+    if len(sensores) > 0xFFFF:
+        raise ValueError("Sensores demais em um quadro.")
+    if not len(indices) == len(tempos) == len(valores):
+        raise ValueError("Colunas de tamanhos diferentes.")
+
+    partes = [_CABECALHO.pack(escala, len(sensores), len(indices))]
+    for sensor_id in sensores:
+        nome = sensor_id.encode("utf-8")
+        if len(nome) > 0xFF:
+            raise ValueError(f"ID de sensor longo demais: {sensor_id}")
+        partes.append(bytes([len(nome)]) + nome)
+
+    for col, tipo in ((indices, "H"), (tempos, "q"), (valores, "i")):
+        if np is not None and isinstance(col, np.ndarray):
+            partes.append(col.astype(_DTYPES[tipo], copy=False).tobytes())
+            continue
+        if not isinstance(col, array) or col.typecode != tipo or sys.byteorder != "little":
+            col = array(tipo, col)
+            if sys.byteorder != "little":
+                col.byteswap()
+        partes.append(col.tobytes())
+
+    corpo = b"".join(partes)
+    return _PREFIXO.pack(MAGICO, len(corpo)) + corpo
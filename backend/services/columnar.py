@@ -0,0 +1,260 @@
+import mmap
+import os
+import threading
+from array import array
+from typing import Iterable, NamedTuple, Optional
+
+from lxml import etree
+
+from backend.services.interprocess import TravaArquivo
+from backend.services.time_index import tempo_elemento
+
+try:
+    import numpy as np
+except ImportError:  # opcional: sem NumPy as varreduras usam memoryview/array
+    np = None
+
+# coluna -> (arquivo, formato do array/memoryview)
+COLUNAS = {
+    "tempos": ("tempos.i64", "q"),
+    "sensores": ("sensores.i32", "i"),
+    "valores": ("valores.f64", "d"),
+}
+
+# um sensorRef por linha; o número da linha é o índice usado na coluna "sensores"
+ARQUIVO_NOMES = "sensores.txt"
+
+ARQUIVO_TRAVA = "colunar.lock"
+
+
+def linhas_de_leituras(leituras: Iterable[etree._Element]) -> list[tuple[int, str, float]]:
+    """(instante epoch ms, sensorRef, valor) de elementos <leitura>; sem valor numérico ficam de fora."""
+    linhas = []
+    for el in leituras:
+        try:
+            linhas.append((tempo_elemento(el), el.get("sensorRef"), float(el.findtext("valor"))))
+        except Exception:
+            continue
+    return linhas
+
+
+class Colunas(NamedTuple):
+    """
+    Colunas mapeadas em memória (somente leitura): arrays NumPy, se
+    instalado, ou memoryviews. `nomes[sensores[i]]` é o sensorRef da linha i.
+    `geracao` muda quando o armazém é refeito (as linhas antigas deixam de valer).
+    """
+
+    tempos: object
+    sensores: object
+    valores: object
+    nomes: list
+    geracao: int = 0
+
+    def __len__(self) -> int:
+        return len(self.tempos)
+
+
+class ArmazemColunar:
+    """
+    Cópia colunar das leituras, ao lado do XML: três arquivos binários de
+    largura fixa (instante epoch ms int64, índice do sensor int32, valor
+    float64), só com append, lidos via mmap. Serve análises que varrem
+    muitas leituras sem reparsear XML nem converter texto em número.
+
+    O histórico XML continua sendo a fonte da verdade: o armazém pode ser
+    refeito a partir dele (`reconstruir`). Várias threads e processos
+    podem anexar; a escrita é serializada por uma trava de arquivo.
+    """
+
+    def __init__(self, diretorio: str):
+        self.diretorio = diretorio
+        os.makedirs(diretorio, exist_ok=True)
+        self._trava = TravaArquivo(os.path.join(diretorio, ARQUIVO_TRAVA))
+        self._lock = threading.Lock()
+
+        self._nomes: list[str] = []
+        self._indices: dict[str, int] = {}
+        self._versao_nomes = None
+        # coluna -> (inode, tamanho mapeado, mmap)
+        self._mapas: dict[str, tuple[int, int, Optional[mmap.mmap]]] = {}
+
+        with self._trava:
+            self._recuperar()
+
+    # Helpers internos
+
+    def _path(self, arquivo: str) -> str:
+        return os.path.join(self.diretorio, arquivo)
+
+    def _linhas_em_disco(self) -> int:
+        """Linhas completas: o mínimo entre as colunas (uma queda pode deixar sobras)."""
+        linhas = []
+        for arquivo, formato in COLUNAS.values():
+            try:
+                tamanho = os.path.getsize(self._path(arquivo))
+            except FileNotFoundError:
+                tamanho = 0
+            linhas.append(tamanho // array(formato).itemsize)
+        return min(linhas)
+
+    def _recuperar(self) -> None:
+        """Corta as colunas no mesmo número de linhas (sob a trava)."""
+        linhas = self._linhas_em_disco()
+        for arquivo, formato in COLUNAS.values():
+            with open(self._path(arquivo), "ab") as f:
+                f.truncate(linhas * array(formato).itemsize)
+        self._carregar_nomes()
+
+    def _carregar_nomes(self) -> None:
+        with open(self._path(ARQUIVO_NOMES), "a+b") as f:
+            st = os.fstat(f.fileno())
+            if (st.st_ino, st.st_size) == self._versao_nomes:
+                return
+            f.seek(0)
+            dados = f.read()
+        # só linhas completas (uma escrita de outro processo pode estar no meio)
+        dados = dados[: dados.rfind(b"\n") + 1]
+        self._nomes = dados.decode("utf-8").splitlines()
+        self._indices = {nome: i for i, nome in enumerate(self._nomes)}
+        self._versao_nomes = (st.st_ino, len(dados))
+
+    def _indice_sensor(self, sensor: str, novos: list) -> int:
+        """Índice do sensor (sob a trava); sensores novos vão para `novos`."""
+        indice = self._indices.get(sensor)
+        if indice is None:
+            indice = len(self._nomes)
+            self._nomes.append(sensor)
+            self._indices[sensor] = indice
+            novos.append(sensor)
+        return indice
+
+    def _gravar(self, linhas: Iterable[tuple[int, str, float]]) -> int:
+        """Acrescenta linhas (sob a trava). Retorna quantas foram gravadas."""
+        self._recuperar()
+        tempos, sensores, valores = array("q"), array("i"), array("d")
+        novos: list[str] = []
+        for tempo, sensor, valor in linhas:
+            tempos.append(tempo)
+            sensores.append(self._indice_sensor(sensor, novos))
+            valores.append(valor)
+        if not tempos:
+            return 0
+
+        if novos:
+            dados = "".join(f"{nome}\n" for nome in novos).encode("utf-8")
+            with open(self._path(ARQUIVO_NOMES), "ab") as f:
+                f.write(dados)
+                st = os.fstat(f.fileno())
+            self._versao_nomes = (st.st_ino, st.st_size)
+        for nome, coluna in (("tempos", tempos), ("sensores", sensores), ("valores", valores)):
+            with open(self._path(COLUNAS[nome][0]), "ab") as f:
+                coluna.tofile(f)
+        return len(tempos)
+
+    def _mapa(self, nome: str, linhas: int):
+        """Coluna `nome` mapeada em memória com `linhas` linhas."""
+        arquivo, formato = COLUNAS[nome]
+        tamanho = linhas * array(formato).itemsize
+        with open(self._path(arquivo), "rb") as f:
+            ino = os.fstat(f.fileno()).st_ino
+            atual = self._mapas.get(nome)
+            if atual is None or atual[0] != ino or atual[1] < tamanho:
+                # cresceu ou foi refeito: novo mapeamento (o antigo é
+                # liberado quando ninguém mais usar as colunas dele)
+                mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if tamanho else None
+                atual = (ino, tamanho, mapa)
+                self._mapas[nome] = atual
+        mapa = atual[2]
+        if mapa is None:
+            return np.empty(0, dtype=formato) if np is not None else memoryview(array(formato))
+        if np is not None:
+            return np.frombuffer(mapa, dtype=formato, count=linhas)
+        return memoryview(mapa)[:tamanho].cast(formato)
+
+    # API
+
+    def anexar(self, linhas: Iterable[tuple[int, str, float]]) -> int:
+        """Acrescenta linhas (instante epoch ms, sensorRef, valor)."""
+        with self._lock, self._trava:
+            return self._gravar(linhas)
+
+    def anexar_leituras(self, leituras: Iterable[etree._Element]) -> int:
+        """Acrescenta elementos <leitura> (sem valor numérico são ignorados)."""
+        return self.anexar(linhas_de_leituras(leituras))
+
+    def reconstruir(self, linhas: Iterable[tuple[int, str, float]]) -> int:
+        """Descarta tudo e grava `linhas` (ex.: refeito a partir do histórico XML)."""
+        with self._lock, self._trava:
+            # arquivos novos (rename), e não truncados: mmaps abertos, aqui ou
+            # em outros processos, continuam válidos sobre os arquivos antigos
+            for arquivo in [a for a, _ in COLUNAS.values()] + [ARQUIVO_NOMES]:
+                with open(self._path(arquivo) + ".tmp", "wb"):
+                    pass
+                os.replace(self._path(arquivo) + ".tmp", self._path(arquivo))
+            self._nomes, self._indices, self._versao_nomes = [], {}, None
+            self._mapas.clear()
+            return self._gravar(linhas)
+
+    def total(self) -> int:
+        return self._linhas_em_disco()
+
+    def colunas(self) -> Colunas:
+        """Snapshot das colunas: as linhas gravadas até agora, via mmap."""
+        with self._lock:
+            linhas = self._linhas_em_disco()
+            self._carregar_nomes()
+            tempos = self._mapa("tempos", linhas)
+            return Colunas(
+                tempos,
+                self._mapa("sensores", linhas),
+                self._mapa("valores", linhas),
+                list(self._nomes),
+                self._mapas["tempos"][0],
+            )
+
+    def varrer(
+        self,
+        inicio: Optional[int] = None,
+        fim: Optional[int] = None,
+        sensor: Optional[str] = None,
+    ) -> tuple:
+        """
+        (instantes, valores) das leituras com inicio <= instante <= fim
+        (epoch ms), opcionalmente de um sensor, na ordem em que foram
+        gravadas. Com NumPy, filtro vetorizado por máscara.
+        """
+        cols = self.colunas()
+        if sensor is not None and sensor not in cols.nomes:
+            return ([], []) if np is None else (cols.tempos[:0], cols.valores[:0])
+        indice = cols.nomes.index(sensor) if sensor is not None else None
+
+        if np is not None:
+            mascara = np.ones(len(cols), dtype=bool)
+            if indice is not None:
+                mascara &= cols.sensores == indice
+            if inicio is not None:
+                mascara &= cols.tempos >= inicio
+            if fim is not None:
+                mascara &= cols.tempos <= fim
+            return cols.tempos[mascara], cols.valores[mascara]
+
+        tempos, valores = [], []
+        for t, s, v in zip(cols.tempos, cols.sensores, cols.valores):
+            if indice is not None and s != indice:
+                continue
+            if (inicio is not None and t < inicio) or (fim is not None and t > fim):
+                continue
+            tempos.append(t)
+            valores.append(v)
+        return tempos, valores
+
+    def fechar(self) -> None:
+        with self._lock:
+            for _, _, mapa in self._mapas.values():
+                if mapa is not None:
+                    try:
+                        mapa.close()
+                    except BufferError:
+                        pass  # ainda há views em uso; liberado pelo GC
+            self._mapas.clear()
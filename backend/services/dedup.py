@@ -0,0 +1,319 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import timedelta
+from typing import Iterable, Optional
+
+from lxml import etree
+
+from backend.services.columnar import Colunas
+from backend.services.interprocess import TravaArquivo
+from backend.services.time_index import tempo_elemento
+
+
+def chave_registro(el: etree._Element) -> Optional[tuple]:
+    """
+    Chave de deduplicação de um <leitura> ou <comando>:
+    (tag, sensor/atuador, instante em epoch ms, valor/ação), com data e
+    valor normalizados ("6.50" == "6.5", "...Z" == "...+00:00"). O valor
+    é o float gravado nas colunas, para que as chaves lidas de lá
+    (IndiceRecentes.sincronizar) coincidam com as da entrada.
+    Retorna None se o elemento não tiver data/valor legíveis.
+    """
+    try:
+        tempo = tempo_elemento(el)
+    except Exception:
+        return None
+
+    if el.tag == "leitura":
+        try:
+            valor = float(el.findtext("valor"))
+        except (TypeError, ValueError):
+            return None
+        return ("leitura", el.get("sensorRef"), tempo, valor)
+    return ("comando", el.get("atuadorRef"), tempo, el.findtext("acao"))
+
+
+class IndiceRecentes:
+    """
+    Índice em memória (hash) dos registros recentes do histórico, para
+    descartar duplicatas na entrada.
+
+    Guarda as chaves cujo instante está dentro de `janela` do registro mais
+    recente visto, até `max_chaves` (as mais antigas saem primeiro).
+    Registros mais velhos que a janela não são conferidos.
+
+    As leituras gravadas por outros processos chegam pelo armazém colunar
+    (`sincronizar`, como os Rollups); quem grava chama sincronizar e
+    reservar sob a trava de escrita entre processos, de modo que a
+    conferência vale para todos os workers.
+    """
+
+    def __init__(self, janela: timedelta, max_chaves: int):
+        self.janela = janela
+        self.max_chaves = max_chaves
+        self._janela_ms = int(janela.total_seconds() * 1000)
+        self._lock = threading.Lock()
+        self._chaves: set = set()
+        self._ordem: deque = deque()
+        self._mais_recente: Optional[int] = None
+        self._lidas = 0
+        self._geracao = None
+        self.duplicatas = 0
+
+    def _evictar(self) -> None:
+        corte = self._mais_recente - self._janela_ms
+        while self._ordem and (
+            len(self._ordem) > self.max_chaves or self._ordem[0][2] < corte
+        ):
+            self._chaves.discard(self._ordem.popleft())
+
+    def _inserir(self, chave: tuple) -> None:
+        self._chaves.add(chave)
+        self._ordem.append(chave)
+        if self._mais_recente is None or chave[2] > self._mais_recente:
+            self._mais_recente = chave[2]
+
+    def carregar(self, elementos: Iterable[etree._Element]) -> None:
+        """Popula o índice com registros já gravados (inicialização)."""
+        with self._lock:
+            for el in elementos:
+                chave = chave_registro(el)
+                if chave is not None and chave not in self._chaves:
+                    self._inserir(chave)
+            if self._mais_recente is not None:
+                self._evictar()
+
+    def sincronizar(self, colunas: Colunas, desde: Optional[int] = None) -> int:
+        """
+        Registra as leituras das colunas ainda não vistas, inclusive as de
+        outros processos; com `desde` (epoch ms), ignora as anteriores a
+        ele. Se o armazém foi refeito, as chaves de leitura são relidas.
+        Retorna quantas linhas foram lidas.
+        """
+        with self._lock:
+            if colunas.geracao != self._geracao or len(colunas) < self._lidas:
+                self._remover_tag("leitura")
+                self._lidas = 0
+                self._geracao = colunas.geracao
+            inicio, fim = self._lidas, len(colunas)
+            nomes = colunas.nomes
+            for tempo, sensor, valor in zip(
+                colunas.tempos[inicio:fim].tolist(),
+                colunas.sensores[inicio:fim].tolist(),
+                colunas.valores[inicio:fim].tolist(),
+            ):
+                if desde is not None and tempo < desde:
+                    continue
+                if self._mais_recente is not None and tempo < self._mais_recente - self._janela_ms:
+                    continue
+                chave = ("leitura", nomes[sensor], tempo, valor)
+                if chave not in self._chaves:
+                    self._inserir(chave)
+                    if len(self._ordem) > self.max_chaves:
+                        self._evictar()
+            if self._mais_recente is not None:
+                self._evictar()
+            self._lidas = fim
+            return fim - inicio
+
+    def reservar(self, elementos: Iterable[etree._Element]) -> tuple[list, list, list]:
+        """
+        Separa novos e duplicados (inclusive repetidos dentro do próprio
+        lote) e já registra as chaves dos novos, atomicamente.
+        Retorna (novos, duplicados, chaves reservadas); se a gravação
+        falhar, as chaves devem ser devolvidas com liberar().
+        """
+        novos, duplicados, reservadas = [], [], []
+        with self._lock:
+            for el in elementos:
+                chave = chave_registro(el)
+                if chave is None:
+                    novos.append(el)
+                    continue
+                if chave in self._chaves:
+                    duplicados.append(el)
+                    continue
+                self._inserir(chave)
+                reservadas.append(chave)
+                novos.append(el)
+            self.duplicatas += len(duplicados)
+            if self._mais_recente is not None:
+                self._evictar()
+        return novos, duplicados, reservadas
+
+    def liberar(self, chaves: list) -> None:
+        if not chaves:
+            return
+        with self._lock:
+            liberadas = set(chaves)
+            self._chaves -= liberadas
+            self._ordem = deque(c for c in self._ordem if c not in liberadas)
+
+    def _remover_tag(self, tag: str) -> None:
+        self._chaves = {c for c in self._chaves if c[0] != tag}
+        self._ordem = deque(c for c in self._ordem if c[0] != tag)
+
+    def limpar(self, tag: Optional[str] = None) -> None:
+        """Esquece as chaves de um tipo ("leitura"/"comando"), ou todas."""
+        with self._lock:
+            if tag is None:
+                self._chaves.clear()
+                self._ordem.clear()
+                self._mais_recente = None
+                return
+            self._remover_tag(tag)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._chaves)
+
+
+class ChavesIdempotencia:
+    """
+    Respostas já dadas a lotes com chave de idempotência, por `ttl`
+    segundos (no máximo `max_chaves`, LRU). Um reenvio com a mesma chave
+    recebe a resposta original em vez de gravar o lote de novo.
+
+    As chaves ficam num log compartilhado entre processos (`path`, uma
+    linha JSON por mudança de estado, gravada sob trava de arquivo): cada
+    consulta aplica antes as linhas que outros workers acrescentaram, então
+    um reenvio que cai em outro processo também é reconhecido. Quando o
+    log passa de 2 × max_chaves linhas, é reescrito só com as chaves vivas.
+
+    Uma chave em andamento só vale por `prazo` segundos: se o processo que
+    a iniciou caiu antes de concluir ou cancelar, um reenvio depois disso
+    é tratado como novo, em vez de receber 409 até o fim do `ttl`.
+    """
+
+    EM_ANDAMENTO = object()
+
+    def __init__(self, path: str, ttl: float, max_chaves: int, prazo: float):
+        self.path = path
+        self.ttl = ttl
+        self.max_chaves = max_chaves
+        self.prazo = prazo
+        self._trava = TravaArquivo(path + ".lock")
+        self._itens: OrderedDict = OrderedDict()
+        # posição do log já aplicada, inode lido e linhas no arquivo
+        self._lido_ate = 0
+        self._ino = None
+        self._linhas = 0
+
+    # Helpers internos (sob a trava)
+
+    def _ler(self) -> None:
+        """Aplica as linhas acrescentadas desde a última leitura do log."""
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            self._itens.clear()
+            self._ino, self._lido_ate, self._linhas = None, 0, 0
+            return
+        with f:
+            ino = os.fstat(f.fileno()).st_ino
+            if ino != self._ino:
+                # reescrito por outro processo: relê do início
+                self._itens.clear()
+                self._ino, self._lido_ate, self._linhas = ino, 0, 0
+            f.seek(self._lido_ate)
+            for linha in f:
+                if not linha.endswith(b"\n"):
+                    break  # queda no meio de uma gravação
+                self._lido_ate += len(linha)
+                self._linhas += 1
+                try:
+                    chave, instante, resposta = json.loads(linha)
+                except ValueError:
+                    continue
+                self._aplicar(chave, instante, resposta)
+
+    def _aplicar(self, chave: str, instante: float, resposta) -> None:
+        self._itens.pop(chave, None)
+        if resposta is None:
+            return  # cancelada
+        if resposta == "andamento":
+            resposta = self.EM_ANDAMENTO
+        else:
+            resposta = tuple(resposta)
+        self._itens[chave] = (instante, resposta)
+
+    def _linha(self, chave: str, instante: float, resposta) -> tuple[bytes, object]:
+        """Linha do log e valor gravado (JSON) para o estado `resposta`."""
+        valor = "andamento" if resposta is self.EM_ANDAMENTO else resposta
+        linha = json.dumps([chave, instante, valor], ensure_ascii=False).encode("utf-8")
+        return linha + b"\n", valor
+
+    def _anotar(self, chave: str, resposta) -> None:
+        """Grava a mudança de estado no log e aplica na memória (None = cancelada)."""
+        instante = time.time()
+        linha, valor = self._linha(chave, instante, resposta)
+        with open(self.path, "ab") as f:
+            f.write(linha)
+            self._ino = os.fstat(f.fileno()).st_ino
+        self._lido_ate += len(linha)
+        self._linhas += 1
+        self._aplicar(chave, instante, valor)
+        if self._linhas > 2 * self.max_chaves:
+            self._compactar()
+
+    def _compactar(self) -> None:
+        """Reescreve o log só com as chaves vivas (arquivo novo + rename)."""
+        self._expirar(time.time())
+        dados = b"".join(
+            self._linha(chave, instante, resposta)[0]
+            for chave, (instante, resposta) in self._itens.items()
+        )
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(dados)
+        os.replace(tmp, self.path)
+        self._ino = os.stat(self.path).st_ino
+        self._lido_ate, self._linhas = len(dados), len(self._itens)
+
+    def _vencida(self, instante: float, resposta, agora: float) -> bool:
+        limite = self.prazo if resposta is self.EM_ANDAMENTO else self.ttl
+        return agora - instante >= limite
+
+    def _expirar(self, agora: float) -> None:
+        while self._itens:
+            chave, (instante, resposta) = next(iter(self._itens.items()))
+            vencida = self._vencida(instante, resposta, agora)
+            if len(self._itens) <= self.max_chaves and not vencida:
+                break
+            if resposta is self.EM_ANDAMENTO and not vencida:
+                break
+            self._itens.popitem(last=False)
+
+    # API
+
+    def iniciar(self, chave: str):
+        """
+        Registra a chave como em andamento. Retorna None se ela é nova,
+        EM_ANDAMENTO se outro envio com a mesma chave (deste ou de outro
+        processo) ainda está sendo gravado, ou a resposta guardada do
+        envio original.
+        """
+        with self._trava:
+            self._ler()
+            agora = time.time()
+            self._expirar(agora)
+            item = self._itens.get(chave)
+            if item is not None and not self._vencida(*item, agora):
+                return item[1]
+            self._anotar(chave, self.EM_ANDAMENTO)
+            return None
+
+    def concluir(self, chave: str, resposta) -> None:
+        """Guarda a resposta (serializável em JSON) dada ao envio."""
+        with self._trava:
+            self._ler()
+            self._anotar(chave, resposta)
+
+    def cancelar(self, chave: str) -> None:
+        """Esquece a chave (o envio falhou e pode ser repetido)."""
+        with self._trava:
+            self._ler()
+            self._anotar(chave, None)
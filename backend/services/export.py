@@ -0,0 +1,135 @@
+"""
+Apoio às exportações em streaming: o documento sai em blocos de bytes,
+gerados conforme os registros são lidos, sem montar a saída inteira.
+"""
+
+import csv
+import json
+import zlib
+from typing import Iterable, Iterator
+
+# bytes acumulados antes de entregar um bloco à resposta
+TAMANHO_BLOCO = 64 * 1024
+
+
+class BlocosSaida:
+    """
+    Destino de escrita (ex.: etree.xmlfile) que só acumula bytes; quem
+    gera a exportação retira os blocos prontos e os entrega à resposta.
+    """
+
+    def __init__(self, tamanho_bloco: int | None = None):
+        self.tamanho_bloco = tamanho_bloco or TAMANHO_BLOCO
+        self._partes: list[bytes] = []
+        self._tamanho = 0
+
+    def write(self, dados) -> int:
+        if isinstance(dados, str):
+            dados = dados.encode("utf-8")
+        self._partes.append(dados)
+        self._tamanho += len(dados)
+        return len(dados)
+
+    def cheio(self) -> bool:
+        return self._tamanho >= self.tamanho_bloco
+
+    def retirar(self) -> bytes:
+        """O que foi escrito desde a última retirada."""
+        dados = b"".join(self._partes)
+        self._partes.clear()
+        self._tamanho = 0
+        return dados
+
+
+# Formatos tabulares (uma linha por leitura)
+
+FORMATOS = ("xml", "csv", "ndjson")
+
+COMPRESSOES = ("gzip",)
+
+# colunas de csv/ndjson, na ordem padrão; as linhas chegam como tuplas nessa ordem
+COLUNAS_LEITURA = ("sensorId", "tipo", "dataHora", "valor", "unidade")
+
+# colunas que saem como número no ndjson (no csv, o texto do XML, exato)
+COLUNAS_NUMERICAS = ("valor",)
+
+
+def selecionar_colunas(texto: str | None) -> tuple[str, ...]:
+    """
+    Colunas pedidas ("sensorId,valor"), na ordem pedida; todas se vazio.
+    Lança ValueError com a mensagem para o cliente.
+    """
+    if not texto:
+        return COLUNAS_LEITURA
+    colunas = tuple(c.strip() for c in texto.split(",") if c.strip())
+    invalidas = [c for c in colunas if c not in COLUNAS_LEITURA]
+    if invalidas or not colunas or len(set(colunas)) != len(colunas):
+        raise ValueError(
+            f"Colunas inválidas: {', '.join(invalidas) or texto}. "
+            f"Use: {', '.join(COLUNAS_LEITURA)}."
+        )
+    return colunas
+
+
+def _posicoes(colunas: tuple[str, ...]) -> list[int]:
+    return [COLUNAS_LEITURA.index(c) for c in colunas]
+
+
+def blocos_csv(linhas: Iterable[tuple], colunas: tuple[str, ...]) -> Iterator[bytes]:
+    """CSV com cabeçalho, em blocos de bytes (UTF-8)."""
+    saida = BlocosSaida()
+    escritor = csv.writer(saida, lineterminator="\n")
+    escritor.writerow(colunas)
+    posicoes = _posicoes(colunas)
+    for linha in linhas:
+        escritor.writerow([linha[i] for i in posicoes])
+        if saida.cheio():
+            yield saida.retirar()
+    yield saida.retirar()
+
+
+def blocos_ndjson(linhas: Iterable[tuple], colunas: tuple[str, ...]) -> Iterator[bytes]:
+    """Um objeto JSON por linha, em blocos de bytes (UTF-8)."""
+    saida = BlocosSaida()
+    posicoes = list(zip(colunas, _posicoes(colunas)))
+    numericas = [c in COLUNAS_NUMERICAS for c in colunas]
+    for linha in linhas:
+        objeto = {}
+        for (coluna, i), numerica in zip(posicoes, numericas):
+            valor = linha[i]
+            objeto[coluna] = float(valor) if numerica and valor is not None else valor
+        saida.write(json.dumps(objeto, ensure_ascii=False))
+        saida.write(b"\n")
+        if saida.cheio():
+            yield saida.retirar()
+    yield saida.retirar()
+
+
+SERIALIZADORES = {"csv": blocos_csv, "ndjson": blocos_ndjson}
+
+
+def blocos_json_lista(itens: Iterable[dict]) -> Iterator[bytes]:
+    """
+    Array JSON em blocos de bytes (UTF-8), item a item. O primeiro item
+    sai sozinho, para a resposta começar sem esperar um bloco cheio.
+    """
+    saida = BlocosSaida()
+    saida.write(b"[")
+    for n, item in enumerate(itens):
+        if n:
+            saida.write(b",")
+        saida.write(json.dumps(item, ensure_ascii=False))
+        if n == 0 or saida.cheio():
+            yield saida.retirar()
+    saida.write(b"]")
+    yield saida.retirar()
+
+
+def comprimir_gzip(blocos: Iterable[bytes]) -> Iterator[bytes]:
+    """Comprime um fluxo de blocos no formato gzip, sem juntá-los."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for bloco in blocos:
+        dados = compressor.compress(bloco)
+        if dados:
+            yield dados
+    yield compressor.flush()
@@ -0,0 +1,180 @@
+import threading
+from array import array
+from bisect import bisect_right
+from typing import Optional
+
+from backend.services.columnar import Colunas, np
+
+
+class JanelaRecente:
+    """
+    Buffer circular com as últimas `capacidade` leituras de um sensor, em
+    dois arrays compactos (instante em epoch ms e valor float64), em ordem
+    de instante. Leituras atrasadas entram na posição certa; mais antigas
+    que todas as do buffer cheio são ignoradas.
+    """
+
+    __slots__ = ("capacidade", "tempos", "valores", "inicio", "tamanho")
+
+    def __init__(self, capacidade: int):
+        self.capacidade = capacidade
+        self.tempos = array("q", bytes(8 * capacidade))
+        self.valores = array("d", bytes(8 * capacidade))
+        # posição da leitura mais antiga e quantidade guardada
+        self.inicio = 0
+        self.tamanho = 0
+
+    def _pos(self, i: int) -> int:
+        return (self.inicio + i) % self.capacidade
+
+    def adicionar(self, tempo: int, valor: float) -> None:
+        if self.tamanho and tempo < self.tempos[self._pos(self.tamanho - 1)]:
+            self._inserir_fora_de_ordem(tempo, valor)
+            return
+        if self.tamanho < self.capacidade:
+            pos = self._pos(self.tamanho)
+            self.tamanho += 1
+        else:
+            # cheio: sobrescreve a mais antiga
+            pos = self.inicio
+            self.inicio = self._pos(1)
+        self.tempos[pos] = tempo
+        self.valores[pos] = valor
+
+    def _inserir_fora_de_ordem(self, tempo: int, valor: float) -> None:
+        if self.tamanho == self.capacidade and tempo < self.tempos[self.inicio]:
+            return
+        pares = self.pares()
+        i = bisect_right([t for t, _ in pares], tempo)
+        pares.insert(i, (tempo, valor))
+        self.inicio = self.tamanho = 0
+        for t, v in pares[-self.capacidade:]:
+            self.adicionar(t, v)
+
+    def estender(self, pares: list[tuple[int, float]]) -> None:
+        """
+        Acrescenta várias leituras de uma vez. Se alguma vier fora de ordem,
+        junta tudo numa só ordenação em vez de refazer o buffer a cada uma.
+        """
+        ultima = self.ultima()
+        anterior = ultima[0] if ultima is not None else None
+        em_ordem = True
+        for tempo, _ in pares:
+            if anterior is not None and tempo < anterior:
+                em_ordem = False
+                break
+            anterior = tempo
+        if em_ordem:
+            for tempo, valor in pares:
+                self.adicionar(tempo, valor)
+            return
+        # estável: no mesmo instante, a que chegou depois continua por último
+        todos = sorted(self.pares() + pares, key=lambda par: par[0])
+        self.inicio = self.tamanho = 0
+        for tempo, valor in todos[-self.capacidade:]:
+            self.adicionar(tempo, valor)
+
+    def pares(self) -> list[tuple[int, float]]:
+        """(instante, valor) da mais antiga para a mais recente."""
+        return [
+            (self.tempos[self._pos(i)], self.valores[self._pos(i)]) for i in range(self.tamanho)
+        ]
+
+    def ultimas(self, limite: Optional[int] = None) -> list[tuple[int, float]]:
+        """(instante, valor) da mais recente para a mais antiga."""
+        n = self.tamanho if limite is None else min(limite, self.tamanho)
+        return [
+            (self.tempos[self._pos(i)], self.valores[self._pos(i)])
+            for i in range(self.tamanho - 1, self.tamanho - 1 - n, -1)
+        ]
+
+    def ultima(self) -> Optional[tuple[int, float]]:
+        if not self.tamanho:
+            return None
+        pos = self._pos(self.tamanho - 1)
+        return self.tempos[pos], self.valores[pos]
+
+    def __len__(self) -> int:
+        return self.tamanho
+
+
+class BufferSensores:
+    """
+    Últimas leituras de cada sensor em memória (uma JanelaRecente por
+    sensorRef), mantidas a partir das colunas (`sincronizar`), como os
+    agregados: enxergam também o que os outros processos gravaram. Servem
+    as consultas de "agora" sem tocar no histórico.
+    """
+
+    def __init__(self, capacidade: int):
+        self.capacidade = capacidade
+        self._janelas: dict[str, JanelaRecente] = {}
+        self._lock = threading.Lock()
+        # linhas das colunas já lidas e geração do armazém a que se referem
+        self._lidas = 0
+        self._geracao = None
+
+    def _janela(self, sensor: str) -> JanelaRecente:
+        janela = self._janelas.get(sensor)
+        if janela is None:
+            janela = self._janelas[sensor] = JanelaRecente(self.capacidade)
+        return janela
+
+    def sincronizar(self, colunas: Colunas) -> int:
+        """
+        Acrescenta as linhas das colunas ainda não lidas, inclusive as de
+        outros processos. Se o armazém foi refeito, os buffers são
+        recarregados. Retorna quantas linhas foram lidas.
+        """
+        with self._lock:
+            if colunas.geracao != self._geracao or len(colunas) < self._lidas:
+                self._janelas.clear()
+                self._lidas = 0
+                self._geracao = colunas.geracao
+            inicio, fim = self._lidas, len(colunas)
+            if inicio == fim:
+                return 0
+            tempos = colunas.tempos[inicio:fim]
+            sensores = colunas.sensores[inicio:fim]
+            valores = colunas.valores[inicio:fim]
+            if np is not None:
+                tempos, sensores, valores = self._ultimas_numpy(tempos, sensores, valores)
+            # agrupadas por sensor: linhas de outros processos chegam intercaladas
+            por_sensor: dict[int, list[tuple[int, float]]] = {}
+            for tempo, sensor, valor in zip(tempos.tolist(), sensores.tolist(), valores.tolist()):
+                por_sensor.setdefault(sensor, []).append((tempo, valor))
+            nomes = colunas.nomes
+            for sensor, pares in por_sensor.items():
+                self._janela(nomes[sensor]).estender(pares)
+            self._lidas = fim
+            return fim - inicio
+
+    def _ultimas_numpy(self, tempos, sensores, valores):
+        """
+        Só as `capacidade` linhas mais recentes de cada sensor (as demais
+        sairiam do buffer de qualquer jeito), por sensor e em ordem de
+        instante: na carga inicial, evita passar linha a linha por todas.
+        """
+        tempos, sensores, valores = np.asarray(tempos), np.asarray(sensores), np.asarray(valores)
+        # estável: no mesmo instante, a última gravada continua por último
+        ordem = np.lexsort((tempos, sensores))
+        s = sensores[ordem]
+        fins = np.searchsorted(s, s, side="right")
+        manter = ordem[fins - np.arange(len(s)) <= self.capacidade]
+        return tempos[manter], sensores[manter], valores[manter]
+
+    def recentes(self, sensor: str, limite: Optional[int] = None) -> list[tuple[int, float]]:
+        with self._lock:
+            janela = self._janelas.get(sensor)
+            return janela.ultimas(limite) if janela is not None else []
+
+    def ultimas(self) -> dict[str, tuple[int, float]]:
+        """Leitura mais recente de cada sensor: {sensorRef: (instante, valor)}."""
+        with self._lock:
+            return {s: j.ultima() for s, j in self._janelas.items() if len(j)}
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._janelas.clear()
+            self._lidas = 0
+            self._geracao = None
@@ -0,0 +1,181 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+# quantidade de contadores no arquivo de versões (8 bytes cada)
+SLOTS_VERSAO = 1024
+
+
+class TravaArquivo:
+    """
+    Lock exclusivo entre processos (flock num arquivo de trava) e entre
+    threads do mesmo processo. Reentrante na mesma thread.
+
+        with trava:
+            ... seção crítica de escrita ...
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._profundidade = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._profundidade == 0:
+            try:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except BaseException:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._lock.release()
+                raise
+        self._profundidade += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._profundidade -= 1
+        if self._profundidade == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+
+class TravaLider:
+    """
+    Lock entre processos que fica com o primeiro que o obtém (flock sem
+    esperar) até ele terminar: os demais só tentam de novo. Serve para
+    escolher um único processo para tarefas que não podem se repetir em
+    cada worker.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd = None
+
+    def tentar(self) -> bool:
+        """True se este processo tem (ou acabou de obter) a trava."""
+        with self._lock:
+            if self._fd is not None:
+                return True
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            self._fd = fd
+            return True
+
+    def liberar(self) -> None:
+        with self._lock:
+            if self._fd is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+                os.close(self._fd)
+                self._fd = None
+
+
+class ContadorVersoes:
+    """
+    Contadores de versão compartilhados entre processos, num arquivo
+    pequeno mapeado em memória (mmap). Cada escrita em um arquivo de dados
+    incrementa o contador dele; quem tem o documento em cache só precisa
+    comparar o contador (uma leitura de memória) para saber se outro
+    processo escreveu.
+
+    Cada caminho ganha seu próprio contador na primeira vez que é usado,
+    anotado num registro ao lado (`<path>.nomes`, um caminho por linha: a
+    linha i usa o contador i), de modo que a escrita num arquivo não
+    invalida o cache de outro. Só quando todos os contadores já foram
+    distribuídos um caminho novo cai no contador do hash dele e pode
+    dividi-lo com outro, o que só causa uma revalidação a mais (e, por
+    isso, quem usa a paridade do contador como seqlock soma 1 e os demais
+    somam 2).
+    """
+
+    _FORMATO = struct.Struct("<Q")
+
+    def __init__(self, path: str, slots: int = SLOTS_VERSAO):
+        self.path = path
+        self.slots = slots
+        tamanho = slots * self._FORMATO.size
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            if os.fstat(fd).st_size < tamanho:
+                os.ftruncate(fd, tamanho)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            self._mapa = mmap.mmap(fd, tamanho)
+        finally:
+            os.close(fd)
+        self._trava = TravaArquivo(path + ".lock")
+
+        # registro caminho -> contador, e quanto dele já foi lido
+        self._registro_path = path + ".nomes"
+        self._posicoes: dict[str, int] = {}
+        self._registrados = 0
+        self._lidos = 0
+
+    def _ler_registro(self) -> None:
+        """Incorpora as linhas do registro gravadas desde a última leitura."""
+        try:
+            with open(self._registro_path, "rb") as f:
+                f.seek(self._lidos)
+                novos = f.read()
+        except FileNotFoundError:
+            return
+        # uma linha só conta depois de completa
+        novos = novos[:novos.rfind(b"\n") + 1]
+        for nome in novos.decode("utf-8").splitlines():
+            if self._registrados < self.slots:
+                self._posicoes.setdefault(nome, self._registrados * self._FORMATO.size)
+            self._registrados += 1
+        self._lidos += len(novos)
+
+    def _posicao(self, chave: str) -> int:
+        chave = os.path.abspath(chave)
+        pos = self._posicoes.get(chave)
+        if pos is not None:
+            return pos
+        with self._trava:
+            self._ler_registro()
+            pos = self._posicoes.get(chave)
+            if pos is not None:
+                return pos
+            if self._registrados >= self.slots:
+                # todos distribuídos: fica com o do hash
+                pos = (zlib.crc32(chave.encode("utf-8")) % self.slots) * self._FORMATO.size
+                self._posicoes[chave] = pos
+                return pos
+            linha = (chave + "\n").encode("utf-8")
+            fd = os.open(self._registro_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, linha)
+            finally:
+                os.close(fd)
+            pos = self._posicoes[chave] = self._registrados * self._FORMATO.size
+            self._registrados += 1
+            self._lidos += len(linha)
+            return pos
+
+    def ler(self, chave: str) -> int:
+        return self._FORMATO.unpack_from(self._mapa, self._posicao(chave))[0]
+
+    def incrementar(self, chave: str, passo: int = 1) -> int:
+        pos = self._posicao(chave)
+        with self._trava:
+            valor = self._FORMATO.unpack_from(self._mapa, pos)[0] + passo
+            self._FORMATO.pack_into(self._mapa, pos, valor)
+        return valor
+
+    def fechar(self) -> None:
+        self._mapa.close()
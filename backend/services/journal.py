@@ -0,0 +1,269 @@
+import logging
+import os
+import threading
+import zlib
+from typing import Callable, Iterable, Optional
+
+from lxml import etree
+
+from backend.services.interprocess import TravaArquivo
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    """
+    Journal (write-ahead log) do histórico.
+
+    Cada lote de leituras/comandos vira uma linha `<lsn> <crc32> <lote>` no
+    arquivo. Gravações concorrentes são agrupadas (group commit): uma única
+    thread "líder" grava tudo o que estiver na fila e faz um só fsync, e as
+    demais apenas esperam o seu lote ficar durável.
+
+    O arquivo pode ser compartilhado por vários processos: o líder grava sob
+    uma trava de arquivo (flock) e, antes, lê o que outros processos tenham
+    acrescentado (`_sincronizar`), de modo que os LSNs nunca se repetem e
+    cada processo enxerga os lotes de todos.
+
+    Os lotes já duráveis, mas ainda não incorporados aos segmentos pelo
+    checkpoint, ficam em memória (`lotes()`) para que as leituras os vejam.
+
+    `lsn_aplicado` informa o último LSN já incorporado (pelo checkpoint de
+    qualquer processo): depois que o arquivo é reescrito sem esses lotes,
+    é por ele que a numeração continua acima do que já foi aplicado.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        parser: etree.XMLParser,
+        lsn_aplicado: Callable[[], int] = lambda: 0,
+        fsync: bool = True,
+    ):
+        self.path = path
+        self.parser = parser
+        self.fsync = fsync
+        self.lsn_aplicado = lsn_aplicado
+        self.trava = TravaArquivo(path + ".lock")
+
+        self._cond = threading.Condition()
+        self._fila: list[etree._Element] = []
+        self._lotes: list[tuple[int, bytes, etree._Element]] = []
+        self._falhas: dict[int, Exception] = {}
+        self._resultados: dict[int, int] = {}
+        self._gravando = False
+        self._proximo_pedido = 1
+        self._pedido_processado = 0
+
+        # posição do arquivo já lida para a memória e o inode lido
+        self._lido_ate = 0
+        self._ino = None
+        self._ultimo_lsn = self._lsn_aplicado = lsn_aplicado()
+
+        with self.trava:
+            self._recuperar()
+            self._arquivo = open(self.path, "ab")
+
+    # Helpers internos
+
+    @staticmethod
+    def _formatar(lsn: int, lote: etree._Element) -> bytes:
+        corpo = etree.tostring(lote, encoding="utf-8")
+        return b"%d %08x %s\n" % (lsn, zlib.crc32(corpo), corpo)
+
+    def _ler_linhas(self, truncar: bool) -> None:
+        """
+        Lê as linhas completas a partir de `_lido_ate`. Com `truncar` (só
+        sob a trava), um final incompleto ou corrompido, resto de uma queda
+        no meio de uma gravação, é cortado do arquivo.
+        """
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            if st.st_ino != self._ino:
+                # arquivo reescrito (checkpoint de outro processo): relê do início
+                self._ino, self._lido_ate = st.st_ino, 0
+                self._lotes = [item for item in self._lotes if item[0] > self._lsn_aplicado]
+                conhecidos = {item[0] for item in self._lotes}
+            else:
+                conhecidos = None
+            f.seek(self._lido_ate)
+
+            for linha in f:
+                try:
+                    if not linha.endswith(b"\n"):
+                        raise ValueError("linha incompleta")
+                    lsn_txt, crc_txt, corpo = linha.rstrip(b"\n").split(b" ", 2)
+                    if zlib.crc32(corpo) != int(crc_txt, 16):
+                        raise ValueError("linha corrompida")
+                    lsn = int(lsn_txt)
+                    lote = etree.fromstring(corpo, parser=self.parser)
+                except Exception:
+                    if truncar:
+                        logger.warning("Journal: descartando final corrompido em %s", self.path)
+                        with open(self.path, "r+b") as g:
+                            g.truncate(self._lido_ate)
+                    break
+
+                self._lido_ate += len(linha)
+                self._ultimo_lsn = max(self._ultimo_lsn, lsn)
+                if lsn > self._lsn_aplicado and (conhecidos is None or lsn not in conhecidos):
+                    self._lotes.append((lsn, linha, lote))
+
+            self._lotes.sort(key=lambda item: item[0])
+
+    def _recuperar(self) -> None:
+        """
+        Relê o arquivo (replay): lotes com LSN > lsn_aplicado voltam para a
+        memória e um final corrompido é truncado.
+        """
+        self._ler_linhas(truncar=True)
+
+    def _sincronizar(self) -> None:
+        """
+        Traz para a memória o que outros processos acrescentaram (sob a
+        trava). Lotes que outro processo já incorporou e descartou do
+        arquivo nunca passam por aqui: o LSN aplicado garante que a
+        numeração siga acima deles.
+        """
+        self._ler_linhas(truncar=False)
+        self._ultimo_lsn = max(self._ultimo_lsn, self.lsn_aplicado())
+        if os.fstat(self._arquivo.fileno()).st_ino != self._ino:
+            self._arquivo.close()
+            self._arquivo = open(self.path, "ab")
+
+    def _gravar(self, pendentes: list) -> list:
+        """Grava os lotes (sob a trava) e devolve as entradas (lsn, linha, lote)."""
+        with self.trava:
+            with self._cond:
+                self._sincronizar()
+            entradas = []
+            for lote in pendentes:
+                self._ultimo_lsn += 1
+                lote.set("lsn", str(self._ultimo_lsn))
+                entradas.append((self._ultimo_lsn, self._formatar(self._ultimo_lsn, lote), lote))
+
+            inicio = self._arquivo.tell()
+            dados = b"".join(linha for _, linha, _ in entradas)
+            try:
+                self._arquivo.write(dados)
+                self._arquivo.flush()
+                if self.fsync:
+                    os.fsync(self._arquivo.fileno())
+            except Exception:
+                # não deixa linha pela metade antes das próximas
+                self._arquivo.truncate(inicio)
+                self._arquivo.seek(inicio)
+                self._ultimo_lsn -= len(entradas)
+                raise
+            self._lido_ate += len(dados)
+            return entradas
+
+    # API
+
+    def anexar(self, leituras: Iterable[etree._Element], comandos: Iterable[etree._Element]) -> int:
+        """
+        Grava um lote no journal e só retorna depois do fsync (commit em
+        grupo com as demais threads que estiverem anexando). Retorna o LSN.
+        """
+        lote = etree.Element("lote")
+        for el in [*leituras, *comandos]:
+            el.tail = None
+            lote.append(el)
+
+        with self._cond:
+            pedido = self._proximo_pedido
+            self._proximo_pedido += 1
+            self._fila.append(lote)
+
+            while self._pedido_processado < pedido:
+                if self._gravando:
+                    self._cond.wait()
+                    continue
+
+                # líder: grava toda a fila com um único fsync
+                self._gravando = True
+                pendentes, self._fila = self._fila, []
+                primeiro = self._pedido_processado + 1
+                self._cond.release()
+                erro = None
+                entradas = []
+                try:
+                    entradas = self._gravar(pendentes)
+                except Exception as e:
+                    erro = e
+                finally:
+                    self._cond.acquire()
+                    self._gravando = False
+
+                for i in range(len(pendentes)):
+                    if erro is None:
+                        self._resultados[primeiro + i] = entradas[i][0]
+                    else:
+                        self._falhas[primeiro + i] = erro
+                self._lotes.extend(entradas)
+                self._pedido_processado = primeiro + len(pendentes) - 1
+                self._cond.notify_all()
+
+            if pedido in self._falhas:
+                raise self._falhas.pop(pedido)
+            return self._resultados.pop(pedido)
+
+    def lotes(self, lsn_minimo: Optional[int] = None) -> list[etree._Element]:
+        """
+        Lotes duráveis ainda não incorporados aos segmentos (somente
+        leitura), inclusive os gravados por outros processos. Com
+        `lsn_minimo`, só os de LSN maior (os demais já estão nos segmentos).
+        """
+        with self._cond:
+            if not self._gravando:
+                self._ler_linhas(truncar=False)
+            if lsn_minimo is not None and lsn_minimo > self._lsn_aplicado:
+                self._lsn_aplicado = lsn_minimo
+                self._lotes = [item for item in self._lotes if item[0] > lsn_minimo]
+            return [lote for _, _, lote in self._lotes]
+
+    def registros_pendentes(self) -> int:
+        with self._cond:
+            return sum(len(lote) for _, _, lote in self._lotes)
+
+    def descartar_ate(self, lsn: int) -> None:
+        """
+        Remove da memória os lotes com LSN <= `lsn` (já incorporados) e
+        reescreve o arquivo só com o restante, via arquivo temporário + rename.
+        """
+        # toma a vez do líder antes da trava: quem estiver gravando termina
+        # primeiro, e os novos lotes esperam a reescrita
+        with self._cond:
+            while self._gravando:
+                self._cond.wait()
+            self._gravando = True
+        try:
+            with self.trava, self._cond:
+                self._sincronizar()
+                self._lsn_aplicado = max(self._lsn_aplicado, lsn)
+                self._lotes = [item for item in self._lotes if item[0] > lsn]
+
+                tmp = self.path + ".tmp"
+                dados = b"".join(linha for _, linha, _ in self._lotes)
+                with open(tmp, "wb") as f:
+                    f.write(dados)
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+                self._arquivo.close()
+                os.replace(tmp, self.path)
+                self._arquivo = open(self.path, "ab")
+                self._ino = os.fstat(self._arquivo.fileno()).st_ino
+                self._lido_ate = len(dados)
+        finally:
+            with self._cond:
+                self._gravando = False
+                self._cond.notify_all()
+
+    def fechar(self) -> None:
+        with self._cond:
+            self._arquivo.close()
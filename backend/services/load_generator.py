@@ -0,0 +1,217 @@
+import math
+import random
+import time
+from array import array
+from typing import Iterator, NamedTuple, Optional
+
+from backend.services.binary_frame import codificar_colunas
+from backend.services.columnar import np
+from backend.services.thresholds import FAIXAS_PADRAO
+
+DIA_MS = 86_400_000
+
+
+class Perfil(NamedTuple):
+    """
+    Forma das leituras de um tipo de sensor, com as grandezas em frações da
+    largura da faixa padrão (FAIXAS_PADRAO).
+    """
+    centro: float      # nível médio, a partir do mínimo da faixa
+    amplitude: float   # meia amplitude da variação diurna
+    pico: float        # hora do dia (UTC) do máximo diurno
+    deriva: float      # deriva por dia, zerada a cada `ciclo` dias
+    ciclo: float       # dias entre reposições (troca de solução, reabastecimento)
+    ruido: float       # desvio-padrão do ruído
+    noturno: bool = False  # zero fora do período claro (luz)
+    limites: tuple = (None, None)  # limites físicos dos valores
+
+
+PERFIS = {
+    "pH": Perfil(0.40, 0.03, 14, 0.04, 7, 0.02),
+    "EC": Perfil(0.60, 0.02, 15, -0.06, 7, 0.015, limites=(0, None)),
+    "temperatura": Perfil(0.45, 0.15, 15, 0.0, 1, 0.02),
+    "nível": Perfil(0.85, 0.0, 0, -0.12, 5, 0.01, limites=(0, 100)),
+    "luminosidade": Perfil(0.0, 0.5, 12, 0.0, 1, 0.01, noturno=True, limites=(0, None)),
+}
+
+
+def frota(n: int, prefixo: str = "carga", por_lote: int = 100) -> list[dict]:
+    """n sensores sintéticos ({id, tipo, lote}), com os tipos de PERFIS em rodízio."""
+    tipos = list(PERFIS)
+    return [
+        {"id": f"{prefixo}-{i:05d}", "tipo": tipos[i % len(tipos)], "lote": f"{prefixo}-L{i // por_lote:03d}"}
+        for i in range(n)
+    ]
+
+
+class GeradorCarga:
+    """
+    Leituras sintéticas de uma frota de sensores, geradas em bloco: para k
+    instantes e n sensores, uma matriz k×n calculada de uma vez com NumPy
+    (ou, sem ele, com array + random). Cada sensor sorteia, em torno do
+    perfil do seu tipo, o nível, a amplitude e a fase do ciclo diurno, a
+    deriva e em que ponto do ciclo de reposição começa; `picos` é a fração
+    de leituras que recebe um desvio de meia faixa (para exercitar alertas
+    e anomalias). Com o mesmo `seed`, a mesma sequência, qualquer que seja
+    o número de instantes por chamada de `valores`.
+    """
+
+    def __init__(self, sensores: list[dict], seed: Optional[int] = None, picos: float = 0.0):
+        if len(sensores) > 0xFFFF:
+            raise ValueError("Sensores demais para um quadro (máximo 65535).")
+        self.ids = [s["id"] for s in sensores]
+        self.picos = picos
+
+        sorteio = random.Random(seed)
+        colunas = {c: [] for c in ("base", "amplitude", "fase", "deriva", "ciclo", "desloc",
+                                   "ruido", "largura", "noturno", "piso", "teto")}
+        for s in sensores:
+            perfil = PERFIS.get(s["tipo"])
+            if perfil is None:
+                raise ValueError(f"Tipo sem perfil de carga: {s['tipo']}")
+            minimo, maximo = (float(v) for v in FAIXAS_PADRAO[s["tipo"]])
+            largura = maximo - minimo
+            piso, teto = perfil.limites
+
+            centro = perfil.centro if perfil.noturno else perfil.centro + sorteio.uniform(-0.05, 0.05)
+            colunas["base"].append(minimo + largura * centro)
+            colunas["amplitude"].append(largura * perfil.amplitude * sorteio.uniform(0.8, 1.2))
+            colunas["fase"].append(2 * math.pi * perfil.pico / 24 + sorteio.uniform(-0.2, 0.2))
+            colunas["deriva"].append(largura * perfil.deriva * sorteio.uniform(0.5, 1.5))
+            colunas["ciclo"].append(perfil.ciclo)
+            colunas["desloc"].append(sorteio.uniform(0, perfil.ciclo))
+            colunas["ruido"].append(largura * perfil.ruido)
+            colunas["largura"].append(largura)
+            colunas["noturno"].append(perfil.noturno)
+            colunas["piso"].append(-math.inf if piso is None else piso)
+            colunas["teto"].append(math.inf if teto is None else teto)
+
+        if np is not None:
+            # ruído e picos em fluxos separados: cada um é sorteado em
+            # ordem instante a instante, então blocos de tamanhos
+            # diferentes dão os mesmos valores
+            self._rng, self._rng_picos = (
+                np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(2)
+            )
+            self._p = {c: np.asarray(v, dtype=bool if c == "noturno" else float) for c, v in colunas.items()}
+        else:
+            self._rng = random.Random(seed)
+            self._p = colunas
+
+    # Helpers internos
+
+    def _valores_numpy(self, tempos: list[int]):
+        p, k, n = self._p, len(tempos), len(self.ids)
+        t = np.asarray(tempos, dtype=np.int64)[:, None]
+        onda = np.cos(2 * np.pi * (t % DIA_MS) / DIA_MS - p["fase"])
+        onda = np.where(p["noturno"], np.maximum(onda, 0.0), onda)
+        dias = t / DIA_MS + p["desloc"]
+        v = (p["base"] + p["amplitude"] * onda + p["deriva"] * np.mod(dias, p["ciclo"])
+             + p["ruido"] * self._rng.standard_normal((k, n)))
+        if self.picos:
+            sorteios = self._rng_picos.random((k, n, 2))
+            sinal = np.where(sorteios[..., 1] < 0.5, -0.5, 0.5)
+            v += np.where(sorteios[..., 0] < self.picos, sinal * p["largura"], 0.0)
+        v = np.where(p["noturno"] & (onda == 0.0), 0.0, v)
+        return np.clip(v, p["piso"], p["teto"]).ravel()
+
+    def _valores_python(self, tempos: list[int]) -> array:
+        p, rng = self._p, self._rng
+        parametros = list(zip(p["base"], p["amplitude"], p["fase"], p["deriva"], p["ciclo"], p["desloc"],
+                              p["ruido"], p["largura"], p["noturno"], p["piso"], p["teto"]))
+        valores = array("d")
+        for t in tempos:
+            angulo = 2 * math.pi * (t % DIA_MS) / DIA_MS
+            dia = t / DIA_MS
+            for base, amplitude, fase, deriva, ciclo, desloc, ruido, largura, noturno, piso, teto in parametros:
+                onda = math.cos(angulo - fase)
+                if noturno and onda < 0:
+                    onda = 0.0
+                v = base + amplitude * onda + deriva * ((dia + desloc) % ciclo) + ruido * rng.gauss(0.0, 1.0)
+                if self.picos and rng.random() < self.picos:
+                    v += largura * (0.5 if rng.random() < 0.5 else -0.5)
+                if noturno and onda == 0.0:
+                    v = 0.0
+                valores.append(min(max(v, piso), teto))
+        return valores
+
+    # API
+
+    def valores(self, tempos: list[int]):
+        """Valores (float) dos instantes `tempos` (epoch em ms), em ordem instante a instante: k×n."""
+        if np is not None:
+            return self._valores_numpy(tempos)
+        return self._valores_python(tempos)
+
+    def quadros(
+        self, inicio: int, fim: int, passo: int, registros_por_quadro: int = 50_000, escala: int = 2
+    ) -> Iterator[tuple[bytes, int]]:
+        """
+        Quadros binários (binary_frame) com uma leitura por sensor a cada
+        `passo` ms de [inicio, fim), instantes inteiros por quadro;
+        produz (quadro, número de registros).
+        """
+        n = len(self.ids)
+        por_quadro = max(1, registros_por_quadro // max(n, 1))
+        fator = 10 ** escala
+
+        for primeiro in range(inicio, fim, passo * por_quadro):
+            tempos = list(range(primeiro, min(primeiro + passo * por_quadro, fim), passo))
+            valores = self.valores(tempos)
+            if np is not None:
+                indices = np.tile(np.arange(n, dtype=np.uint16), len(tempos))
+                colunas_tempo = np.repeat(np.asarray(tempos, dtype=np.int64), n)
+                escalados = np.rint(valores * fator).astype(np.int32)
+            else:
+                indices = array("H", range(n)) * len(tempos)
+                colunas_tempo = array("q")
+                for t in tempos:
+                    colunas_tempo.extend(array("q", [t]) * n)
+                escalados = array("i", (round(v * fator) for v in valores))
+            yield codificar_colunas(self.ids, indices, colunas_tempo, escalados, escala), len(tempos) * n
+
+
+def preparar_frota(service, sensores: list[dict]) -> int:
+    """Cadastra (numa única gravação) os sensores da frota que ainda não existem; retorna quantos."""
+    existentes = {s["id"] for s in service.listar_sensores()}
+    novos = [s for s in sensores if s["id"] not in existentes]
+    if novos:
+        service.cadastrar_sensores(novos)
+    return len(novos)
+
+
+def executar_carga(
+    service,
+    gerador: GeradorCarga,
+    inicio: int,
+    fim: int,
+    passo: int,
+    taxa: Optional[float] = None,
+    registros_por_quadro: int = 50_000,
+) -> dict:
+    """
+    Alimenta o serviço com os quadros do gerador pelo caminho real de
+    ingestão (registrar_quadros). Com `taxa` (leituras/s), espera entre
+    os quadros para não passar dela; sem, grava o mais rápido possível.
+    Retorna { registros, aceitas, duplicadas, rejeitadas, quadros, bytes,
+    segundos, taxa } (taxa efetiva, em leituras/s).
+    """
+    totais = {"registros": 0, "aceitas": 0, "duplicadas": 0, "rejeitadas": 0, "quadros": 0, "bytes": 0}
+    comeco = time.monotonic()
+    for quadro, registros in gerador.quadros(inicio, fim, passo, registros_por_quadro):
+        resultado = service.registrar_quadros(quadro)
+        for chave in ("aceitas", "duplicadas", "rejeitadas"):
+            totais[chave] += resultado[chave]
+        totais["registros"] += registros
+        totais["quadros"] += 1
+        totais["bytes"] += len(quadro)
+
+        if taxa:
+            adiantado = totais["registros"] / taxa - (time.monotonic() - comeco)
+            if adiantado > 0:
+                time.sleep(adiantado)
+
+    segundos = time.monotonic() - comeco
+    totais["segundos"] = segundos
+    totais["taxa"] = totais["registros"] / segundos if segundos else 0.0
+    return totais
@@ -0,0 +1,314 @@
+import glob
+import logging
+import os
+import zlib
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Optional
+
+from lxml import etree
+
+from backend.services.interprocess import TravaArquivo
+from backend.services.xml_cache import CacheDocumento
+from backend.services.xml_utils import formatar_data_hora
+
+logger = logging.getLogger(__name__)
+
+# posição do consumidor: "<segmento> <byte>"
+ARQUIVO_OFFSET = "consumidor.offset"
+EXTENSAO = ".fila"
+
+
+class FilaOffline:
+    """
+    Fila offline de leituras (RNF5) em log append-only segmentado.
+
+    Cada leitura é uma linha `<crc32> <leitura .../>` no segmento atual; o
+    segmento é trocado ao passar de `segmento_bytes`. O consumidor guarda a
+    sua posição (segmento + byte) em arquivo, e os segmentos já consumidos
+    são apagados. Assim, enfileirar custa O(leitura) e drenar lê os
+    segmentos em sequência, um lote por vez, sem carregar a fila inteira.
+
+    Ao passar de `max_bytes`, os segmentos mais antigos são descartados
+    (contados em `metricas()["descartadasPorLimite"]`).
+
+    Vários processos podem usar a mesma fila: as escritas ocorrem sob uma
+    trava de arquivo e cada processo relê a posição do consumidor e a lista
+    de segmentos quando a versão da fila (ContadorVersoes) muda. Os
+    contadores de `metricas()` além de registros/bytes são do processo.
+    """
+
+    def __init__(
+        self,
+        diretorio: str,
+        parser: etree.XMLParser,
+        max_bytes: int,
+        segmento_bytes: int,
+    ):
+        self.diretorio = diretorio
+        self.parser = parser
+        self.max_bytes = max_bytes
+        self.segmento_bytes = segmento_bytes
+
+        os.makedirs(diretorio, exist_ok=True)
+
+        # protege segmentos, posição do consumidor e contadores (entre processos)
+        self._lock = TravaArquivo(os.path.join(diretorio, "fila.lock"))
+        # um consumidor por vez
+        self._lock_consumo = TravaArquivo(os.path.join(diretorio, "consumo.lock"))
+
+        self._adicionadas = 0
+        self._consumidas = 0
+        self._descartadas_limite = 0
+        self._descartadas_corrompidas = 0
+        self._ultimo_consumo: Optional[str] = None
+
+        self._offset_path = os.path.join(diretorio, ARQUIVO_OFFSET)
+        self._arquivo = None
+        self._versao = None
+
+        with self._lock:
+            self._carregar()
+            for seq in [s for s in self._listar_segmentos() if s < self._segmento_lido]:
+                os.remove(self._path(seq))
+            self._descartar_final_corrompido(self._segmentos[-1])
+            self._registros = self._contar_registros()
+
+    # Helpers internos
+
+    def _carregar(self) -> None:
+        """(Re)lê do disco a posição do consumidor e os segmentos da fila."""
+        self._versao = CacheDocumento.versao_atual(self._offset_path)
+        self._segmento_lido, self._posicao = self._ler_offset()
+
+        self._segmentos = [s for s in self._listar_segmentos() if s >= self._segmento_lido]
+        if not self._segmentos:
+            self._segmentos = [self._segmento_lido]
+        if self._segmentos[0] != self._segmento_lido:
+            self._segmento_lido, self._posicao = self._segmentos[0], 0
+
+        ultimo = self._path(self._segmentos[-1])
+        if self._arquivo is None or self._arquivo.name != ultimo:
+            if self._arquivo is not None:
+                self._arquivo.close()
+            self._arquivo = open(ultimo, "ab")
+
+    def _sincronizar(self) -> None:
+        """Recarrega o estado se outro processo mexeu na fila (sob a trava)."""
+        if CacheDocumento.versao_atual(self._offset_path) != self._versao:
+            self._carregar()
+            self._registros = self._contar_registros()
+
+    def _publicar(self) -> None:
+        """Avisa os outros processos de que a fila mudou (sob a trava)."""
+        self._versao = CacheDocumento.registrar_escrita(self._offset_path)
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.diretorio, f"{seq:08d}{EXTENSAO}")
+
+    def _listar_segmentos(self) -> list[int]:
+        nomes = glob.glob(os.path.join(self.diretorio, "*" + EXTENSAO))
+        return sorted(int(os.path.basename(n)[: -len(EXTENSAO)]) for n in nomes)
+
+    def _ler_offset(self) -> tuple[int, int]:
+        try:
+            with open(self._offset_path, encoding="utf-8") as f:
+                seq, pos = f.read().split()
+            return int(seq), int(pos)
+        except (OSError, ValueError):
+            return 1, 0
+
+    def _gravar_offset(self, seq: int, pos: int) -> None:
+        tmp = self._offset_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(f"{seq} {pos}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._offset_path)
+
+    def _tamanho(self, seq: int) -> int:
+        try:
+            return os.path.getsize(self._path(seq))
+        except OSError:
+            return 0
+
+    def _descartar_final_corrompido(self, seq: int) -> None:
+        """Trunca uma linha incompleta no fim do segmento (queda no meio da escrita)."""
+        path = self._path(seq)
+        if not os.path.exists(path):
+            return
+        valido_ate = 0
+        with open(path, "rb") as f:
+            for linha in f:
+                if not linha.endswith(b"\n"):
+                    break
+                valido_ate += len(linha)
+        if valido_ate != os.path.getsize(path):
+            logger.warning("Fila offline: descartando final incompleto de %s", path)
+            with open(path, "r+b") as f:
+                f.truncate(valido_ate)
+
+    def _contar_registros(self) -> int:
+        total = 0
+        for seq in self._segmentos:
+            if not os.path.exists(self._path(seq)):
+                continue
+            with open(self._path(seq), "rb") as f:
+                if seq == self._segmento_lido:
+                    f.seek(self._posicao)
+                for bloco in iter(lambda: f.read(1 << 20), b""):
+                    total += bloco.count(b"\n")
+        return total
+
+    def _bytes_pendentes(self) -> int:
+        total = sum(self._tamanho(seq) for seq in self._segmentos)
+        return total - self._posicao
+
+    @staticmethod
+    def _formatar(el: etree._Element) -> bytes:
+        el.tail = None
+        corpo = etree.tostring(el, encoding="utf-8")
+        return b"%08x %s\n" % (zlib.crc32(corpo), corpo)
+
+    def _novo_segmento(self) -> None:
+        self._arquivo.close()
+        self._segmentos.append(self._segmentos[-1] + 1)
+        self._arquivo = open(self._path(self._segmentos[-1]), "ab")
+
+    def _aplicar_limite(self) -> None:
+        """Descarta os segmentos mais antigos até caber em max_bytes."""
+        while len(self._segmentos) > 1 and self._bytes_pendentes() > self.max_bytes:
+            seq = self._segmentos.pop(0)
+            with open(self._path(seq), "rb") as f:
+                f.seek(self._posicao if seq == self._segmento_lido else 0)
+                perdidas = sum(bloco.count(b"\n") for bloco in iter(lambda: f.read(1 << 20), b""))
+            os.remove(self._path(seq))
+            self._registros -= perdidas
+            self._descartadas_limite += perdidas
+            self._segmento_lido, self._posicao = self._segmentos[0], 0
+            self._gravar_offset(self._segmento_lido, 0)
+            logger.warning("Fila offline cheia: %d leituras antigas descartadas", perdidas)
+
+    def _ler_lote(self, tamanho: int) -> tuple[list[etree._Element], int, int, int]:
+        """
+        Lê até `tamanho` leituras a partir da posição do consumidor.
+        Retorna (leituras, linhas corrompidas, segmento, posição), com a
+        posição logo após o lote.
+        """
+        with self._lock:
+            self._sincronizar()
+            seq, pos = self._segmento_lido, self._posicao
+            segmentos = list(self._segmentos)
+
+        elementos = []
+        corrompidas = 0
+        for s in segmentos[segmentos.index(seq):]:
+            if s != seq:
+                seq, pos = s, 0
+            try:
+                f = open(self._path(s), "rb")
+            except FileNotFoundError:
+                continue  # descartado pelo limite
+            with f:
+                f.seek(pos)
+                for linha in f:
+                    if not linha.endswith(b"\n"):
+                        break  # escrita em andamento
+                    pos += len(linha)
+                    try:
+                        crc, corpo = linha.rstrip(b"\n").split(b" ", 1)
+                        if zlib.crc32(corpo) != int(crc, 16):
+                            raise ValueError("crc")
+                        elementos.append(etree.fromstring(corpo, parser=self.parser))
+                    except Exception:
+                        corrompidas += 1
+                        continue
+                    if len(elementos) >= tamanho:
+                        return elementos, corrompidas, seq, pos
+        return elementos, corrompidas, seq, pos
+
+    # API
+
+    def adicionar(self, leituras: Iterable[etree._Element]) -> int:
+        """Enfileira elementos <leitura>. Retorna quantos foram gravados."""
+        linhas = [self._formatar(el) for el in leituras]
+        if not linhas:
+            return 0
+
+        with self._lock:
+            self._sincronizar()
+            if os.fstat(self._arquivo.fileno()).st_size >= self.segmento_bytes:
+                self._novo_segmento()
+            self._arquivo.write(b"".join(linhas))
+            self._arquivo.flush()
+            os.fsync(self._arquivo.fileno())
+            self._registros += len(linhas)
+            self._adicionadas += len(linhas)
+            self._aplicar_limite()
+            self._publicar()
+        return len(linhas)
+
+    def drenar(self, processar: Callable[[list], object], tamanho_lote: int) -> int:
+        """
+        Consome a fila em lotes de até `tamanho_lote` leituras. Cada lote é
+        passado a `processar`; só depois que ele retorna a posição do
+        consumidor avança (entrega ao menos uma vez). Se `processar` lançar
+        exceção, o lote continua na fila e a exceção é propagada.
+        Retorna quantas leituras foram consumidas.
+        """
+        consumidas = 0
+        with self._lock_consumo:
+            while True:
+                elementos, corrompidas, seq, pos = self._ler_lote(tamanho_lote)
+                with self._lock:
+                    self._sincronizar()
+                    avancou = (seq, pos) != (self._segmento_lido, self._posicao)
+                if not avancou:
+                    break
+
+                if elementos:
+                    processar(elementos)
+
+                with self._lock:
+                    self._sincronizar()
+                    # o limite pode ter descartado o trecho durante o processamento
+                    if seq < self._segmento_lido:
+                        continue
+                    self._gravar_offset(seq, pos)
+                    for antigo in [s for s in self._segmentos if s < seq]:
+                        os.remove(self._path(antigo))
+                        self._segmentos.remove(antigo)
+                    self._segmento_lido, self._posicao = seq, pos
+                    self._registros -= len(elementos) + corrompidas
+                    self._consumidas += len(elementos)
+                    self._descartadas_corrompidas += corrompidas
+                    self._ultimo_consumo = formatar_data_hora(datetime.now(timezone.utc))
+                    self._publicar()
+                consumidas += len(elementos)
+        return consumidas
+
+    def registros(self) -> int:
+        with self._lock:
+            self._sincronizar()
+            return self._registros
+
+    def metricas(self) -> dict:
+        """Ocupação da fila e contadores (backpressure)."""
+        with self._lock:
+            self._sincronizar()
+            bytes_pendentes = self._bytes_pendentes()
+            return {
+                "registros": self._registros,
+                "bytes": bytes_pendentes,
+                "segmentos": len(self._segmentos),
+                "limiteBytes": self.max_bytes,
+                "ocupacao": round(bytes_pendentes / self.max_bytes, 4) if self.max_bytes else 0.0,
+                "adicionadas": self._adicionadas,
+                "consumidas": self._consumidas,
+                "descartadasPorLimite": self._descartadas_limite,
+                "descartadasCorrompidas": self._descartadas_corrompidas,
+                "ultimoConsumo": self._ultimo_consumo,
+            }
+
+    def fechar(self) -> None:
+        with self._lock:
+            self._arquivo.close()
@@ -0,0 +1,83 @@
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, NamedTuple, Optional
+
+from backend.services.time_index import EPOCH, epoch_ms
+
+# instantes (epoch ms) representáveis em datetime; fim_da_pagina soma 1 ms
+TEMPO_MINIMO = epoch_ms(datetime.min.replace(tzinfo=timezone.utc))
+TEMPO_MAXIMO = epoch_ms(datetime.max.replace(tzinfo=timezone.utc)) - 1
+
+
+class Cursor(NamedTuple):
+    """Posição de uma listagem paginada (keyset), do mais recente ao mais antigo."""
+
+    # instante (epoch ms) do último item entregue
+    tempo: int
+    # quantos itens com esse mesmo instante já foram entregues
+    repetidos: int
+
+
+def codificar_cursor(cursor: Cursor) -> str:
+    """Cursor opaco para o cliente (base64url de um JSON pequeno)."""
+    dados = json.dumps({"t": cursor.tempo, "n": cursor.repetidos}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(dados.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(texto: str) -> Cursor:
+    """Lança ValueError se o cursor não for um gerado por codificar_cursor()."""
+    try:
+        dados = json.loads(base64.urlsafe_b64decode(texto + "=" * (-len(texto) % 4)))
+        cursor = Cursor(int(dados["t"]), int(dados["n"]))
+    except Exception:
+        raise ValueError("Cursor inválido.") from None
+    if cursor.repetidos < 0 or not TEMPO_MINIMO <= cursor.tempo <= TEMPO_MAXIMO:
+        raise ValueError("Cursor inválido.")
+    return cursor
+
+
+def fim_da_pagina(ate: Optional[datetime], cursor: Optional[Cursor]) -> Optional[datetime]:
+    """
+    Fim do intervalo a consultar: com cursor, nada depois do instante dele
+    (o índice por tempo pula direto para lá).
+    """
+    if cursor is None:
+        return ate
+    limite = EPOCH + timedelta(milliseconds=cursor.tempo + 1) - timedelta(microseconds=1)
+    if ate is None or epoch_ms(ate) > cursor.tempo:
+        return limite
+    return ate
+
+
+def paginar(
+    registros: Iterable[tuple[int, object]],
+    limite: Optional[int] = None,
+    cursor: Optional[Cursor] = None,
+) -> tuple[list, Optional[str]]:
+    """
+    Monta uma página a partir de pares (instante, item) em ordem
+    decrescente de instante, já filtrados. Só consome os registros até
+    completar a página. Retorna (itens, cursor da próxima página ou None).
+    """
+    itens = []
+    ultimo, repetidos = (cursor.tempo, cursor.repetidos) if cursor is not None else (None, 0)
+    pular = cursor.repetidos if cursor is not None else 0
+
+    for tempo, item in registros:
+        if cursor is not None:
+            if tempo > cursor.tempo:
+                continue
+            if tempo == cursor.tempo and pular:
+                # entregues na página anterior
+                pular -= 1
+                continue
+        if limite is not None and len(itens) >= limite:
+            return itens, codificar_cursor(Cursor(ultimo, repetidos))
+        itens.append(item)
+        if tempo == ultimo:
+            repetidos += 1
+        else:
+            ultimo, repetidos = tempo, 1
+
+    return itens, None
@@ -0,0 +1,355 @@
+import logging
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Collection, Iterable, NamedTuple, Optional
+
+from backend.services.columnar import Colunas, np
+
+logger = logging.getLogger(__name__)
+
+# nome do bucket -> largura em ms (buckets alinhados ao epoch, em UTC)
+BUCKETS = {"1m": 60_000, "5m": 300_000, "1h": 3_600_000, "1d": 86_400_000}
+
+_CABECALHO = b"rollups 1"
+
+# a poda pela retenção só roda quando o corte avança pelo menos isto
+PASSO_PODA = 3_600_000
+
+# leituras com instante além de agora + isto (relógio adiantado) não
+# adiantam a retenção
+TOLERANCIA_FUTURO = 3_600_000
+
+
+def _limite_futuro() -> int:
+    return int(time.time() * 1000) + TOLERANCIA_FUTURO
+
+
+class Agregado(NamedTuple):
+    """Resumo das leituras de um sensor num bucket."""
+
+    inicio: int
+    quantidade: int
+    soma: float
+    minimo: float
+    maximo: float
+    ultimo_tempo: int
+    ultimo_valor: float
+
+    @property
+    def media(self) -> float:
+        return self.soma / self.quantidade
+
+
+class SerieAgregada:
+    """
+    Buckets de um sensor numa largura, em ordem de início, em arrays
+    paralelos compactos. Leituras em ordem caem no último bucket ou abrem
+    um novo no fim; atrasadas entram na posição certa.
+    """
+
+    __slots__ = ("inicios", "quantidades", "somas", "minimos", "maximos", "tempos", "valores")
+
+    def __init__(self):
+        self.inicios = array("q")
+        self.quantidades = array("q")
+        self.somas = array("d")
+        self.minimos = array("d")
+        self.maximos = array("d")
+        # instante e valor da última leitura de cada bucket
+        self.tempos = array("q")
+        self.valores = array("d")
+
+    def combinar(self, grupo: Agregado) -> None:
+        n = len(self.inicios)
+        i = n - 1 if n and self.inicios[-1] == grupo.inicio else bisect_left(self.inicios, grupo.inicio)
+        if i < n and self.inicios[i] == grupo.inicio:
+            self.quantidades[i] += grupo.quantidade
+            self.somas[i] += grupo.soma
+            self.minimos[i] = min(self.minimos[i], grupo.minimo)
+            self.maximos[i] = max(self.maximos[i], grupo.maximo)
+            if grupo.ultimo_tempo >= self.tempos[i]:
+                self.tempos[i] = grupo.ultimo_tempo
+                self.valores[i] = grupo.ultimo_valor
+            return
+        for coluna, valor in zip(self._colunas(), grupo):
+            if i == n:
+                coluna.append(valor)
+            else:
+                coluna.insert(i, valor)
+
+    def _colunas(self) -> tuple:
+        return (
+            self.inicios, self.quantidades, self.somas,
+            self.minimos, self.maximos, self.tempos, self.valores,
+        )
+
+    def intervalo(self, inicio: Optional[int], fim: Optional[int]) -> list[Agregado]:
+        """Buckets com início em [inicio, fim] (epoch ms, já alinhados)."""
+        i = bisect_left(self.inicios, inicio) if inicio is not None else 0
+        j = bisect_right(self.inicios, fim) if fim is not None else len(self.inicios)
+        return [Agregado(*(c[k] for c in self._colunas())) for k in range(i, j)]
+
+    def gravar(self, f) -> None:
+        for coluna in self._colunas():
+            coluna.tofile(f)
+
+    @classmethod
+    def ler(cls, f, n: int) -> "SerieAgregada":
+        serie = cls()
+        for coluna in serie._colunas():
+            coluna.fromfile(f, n)
+        return serie
+
+    def descartar_antes(self, inicio: int) -> None:
+        """Remove os buckets que começam antes de `inicio`."""
+        i = bisect_left(self.inicios, inicio)
+        for coluna in self._colunas():
+            del coluna[:i]
+
+    def __len__(self) -> int:
+        return len(self.inicios)
+
+
+def _reagrupar(grupos: Iterable[tuple], largura: int) -> list[tuple]:
+    """
+    Junta grupos (sensor, início, quantidade, soma, mínimo, máximo,
+    instante e valor da última) em buckets de `largura`. Uma leitura é o
+    grupo (sensor, t, 1, v, v, v, t, v); grupos de uma largura menor que
+    divida `largura` também servem.
+    """
+    acumulados: dict[tuple, list] = {}
+    for sensor, inicio, quantidade, soma, minimo, maximo, tempo, valor in grupos:
+        chave = (sensor, inicio - inicio % largura)
+        a = acumulados.get(chave)
+        if a is None:
+            acumulados[chave] = [quantidade, soma, minimo, maximo, tempo, valor]
+            continue
+        a[0] += quantidade
+        a[1] += soma
+        if minimo < a[2]:
+            a[2] = minimo
+        if maximo > a[3]:
+            a[3] = maximo
+        if tempo >= a[4]:
+            a[4], a[5] = tempo, valor
+    return [(sensor, Agregado(inicio, *a)) for (sensor, inicio), a in acumulados.items()]
+
+
+def _agrupar_numpy(tempos, sensores, valores, largura: int) -> list[tuple]:
+    """Mesmo que _reagrupar sobre leituras, com NumPy: ordena e reduz por trechos."""
+    tempos, sensores, valores = np.asarray(tempos), np.asarray(sensores), np.asarray(valores)
+    inicios = tempos - tempos % largura
+    # estável: no mesmo instante, a última gravada continua por último
+    ordem = np.lexsort((tempos, inicios, sensores))
+    s, b, t, v = sensores[ordem], inicios[ordem], tempos[ordem], valores[ordem]
+    quebras = np.flatnonzero((s[1:] != s[:-1]) | (b[1:] != b[:-1])) + 1
+    comecos = np.concatenate(([0], quebras))
+    finais = np.concatenate((quebras, [len(s)])) - 1
+    colunas = zip(
+        b[comecos].tolist(),
+        (finais - comecos + 1).tolist(),
+        np.add.reduceat(v, comecos).tolist(),
+        np.minimum.reduceat(v, comecos).tolist(),
+        np.maximum.reduceat(v, comecos).tolist(),
+        t[finais].tolist(),
+        v[finais].tolist(),
+    )
+    return [(sensor, Agregado(*c)) for sensor, c in zip(s[comecos].tolist(), colunas)]
+
+
+class Rollups:
+    """
+    Agregados das leituras (quantidade, soma, mínimo, máximo e última) por
+    sensor, em buckets de cada largura de BUCKETS, pré-calculados: cada
+    sincronização agrega só as linhas do armazém colunar que ainda não
+    tinham sido vistas, em lote (NumPy, se instalado). Consultas por
+    período só percorrem os buckets pedidos.
+
+    Como seguem o armazém colunar, leituras gravadas por outros processos
+    entram na próxima sincronização; se o armazém for refeito, os
+    agregados também são.
+
+    `retencao` limita, por largura, quanto fica em memória (ms antes da
+    leitura mais recente vista; ausente = tudo): o detalhe fino serve o
+    período recente, e as larguras maiores, o histórico. A referência não
+    passa de agora + TOLERANCIA_FUTURO, para uma leitura com data errada
+    não apagar o presente. Com `path`, o estado vai para um checkpoint
+    binário (`salvar`), como o das EstatisticasSensores: ao reiniciar, só
+    as linhas das colunas posteriores a ele são agregadas.
+    """
+
+    def __init__(
+        self,
+        larguras: dict[str, int] = BUCKETS,
+        retencao: Optional[dict[str, int]] = None,
+        path: Optional[str] = None,
+    ):
+        # da menor para a maior: as maiores podem partir dos grupos das menores
+        self.larguras = dict(sorted(larguras.items(), key=lambda item: item[1]))
+        self.retencao = {n: r for n, r in (retencao or {}).items() if r is not None}
+        self.path = path
+        self._series: dict[tuple[str, str], SerieAgregada] = {}
+        self._lidas = 0
+        self._geracao = None
+        self._mais_recente: Optional[int] = None
+        # bucket -> início mínimo mantido (ver podar)
+        self._cortes: dict[str, int] = {}
+        self._lock = threading.Lock()
+        if path is not None:
+            self._carregar()
+
+    def _carregar(self) -> None:
+        """Lê o checkpoint, se houver e estiver íntegro (senão começa do zero)."""
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        try:
+            with f:
+                cabecalho = f.readline().split()
+                if b" ".join(cabecalho[:2]) != _CABECALHO:
+                    raise ValueError("cabeçalho desconhecido")
+                geracao, lidas = int(cabecalho[2]), int(cabecalho[3])
+                mais_recente = int(cabecalho[4]) if cabecalho[4] != b"-" else None
+                cortes, series = {}, {}
+                for linha in iter(f.readline, b""):
+                    partes = linha.rstrip(b"\n").decode("utf-8").split("\t")
+                    if partes[0] == "c":
+                        cortes[partes[1]] = int(partes[2])
+                    elif partes[0] == "s":
+                        series[(partes[1], partes[3])] = SerieAgregada.ler(f, int(partes[2]))
+                    else:
+                        raise ValueError("linha desconhecida")
+        except Exception:
+            logger.warning("Checkpoint de agregados ilegível (%s); refazendo", self.path)
+            return
+        if mais_recente is not None and mais_recente > _limite_futuro():
+            # checkpoint de antes do limite (ou relógio que voltou): os cortes recuam
+            mais_recente = _limite_futuro()
+            for nome, corte in cortes.items():
+                if nome in self.retencao:
+                    cortes[nome] = min(corte, self._corte(nome, mais_recente))
+        self._series, self._cortes = series, cortes
+        self._geracao, self._lidas, self._mais_recente = geracao, lidas, mais_recente
+
+    def _cortar(self, nome: str, antes: int) -> None:
+        """Descarta os buckets de `nome` anteriores a `antes` (sob o lock)."""
+        self._cortes[nome] = max(antes, self._cortes.get(nome, antes))
+        for (bucket, _), serie in self._series.items():
+            if bucket == nome:
+                serie.descartar_antes(self._cortes[nome])
+
+    def _corte(self, nome: str, mais_recente: int) -> int:
+        """Início do bucket mais antigo de `nome` mantido pela retenção."""
+        corte = mais_recente - self.retencao[nome]
+        return corte - corte % self.larguras[nome]
+
+    def _aplicar_retencao(self) -> None:
+        for nome in self.retencao:
+            corte = self._corte(nome, self._mais_recente)
+            if corte >= self._cortes.get(nome, corte - PASSO_PODA) + PASSO_PODA:
+                self._cortar(nome, corte)
+
+    def sincronizar(self, colunas: Colunas) -> int:
+        """Agrega as linhas ainda não vistas. Retorna quantas foram agregadas."""
+        with self._lock:
+            if colunas.geracao != self._geracao or len(colunas) < self._lidas:
+                self._series.clear()
+                self._cortes.clear()
+                self._lidas = 0
+                self._geracao = colunas.geracao
+                self._mais_recente = None
+            inicio, fim = self._lidas, len(colunas)
+            if fim > inicio:
+                tempos = colunas.tempos[inicio:fim]
+                mais_recente = min(int(max(tempos)), _limite_futuro())
+                if self._mais_recente is None or mais_recente > self._mais_recente:
+                    self._mais_recente = mais_recente
+                    # antes de agregar: o que já sai pela retenção nem entra
+                    self._aplicar_retencao()
+                self._acumular(tempos, colunas.sensores[inicio:fim], colunas.valores[inicio:fim], colunas.nomes)
+                self._lidas = fim
+            return fim - inicio
+
+    def salvar(self) -> None:
+        """
+        Grava o checkpoint (arquivo temporário + fsync + rename): uma linha
+        por corte e, por série, uma linha seguida das colunas em binário.
+        Vários processos podem gravar; o último rename vale.
+        """
+        if self.path is None:
+            return
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with self._lock, open(tmp, "wb") as f:
+            mais_recente = "-" if self._mais_recente is None else str(self._mais_recente)
+            f.write(b"%s %d %d %s\n" % (_CABECALHO, self._geracao or 0, self._lidas, mais_recente.encode()))
+            for nome, corte in self._cortes.items():
+                f.write(f"c\t{nome}\t{corte}\n".encode("utf-8"))
+            for (nome, sensor), serie in self._series.items():
+                f.write(f"s\t{nome}\t{len(serie)}\t{sensor}\n".encode("utf-8"))
+                serie.gravar(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def _acumular(self, tempos, sensores, valores, nomes: list) -> None:
+        anteriores, largura_anterior = None, None
+        for nome, largura in self.larguras.items():
+            if np is not None:
+                grupos = _agrupar_numpy(tempos, sensores, valores, largura)
+            elif anteriores is not None and largura % largura_anterior == 0:
+                grupos = _reagrupar(((s, *g) for s, g in anteriores), largura)
+            else:
+                grupos = _reagrupar(
+                    ((s, t, 1, v, v, v, t, v) for t, s, v in zip(tempos, sensores, valores)),
+                    largura,
+                )
+            anteriores, largura_anterior = grupos, largura
+            corte = self._cortes.get(nome)
+            for sensor, grupo in grupos:
+                if corte is not None and grupo.inicio < corte:
+                    continue
+                chave = (nome, nomes[sensor])
+                serie = self._series.get(chave)
+                if serie is None:
+                    serie = self._series[chave] = SerieAgregada()
+                serie.combinar(grupo)
+
+    def podar(self, antes: int, manter: Collection[str]) -> None:
+        """
+        Descarta os buckets anteriores a `antes` (epoch ms), exceto os das
+        larguras em `manter`; leituras antigas agregadas depois também não
+        os refazem. Serve à retenção: o detalhe fino do período arquivado
+        sai da memória, os agregados por hora/dia ficam.
+        """
+        with self._lock:
+            for nome in self.larguras:
+                if nome not in manter:
+                    self._cortar(nome, antes)
+
+    def sensores(self) -> list[str]:
+        """sensorRefs com algum agregado."""
+        with self._lock:
+            return sorted({sensor for _, sensor in self._series})
+
+    def consultar(
+        self,
+        bucket: str,
+        sensor: str,
+        inicio: Optional[int] = None,
+        fim: Optional[int] = None,
+    ) -> list[Agregado]:
+        """
+        Buckets do sensor que cobrem algum instante de [inicio, fim]
+        (epoch ms), em ordem. O primeiro pode ter leituras anteriores a
+        `inicio`: os agregados são por bucket inteiro.
+        """
+        largura = self.larguras[bucket]
+        if inicio is not None:
+            inicio -= inicio % largura
+        with self._lock:
+            serie = self._series.get((bucket, sensor))
+            return serie.intervalo(inicio, fim) if serie is not None else []
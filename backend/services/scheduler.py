@@ -0,0 +1,173 @@
+import logging
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Tarefa:
+    """Tarefa periódica do Agendador, com as métricas das execuções."""
+
+    def __init__(self, nome: str, funcao: Callable[[], object], intervalo: float, exclusiva: bool):
+        self.nome = nome
+        self.funcao = funcao
+        self.intervalo = intervalo
+        self.exclusiva = exclusiva
+        # instante nominal (sem jitter) e o efetivamente agendado
+        self.base = 0.0
+        self.proxima = 0.0
+
+        self.execucoes = 0
+        self.falhas = 0
+        self.estouros = 0
+        self.ignoradas = 0
+        self.ultimo_erro: Optional[str] = None
+        self.ultima_duracao = 0.0
+        self.duracao_total = 0.0
+        self.duracao_maxima = 0.0
+        self.atraso_maximo = 0.0
+        self.ultima_execucao: Optional[float] = None
+
+    def metricas(self) -> dict:
+        return {
+            "intervalo": self.intervalo,
+            "exclusiva": self.exclusiva,
+            "execucoes": self.execucoes,
+            "falhas": self.falhas,
+            "estouros": self.estouros,
+            "ignoradas": self.ignoradas,
+            "ultimoErro": self.ultimo_erro,
+            "ultimaDuracaoMs": self.ultima_duracao * 1000,
+            "mediaDuracaoMs": self.duracao_total / self.execucoes * 1000 if self.execucoes else 0.0,
+            "maximaDuracaoMs": self.duracao_maxima * 1000,
+            "maximoAtrasoMs": self.atraso_maximo * 1000,
+            "ultimaExecucao": self.ultima_execucao,
+        }
+
+
+class Agendador(threading.Thread):
+    """
+    Uma thread de fundo que roda tarefas periódicas (checkpoint do journal,
+    retenção, simulação, sincronização da fila offline...), cada uma no
+    seu intervalo (segundos):
+      - jitter: cada execução é sorteada em ±`jitter` × intervalo em torno
+        do instante nominal, para tarefas de vários processos não
+        coincidirem; o nominal não acumula o sorteio;
+      - estouro: se a execução termina depois do próximo instante nominal,
+        as execuções perdidas não são repetidas em rajada; a próxima fica
+        para um intervalo depois do fim, e o estouro é contado;
+      - métricas por tarefa (execuções, falhas, duração, atraso) em
+        `metricas()`.
+    Tarefas exclusivas só rodam no processo que tiver a `trava_lider`
+    (ex.: simulação, que não pode rodar uma vez por worker). A trava só
+    fica com quem tem tarefas exclusivas: sem elas (`remover`) ou ao
+    parar, é solta, e outro processo assume na próxima tentativa dele.
+    """
+
+    def __init__(self, jitter: float = 0.0, trava_lider=None, nome: str = "agendador"):
+        super().__init__(name=nome, daemon=True)
+        self.jitter = jitter
+        self.trava_lider = trava_lider
+        self._tarefas: dict[str, Tarefa] = {}
+        self._cond = threading.Condition()
+        self._parar = False
+
+    # Helpers internos
+
+    def _sortear(self, tarefa: Tarefa) -> float:
+        return tarefa.base + random.uniform(-self.jitter, self.jitter) * tarefa.intervalo
+
+    def _executar(self, tarefa: Tarefa) -> None:
+        if tarefa.exclusiva and self.trava_lider is not None and not self.trava_lider.tentar():
+            tarefa.ignoradas += 1
+        else:
+            inicio = time.monotonic()
+            tarefa.atraso_maximo = max(tarefa.atraso_maximo, inicio - tarefa.proxima)
+            try:
+                tarefa.funcao()
+            except Exception as e:
+                tarefa.falhas += 1
+                tarefa.ultimo_erro = str(e)
+                logger.exception("Falha na tarefa periódica %s", tarefa.nome)
+            duracao = time.monotonic() - inicio
+            tarefa.execucoes += 1
+            tarefa.ultima_duracao = duracao
+            tarefa.duracao_total += duracao
+            tarefa.duracao_maxima = max(tarefa.duracao_maxima, duracao)
+            tarefa.ultima_execucao = time.time()
+
+        fim = time.monotonic()
+        with self._cond:
+            tarefa.base += tarefa.intervalo
+            if fim > tarefa.base:
+                # terminou depois do instante da execução seguinte
+                tarefa.estouros += 1
+                tarefa.base = fim + tarefa.intervalo
+            tarefa.proxima = self._sortear(tarefa)
+
+    # API
+
+    def adicionar(
+        self, nome: str, funcao: Callable[[], object], intervalo: float, exclusiva: bool = False
+    ) -> None:
+        """Agenda `funcao` a cada `intervalo` segundos; a primeira execução, um intervalo depois."""
+        with self._cond:
+            tarefa = Tarefa(nome, funcao, intervalo, exclusiva)
+            tarefa.base = time.monotonic() + intervalo
+            tarefa.proxima = self._sortear(tarefa)
+            self._tarefas[nome] = tarefa
+            self._cond.notify()
+
+    def remover(self, nome: str) -> None:
+        """Tira a tarefa da agenda (a execução em andamento termina)."""
+        with self._cond:
+            self._tarefas.pop(nome, None)
+            self._cond.notify()
+
+    def acordar(self, nome: str) -> None:
+        """Antecipa a próxima execução da tarefa para agora."""
+        with self._cond:
+            tarefa = self._tarefas.get(nome)
+            if tarefa is not None:
+                tarefa.base = tarefa.proxima = time.monotonic()
+                self._cond.notify()
+
+    def parar(self) -> None:
+        """
+        Para a thread (esperando a tarefa em andamento terminar) e solta a
+        trava de líder, para outro processo assumir as tarefas exclusivas.
+        """
+        with self._cond:
+            self._parar = True
+            self._cond.notify()
+        if self.is_alive():
+            self.join()
+        if self.trava_lider is not None:
+            self.trava_lider.liberar()
+
+    def metricas(self) -> dict:
+        with self._cond:
+            return {nome: t.metricas() for nome, t in self._tarefas.items()}
+
+    def run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._parar:
+                    # sem tarefas exclusivas, a liderança passa adiante
+                    # (aqui, entre execuções: nenhuma está em andamento)
+                    if self.trava_lider is not None and not any(
+                        t.exclusiva for t in self._tarefas.values()
+                    ):
+                        self.trava_lider.liberar()
+                    agora = time.monotonic()
+                    vencidas = [t for t in self._tarefas.values() if t.proxima <= agora]
+                    if vencidas:
+                        break
+                    proxima = min((t.proxima for t in self._tarefas.values()), default=None)
+                    self._cond.wait(None if proxima is None else proxima - agora)
+                if self._parar:
+                    return
+            for tarefa in sorted(vencidas, key=lambda t: t.proxima):
+                self._executar(tarefa)
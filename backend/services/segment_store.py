@@ -0,0 +1,727 @@
+import copy
+import glob
+import heapq
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from itertools import chain
+from operator import itemgetter
+from typing import Collection, Iterable, Iterator, Optional
+
+from lxml import etree
+
+from backend.config import Config
+from backend.services.archive import ArquivoHistorico
+from backend.services.interprocess import TravaArquivo
+from backend.services.journal import Journal
+from backend.services.time_index import REFERENCIAS, IndiceTempo, epoch_ms, tempo_elemento
+from backend.services.xml_cache import CacheDocumento
+from backend.services.xml_utils import (
+    compilar_fragmento,
+    escrever_xml,
+    formatar_data_hora,
+    parse_data_hora,
+    sincronizar_diretorio,
+)
+
+# elemento do histórico -> contêiner dentro de <segmento>
+CONTEINERES = {"leitura": "leituras", "comando": "comandos"}
+
+MANIFESTO = "manifesto.xml"
+
+# lista de arquivos de um commit em andamento (ver _commit)
+MARCADOR_COMMIT = "commit.pendente"
+
+# trava de escrita compartilhada entre processos
+ARQUIVO_TRAVA = "escrita.lock"
+
+# máximo de recapturas de _visao() durante commits de outros processos
+TENTATIVAS_VISAO = 1000
+
+
+def _utc(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is not None and dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+class ArmazemSegmentos:
+    """
+    Histórico de leituras e comandos de atuadores dividido em arquivos de
+    segmento (um por dia UTC, quebrando a cada N registros), validados por
+    segmentos.xsd. O manifesto lista cada segmento com seus limites de tempo.
+
+    Com journal, `anexar()` só grava o lote no journal (O(lote)); o
+    `checkpoint()` incorpora os lotes aos segmentos depois, reescrevendo
+    apenas os segmentos de destino e o manifesto num commit atômico.
+    Consultas por intervalo abrem apenas os segmentos que o intersectam,
+    um grupo de segmentos por vez, conforme a leitura avança, e, dentro de
+    cada um, usam um índice ordenado por tempo (IndiceTempo), mantido a
+    cada commit, sem percorrer os demais registros. Ficam parseados em
+    memória no máximo `max_abertos` segmentos (LRU), além dos do dia atual.
+
+    Com `arquivo_dir`, `arquivar()` aplica a retenção: segmentos antigos
+    saem do armazém para um ArquivoHistorico (gzip), fora das consultas.
+    """
+
+    def __init__(
+        self,
+        diretorio: str,
+        schema_path: str,
+        parser: etree.XMLParser,
+        max_registros: int,
+        journal_path: Optional[str] = None,
+        arquivo_dir: Optional[str] = None,
+        max_abertos: Optional[int] = None,
+    ):
+        self.diretorio = diretorio
+        self.manifesto_path = os.path.join(diretorio, MANIFESTO)
+        self.parser = parser
+        self.max_registros = max_registros
+
+        xsd_doc = etree.parse(schema_path, parser=parser)
+        self.schema = etree.XMLSchema(xsd_doc)
+        self._schemas_fragmento = {
+            nome: compilar_fragmento(xsd_doc, nome) for nome in CONTEINERES
+        }
+
+        os.makedirs(diretorio, exist_ok=True)
+
+        # serializa as escritas (segmentos + manifesto), entre threads e processos
+        self._lock = TravaArquivo(os.path.join(diretorio, ARQUIVO_TRAVA))
+        # troca atômica do que as leituras enxergam (segmentos + journal)
+        self._lock_visao = threading.Lock()
+        # segmentos parseados, do menos para o mais usado (ver _evictar)
+        self.max_abertos = max_abertos
+        self._caches: OrderedDict[str, CacheDocumento] = OrderedDict()
+        # arquivo -> (raiz indexada, {tag: (elementos, IndiceTempo)})
+        self._indices: dict[str, tuple] = {}
+        self._lock_indices = threading.Lock()
+
+        with self._lock:
+            self._recuperar_commit()
+            if not os.path.exists(self.manifesto_path):
+                escrever_xml(etree.ElementTree(etree.Element("manifesto")), self.manifesto_path)
+            if CacheDocumento.versao_atual(self.manifesto_path) % 2:
+                # queda no meio de um commit (ver _commit)
+                CacheDocumento.registrar_escrita(self.manifesto_path, passo=1)
+        self._manifesto = CacheDocumento(
+            self.manifesto_path, parser, validar=self.schema.assertValid
+        )
+
+        self.journal = None
+        if journal_path:
+            self.journal = Journal(journal_path, parser, lsn_aplicado=self._lsn_aplicado)
+
+        # arquivo morto da retenção (ver arquivar)
+        self.arquivo = None
+        if arquivo_dir:
+            self.arquivo = ArquivoHistorico(arquivo_dir, self.schema, parser)
+
+    # Helpers internos
+
+    def _path(self, arquivo: str) -> str:
+        return os.path.join(self.diretorio, arquivo)
+
+    def _cache(self, arquivo: str) -> CacheDocumento:
+        with self._lock_indices:
+            cache = self._caches.get(arquivo)
+            if cache is None:
+                cache = CacheDocumento(
+                    self._path(arquivo),
+                    self.parser,
+                    validar=self.schema.assertValid,
+                )
+                self._caches[arquivo] = cache
+                self._evictar()
+            else:
+                self._caches.move_to_end(arquivo)
+            return cache
+
+    def _evictar(self) -> None:
+        """
+        Esquece (cache e índice) os segmentos menos usados além de
+        `max_abertos`, exceto os do dia atual, que recebem os checkpoints
+        (sob _lock_indices). Leituras em andamento continuam com a árvore.
+        """
+        if self.max_abertos is None:
+            return
+        hoje = datetime.now(timezone.utc).strftime("%Y%m%d")
+        excesso = len(self._caches) - self.max_abertos
+        for arquivo in list(self._caches):
+            if excesso <= 0:
+                break
+            if arquivo.startswith(hoje):
+                continue
+            del self._caches[arquivo]
+            self._indices.pop(arquivo, None)
+            excesso -= 1
+
+    def _esquecer(self, arquivo: str) -> None:
+        """Tira do cache um segmento apagado."""
+        with self._lock_indices:
+            cache = self._caches.pop(arquivo, None)
+            self._indices.pop(arquivo, None)
+        if cache is not None:
+            cache.invalidar()
+
+    @staticmethod
+    def _entrada_para_dict(entrada: etree._Element) -> dict:
+        return {
+            "arquivo": entrada.get("arquivo"),
+            "dia": entrada.get("dia"),
+            "inicio": entrada.get("inicio"),
+            "fim": entrada.get("fim"),
+            "leituras": int(entrada.get("leituras")),
+            "comandos": int(entrada.get("comandos")),
+        }
+
+    def _entradas(
+        self, inicio: Optional[datetime] = None, fim: Optional[datetime] = None
+    ) -> list[etree._Element]:
+        entradas = self._manifesto.snapshot().getroot().findall("entrada")
+        if inicio is None and fim is None:
+            return entradas
+
+        selecionadas = []
+        for e in entradas:
+            if fim is not None and parse_data_hora(e.get("inicio")) > fim:
+                continue
+            if inicio is not None and parse_data_hora(e.get("fim")) < inicio:
+                continue
+            selecionadas.append(e)
+        return selecionadas
+
+    def _lsn_aplicado(self) -> int:
+        """Último LSN do journal já incorporado aos segmentos."""
+        return int(self._manifesto.snapshot().getroot().get("lsn", "0"))
+
+    def _visao(self, inicio: Optional[datetime], fim: Optional[datetime]):
+        """
+        Entradas do manifesto no intervalo + lotes pendentes do journal,
+        capturados juntos: um checkpoint concorrente não faz a leitura
+        perder nem duplicar registros. Os segmentos só são abertos depois
+        (ver percorrer); como um commit só acrescenta registros no fim de
+        cada contêiner, as contagens da entrada delimitam o que já estava
+        lá na captura.
+        Entre processos, a versão do manifesto funciona como seqlock: ímpar
+        durante um commit, e a captura é refeita se ela mudou no meio.
+        """
+        def capturar():
+            with self._lock_visao:
+                entradas = [self._entrada_para_dict(e) for e in self._entradas(inicio, fim)]
+                lotes = []
+                if self.journal is not None:
+                    lotes = self.journal.lotes(lsn_minimo=self._lsn_aplicado())
+            return entradas, lotes
+
+        for _ in range(TENTATIVAS_VISAO):
+            versao = CacheDocumento.versao_atual(self.manifesto_path)
+            if versao % 2:
+                time.sleep(0.001)
+                continue
+            visao = capturar()
+            if CacheDocumento.versao_atual(self.manifesto_path) == versao:
+                return visao
+        # commit alheio demorado (ou versão ímpar órfã): sob a trava de
+        # escrita nenhum commit está em andamento
+        with self._lock:
+            return capturar()
+
+    def _indice(self, arquivo: str, root: etree._Element, tag: str) -> tuple[list, IndiceTempo]:
+        """Elementos `tag` do segmento e o seu índice por tempo (criado se preciso)."""
+        with self._lock_indices:
+            atual = self._indices.get(arquivo)
+            if atual is None or atual[0] is not root:
+                # segmento ainda não indexado, ou relido do disco
+                atual = (root, {})
+                self._indices[arquivo] = atual
+            por_tag = atual[1]
+            if tag not in por_tag:
+                conteiner = root.find(CONTEINERES[tag])
+                elementos = list(conteiner) if conteiner is not None else []
+                indice = IndiceTempo(REFERENCIAS[tag])
+                indice.estender(elementos)
+                por_tag[tag] = (elementos, indice)
+            if arquivo not in self._caches:
+                # saiu do cache (LRU) enquanto era lido: o índice também sai
+                self._indices.pop(arquivo, None)
+            return por_tag[tag]
+
+    def _reindexar(self, arquivo: str, base: Optional[tuple], tree: etree._ElementTree) -> None:
+        """
+        Índice da nova árvore de um segmento, a partir do índice da árvore
+        copiada (`base`): só os elementos acrescentados no fim são indexados.
+        """
+        if base is None:
+            return
+        root = tree.getroot()
+        por_tag = {}
+        for tag, (_, indice) in base[1].items():
+            conteiner = root.find(CONTEINERES[tag])
+            elementos = list(conteiner) if conteiner is not None else []
+            novo = indice.copia()
+            novo.estender(elementos[novo.tamanho:])
+            por_tag[tag] = (elementos, novo)
+        with self._lock_indices:
+            self._indices[arquivo] = (root, por_tag)
+
+    @staticmethod
+    def _conteiner(root: etree._Element, tag: str) -> etree._Element:
+        el = root.find(tag)
+        if el is None:
+            el = etree.Element(tag)
+            # a sequência do XSD é leituras -> comandos
+            if tag == "leituras":
+                root.insert(0, el)
+            else:
+                root.append(el)
+        return el
+
+    def _nova_entrada(self, manifesto: etree._Element, dia: str) -> etree._Element:
+        seq = sum(1 for e in manifesto.iterfind("entrada") if e.get("dia") == dia)
+        while True:
+            seq += 1
+            arquivo = f"{dia.replace('-', '')}-{seq:04d}.xml"
+            if not os.path.exists(self._path(arquivo)):
+                break
+        return etree.SubElement(
+            manifesto,
+            "entrada",
+            arquivo=arquivo,
+            dia=dia,
+            inicio=f"{dia}T00:00:00Z",
+            fim=f"{dia}T00:00:00Z",
+            leituras="0",
+            comandos="0",
+        )
+
+    def _entrada_com_espaco(self, manifesto: etree._Element, dia: str):
+        for e in reversed(manifesto.findall("entrada")):
+            if e.get("dia") != dia:
+                continue
+            total = int(e.get("leituras")) + int(e.get("comandos"))
+            if total < self.max_registros:
+                return e
+            return None
+        return None
+
+    def _preparar(self, elementos: Iterable[etree._Element], validar: bool = True) -> list:
+        """Valida cada elemento contra o seu tipo no XSD e extrai a data."""
+        registros = []
+        for el in elementos:
+            schema = self._schemas_fragmento.get(el.tag)
+            if schema is None:
+                raise ValueError(f"Elemento não pertence ao histórico: <{el.tag}>")
+            if validar:
+                schema.assertValid(el)
+            registros.append((el, parse_data_hora(el.findtext("dataHora"))))
+        return registros
+
+    def _incorporar(self, registros: list, lsn: Optional[int] = None) -> None:
+        """
+        Distribui os registros pelos segmentos e grava tudo num único commit.
+        Os registros são agrupados por dia (UTC) e vão para o segmento mais
+        recente daquele dia que ainda tenha espaço (ou para um segmento novo).
+        """
+        grupos: dict[str, list] = {}
+        for el, dt in registros:
+            grupos.setdefault(dt.date().isoformat(), []).append((el, dt))
+
+        manifesto = self._manifesto.copia()
+        root = manifesto.getroot()
+        arvores = {}
+        bases = {}
+        novos = set()
+
+        for dia, itens in grupos.items():
+            while itens:
+                entrada = self._entrada_com_espaco(root, dia)
+                if entrada is None:
+                    entrada = self._nova_entrada(root, dia)
+                    novos.add(entrada.get("arquivo"))
+                usados = int(entrada.get("leituras")) + int(entrada.get("comandos"))
+                lote, itens = itens[: self.max_registros - usados], itens[self.max_registros - usados :]
+
+                arquivo = entrada.get("arquivo")
+                tree = arvores.get(arquivo)
+                if tree is None:
+                    if arquivo in novos:
+                        tree = etree.ElementTree(etree.Element("segmento", dia=dia))
+                    else:
+                        cache = self._cache(arquivo)
+                        bases[arquivo] = self._indices.get(arquivo)
+                        if bases[arquivo] is not None and bases[arquivo][0] is not cache.snapshot().getroot():
+                            bases[arquivo] = None
+                        tree = cache.copia()
+                    arvores[arquivo] = tree
+                seg_root = tree.getroot()
+
+                for el, _ in lote:
+                    el.tail = None
+                    self._conteiner(seg_root, CONTEINERES[el.tag]).append(el)
+
+                datas = [dt for _, dt in lote]
+                if usados > 0:
+                    datas += [parse_data_hora(entrada.get("inicio")), parse_data_hora(entrada.get("fim"))]
+                n_leituras = sum(1 for el, _ in lote if el.tag == "leitura")
+                entrada.set("inicio", formatar_data_hora(min(datas)))
+                entrada.set("fim", formatar_data_hora(max(datas)))
+                entrada.set("leituras", str(int(entrada.get("leituras")) + n_leituras))
+                entrada.set("comandos", str(int(entrada.get("comandos")) + len(lote) - n_leituras))
+
+        # fragmentos já validados em _preparar; segmento novo valida inteiro
+        for arquivo, tree in arvores.items():
+            if arquivo in novos or Config.XML_VALIDATION_MODE != "incremental":
+                self.schema.assertValid(tree)
+
+        # as novas árvores só ficam visíveis no commit; o índice pode vir antes
+        for arquivo, tree in arvores.items():
+            self._reindexar(arquivo, bases.get(arquivo), tree)
+
+        if lsn is not None:
+            root.set("lsn", str(lsn))
+        self._commit(manifesto, arvores, lsn)
+
+    def _commit(self, manifesto: etree._ElementTree, arvores: dict, lsn: Optional[int] = None) -> None:
+        """
+        Grava vários arquivos de forma atômica em conjunto:
+          1. cada arquivo novo é escrito como `<nome>.novo` (com fsync);
+          2. o marcador de commit lista as operações (+ renomear, - apagar);
+          3. os renames/remoções são aplicados e o marcador é apagado.
+        Uma queda antes do passo 2 mantém o estado antigo; depois dele, a
+        inicialização conclui o commit (_recuperar_commit).
+        `arvores` mapeia nome do arquivo -> árvore (ou None para apagar).
+        """
+        self.schema.assertValid(manifesto)
+        escritas = dict(arvores)
+        escritas[MANIFESTO] = manifesto
+
+        for arquivo, tree in escritas.items():
+            if tree is not None:
+                escrever_xml(tree, self._path(arquivo) + ".novo")
+
+        marcador = self._path(MARCADOR_COMMIT)
+        with open(marcador + ".tmp", "w", encoding="utf-8") as f:
+            for arquivo, tree in escritas.items():
+                f.write(f"{'+' if tree is not None else '-'} {arquivo}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(marcador + ".tmp", marcador)
+
+        # versão ímpar: commit em andamento (instalar() abaixo a torna par)
+        CacheDocumento.registrar_escrita(self.manifesto_path, passo=1)
+        with self._lock_visao:
+            self._aplicar_commit()
+            for arquivo, tree in arvores.items():
+                if tree is None:
+                    self._esquecer(arquivo)
+                else:
+                    self._cache(arquivo).instalar(tree)
+            self._manifesto.instalar(manifesto, passo=1)
+            if lsn is not None and self.journal is not None:
+                self.journal.descartar_ate(lsn)
+
+    def _aplicar_commit(self) -> None:
+        marcador = self._path(MARCADOR_COMMIT)
+        with open(marcador, encoding="utf-8") as f:
+            operacoes = [linha.split(" ", 1) for linha in f.read().splitlines() if linha]
+
+        for op, arquivo in operacoes:
+            path = self._path(arquivo)
+            if op == "+":
+                if os.path.exists(path + ".novo"):
+                    os.replace(path + ".novo", path)
+            elif os.path.exists(path):
+                os.remove(path)
+
+        sincronizar_diretorio(self.diretorio)
+        os.remove(marcador)
+
+    def _recuperar_commit(self) -> None:
+        """Conclui um commit interrompido e apaga temporários órfãos."""
+        if os.path.exists(self._path(MARCADOR_COMMIT)):
+            self._aplicar_commit()
+        for sobra in glob.glob(self._path("*.novo")) + glob.glob(self._path("*.tmp")):
+            os.remove(sobra)
+
+    # LEITURA
+
+    def segmentos(
+        self, inicio: Optional[datetime] = None, fim: Optional[datetime] = None
+    ) -> list[dict]:
+        """Entradas do manifesto que intersectam [inicio, fim]."""
+        with self._lock_visao:
+            entradas = self._entradas(_utc(inicio), _utc(fim))
+        return [self._entrada_para_dict(e) for e in entradas]
+
+    def percorrer(
+        self,
+        tag: str,
+        inicio: Optional[datetime] = None,
+        fim: Optional[datetime] = None,
+        refs: Optional[Collection[str]] = None,
+        reverso: bool = False,
+    ) -> Iterator[tuple[int, etree._Element]]:
+        """
+        Pares (instante em epoch ms, elemento `tag`) em ordem de dataHora
+        (decrescente com `reverso`), limitados a [inicio, fim] e, se
+        informadas, às referências `refs` (sensores/atuadores). Usa o
+        índice de cada segmento; os elementos são somente leitura.
+        """
+        inicio, fim = _utc(inicio), _utc(fim)
+        inicio_ms = epoch_ms(inicio) if inicio is not None else None
+        fim_ms = epoch_ms(fim) if fim is not None else None
+        refs = None if refs is None else set(refs)
+        chave = itemgetter(0)
+
+        entradas, lotes = self._visao(inicio, fim)
+        campo = CONTEINERES[tag]
+
+        def trecho(arquivo: str, limite: int):
+            # aberto só quando a leitura chega nele; dos seus registros,
+            # só os `limite` primeiros (os que existiam na captura)
+            try:
+                root = self._cache(arquivo).snapshot().getroot()
+            except FileNotFoundError:
+                return  # arquivado pela retenção depois da captura
+            elementos, indice = self._indice(arquivo, root, tag)
+            if refs is None:
+                pares = indice.intervalo(inicio_ms, fim_ms, reverso=reverso)
+            else:
+                pares = heapq.merge(
+                    *(indice.intervalo(inicio_ms, fim_ms, ref, reverso) for ref in refs),
+                    key=chave,
+                    reverse=reverso,
+                )
+            for tempo, pos in pares:
+                if pos < limite:
+                    yield tempo, elementos[pos]
+
+        def grupo(itens: list):
+            if len(itens) == 1:
+                return trecho(*itens[0])
+            return heapq.merge(*(trecho(*item) for item in itens), key=chave, reverse=reverso)
+
+        # segmentos em ordem de início, agrupados enquanto os períodos se
+        # sobrepõem: só os de um grupo são intercalados (e abertos) juntos
+        grupos, fim_grupo = [], None
+        for e in sorted(
+            (e for e in entradas if e[campo]), key=lambda e: parse_data_hora(e["inicio"])
+        ):
+            e_inicio, e_fim = parse_data_hora(e["inicio"]), parse_data_hora(e["fim"])
+            if grupos and e_inicio <= fim_grupo:
+                grupos[-1].append((e["arquivo"], e[campo]))
+                fim_grupo = max(fim_grupo, e_fim)
+            else:
+                grupos.append([(e["arquivo"], e[campo])])
+                fim_grupo = e_fim
+        if reverso:
+            grupos.reverse()
+        fontes = [chain.from_iterable(grupo(itens) for itens in grupos)]
+
+        # lotes do journal (poucos, ainda não indexados)
+        pendentes = []
+        for lote in lotes:
+            for el in lote.iterfind(tag):
+                if refs is not None and el.get(REFERENCIAS[tag]) not in refs:
+                    continue
+                try:
+                    tempo = tempo_elemento(el)
+                except Exception:
+                    continue
+                if inicio_ms is not None and tempo < inicio_ms:
+                    continue
+                if fim_ms is not None and tempo > fim_ms:
+                    continue
+                pendentes.append((tempo, el))
+        pendentes.sort(key=chave, reverse=reverso)
+        fontes.append(pendentes)
+
+        return heapq.merge(*fontes, key=chave, reverse=reverso)
+
+    def iterar_leituras(
+        self,
+        inicio: Optional[datetime] = None,
+        fim: Optional[datetime] = None,
+        sensor: Optional[str] = None,
+    ) -> Iterator[etree._Element]:
+        """
+        Percorre os elementos <leitura> (somente leitura) em ordem crescente
+        de dataHora, opcionalmente limitados a [inicio, fim] e a um sensor.
+        Inclui as leituras ainda pendentes no journal.
+        """
+        refs = None if sensor is None else [sensor]
+        return (el for _, el in self.percorrer("leitura", inicio, fim, refs))
+
+    def iterar_comandos(
+        self,
+        inicio: Optional[datetime] = None,
+        fim: Optional[datetime] = None,
+        atuador: Optional[str] = None,
+    ) -> Iterator[etree._Element]:
+        """Mesmo que iterar_leituras, para os elementos <comando atuadorRef>."""
+        refs = None if atuador is None else [atuador]
+        return (el for _, el in self.percorrer("comando", inicio, fim, refs))
+
+    # ESCRITA
+
+    def erro_fragmento(self, el: etree._Element) -> Optional[str]:
+        """
+        Confere um elemento <leitura>/<comando> contra o seu tipo no XSD.
+        Retorna a mensagem do primeiro erro, ou None se for válido.
+        """
+        schema = self._schemas_fragmento.get(el.tag)
+        if schema is None:
+            return f"Elemento não pertence ao histórico: <{el.tag}>"
+        if schema.validate(el):
+            return None
+        return schema.error_log.last_error.message
+
+    def anexar(
+        self,
+        leituras: Iterable[etree._Element] = (),
+        comandos: Iterable[etree._Element] = (),
+        validar: bool = True,
+    ) -> None:
+        """
+        Acrescenta elementos <leitura> e <comando atuadorRef=...> ao histórico.
+        Com journal, retorna assim que o lote estiver durável no journal;
+        sem journal, grava direto nos segmentos.
+        `validar=False` dispensa a validação XSD de elementos já conferidos
+        com erro_fragmento().
+        Os elementos passam a pertencer ao armazém e não devem ser alterados.
+        """
+        leituras, comandos = list(leituras), list(comandos)
+        registros = self._preparar([*leituras, *comandos], validar)
+        if not registros:
+            return
+
+        if self.journal is not None:
+            self.journal.anexar(leituras, comandos)
+        else:
+            with self._lock:
+                self._incorporar(registros)
+
+    def importar(
+        self,
+        leituras: Iterable[etree._Element] = (),
+        comandos: Iterable[etree._Element] = (),
+    ) -> None:
+        """Carga em massa: grava direto nos segmentos, sem passar pelo journal."""
+        registros = self._preparar([*leituras, *comandos])
+        if registros:
+            with self._lock:
+                self._incorporar(registros)
+
+    def checkpoint(self) -> int:
+        """
+        Incorpora aos segmentos os lotes pendentes do journal e o trunca.
+        Retorna quantos registros foram incorporados.
+        """
+        if self.journal is None:
+            return 0
+
+        with self._lock:
+            lotes = self.journal.lotes(lsn_minimo=self._lsn_aplicado())
+            if not lotes:
+                return 0
+
+            registros = []
+            for lote in lotes:
+                # cópia: os lotes continuam visíveis às leituras até o commit
+                for el in lote:
+                    novo = copy.deepcopy(el)
+                    registros.append((novo, parse_data_hora(novo.findtext("dataHora"))))
+
+            self._incorporar(registros, lsn=int(lotes[-1].get("lsn")))
+            return len(registros)
+
+    def registros_pendentes(self) -> int:
+        return self.journal.registros_pendentes() if self.journal is not None else 0
+
+    def _remover(self, tag: str) -> None:
+        with self._lock:
+            # o que ainda está no journal também precisa ser apagado
+            self.checkpoint()
+
+            manifesto = self._manifesto.copia()
+            root = manifesto.getroot()
+            arvores = {}
+
+            for entrada in list(root.findall("entrada")):
+                arquivo = entrada.get("arquivo")
+                tree = self._cache(arquivo).copia()
+                seg_root = tree.getroot()
+
+                el = seg_root.find(tag)
+                if el is None:
+                    continue
+                seg_root.remove(el)
+
+                restantes = [
+                    parse_data_hora(d.text) for d in seg_root.iterfind("*/*/dataHora")
+                ]
+                if not restantes:
+                    root.remove(entrada)
+                    arvores[arquivo] = None
+                    continue
+
+                self.schema.assertValid(tree)
+                arvores[arquivo] = tree
+                entrada.set("inicio", formatar_data_hora(min(restantes)))
+                entrada.set("fim", formatar_data_hora(max(restantes)))
+                entrada.set("leituras", str(len(seg_root.findall("leituras/leitura"))))
+                entrada.set("comandos", str(len(seg_root.findall("comandos/comando"))))
+
+            self._commit(manifesto, arvores)
+            if self.arquivo is not None:
+                self.arquivo.remover(tag)
+
+    def arquivar(self, antes: datetime) -> int:
+        """
+        Retenção: move para o arquivo morto os segmentos cujos registros
+        são todos anteriores a `antes`. Cada segmento é um commit, então a
+        trava de escrita fica pouco tempo com quem arquiva (o journal
+        continua recebendo lotes). Retorna quantos registros foram
+        arquivados.
+        """
+        if self.arquivo is None:
+            raise RuntimeError("Armazém sem arquivo morto (arquivo_dir).")
+        antes = _utc(antes)
+        with self._lock:
+            # lotes antigos ainda no journal também vão para o arquivo
+            self.checkpoint()
+            arquivos = [
+                e.get("arquivo")
+                for e in self._manifesto.snapshot().getroot().iterfind("entrada")
+                if parse_data_hora(e.get("fim")) < antes
+            ]
+
+        total = 0
+        for arquivo in arquivos:
+            with self._lock:
+                manifesto = self._manifesto.copia()
+                root = manifesto.getroot()
+                entrada = next((e for e in root.iterfind("entrada") if e.get("arquivo") == arquivo), None)
+                if entrada is None or parse_data_hora(entrada.get("fim")) >= antes:
+                    continue  # mudou desde a seleção (outro processo)
+                self.arquivo.guardar([(entrada, self._cache(arquivo).snapshot())])
+                root.remove(entrada)
+                self._commit(manifesto, {arquivo: None})
+                total += int(entrada.get("leituras")) + int(entrada.get("comandos"))
+        return total
+
+    def remover_leituras(self) -> None:
+        """Apaga todas as leituras do histórico, inclusive as arquivadas (segmentos vazios somem)."""
+        self._remover("leituras")
+
+    def remover_comandos(self) -> None:
+        """Apaga todos os comandos de atuadores do histórico, inclusive os arquivados."""
+        self._remover("comandos")
+
+    def fechar(self) -> None:
+        if self.journal is not None:
+            self.journal.fechar()
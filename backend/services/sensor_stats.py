@@ -0,0 +1,301 @@
+import logging
+import math
+import os
+import threading
+from collections import deque
+from typing import Iterator, NamedTuple, Optional
+
+from backend.services.columnar import Colunas
+from backend.services.thresholds import TabelaFaixas
+
+logger = logging.getLogger(__name__)
+
+# tipos de anomalia (além da faixa fixa)
+DESVIO = "desvio"
+TENDENCIA = "tendencia"
+ANOMALIAS = (DESVIO, TENDENCIA)
+
+_CABECALHO = "estatisticas 1"
+
+
+class Anomalia(NamedTuple):
+    tempo: int
+    sensor: str
+    valor: float
+    tipo: str
+
+
+class EstatisticaSensor:
+    """
+    Estado O(1) de um sensor: média e variância acumuladas (Welford),
+    média e variância móveis exponenciais (EWMA) e taxa de variação da
+    EWMA, suavizada, em unidades por ms.
+    """
+
+    __slots__ = (
+        "n", "media", "m2", "ewma", "ewvar", "taxa",
+        "tempo", "valor", "tendencia", "desvios", "eventos",
+    )
+
+    def __init__(self, max_eventos: int):
+        self.n = 0
+        self.media = self.m2 = 0.0
+        self.ewma = self.ewvar = self.taxa = 0.0
+        self.tempo: Optional[int] = None
+        self.valor: Optional[float] = None
+        self.tendencia = False
+        self.desvios = 0
+        # últimas anomalias, da mais antiga à mais recente
+        self.eventos: deque = deque(maxlen=max_eventos)
+
+    @property
+    def variancia(self) -> float:
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+
+class EstatisticasSensores:
+    """
+    Estatísticas por sensor atualizadas leitura a leitura, sem reler o
+    histórico, e as anomalias que elas apontam antes de a leitura sair da
+    faixa fixa:
+      - desvio: leitura a mais de `limite_z` desvios-padrão da EWMA;
+      - tendencia: dentro da faixa, mas a EWMA, na taxa atual, cruza o
+        mínimo ou o máximo em menos de `horizonte` ms (ex.: EC caindo
+        devagar).
+
+    Como IndiceAlertas, acompanha o armazém colunar (ordem de chegada;
+    leituras atrasadas só entram na média e variância acumuladas). O
+    estado cabe num checkpoint pequeno (`salvar`), com a posição já lida
+    das colunas: ao reiniciar, só as linhas posteriores são processadas.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        alfa: float = 0.1,
+        limite_z: float = 3.0,
+        horizonte: int = 3_600_000,
+        minimo_amostras: int = 10,
+        max_eventos: int = 256,
+    ):
+        self.path = path
+        self.alfa = alfa
+        self.limite_z = limite_z
+        self.horizonte = horizonte
+        self.minimo_amostras = minimo_amostras
+        self.max_eventos = max_eventos
+
+        self._sensores: dict[str, EstatisticaSensor] = {}
+        self._lidas = 0
+        self._geracao = None
+        self._corte: Optional[int] = None
+        # índice do sensor no armazém colunar -> faixa efetiva (da tabela em _tabela)
+        self._tabela: Optional[TabelaFaixas] = None
+        self._faixas: list = []
+        self._lock = threading.Lock()
+        self._carregar()
+
+    # Helpers internos
+
+    def _estado(self, sensor: str) -> EstatisticaSensor:
+        estado = self._sensores.get(sensor)
+        if estado is None:
+            estado = self._sensores[sensor] = EstatisticaSensor(self.max_eventos)
+        return estado
+
+    def _atualizar(self, sensor: str, tempo: int, valor: float, faixa) -> list[Anomalia]:
+        e = self._estado(sensor)
+        e.n += 1
+        delta = valor - e.media
+        e.media += delta / e.n
+        e.m2 += delta * (valor - e.media)
+
+        if e.tempo is None:
+            e.ewma, e.tempo, e.valor = valor, tempo, valor
+            return []
+        if tempo < e.tempo:
+            return []  # atrasada: não mexe no que depende da ordem
+
+        anomalias = []
+        diferenca = valor - e.ewma
+        desvio_padrao = math.sqrt(e.ewvar)
+        if (
+            e.n > self.minimo_amostras
+            and desvio_padrao > 0
+            and abs(diferenca) > self.limite_z * desvio_padrao
+        ):
+            e.desvios += 1
+            anomalias.append(Anomalia(tempo, sensor, valor, DESVIO))
+
+        anterior = e.ewma
+        incremento = self.alfa * diferenca
+        e.ewma += incremento
+        e.ewvar = (1 - self.alfa) * (e.ewvar + diferenca * incremento)
+        if tempo > e.tempo:
+            e.taxa += self.alfa * ((e.ewma - anterior) / (tempo - e.tempo) - e.taxa)
+        e.tempo, e.valor = tempo, valor
+
+        tendencia = faixa is not None and e.n > self.minimo_amostras and self._cruza(e, faixa)
+        if tendencia and not e.tendencia:
+            anomalias.append(Anomalia(tempo, sensor, valor, TENDENCIA))
+        e.tendencia = tendencia
+
+        for anomalia in anomalias:
+            if self._corte is None or anomalia.tempo >= self._corte:
+                e.eventos.append(anomalia)
+        return anomalias
+
+    def _cruza(self, e: EstatisticaSensor, faixa) -> bool:
+        """A EWMA, dentro da faixa, atinge um limite dentro do horizonte?"""
+        minimo, maximo = float(faixa.minimo), float(faixa.maximo)
+        if not minimo <= e.ewma <= maximo:
+            return False
+        if e.taxa < 0:
+            return (e.ewma - minimo) / -e.taxa < self.horizonte
+        if e.taxa > 0:
+            return (maximo - e.ewma) / e.taxa < self.horizonte
+        return False
+
+    def _carregar(self) -> None:
+        """Lê o checkpoint, se houver e estiver íntegro (senão começa do zero)."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                linhas = f.read().splitlines()
+        except FileNotFoundError:
+            return
+        try:
+            cabecalho = linhas[0].rsplit(" ", 2)
+            if cabecalho[0] != _CABECALHO:
+                raise ValueError("cabeçalho desconhecido")
+            geracao, lidas = int(cabecalho[1]), int(cabecalho[2])
+            sensores = {}
+            for linha in linhas[1:]:
+                partes = linha.split("\t")
+                if partes[0] == "s":
+                    e = EstatisticaSensor(self.max_eventos)
+                    (e.n, e.media, e.m2, e.ewma, e.ewvar, e.taxa,
+                     e.tempo, e.valor, e.tendencia, e.desvios) = (
+                        int(partes[2]), float(partes[3]), float(partes[4]), float(partes[5]),
+                        float(partes[6]), float(partes[7]),
+                        int(partes[8]) if partes[8] != "-" else None,
+                        float(partes[9]) if partes[9] != "-" else None,
+                        partes[10] == "1", int(partes[11]),
+                    )
+                    sensores[partes[1]] = e
+                elif partes[0] == "a":
+                    sensores[partes[1]].eventos.append(
+                        Anomalia(int(partes[2]), partes[1], float(partes[3]), partes[4])
+                    )
+        except Exception:
+            logger.warning("Checkpoint de estatísticas ilegível (%s); refazendo", self.path)
+            return
+        self._sensores, self._geracao, self._lidas = sensores, geracao, lidas
+
+    # API
+
+    def sincronizar(self, colunas: Colunas, tabela: TabelaFaixas) -> list[Anomalia]:
+        """
+        Atualiza as estatísticas com as linhas do armazém colunar ainda não
+        vistas. Retorna as anomalias encontradas nelas.
+        """
+        with self._lock:
+            if colunas.geracao != self._geracao or len(colunas) < self._lidas:
+                self._sensores.clear()
+                self._lidas = 0
+                self._geracao = colunas.geracao
+            if tabela is not self._tabela:
+                self._tabela, self._faixas = tabela, []
+            faixas = self._faixas
+            faixas.extend(tabela.faixa(nome) for nome in colunas.nomes[len(faixas):])
+            inicio, fim = self._lidas, len(colunas)
+
+            anomalias = []
+            for tempo, sensor, valor in zip(
+                colunas.tempos[inicio:fim], colunas.sensores[inicio:fim], colunas.valores[inicio:fim]
+            ):
+                sensor = int(sensor)
+                anomalias.extend(
+                    self._atualizar(colunas.nomes[sensor], int(tempo), float(valor), faixas[sensor])
+                )
+            self._lidas = fim
+            return anomalias
+
+    def salvar(self) -> None:
+        """
+        Grava o checkpoint (arquivo temporário + fsync + rename). Vários
+        processos podem gravar: cada um tem o seu temporário e o último
+        rename vale (qualquer um é um estado coerente das colunas).
+        """
+        with self._lock:
+            linhas = [f"{_CABECALHO} {self._geracao or 0} {self._lidas}"]
+            for sensor, e in self._sensores.items():
+                linhas.append("\t".join([
+                    "s", sensor, str(e.n), repr(e.media), repr(e.m2), repr(e.ewma),
+                    repr(e.ewvar), repr(e.taxa),
+                    str(e.tempo) if e.tempo is not None else "-",
+                    repr(e.valor) if e.valor is not None else "-",
+                    "1" if e.tendencia else "0", str(e.desvios),
+                ]))
+                linhas.extend(
+                    f"a\t{sensor}\t{a.tempo}\t{a.valor!r}\t{a.tipo}" for a in e.eventos
+                )
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(linhas) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def podar(self, antes: int) -> None:
+        """Descarta as anomalias anteriores a `antes` (epoch ms), como IndiceAlertas.podar."""
+        with self._lock:
+            self._corte = max(antes, self._corte if self._corte is not None else antes)
+            for e in self._sensores.values():
+                while e.eventos and e.eventos[0].tempo < self._corte:
+                    e.eventos.popleft()
+
+    def consultar(self, sensor: str) -> Optional[dict]:
+        """Estatísticas e sinalizações atuais do sensor; None se não tiver leituras."""
+        with self._lock:
+            e = self._sensores.get(sensor)
+            if e is None:
+                return None
+            ultima = e.eventos[-1] if e.eventos else None
+            desvio_recente = ultima is not None and ultima.tipo == DESVIO and ultima.tempo == e.tempo
+            return {
+                "amostras": e.n,
+                "media": e.media,
+                "desvioPadrao": math.sqrt(e.variancia),
+                "ewma": e.ewma,
+                "ewmaDesvioPadrao": math.sqrt(e.ewvar),
+                "taxaPorMinuto": e.taxa * 60_000,
+                "ultimoTempo": e.tempo,
+                "ultimoValor": e.valor,
+                "anomalias": {DESVIO: desvio_recente, TENDENCIA: e.tendencia},
+                "desvios": e.desvios,
+                "eventos": list(reversed(e.eventos)),
+            }
+
+    def anomalias(
+        self,
+        inicio: Optional[int] = None,
+        fim: Optional[int] = None,
+        sensores=None,
+        tipos=None,
+    ) -> Iterator[Anomalia]:
+        """
+        Anomalias recentes (até `max_eventos` por sensor) com inicio <=
+        instante <= fim, da mais recente à mais antiga.
+        """
+        with self._lock:
+            eventos = [
+                a
+                for sensor, e in self._sensores.items()
+                if sensores is None or sensor in sensores
+                for a in e.eventos
+                if (tipos is None or a.tipo in tipos)
+                and (inicio is None or a.tempo >= inicio)
+                and (fim is None or a.tempo <= fim)
+            ]
+        eventos.sort(key=lambda a: a.tempo, reverse=True)
+        return iter(eventos)
@@ -0,0 +1,173 @@
+import threading
+from array import array
+from decimal import Decimal
+from typing import Iterable, NamedTuple, Optional
+
+from lxml import etree
+
+from backend.services.columnar import np
+
+# Faixas ideais por tipo de sensor, quando nada mais específico foi configurado
+FAIXAS_PADRAO = {
+    "pH": (Decimal("4.5"), Decimal("7.5")),
+    "EC": (Decimal("0.5"), Decimal("3.0")),
+    "temperatura": (Decimal("10"), Decimal("35")),
+    "nível": (Decimal("0"), Decimal("100")),
+    "luminosidade": (Decimal("0"), Decimal("200000")),
+}
+
+# códigos de status devolvidos por TabelaFaixas.classificar
+DENTRO, ABAIXO, ACIMA, SEM_FAIXA = range(4)
+STATUS = ("dentro", "abaixo", "acima", "sem-faixa")
+
+
+class Faixa(NamedTuple):
+    """Faixa efetiva; `origem`: "sensor", "lote", "tipo" ou "padrao" (FAIXAS_PADRAO)."""
+
+    minimo: Decimal
+    maximo: Decimal
+    origem: str
+
+
+def faixas_configuradas(root: etree._Element) -> list[dict]:
+    """<faixa> do XML principal: [{sensorId, tipo, lote, minimo, maximo}] (Decimal)."""
+    return [
+        {
+            "sensorId": f.get("sensorRef"),
+            "tipo": f.get("tipo"),
+            "lote": f.get("lote"),
+            "minimo": Decimal(f.get("minimo")),
+            "maximo": Decimal(f.get("maximo")),
+        }
+        for f in root.iterfind("faixas/faixa")
+    ]
+
+
+class TabelaFaixas:
+    """
+    Faixa efetiva de cada sensor cadastrado, resolvida uma vez (por
+    sensor, depois por lote + tipo, por tipo e, por fim, FAIXAS_PADRAO) e
+    guardada numa tabela plana: arrays de mínimos e máximos indexados
+    pela posição do sensor. Classificar um lote de leituras é só indexar
+    e comparar, sem consultar o XML nem montar mensagens.
+    """
+
+    def __init__(self, sensores: Iterable[tuple[str, Optional[str], Optional[str], Optional[Faixa]]]):
+        self.ids: list[str] = []
+        self.tipos: list[Optional[str]] = []
+        self.lotes: list[Optional[str]] = []
+        self.faixas: list[Optional[Faixa]] = []
+        for sensor_id, tipo, lote, faixa in sensores:
+            self.ids.append(sensor_id)
+            self.tipos.append(tipo)
+            self.lotes.append(lote)
+            self.faixas.append(faixa)
+        self.indices = {sensor_id: i for i, sensor_id in enumerate(self.ids)}
+
+        # a última posição (NaN) é a de quem não tem faixa: índice -1
+        nan = float("nan")
+        self.minimos = array("d", [float(f.minimo) if f else nan for f in self.faixas] + [nan])
+        self.maximos = array("d", [float(f.maximo) if f else nan for f in self.faixas] + [nan])
+        if np is not None:
+            self._minimos_np = np.frombuffer(self.minimos, dtype=float)
+            self._maximos_np = np.frombuffer(self.maximos, dtype=float)
+
+    def indice(self, sensor: str) -> int:
+        """Posição do sensor na tabela; -1 se não estiver cadastrado."""
+        return self.indices.get(sensor, -1)
+
+    def faixa(self, sensor: str) -> Optional[Faixa]:
+        i = self.indices.get(sensor)
+        return self.faixas[i] if i is not None else None
+
+    def tipo(self, sensor: str) -> Optional[str]:
+        i = self.indices.get(sensor)
+        return self.tipos[i] if i is not None else None
+
+    def classificar(self, valores, indices):
+        """
+        Códigos de status (DENTRO, ABAIXO, ACIMA, SEM_FAIXA) de leituras
+        dadas por arrays paralelos de valores e de índices de sensor (ver
+        `indice`). Com NumPy, um array int8; sem, um array("b").
+        """
+        if np is not None:
+            valores = np.asarray(valores, dtype=float)
+            indices = np.asarray(indices, dtype=np.intp)
+            minimos, maximos = self._minimos_np[indices], self._maximos_np[indices]
+            codigos = np.full(len(valores), DENTRO, dtype=np.int8)
+            codigos[valores < minimos] = ABAIXO
+            codigos[valores > maximos] = ACIMA
+            codigos[np.isnan(minimos)] = SEM_FAIXA
+            return codigos
+
+        return array("b", (self._codigo(valor, i) for valor, i in zip(valores, indices)))
+
+    def _codigo(self, valor: float, i: int) -> int:
+        minimo = self.minimos[i]
+        if minimo != minimo:
+            return SEM_FAIXA
+        if valor < minimo:
+            return ABAIXO
+        if valor > self.maximos[i]:
+            return ACIMA
+        return DENTRO
+
+    def classificar_um(self, sensor: str, valor: float) -> int:
+        """Mesmo que classificar, para uma leitura avulsa (sem montar arrays)."""
+        return self._codigo(valor, self.indice(sensor))
+
+    def mensagem(self, sensor: str, valor, codigo: int) -> str:
+        """Mensagem do status `codigo`, montada só quando pedida; `valor` sai como veio."""
+        if codigo == SEM_FAIXA:
+            return "Faixa não configurada para esse tipo de sensor."
+        if codigo == DENTRO:
+            return "Dentro da faixa ideal."
+        tipo, faixa = self.tipo(sensor), self.faixa(sensor)
+        if codigo == ABAIXO:
+            return f"{tipo} abaixo da faixa ideal ({valor} < {faixa.minimo})"
+        return f"{tipo} acima da faixa ideal ({valor} > {faixa.maximo})"
+
+
+def compilar_faixas(root: etree._Element, padrao: dict = FAIXAS_PADRAO) -> TabelaFaixas:
+    """Resolve a faixa efetiva de cada sensor do XML principal."""
+    por_sensor, por_lote, por_tipo = {}, {}, {}
+    for f in faixas_configuradas(root):
+        if f["sensorId"] is not None:
+            por_sensor[f["sensorId"]] = Faixa(f["minimo"], f["maximo"], "sensor")
+        elif f["lote"] is not None:
+            por_lote[(f["lote"], f["tipo"])] = Faixa(f["minimo"], f["maximo"], "lote")
+        else:
+            por_tipo[f["tipo"]] = Faixa(f["minimo"], f["maximo"], "tipo")
+
+    def resolver(sensor_id, tipo, lote):
+        faixa = por_sensor.get(sensor_id) or por_lote.get((lote, tipo)) or por_tipo.get(tipo)
+        if faixa is None and tipo in padrao:
+            faixa = Faixa(*padrao[tipo], "padrao")
+        return faixa
+
+    sensores = []
+    for s in root.iterfind("sensores/sensor"):
+        sensor_id, tipo, lote = s.get("id"), s.findtext("tipo"), s.findtext("lote") or None
+        sensores.append((sensor_id, tipo, lote, resolver(sensor_id, tipo, lote)))
+    return TabelaFaixas(sensores)
+
+
+class MotorFaixas:
+    """
+    Mantém a TabelaFaixas do XML principal: recompilada só quando o
+    documento muda (outro snapshot), e compartilhada por ingestão,
+    listagens e alertas.
+    """
+
+    def __init__(self, padrao: dict = FAIXAS_PADRAO):
+        self.padrao = padrao
+        self._documento = None
+        self._tabela: Optional[TabelaFaixas] = None
+        self._lock = threading.Lock()
+
+    def tabela(self, documento: etree._ElementTree) -> TabelaFaixas:
+        with self._lock:
+            if documento is not self._documento:
+                self._tabela = compilar_faixas(documento.getroot(), self.padrao)
+                self._documento = documento
+            return self._tabela
@@ -0,0 +1,105 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Optional
+
+from lxml import etree
+
+from backend.services.xml_utils import parse_data_hora
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# atributo de referência de cada elemento do histórico (índice por sensor/atuador)
+REFERENCIAS = {"leitura": "sensorRef", "comando": "atuadorRef"}
+
+
+def epoch_ms(dt: datetime) -> int:
+    """Instante em milissegundos desde 1970-01-01 UTC (datetime com fuso)."""
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000 + delta.microseconds // 1000
+
+
+def tempo_elemento(el: etree._Element) -> int:
+    """Instante do <dataHora> de uma leitura/comando, em epoch ms."""
+    return epoch_ms(parse_data_hora(el.findtext("dataHora")))
+
+
+class IndiceTempo:
+    """
+    Índice por tempo dos elementos de um contêiner (ex.: as <leitura> de
+    um segmento): os instantes em epoch ms, em ordem crescente, junto com
+    a posição de cada elemento no contêiner. Há um índice geral e um por
+    referência (`atributo`, ex.: sensorRef).
+
+    Consultas por intervalo usam bisect: O(log n + k). Elementos novos só
+    podem ser acrescentados ao fim do contêiner (`estender`); o índice de
+    uma árvore não muda depois de pronto, então quem grava faz `copia()`.
+    """
+
+    def __init__(self, atributo: str):
+        self.atributo = atributo
+        self.tempos = array("q")
+        self.posicoes = array("q")
+        self.por_ref: dict[str, tuple[array, array]] = {}
+        # elementos já indexados (posições 0 .. tamanho-1)
+        self.tamanho = 0
+
+    @staticmethod
+    def _inserir(tempos: array, posicoes: array, tempo: int, posicao: int) -> None:
+        if not tempos or tempo >= tempos[-1]:
+            tempos.append(tempo)
+            posicoes.append(posicao)
+        else:
+            # fora de ordem (ex.: leitura atrasada): depois dos de mesmo instante
+            i = bisect_right(tempos, tempo)
+            tempos.insert(i, tempo)
+            posicoes.insert(i, posicao)
+
+    def estender(self, elementos: Iterable[etree._Element]) -> None:
+        """Indexa os elementos seguintes do contêiner, na ordem em que estão."""
+        for el in elementos:
+            posicao = self.tamanho
+            self.tamanho += 1
+            try:
+                tempo = tempo_elemento(el)
+            except Exception:
+                continue
+            self._inserir(self.tempos, self.posicoes, tempo, posicao)
+            ref = el.get(self.atributo)
+            if ref is not None:
+                if ref not in self.por_ref:
+                    self.por_ref[ref] = (array("q"), array("q"))
+                self._inserir(*self.por_ref[ref], tempo, posicao)
+
+    def copia(self) -> "IndiceTempo":
+        novo = IndiceTempo(self.atributo)
+        novo.tempos = self.tempos[:]
+        novo.posicoes = self.posicoes[:]
+        novo.por_ref = {ref: (t[:], p[:]) for ref, (t, p) in self.por_ref.items()}
+        novo.tamanho = self.tamanho
+        return novo
+
+    def intervalo(
+        self,
+        inicio: Optional[int] = None,
+        fim: Optional[int] = None,
+        ref: Optional[str] = None,
+        reverso: bool = False,
+    ) -> Iterator[tuple[int, int]]:
+        """
+        Pares (instante, posição) com inicio <= instante <= fim, em ordem
+        crescente (decrescente com `reverso`), sem copiar os arrays.
+        """
+        if ref is None:
+            tempos, posicoes = self.tempos, self.posicoes
+        elif ref in self.por_ref:
+            tempos, posicoes = self.por_ref[ref]
+        else:
+            return
+        i = 0 if inicio is None else bisect_left(tempos, inicio)
+        j = len(tempos) if fim is None else bisect_right(tempos, fim)
+        for k in range(j - 1, i - 1, -1) if reverso else range(i, j):
+            yield tempos[k], posicoes[k]
+
+    def __len__(self) -> int:
+        return len(self.tempos)
@@ -0,0 +1,187 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FilaEscritaCheia(RuntimeError):
+    """A fila do escritor está cheia (backpressure): tente de novo mais tarde."""
+
+
+class LockLeituraEscrita:
+    """
+    Lock de leitores/escritor: vários leitores ao mesmo tempo, ou um
+    escritor sozinho. Um escritor esperando bloqueia novos leitores, para
+    não ficar sem vez sob leitura contínua.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._leitores = 0
+        self._escrevendo = False
+        self._escritores_esperando = 0
+
+    @contextmanager
+    def leitura(self):
+        with self._cond:
+            while self._escrevendo or self._escritores_esperando:
+                self._cond.wait()
+            self._leitores += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._leitores -= 1
+                if not self._leitores:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def escrita(self):
+        with self._cond:
+            self._escritores_esperando += 1
+            while self._escrevendo or self._leitores:
+                self._cond.wait()
+            self._escritores_esperando -= 1
+            self._escrevendo = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._escrevendo = False
+                self._cond.notify_all()
+
+
+class Tarefa:
+    """Uma escrita na fila. Tarefas com o mesmo `grupo` podem ser agrupadas."""
+
+    __slots__ = ("funcao", "args", "grupo", "futuro")
+
+    def __init__(self, funcao: Callable, args: tuple, grupo: Optional[str]):
+        self.funcao = funcao
+        self.args = args
+        self.grupo = grupo
+        self.futuro: Future = Future()
+
+
+class EscritorUnico(threading.Thread):
+    """
+    Thread única por onde passam todas as escritas.
+
+    As tarefas chegam por uma fila limitada (`tamanho_fila`); quando ela
+    enche, `submeter` lança FilaEscritaCheia em vez de acumular memória.
+    A cada rodada o escritor pega tudo o que estiver na fila (até
+    `max_lote` tarefas) e executa sob o lock de escrita. Tarefas
+    consecutivas de um grupo registrado com `agrupar()` são executadas
+    juntas por uma única chamada (ex.: várias gravações de histórico
+    viram um só append no journal).
+    """
+
+    def __init__(self, tamanho_fila: int, max_lote: int, lock: Optional[LockLeituraEscrita] = None):
+        super().__init__(name="escritor-xml", daemon=True)
+        self.lock = lock or LockLeituraEscrita()
+        self.max_lote = max_lote
+        self._fila: queue.Queue = queue.Queue(maxsize=tamanho_fila)
+        self._agrupadores: dict[str, Callable[[list], list]] = {}
+        self._parar = threading.Event()
+
+    def agrupar(self, grupo: str, executar_lote: Callable[[list], list]) -> None:
+        """
+        Registra como executar de uma vez várias tarefas do `grupo`:
+        `executar_lote` recebe a lista de tuplas de argumentos e devolve a
+        lista de resultados (um resultado ou uma exceção por tarefa).
+        """
+        self._agrupadores[grupo] = executar_lote
+
+    def na_thread(self) -> bool:
+        return threading.current_thread() is self
+
+    def submeter(self, funcao: Callable, *args, grupo: Optional[str] = None) -> Future:
+        """
+        Enfileira uma escrita e devolve o Future do resultado (o "ticket").
+        Chamado de dentro do próprio escritor, executa na hora.
+        """
+        tarefa = Tarefa(funcao, args, grupo)
+        if self.na_thread():
+            # já dentro de uma escrita (e com o lock): sem fila
+            try:
+                tarefa.futuro.set_result(funcao(*args))
+            except BaseException as e:
+                tarefa.futuro.set_exception(e)
+            return tarefa.futuro
+        if not self.is_alive():
+            self._executar([tarefa])
+            return tarefa.futuro
+        try:
+            self._fila.put_nowait(tarefa)
+        except queue.Full:
+            raise FilaEscritaCheia("Fila de escrita cheia, tente novamente.") from None
+        return tarefa.futuro
+
+    def executar(self, funcao: Callable, *args, grupo: Optional[str] = None, timeout: Optional[float] = None):
+        """Enfileira e espera o resultado (exceções são repassadas)."""
+        return self.submeter(funcao, *args, grupo=grupo).result(timeout)
+
+    def pendentes(self) -> int:
+        return self._fila.qsize()
+
+    def parar(self) -> None:
+        """Executa o que já estiver na fila e encerra a thread."""
+        self._parar.set()
+        try:
+            self._fila.put_nowait(None)
+        except queue.Full:
+            pass
+        if self.is_alive() and not self.na_thread():
+            self.join()
+
+    def _executar(self, tarefas: list) -> None:
+        i = 0
+        while i < len(tarefas):
+            tarefa = tarefas[i]
+            lote = [tarefa]
+            if tarefa.grupo in self._agrupadores:
+                while i + len(lote) < len(tarefas) and tarefas[i + len(lote)].grupo == tarefa.grupo:
+                    lote.append(tarefas[i + len(lote)])
+            i += len(lote)
+
+            with self.lock.escrita():
+                if len(lote) > 1:
+                    self._executar_grupo(lote)
+                    continue
+                try:
+                    tarefa.futuro.set_result(tarefa.funcao(*tarefa.args))
+                except BaseException as e:
+                    tarefa.futuro.set_exception(e)
+
+    def _executar_grupo(self, lote: list) -> None:
+        try:
+            resultados = self._agrupadores[lote[0].grupo]([t.args for t in lote])
+        except BaseException as e:
+            resultados = [e] * len(lote)
+        for tarefa, resultado in zip(lote, resultados):
+            if isinstance(resultado, BaseException):
+                tarefa.futuro.set_exception(resultado)
+            else:
+                tarefa.futuro.set_result(resultado)
+
+    def run(self) -> None:
+        while True:
+            tarefa = self._fila.get()
+            tarefas = [] if tarefa is None else [tarefa]
+            while len(tarefas) < self.max_lote:
+                try:
+                    proxima = self._fila.get_nowait()
+                except queue.Empty:
+                    break
+                if proxima is not None:
+                    tarefas.append(proxima)
+            try:
+                self._executar(tarefas)
+            except Exception:
+                logger.exception("Falha no escritor")
+            if self._parar.is_set() and self._fila.empty():
+                break
@@ -0,0 +1,126 @@
+import copy
+import os
+import threading
+from typing import Callable, Optional
+
+from lxml import etree
+
+
+class CacheDocumento:
+    """
+    Cache de um documento XML já parseado e validado.
+
+    A árvore em cache é compartilhada entre as leituras e nunca é alterada
+    no lugar: quem precisa escrever recebe uma cópia (copy-on-write) e, depois
+    de salvar, instala a nova árvore no cache. Assim cada leitura enxerga um
+    snapshot consistente do documento.
+
+    O cache é invalidado quando:
+      - o contador de versão de escrita do arquivo mudou (escrita feita por
+        outra instância, ou por outro processo se houver um ContadorVersoes
+        configurado com usar_contador());
+      - mtime / inode / tamanho do arquivo mudaram (alteração externa).
+    """
+
+    # contador de versão por arquivo, compartilhado entre instâncias
+    _versoes: dict[str, int] = {}
+    _versoes_lock = threading.Lock()
+
+    # contador compartilhado entre processos (mmap), se configurado
+    _contador = None
+
+    def __init__(
+        self,
+        path: str,
+        parser: etree.XMLParser,
+        validar: Optional[Callable[[etree._ElementTree], None]] = None,
+    ):
+        self.path = os.path.abspath(path)
+        self.parser = parser
+        self.validar = validar
+
+        self._lock = threading.Lock()
+        self._tree: Optional[etree._ElementTree] = None
+        self._stat = None
+        self._versao = -1
+
+    # versão de escrita
+
+    @classmethod
+    def usar_contador(cls, contador) -> None:
+        """Passa a usar um ContadorVersoes (entre processos) no lugar do dict."""
+        cls._contador = contador
+
+    @classmethod
+    def versao_atual(cls, path: str) -> int:
+        if cls._contador is not None:
+            return cls._contador.ler(path)
+        with cls._versoes_lock:
+            return cls._versoes.get(os.path.abspath(path), 0)
+
+    @classmethod
+    def registrar_escrita(cls, path: str, passo: int = 2) -> int:
+        """
+        Incrementa a versão do arquivo. Escritas comuns somam 2, deixando a
+        paridade para quem usa a versão como seqlock (passo=1 ao abrir e ao
+        fechar um commit): um contador compartilhado com outro arquivo
+        nunca fica ímpar por causa das escritas dele.
+        """
+        if cls._contador is not None:
+            return cls._contador.incrementar(path, passo)
+        path = os.path.abspath(path)
+        with cls._versoes_lock:
+            versao = cls._versoes.get(path, 0) + passo
+            cls._versoes[path] = versao
+            return versao
+
+    # helpers internos
+
+    def _stat_arquivo(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+    def _valido(self, stat) -> bool:
+        return (
+            self._tree is not None
+            and self._versao == self.versao_atual(self.path)
+            and self._stat == stat
+        )
+
+    # API
+
+    def snapshot(self) -> etree._ElementTree:
+        """
+        Retorna a árvore compartilhada (somente leitura).
+        Só reparseia / revalida se o arquivo mudou desde o último acesso.
+        """
+        with self._lock:
+            stat = self._stat_arquivo()
+            if not self._valido(stat):
+                versao = self.versao_atual(self.path)
+                tree = etree.parse(self.path, parser=self.parser)
+                if self.validar is not None:
+                    self.validar(tree)
+                self._tree, self._stat, self._versao = tree, stat, versao
+            return self._tree
+
+    def copia(self) -> etree._ElementTree:
+        """Cópia independente da árvore, para quem vai modificar o documento."""
+        return copy.deepcopy(self.snapshot())
+
+    def instalar(self, tree: etree._ElementTree, passo: int = 2) -> None:
+        """
+        Registra uma escrita recém-feita em disco e passa a usar `tree`
+        como snapshot, evitando reparsear o arquivo que acabou de ser salvo.
+        A árvore instalada não deve mais ser modificada por quem a salvou.
+        """
+        with self._lock:
+            self._versao = self.registrar_escrita(self.path, passo)
+            self._stat = self._stat_arquivo()
+            self._tree = tree
+
+    def invalidar(self) -> None:
+        with self._lock:
+            self._tree = None
+            self._stat = None
+            self._versao = -1
@@ -1,20 +1,73 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
+from functools import wraps
+import heapq
+from itertools import chain, islice
+import logging
+from operator import itemgetter
 import os
 import random
+import time
+from typing import Iterator
 
 from lxml import etree
 
 from backend.config import Config
-
-# Faixas ideais por tipo de sensor
-FAIXAS = {
-    "pH": (Decimal("4.5"), Decimal("7.5")),
-    "EC": (Decimal("0.5"), Decimal("3.0")),
-    "temperatura": (Decimal("10"), Decimal("35")),
-    "nível": (Decimal("0"), Decimal("100")),
-    "luminosidade": (Decimal("0"), Decimal("200000")),
-}
+from backend.services.actuator_control import ESTADOS, ControleAtuadores
+from backend.services.alert_index import IndiceAlertas
+from backend.services.binary_frame import (
+    decodificar_quadros,
+    epoch_ms_para_datetime,
+    valor_para_texto,
+)
+from backend.services.columnar import ArmazemColunar
+from backend.services.dedup import ChavesIdempotencia, IndiceRecentes
+from backend.services.export import (
+    COLUNAS_LEITURA,
+    COMPRESSOES,
+    FORMATOS,
+    SERIALIZADORES,
+    BlocosSaida,
+    comprimir_gzip,
+)
+from backend.services.hot_window import BufferSensores
+from backend.services.interprocess import ContadorVersoes, TravaArquivo, TravaLider
+from backend.services.offline_queue import FilaOffline
+from backend.services.pagination import Cursor, fim_da_pagina, paginar
+from backend.services.rollups import Rollups
+from backend.services.scheduler import Agendador
+from backend.services.segment_store import ArmazemSegmentos
+from backend.services.sensor_stats import ANOMALIAS, EstatisticasSensores
+from backend.services.thresholds import (
+    DENTRO,
+    FAIXAS_PADRAO,
+    SEM_FAIXA,
+    STATUS,
+    MotorFaixas,
+    TabelaFaixas,
+    faixas_configuradas,
+)
+from backend.services.time_index import epoch_ms
+from backend.services.writer import EscritorUnico, LockLeituraEscrita
+from backend.services.xml_cache import CacheDocumento
+from backend.services.xml_utils import (
+    compilar_fragmento,
+    escrever_xml,
+    formatar_data_hora,
+    parse_data_hora,
+)
+
+logger = logging.getLogger(__name__)
+
+# chave (no contador de versões compartilhado) do histórico de comandos:
+# muda a cada comando gravado ou apagado, em qualquer processo
+VERSAO_COMANDOS = "comandos.versao"
+
+# Elementos do XML principal que podem ser validados isoladamente
+FRAGMENTOS_VALIDAVEIS = ("sensor", "atuador", "faixa")
+
+# Elementos validados um a um na exportação em streaming
+FRAGMENTOS_EXPORTACAO = ("meta", "sensor", "leitura", "atuador", "comando")
 
 # Unidades automáticas por tipo
 UNIDADES_POR_TIPO = {
@@ -25,9 +78,45 @@ UNIDADES_POR_TIPO = {
     "luminosidade": "lux",
 }
 
+# Tipos JSON aceitos nos campos de cada item de POST /api/leituras/lote
+# (null conta como campo ausente)
+TIPOS_ITEM_LOTE = {
+    "sensorId": ((str,), "texto"),
+    "dataHora": ((str,), "texto"),
+    "valor": ((int, float, str), "número ou texto decimal"),
+    "unidade": ((str,), "texto"),
+}
+
+
+class ItemInvalido(ValueError):
+    """Item de lote com campo de tipo errado: o lote inteiro é recusado."""
+
+    def __init__(self, indice: int, mensagem: str):
+        super().__init__(mensagem)
+        self.indice = indice
+
+
+def escrita(metodo):
+    """
+    Executa o método na thread do escritor único (EscritorUnico), que
+    serializa todas as escritas do processo, e sob a trava do documento
+    principal, que serializa as dos outros processos; quem chama espera o
+    resultado.
+    """
+    def sob_trava(self, *args):
+        with self._trava_nucleo:
+            return metodo(self, *args)
+
+    @wraps(metodo)
+    def wrapper(self, *args):
+        return self._escritor.executar(sob_trava, self, *args, timeout=Config.XML_WRITE_TIMEOUT)
+    return wrapper
+
 
 class XMLService:
     def __init__(self):
+        self._fechado = False
+
         # Caminhos
         self.schema_path = Config.XML_SCHEMA_PATH
         self.data_path = Config.XML_DATA_PATH
@@ -40,129 +129,623 @@ class XMLService:
         xsd_doc = etree.parse(self.schema_path, parser=self.parser)
         self.schema = etree.XMLSchema(xsd_doc)
 
-        # Garante arquivo de pendências
-        self._init_pending_file()
+        # Schemas menores, um por tipo de elemento, para validação incremental
+        self._schemas_fragmento = {
+            nome: compilar_fragmento(xsd_doc, nome) for nome in FRAGMENTOS_VALIDAVEIS
+        }
+        self._schemas_exportacao = {
+            nome: compilar_fragmento(xsd_doc, nome) for nome in FRAGMENTOS_EXPORTACAO
+        }
+
+        # Outros processos (workers) podem usar os mesmos arquivos: as
+        # versões dos documentos ficam num contador compartilhado (mmap)
+        os.makedirs(Config.XML_LOCK_DIR, exist_ok=True)
+        CacheDocumento.usar_contador(ContadorVersoes(Config.XML_VERSION_PATH))
+        self._trava_nucleo = TravaArquivo(os.path.join(Config.XML_LOCK_DIR, "nucleo.lock"))
+
+        # Escritas passam todas por uma única thread; leituras capturam
+        # snapshots sob o lock de leitura (ver _capturar)
+        self._rw = LockLeituraEscrita()
+        self._escritor = EscritorUnico(
+            Config.XML_WRITE_QUEUE_SIZE, Config.XML_WRITE_BATCH_MAX, self._rw
+        )
+        self._escritor.agrupar("historico", self._gravar_historicos)
+
+        # Cache do documento principal (parse + XSD só quando o arquivo muda)
+        self._cache = CacheDocumento(
+            self.data_path, self.parser, validar=self._validar_completo
+        )
+
+        # Histórico de leituras e comandos em segmentos
+        self.segmentos = ArmazemSegmentos(
+            Config.XML_SEGMENTS_DIR,
+            Config.XML_SEGMENT_SCHEMA_PATH,
+            self.parser,
+            Config.XML_SEGMENT_MAX_RECORDS,
+            journal_path=Config.XML_JOURNAL_PATH if Config.XML_JOURNAL_ENABLED else None,
+            arquivo_dir=Config.XML_ARCHIVE_DIR,
+            max_abertos=Config.XML_SEGMENT_CACHE_MAX,
+        )
+
+        # Tarefas periódicas (checkpoints, retenção e, com agendar_ingestao,
+        # simulação e fila offline) numa única thread, iniciada no fim
+        self.agendador = Agendador(
+            Config.SCHEDULER_JITTER, trava_lider=TravaLider(Config.SCHEDULER_LEADER_PATH)
+        )
+
+        # O que sobrou no journal (queda antes do checkpoint) vai já para os segmentos
+        self.segmentos.checkpoint()
+        if Config.XML_JOURNAL_ENABLED:
+            self.agendador.adicionar(
+                "checkpoint", self.segmentos.checkpoint, Config.XML_JOURNAL_CHECKPOINT_INTERVAL
+            )
+
+        # Cópia colunar das leituras (análises); refeita se divergir do histórico
+        self.colunas = ArmazemColunar(Config.XML_COLUMNAR_DIR)
+        # (inclui as leituras arquivadas pela retenção)
+        total = sum(s["leituras"] for s in self.segmentos.segmentos())
+        total += self.segmentos.arquivo.total("leituras")
+        if self.colunas.total() != total:
+            self._reconstruir_colunas()
+
+        # Registros recentes do histórico, para descartar duplicatas: as
+        # leituras vêm das colunas e os comandos dos segmentos, e ambos são
+        # ressincronizados (sob a trava do núcleo) antes de cada gravação,
+        # para enxergar o que os outros processos gravaram
+        self.recentes = IndiceRecentes(
+            timedelta(seconds=Config.XML_DEDUP_WINDOW), Config.XML_DEDUP_MAX_KEYS
+        )
+        desde = datetime.now(timezone.utc) - self.recentes.janela
+        self.recentes.sincronizar(self.colunas.colunas(), desde=epoch_ms(desde))
+        self._comandos_path = os.path.join(Config.XML_SEGMENTS_DIR, VERSAO_COMANDOS)
+        self._versao_comandos = None
+        self._sincronizar_comandos()
+
+        # Agregados por bucket (1m, 5m, 1h, 1d), mantidos a partir das
+        # colunas: retomam do checkpoint e só agregam as linhas posteriores
+        self.rollups = Rollups(
+            retencao={
+                nome: dias * 86_400_000 if dias is not None else None
+                for nome, dias in Config.XML_ROLLUPS_RETENTION.items()
+            },
+            path=Config.XML_ROLLUPS_PATH,
+        )
+        self.rollups.sincronizar(self.colunas.colunas())
+        self.agendador.adicionar(
+            "agregados", self.rollups.salvar, Config.XML_ROLLUPS_CHECKPOINT_INTERVAL
+        )
+
+        # Faixas ideais (por sensor, lote, tipo ou padrão), compiladas numa
+        # tabela por sensor a cada mudança do XML principal
+        self._faixas = MotorFaixas(FAIXAS_PADRAO)
+
+        # Leituras fora da faixa (alertas) e episódios por sensor, também
+        # mantidos a partir das colunas; refeitos no escritor quando uma
+        # faixa muda, ou no agendador se foi outro processo que a mudou
+        self.alertas = IndiceAlertas()
+
+        # Estatísticas por sensor e anomalias (desvio, tendência): retomam do
+        # checkpoint e só processam as leituras das colunas posteriores a ele
+        self.estatisticas = EstatisticasSensores(
+            Config.XML_STATS_PATH,
+            alfa=Config.XML_STATS_ALPHA,
+            limite_z=Config.XML_STATS_Z,
+            horizonte=Config.XML_STATS_HORIZON * 1000,
+            minimo_amostras=Config.XML_STATS_MIN_SAMPLES,
+            max_eventos=Config.XML_STATS_MAX_EVENTS,
+        )
+        self._podar_arquivados()
+        self._sincronizar_alertas()
+        self.agendador.adicionar(
+            "alertas", self._reclassificar_alertas, Config.XML_ALERTS_RECLASSIFY_INTERVAL
+        )
+        self.agendador.adicionar(
+            "estatisticas", self.estatisticas.salvar, Config.XML_STATS_CHECKPOINT_INTERVAL
+        )
+
+        # Retenção do histórico em segundo plano (a primeira rodada só
+        # depois de um intervalo, para não pesar na inicialização)
+        if Config.XML_RETENTION_DAYS is not None:
+            self.agendador.adicionar(
+                "retencao", self.compactar_historico, Config.XML_RETENTION_INTERVAL
+            )
+
+        # Últimas leituras de cada sensor em memória (estado "agora"), das colunas
+        self.buffer_sensores = BufferSensores(Config.XML_RECENTES_POR_SENSOR)
+        self.buffer_sensores.sincronizar(self.colunas.colunas())
+
+        # Último comando de cada atuador (estado atual) e decisão dos
+        # comandos da simulação, com banda morta e histerese
+        # (recarregado quando outro processo grava comandos: VERSAO_COMANDOS)
+        self.controle = ControleAtuadores(Config.XML_CONTROL_DEADBAND)
+        self._versao_atuadores = CacheDocumento.versao_atual(self._comandos_path)
+        self._carregar_estado_atuadores()
+
+        # Respostas de lotes enviados com chave de idempotência
+        self.idempotencia = ChavesIdempotencia(
+            Config.API_IDEMPOTENCY_PATH,
+            Config.API_IDEMPOTENCY_TTL,
+            Config.API_IDEMPOTENCY_MAX_KEYS,
+            Config.API_IDEMPOTENCY_LEASE,
+        )
+
+        # Fila offline (leituras que não puderam ir para o histórico)
+        self.fila_offline = FilaOffline(
+            Config.XML_PENDING_DIR,
+            self.parser,
+            Config.XML_PENDING_MAX_BYTES,
+            Config.XML_PENDING_SEGMENT_BYTES,
+        )
+        self._importar_pendentes_legado()
+
+        # Validação completa na inicialização
+        self._ultima_validacao_completa = 0.0
+        root = self._snapshot().getroot()
+
+        # XML no formato antigo (histórico dentro de hidroponia.xml)
+        if root.find("leituras") is not None or root.find("atuadores/atuador/comandos") is not None:
+            self.importar_xml(self.data_path)
+
+        self._escritor.start()
+        self.agendador.start()
 
     # Helpers internos
 
+    def _snapshot(self) -> etree._ElementTree:
+        """
+        Árvore compartilhada do XML principal, apenas para leitura.
+        Nunca modificar: escritas devem usar _load_tree().
+        """
+        return self._cache.snapshot()
+
     def _load_tree(self) -> etree._ElementTree:
-        tree = etree.parse(self.data_path, parser=self.parser)
-        self.schema.assertValid(tree)
-        return tree
+        # cópia do snapshot em cache: modificações não afetam as leituras
+        return self._cache.copia()
 
-    def _save_tree(self, tree: etree._ElementTree) -> None:
-        self.schema.assertValid(tree)
-        tree.write(
-            self.data_path,
-            encoding="utf-8",
-            xml_declaration=True,
-            pretty_print=True,
+    def _save_tree(self, tree: etree._ElementTree, novos: list | None = None) -> None:
+        """
+        Valida e grava o XML principal.
+        `novos` lista os elementos acrescentados pela operação; quando
+        informado (e a validação incremental estiver ativa), só eles são
+        validados, em vez do documento inteiro.
+        """
+        if novos is not None and self._validacao_incremental():
+            self._validar_fragmentos(tree, novos)
+        else:
+            self._validar_completo(tree)
+        escrever_xml(tree, self.data_path)
+        self._cache.instalar(tree)
+        # faixas podem ter mudado: reclassifica aqui, não na próxima consulta
+        self._reclassificar_alertas()
+
+    def _anexar_historico(
+        self, leituras: list, comandos: list | None = None, validar: bool = True
+    ) -> list:
+        """
+        Grava leituras e comandos nos segmentos, conferindo antes
+        sensorRef / atuadorRef contra os IDs do XML principal.
+        Registros já presentes no histórico recente (mesmo sensor/atuador,
+        instante e valor/ação) são ignorados; retorna a lista deles.
+        Passa pelo escritor único: chamadas concorrentes viram um só append.
+        """
+        return self._escritor.executar(
+            self._gravar_historico,
+            leituras,
+            comandos or [],
+            validar,
+            grupo="historico",
+            timeout=Config.XML_WRITE_TIMEOUT,
         )
 
-    # PENDENCIAS (fila offline - RNF5)
+    def _conferir_historico(self, root, leituras: list, comandos: list, validar: bool) -> None:
+        sensor_ids = {s.get("id") for s in root.iterfind("sensores/sensor")}
+        atuador_ids = {a.get("id") for a in root.iterfind("atuadores/atuador")}
 
-    def _init_pending_file(self):
-        if not os.path.exists(self.pending_path):
-            root = etree.Element("pendencias")
-            leituras_el = etree.SubElement(root, "leituras")
-            tree = etree.ElementTree(root)
-            tree.write(
-                self.pending_path,
-                encoding="utf-8",
-                xml_declaration=True,
-                pretty_print=True,
+        for el in leituras:
+            if el.get("sensorRef") not in sensor_ids:
+                raise etree.DocumentInvalid(
+                    f"sensorRef sem sensor correspondente: {el.get('sensorRef')}"
+                )
+        for el in comandos:
+            if el.get("atuadorRef") not in atuador_ids:
+                raise etree.DocumentInvalid(
+                    f"atuadorRef sem atuador correspondente: {el.get('atuadorRef')}"
+                )
+        if validar:
+            for el in [*leituras, *comandos]:
+                erro = self.segmentos.erro_fragmento(el)
+                if erro is not None:
+                    raise etree.DocumentInvalid(erro)
+
+    def _gravar_historico(self, leituras: list, comandos: list, validar: bool) -> list:
+        resultado = self._gravar_historicos([(leituras, comandos, validar)])[0]
+        if isinstance(resultado, Exception):
+            raise resultado
+        return resultado
+
+    def _sincronizar_comandos(self) -> None:
+        """
+        Relê dos segmentos os comandos recentes quando outro processo
+        gravou ou apagou comandos (versão compartilhada VERSAO_COMANDOS).
+        """
+        versao = CacheDocumento.versao_atual(self._comandos_path)
+        if versao == self._versao_comandos:
+            return
+        desde = datetime.now(timezone.utc) - self.recentes.janela
+        self.recentes.limpar("comando")
+        self.recentes.carregar(self.segmentos.iterar_comandos(desde))
+        self._versao_comandos = versao
+
+    def _sincronizar_atuadores(self) -> None:
+        """
+        Recarrega o último comando de cada atuador quando outro processo
+        gravou ou apagou comandos (versão compartilhada VERSAO_COMANDOS).
+        Sob a trava do núcleo, para não perder um comando gravado ao
+        mesmo tempo por este processo.
+        """
+        if CacheDocumento.versao_atual(self._comandos_path) == self._versao_atuadores:
+            return
+        with self._trava_nucleo:
+            versao = CacheDocumento.versao_atual(self._comandos_path)
+            if versao != self._versao_atuadores:
+                self._carregar_estado_atuadores()
+                self._versao_atuadores = versao
+
+    def _registrar_escrita_comandos(self) -> None:
+        """Avisa os outros processos que o histórico de comandos mudou (sob a trava do núcleo)."""
+        self._versao_comandos = self._versao_atuadores = CacheDocumento.registrar_escrita(
+            self._comandos_path
+        )
+
+    def _gravar_historicos(self, lotes: list) -> list:
+        """
+        Grava vários pedidos (leituras, comandos, validar) num único append.
+        Retorna, por pedido, os duplicados ignorados ou a exceção dele.
+        Sob a trava do núcleo: a conferência de duplicatas e o append são
+        atômicos também entre processos.
+        """
+        with self._trava_nucleo:
+            self.recentes.sincronizar(self.colunas.colunas())
+            self._sincronizar_comandos()
+            self._sincronizar_atuadores()
+            return self._gravar_historicos_sob_trava(lotes)
+
+    def _gravar_historicos_sob_trava(self, lotes: list) -> list:
+        root = self._snapshot().getroot()
+        resultados = [None] * len(lotes)
+        novos = []
+        reservadas = []
+
+        for i, (leituras, comandos, validar) in enumerate(lotes):
+            try:
+                self._conferir_historico(root, leituras, comandos, validar)
+            except Exception as e:
+                resultados[i] = e
+                continue
+            n, duplicados, chaves = self.recentes.reservar([*leituras, *comandos])
+            novos.extend(n)
+            reservadas.extend(chaves)
+            resultados[i] = duplicados
+
+        if novos:
+            try:
+                self.segmentos.anexar(
+                    [el for el in novos if el.tag == "leitura"],
+                    [el for el in novos if el.tag == "comando"],
+                    validar=False,
+                )
+            except Exception as e:
+                self.recentes.liberar(reservadas)
+                resultados = [r if isinstance(r, Exception) else e for r in resultados]
+            else:
+                leituras_novas = [el for el in novos if el.tag == "leitura"]
+                comandos_novos = [el for el in novos if el.tag == "comando"]
+                self.controle.registrar(comandos_novos)
+                if comandos_novos:
+                    self._registrar_escrita_comandos()
+                try:
+                    self.colunas.anexar_leituras(leituras_novas)
+                    colunas = self.colunas.colunas()
+                    self.buffer_sensores.sincronizar(colunas)
+                    self.rollups.sincronizar(colunas)
+                    self._sincronizar_alertas(colunas)
+                except Exception:
+                    # o histórico já está gravado; a cópia colunar é refeita na inicialização
+                    logger.exception("Falha ao anexar leituras ao armazém colunar")
+
+        if self.segmentos.registros_pendentes() >= Config.XML_JOURNAL_CHECKPOINT_RECORDS:
+            self.agendador.acordar("checkpoint")
+        return resultados
+
+    def _reconstruir_colunas(self) -> int:
+        """Refaz o armazém colunar a partir do histórico (a fonte da verdade)."""
+        def linhas():
+            for tempo, el in self._historico_completo("leitura"):
+                try:
+                    yield tempo, el.get("sensorRef"), float(el.findtext("valor"))
+                except (TypeError, ValueError):
+                    continue
+        return self.colunas.reconstruir(linhas())
+
+    def _tabela_faixas(self) -> TabelaFaixas:
+        """Faixa efetiva de cada sensor, do XML principal atual."""
+        return self._faixas.tabela(self._snapshot())
+
+    def _sincronizar_alertas(self, colunas=None) -> TabelaFaixas:
+        """
+        Leva ao índice de alertas e às estatísticas por sensor as leituras
+        novas das colunas (inclusive as de outros processos). Retorna a
+        tabela de faixas usada.
+        """
+        tabela = self._tabela_faixas()
+        if colunas is None:
+            colunas = self.colunas.colunas()
+        self.alertas.sincronizar(colunas, tabela)
+        self.estatisticas.sincronizar(colunas, tabela)
+        if self.alertas.desatualizado:
+            # faixa mudada por outro processo
+            self.agendador.acordar("alertas")
+        return tabela
+
+    def _reclassificar_alertas(self) -> None:
+        """
+        Se a faixa de algum sensor mudou, troca o índice de alertas por um
+        refeito com a tabela atual. Roda no escritor (depois de gravar o
+        XML principal) e no agendador, nunca numa consulta: enquanto isso,
+        as consultas seguem no índice anterior.
+        """
+        tabela = self._tabela_faixas()
+        colunas = self.colunas.colunas()
+        self.alertas.sincronizar(colunas, tabela)
+        if self.alertas.desatualizado:
+            self.alertas = self.alertas.refeito(colunas, tabela)
+
+    def _carregar_estado_atuadores(self) -> None:
+        """Último comando de cada atuador, pelo índice do histórico (um por atuador)."""
+        self.controle.carregar(
+            (a.get("id"), tempo, c.findtext("dataHora"), c.findtext("acao"))
+            for a in self._snapshot().getroot().iterfind("atuadores/atuador")
+            for tempo, c in islice(
+                self.segmentos.percorrer("comando", None, None, [a.get("id")], reverso=True), 1
             )
+        )
 
-    def _load_pending_tree(self) -> etree._ElementTree:
-        return etree.parse(self.pending_path, parser=self.parser)
+    def _capturar(self, leituras: bool = False, comandos: bool = False, inicio=None, fim=None):
+        """
+        Snapshot consistente do XML principal + histórico, capturado sob o
+        lock de leitura: (root, [leitura...], [comando...]), somente leitura.
+        """
+        with self._rw.leitura():
+            root = self._snapshot().getroot()
+            ls = list(self.segmentos.iterar_leituras(inicio, fim)) if leituras else []
+            cs = list(self.segmentos.iterar_comandos(inicio, fim)) if comandos else []
+        return root, ls, cs
 
-    def _save_pending_tree(self, tree: etree._ElementTree) -> None:
-        tree.write(
-            self.pending_path,
-            encoding="utf-8",
-            xml_declaration=True,
-            pretty_print=True,
+    def _historico_completo(self, tag: str, inicio=None, fim=None, refs=None):
+        """
+        Pares (instante, elemento) dos segmentos e do arquivo morto, em
+        ordem de dataHora. Os segmentos são capturados na chamada; os
+        elementos são lidos conforme o iterador avança.
+        """
+        return heapq.merge(
+            self.segmentos.arquivo.percorrer(tag, inicio, fim, refs),
+            self.segmentos.percorrer(tag, inicio, fim, refs),
+            key=itemgetter(0),
         )
 
-    def adicionar_pendentes(self, leituras: list[dict]) -> None:
+    def _corte_retencao(self) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(days=Config.XML_RETENTION_DAYS)
+
+    def _podar_arquivados(self) -> None:
         """
-        Adiciona leituras à fila offline (RNF5).
-        Cada leitura: { sensorId, tipo, unidade, dataHora, valor }
+        Retira dos agregados finos e do índice de alertas o período já
+        arquivado (até a última leitura no arquivo morto), que as
+        listagens do histórico também não mostram mais.
+        """
+        fins = [parse_data_hora(e["fim"]) for e in self.segmentos.arquivo.entradas() if e["leituras"]]
+        if fins:
+            corte = epoch_ms(max(fins)) + 1
+            self.rollups.podar(corte, Config.XML_RETENTION_ROLLUPS)
+            self.alertas.podar(corte)
+            self.estatisticas.podar(corte)
+
+    def fechar(self) -> None:
+        """
+        Para o agendador, conclui as escritas na fila, incorpora o que
+        restou do journal e fecha os arquivos. Chamadas repetidas (ex.:
+        pelo atexit, depois de um fechamento explícito) não fazem nada.
+        """
+        if self._fechado:
+            return
+        self._fechado = True
+        self.agendador.parar()
+        self._escritor.parar()
+        self.estatisticas.salvar()
+        self.rollups.salvar()
+        self.segmentos.checkpoint()
+        self.segmentos.fechar()
+        self.fila_offline.fechar()
+        self.colunas.fechar()
+
+    # VALIDAÇÃO
+
+    def _validacao_incremental(self) -> bool:
+        if Config.XML_VALIDATION_MODE != "incremental":
+            return False
+        decorrido = time.monotonic() - self._ultima_validacao_completa
+        return decorrido < Config.XML_FULL_VALIDATION_INTERVAL
+
+    def _validar_completo(self, tree: etree._ElementTree) -> None:
+        self.schema.assertValid(tree)
+        self._ultima_validacao_completa = time.monotonic()
+
+    def _validar_fragmentos(self, tree: etree._ElementTree, novos: list) -> None:
+        """
+        Valida apenas os elementos novos contra o tipo correspondente do XSD,
+        mais a unicidade de xs:ID (compartilhada entre sensores e atuadores).
+        """
+        root = tree.getroot()
+        novos_ids = {id(el) for el in novos}
+
+        ids_existentes = set()
+        for el in root.iterfind("sensores/sensor"):
+            if id(el) not in novos_ids:
+                ids_existentes.add(el.get("id"))
+        for el in root.iterfind("atuadores/atuador"):
+            if id(el) not in novos_ids:
+                ids_existentes.add(el.get("id"))
+
+        for el in novos:
+            schema = self._schemas_fragmento.get(el.tag)
+            if schema is None:
+                raise ValueError(f"Elemento sem validação incremental: <{el.tag}>")
+            schema.assertValid(el)
+
+            if el.get("id") is None:
+                continue
+            if el.get("id") in ids_existentes:
+                raise etree.DocumentInvalid(f"ID duplicado no XML: {el.get('id')}")
+            ids_existentes.add(el.get("id"))
+
+    def validar_documento(self) -> None:
+        """Força uma validação completa do XML principal contra o XSD."""
+        self._validar_completo(self._snapshot())
+
+    # IMPORTAÇÃO (formato de arquivo único)
+
+    @escrita
+    def importar_xml(self, origem) -> int:
+        """
+        Importa um documento no formato de arquivo único (meta, sensores,
+        leituras e atuadores com comandos, tudo em um <hidroponia>).
+        Meta, sensores e atuadores substituem o XML principal; leituras e
+        comandos são acrescentados aos segmentos.
+        Retorna quantos registros de histórico foram importados.
         """
-        tree = self._load_pending_tree()
+        tree = etree.parse(origem, parser=self.parser)
+        self._validar_completo(tree)
         root = tree.getroot()
+
+        leituras = []
         leituras_el = root.find("leituras")
+        if leituras_el is not None:
+            leituras = leituras_el.findall("leitura")
+            root.remove(leituras_el)
+
+        comandos = []
+        for a in root.iterfind("atuadores/atuador"):
+            comandos_el = a.find("comandos")
+            if comandos_el is None:
+                continue
+            for c in comandos_el.findall("comando"):
+                c.set("atuadorRef", a.get("id"))
+                comandos.append(c)
+            a.remove(comandos_el)
 
+        # histórico primeiro: se falhar, o XML principal fica intacto
+        self.segmentos.importar(leituras, comandos)
+        self._save_tree(tree)
+        self._carregar_estado_atuadores()
+        if leituras:
+            # carga em massa: refaz as cópias derivadas pelo índice do histórico
+            self._reconstruir_colunas()
+            self.buffer_sensores.sincronizar(self.colunas.colunas())
+        return len(leituras) + len(comandos)
+
+    # PENDENCIAS (fila offline - RNF5)
+
+    def _importar_pendentes_legado(self) -> None:
+        """Move para a fila o antigo leituras_pendentes.xml, se existir."""
+        if not os.path.exists(self.pending_path):
+            return
+        root = etree.parse(self.pending_path, parser=self.parser).getroot()
+        self.fila_offline.adicionar(root.iterfind("leituras/leitura"))
+        os.remove(self.pending_path)
+
+    def adicionar_pendentes(self, leituras: list[dict]) -> None:
+        """
+        Adiciona leituras à fila offline (RNF5).
+        Cada leitura: { sensorId, tipo, unidade, dataHora, valor }
+        """
+        elementos = []
         for l in leituras:
-            leitura_el = etree.SubElement(
-                leituras_el,
-                "leitura",
-                sensorRef=l["sensorId"],
-            )
+            leitura_el = etree.Element("leitura", sensorRef=l["sensorId"])
             if l.get("unidade"):
                 leitura_el.set("unidade", l["unidade"])
-            dh = etree.SubElement(leitura_el, "dataHora")
-            dh.text = l["dataHora"]
-            val = etree.SubElement(leitura_el, "valor")
-            val.text = str(Decimal(str(l["valor"])))
+            etree.SubElement(leitura_el, "dataHora").text = l["dataHora"]
+            etree.SubElement(leitura_el, "valor").text = str(Decimal(str(l["valor"])))
+            elementos.append(leitura_el)
 
-        self._save_pending_tree(tree)
+        self.fila_offline.adicionar(elementos)
 
     def sincronizar_pendentes(self) -> int:
         """
-        Move leituras da fila offline para o XML principal,
-        considerando apenas leituras com até 24h de idade.
+        Move leituras da fila offline para o histórico, em lotes de
+        XML_PENDING_SYNC_BATCH, considerando apenas leituras com até 24h
+        de idade. Leituras velhas ou inválidas (data ilegível, sensor
+        removido) são descartadas.
         Retorna quantas leituras foram sincronizadas.
         """
-        pend_tree = self._load_pending_tree()
-        pend_root = pend_tree.getroot()
-        pend_leituras_el = pend_root.find("leituras")
-
-        pend_leituras = list(pend_leituras_el.findall("leitura"))
-        if not pend_leituras:
-            return 0
-
-        now = datetime.utcnow()
-        tree = self._load_tree()
-        root = tree.getroot()
-        leituras_el = root.find("leituras")
-
-        transferidas = 0
-        for l in pend_leituras:
-            data_hora = l.findtext("dataHora")
-            try:
-                dt = datetime.fromisoformat(data_hora.replace("Z", "+00:00"))
-            except Exception:
-                # se não conseguir converter, descarta
-                pend_leituras_el.remove(l)
-                continue
+        sincronizadas = 0
+
+        def processar(lote: list) -> None:
+            nonlocal sincronizadas
+            limite = datetime.now(timezone.utc) - timedelta(hours=24)
+            root = self._snapshot().getroot()
+            sensor_ids = {s.get("id") for s in root.iterfind("sensores/sensor")}
+
+            novas = []
+            for l in lote:
+                if l.get("sensorRef") not in sensor_ids:
+                    continue
+                try:
+                    if parse_data_hora(l.findtext("dataHora")) < limite:
+                        continue
+                except Exception:
+                    continue
+                if self.segmentos.erro_fragmento(l) is None:
+                    novas.append(l)
+
+            if novas:
+                duplicadas = self._anexar_historico(novas, validar=False)
+                sincronizadas += len(novas) - len(duplicadas)
+
+        self.fila_offline.drenar(processar, Config.XML_PENDING_SYNC_BATCH)
+        return sincronizadas
+
+    def agendar_ingestao(self, simulacao: float | None, sincronizacao: float | None) -> None:
+        """
+        Coloca no agendador a simulação (simular_ciclo) e a sincronização
+        da fila offline (sincronizar_pendentes), a cada tantos segundos
+        (None: não agenda). Rodam só no processo com a trava do agendador.
+        """
+        if simulacao is not None:
+            self.agendador.adicionar("simulacao", self.simular_ciclo, simulacao, exclusiva=True)
+        if sincronizacao is not None:
+            self.agendador.adicionar(
+                "sincronizacao", self.sincronizar_pendentes, sincronizacao, exclusiva=True
+            )
 
-            if now - dt <= timedelta(hours=24):
-                # clona a leitura para o XML principal
-                novo = etree.SubElement(
-                    leituras_el,
-                    "leitura",
-                    sensorRef=l.get("sensorRef"),
-                )
-                if l.get("unidade"):
-                    novo.set("unidade", l.get("unidade"))
-                etree.SubElement(novo, "dataHora").text = data_hora
-                etree.SubElement(novo, "valor").text = l.findtext("valor")
-                transferidas += 1
+    def suspender_ingestao(self) -> None:
+        """
+        Tira do agendador a simulação e a sincronização da fila offline;
+        a liderança passa a outro processo que as tenha agendado.
+        """
+        self.agendador.remover("simulacao")
+        self.agendador.remover("sincronizacao")
 
-            # de qualquer forma, remove da fila
-            pend_leituras_el.remove(l)
+    def metricas_agendador(self) -> dict:
+        """Métricas de cada tarefa periódica (execuções, falhas, estouros, duração)."""
+        return self.agendador.metricas()
 
-        # salva ambos
-        if transferidas > 0:
-            self._save_tree(tree)
-        self._save_pending_tree(pend_tree)
-        return transferidas
+    def metricas_pendentes(self) -> dict:
+        """Ocupação e contadores da fila offline."""
+        return self.fila_offline.metricas()
 
     # SENSORES
 
     def listar_sensores(self):
-        tree = self._load_tree()
+        tree = self._snapshot()
         root = tree.getroot()
         sensores_el = root.find("sensores")
 
@@ -175,33 +758,57 @@ class XMLService:
                     "unidade": s.findtext("unidade"),
                     "modelo": s.findtext("modelo"),
                     "localizacao": s.findtext("localizacao"),
+                    "lote": s.findtext("lote"),
                 }
             )
 
         return list(reversed(sensores))
 
+    @escrita
     def cadastrar_sensor(self, data: dict) -> None:
+        self._cadastrar_sensores([data])
+
+    @escrita
+    def cadastrar_sensores(self, lista: list[dict]) -> None:
+        """
+        Cadastra vários sensores ({id, tipo, modelo?, localizacao?, lote?})
+        numa única gravação do XML principal (frotas grandes, gerador de
+        carga). Lança ValueError se algum ID já existir ou se repetir na
+        lista (nada é gravado).
+        """
+        self._cadastrar_sensores(lista)
+
+    def _cadastrar_sensores(self, lista: list[dict]) -> None:
         tree = self._load_tree()
         root = tree.getroot()
         sensores_el = root.find("sensores")
 
-        for s in sensores_el.findall("sensor"):
-            if s.get("id") == data["id"]:
+        ids = {s.get("id") for s in sensores_el.findall("sensor")}
+        for data in lista:
+            if data["id"] in ids:
                 raise ValueError("Já existe sensor com esse ID.")
+            ids.add(data["id"])
 
-        sensor_el = etree.SubElement(sensores_el, "sensor")
-        sensor_el.set("id", data["id"])
+        novos = []
+        for data in lista:
+            sensor_el = etree.SubElement(sensores_el, "sensor")
+            sensor_el.set("id", data["id"])
 
-        tipo = data["tipo"]
-        unidade_auto = UNIDADES_POR_TIPO.get(tipo, "")
+            tipo = data["tipo"]
+            unidade_auto = UNIDADES_POR_TIPO.get(tipo, "")
 
-        etree.SubElement(sensor_el, "tipo").text = tipo
-        etree.SubElement(sensor_el, "unidade").text = unidade_auto
-        etree.SubElement(sensor_el, "modelo").text = data.get("modelo") or ""
-        etree.SubElement(sensor_el, "localizacao").text = data.get("localizacao") or ""
+            etree.SubElement(sensor_el, "tipo").text = tipo
+            etree.SubElement(sensor_el, "unidade").text = unidade_auto
+            etree.SubElement(sensor_el, "modelo").text = data.get("modelo") or ""
+            etree.SubElement(sensor_el, "localizacao").text = data.get("localizacao") or ""
+            if data.get("lote"):
+                etree.SubElement(sensor_el, "lote").text = data["lote"]
+            novos.append(sensor_el)
 
-        self._save_tree(tree)
+        if novos:
+            self._save_tree(tree, novos=novos)
 
+    @escrita
     def limpar_sensores(self) -> None:
         tree = self._load_tree()
         root = tree.getroot()
@@ -209,6 +816,10 @@ class XMLService:
 
         for s in list(sensores_el.findall("sensor")):
             sensores_el.remove(s)
+        # faixas por sensor e mapeamentos dos atuadores apontam (IDREF) para os removidos
+        self._remover_faixas(root, lambda f: f.get("sensorRef") is not None)
+        for c in root.findall("atuadores/atuador/controla"):
+            c.getparent().remove(c)
 
         # placeholder para não quebrar XSD
         sensor_el = etree.SubElement(sensores_el, "sensor", id="sensor-placeholder")
@@ -219,65 +830,158 @@ class XMLService:
 
         self._save_tree(tree)
 
-    # ATUADORES
+    # FAIXAS IDEAIS
+
+    def listar_faixas(self) -> dict:
+        """
+        Faixas configuradas no XML principal e a efetiva de cada sensor:
+        { configuradas: [{sensorId, tipo, lote, minimo, maximo}],
+          efetivas: [{sensorId, tipo, lote, minimo, maximo, origem}] },
+        com origem "sensor", "lote", "tipo" ou "padrao".
+        """
+        tabela = self._tabela_faixas()
+        configuradas = [
+            {**f, "minimo": float(f["minimo"]), "maximo": float(f["maximo"])}
+            for f in faixas_configuradas(self._snapshot().getroot())
+        ]
+        efetivas = [
+            {
+                "sensorId": sensor_id,
+                "tipo": tipo,
+                "lote": lote,
+                "minimo": float(faixa.minimo) if faixa else None,
+                "maximo": float(faixa.maximo) if faixa else None,
+                "origem": faixa.origem if faixa else None,
+            }
+            for sensor_id, tipo, lote, faixa in zip(tabela.ids, tabela.tipos, tabela.lotes, tabela.faixas)
+        ]
+        return {"configuradas": configuradas, "efetivas": efetivas}
+
+    @escrita
+    def definir_faixa(self, data: dict) -> None:
+        """
+        Configura a faixa ideal de um sensor (sensorId), de um tipo num
+        lote (tipo + lote) ou de um tipo (tipo), substituindo a que houver
+        para o mesmo alvo: { sensorId? | tipo, lote?, minimo, maximo }.
+        Lança ValueError com a mensagem para o cliente.
+        """
+        sensor_id, tipo, lote = data.get("sensorId"), data.get("tipo"), data.get("lote")
+        if (sensor_id is None) == (tipo is None):
+            raise ValueError("Informe sensorId ou tipo (com lote opcional).")
+        if sensor_id is not None and lote is not None:
+            raise ValueError("Faixa por sensor não aceita lote.")
+        try:
+            minimo, maximo = Decimal(str(data["minimo"])), Decimal(str(data["maximo"]))
+        except KeyError:
+            raise ValueError("Campos obrigatórios: minimo, maximo.") from None
+        except ArithmeticError:
+            raise ValueError("minimo e maximo devem ser numéricos.") from None
+        if not (minimo.is_finite() and maximo.is_finite()) or minimo > maximo:
+            raise ValueError("Faixa inválida: minimo deve ser finito e até maximo.")
 
-    def listar_atuadores(self):
         tree = self._load_tree()
         root = tree.getroot()
-        atuadores_el = root.find("atuadores")
+        if sensor_id is not None and not any(
+            s.get("id") == sensor_id for s in root.iterfind("sensores/sensor")
+        ):
+            raise ValueError(f"Sensor não cadastrado: {sensor_id}")
+
+        alvo = {"sensorRef": sensor_id, "tipo": tipo, "lote": lote}
+        self._remover_faixas(root, lambda f: all(f.get(k) == v for k, v in alvo.items()))
+        faixas_el = root.find("faixas")
+        if faixas_el is None:
+            faixas_el = etree.SubElement(root, "faixas")
+        faixa_el = etree.SubElement(
+            faixas_el,
+            "faixa",
+            {k: str(v) for k, v in alvo.items() if v is not None},
+            minimo=str(minimo),
+            maximo=str(maximo),
+        )
+        self._save_tree(tree, novos=[faixa_el])
 
-        if atuadores_el is None:
-            return []
+    @escrita
+    def limpar_faixas(self) -> None:
+        """Remove as faixas configuradas (voltam a valer as padrão por tipo)."""
+        tree = self._load_tree()
+        self._remover_faixas(tree.getroot(), lambda f: True)
+        self._save_tree(tree)
 
-        atuadores = []
-        for a in atuadores_el.findall("atuador"):
-            comandos_el = a.find("comandos")
-            comandos = []
-            ultimo = None
-
-            if comandos_el is not None:
-                for c in comandos_el.findall("comando"):
-                    cmd = {
-                        "dataHora": c.findtext("dataHora"),
-                        "acao": c.findtext("acao"),
-                    }
-                    comandos.append(cmd)
-                if comandos:
-                    # último comando é o mais recente pelo dataHora
-                    comandos.sort(key=lambda x: x["dataHora"])
-                    ultimo = comandos[-1]
+    @staticmethod
+    def _remover_faixas(root: etree._Element, condicao) -> None:
+        faixas_el = root.find("faixas")
+        if faixas_el is None:
+            return
+        for f in list(faixas_el.iterfind("faixa")):
+            if condicao(f):
+                faixas_el.remove(f)
+        if not len(faixas_el):
+            # <faixas> exige ao menos uma <faixa>
+            root.remove(faixas_el)
 
+    # ATUADORES
+
+    def listar_atuadores(self):
+        """
+        Atuadores cadastrados, do último ao primeiro: [{id, tipo, controla,
+        estado, ultimoComando}]. O estado ("ligado"/"desligado", None sem
+        comandos) e o último comando vêm do índice em memória, sem
+        percorrer o histórico (que fica em GET /api/atuadores/comandos).
+        """
+        # comandos gravados ou apagados por outros processos
+        self._sincronizar_atuadores()
+        atuadores = []
+        for a in self._snapshot().getroot().iterfind("atuadores/atuador"):
+            ultimo = self.controle.ultimo(a.get("id"))
             atuadores.append(
                 {
                     "id": a.get("id"),
                     "tipo": a.findtext("tipo"),
-                    "comandos": comandos,
-                    "ultimoComando": ultimo,
+                    "controla": [c.get("sensorRef") for c in a.iterfind("controla")],
+                    "estado": ESTADOS.get(ultimo.acao) if ultimo else None,
+                    "ultimoComando": {"dataHora": ultimo.dataHora, "acao": ultimo.acao} if ultimo else None,
                 }
             )
 
         return list(reversed(atuadores))
 
+    @escrita
     def cadastrar_atuador(self, data: dict) -> None:
         tree = self._load_tree()
         root = tree.getroot()
         atuadores_el = root.find("atuadores")
         if atuadores_el is None:
-            atuadores_el = etree.SubElement(root, "atuadores")
+            atuadores_el = etree.Element("atuadores")
+            # <faixas>, se houver, vem depois no XSD
+            faixas_el = root.find("faixas")
+            if faixas_el is not None:
+                faixas_el.addprevious(atuadores_el)
+            else:
+                root.append(atuadores_el)
 
         for a in atuadores_el.findall("atuador"):
             if a.get("id") == data["id"]:
                 raise ValueError("Já existe atuador com esse ID.")
 
+        sensor_ids = {s.get("id") for s in root.iterfind("sensores/sensor")}
+        controla = data.get("controla") or []
+        for sensor_id in controla:
+            if sensor_id not in sensor_ids:
+                raise ValueError(f"Sensor não cadastrado: {sensor_id}")
+
         a_el = etree.SubElement(atuadores_el, "atuador")
         a_el.set("id", data["id"])
         etree.SubElement(a_el, "tipo").text = data["tipo"]
+        for sensor_id in controla:
+            etree.SubElement(a_el, "controla", sensorRef=sensor_id)
 
-        self._save_tree(tree)
+        self._save_tree(tree, novos=[a_el])
 
+    @escrita
     def limpar_atuadores(self) -> None:
         """
-        Remove completamente o elemento <atuadores> do XML.
+        Remove completamente o elemento <atuadores> do XML,
+        junto com o histórico de comandos.
         Isso é válido porque, no XSD, <atuadores> tem minOccurs=0.
         """
         tree = self._load_tree()
@@ -288,6 +992,10 @@ class XMLService:
             root.remove(atuadores_el)
 
         self._save_tree(tree)
+        self.segmentos.remover_comandos()
+        self.recentes.limpar("comando")
+        self.controle.limpar()
+        self._registrar_escrita_comandos()
 
     # HISTÓRICO DE COMANDOS DE ATUADORES
 
@@ -306,55 +1014,74 @@ class XMLService:
         ]
         Ordenado do mais recente para o mais antigo.
         """
-        tree = self._load_tree()
-        root = tree.getroot()
-        atuadores_el = root.find("atuadores")
-
-        if atuadores_el is None:
-            return []
-
-        comandos_lista = []
-
-        for a in atuadores_el.findall("atuador"):
-            atuador_id = a.get("id")
-            tipo = a.findtext("tipo")
-            comandos_el = a.find("comandos")
-            if comandos_el is None:
+        return self.consultar_comandos()[0]
+
+    def consultar_comandos(
+        self,
+        atuador: str | None = None,
+        tipo: str | None = None,
+        acao: str | None = None,
+        desde: datetime | None = None,
+        ate: datetime | None = None,
+        limite: int | None = None,
+        cursor: Cursor | None = None,
+    ) -> tuple[list[dict], str | None]:
+        """
+        Comandos (formato de listar_comandos) filtrados por atuador, tipo
+        de atuador, ação e intervalo, paginados por cursor. Retorna a página
+        e o cursor da próxima (None na última). Só os comandos percorridos
+        até completar a página viram dict.
+        """
+        registros = self._registros_comandos(atuador, tipo, acao, desde, fim_da_pagina(ate, cursor))
+        return paginar(registros, limite, cursor)
+
+    def iterar_comandos(
+        self,
+        atuador: str | None = None,
+        tipo: str | None = None,
+        acao: str | None = None,
+        desde: datetime | None = None,
+        ate: datetime | None = None,
+    ) -> Iterator[dict]:
+        """
+        Mesmos comandos de consultar_comandos, sem paginação: um gerador, do
+        mais recente ao mais antigo, para respostas em streaming. O
+        histórico é capturado na chamada; cada dict é montado ao ser pedido.
+        """
+        return (item for _, item in self._registros_comandos(atuador, tipo, acao, desde, ate))
+
+    def _registros_comandos(self, atuador, tipo, acao, desde, ate) -> Iterator[tuple[int, dict]]:
+        """(instante, dict) dos comandos filtrados, do mais recente ao mais antigo."""
+        with self._rw.leitura():
+            root = self._snapshot().getroot()
+            tipos = {a.get("id"): a.findtext("tipo") for a in root.iterfind("atuadores/atuador")}
+            refs = [
+                i for i, t in tipos.items()
+                if (atuador is None or i == atuador) and (tipo is None or t == tipo)
+            ]
+            comandos = self.segmentos.percorrer("comando", desde, ate, refs, reverso=True)
+
+        for tempo, c in comandos:
+            if acao is not None and c.findtext("acao") != acao:
                 continue
-
-            for c in comandos_el.findall("comando"):
-                data_hora = c.findtext("dataHora")
-                acao = c.findtext("acao")
-                comandos_lista.append(
-                    {
-                        "atuadorId": atuador_id,
-                        "tipo": tipo,
-                        "dataHora": data_hora,
-                        "acao": acao,
-                    }
-                )
-
-        # ordena por dataHora desc
-        comandos_lista.sort(key=lambda x: x["dataHora"] or "", reverse=True)
-        return comandos_lista
-
+            atuador_id = c.get("atuadorRef")
+            yield tempo, {
+                "atuadorId": atuador_id,
+                "tipo": tipos[atuador_id],
+                "dataHora": c.findtext("dataHora"),
+                "acao": c.findtext("acao"),
+            }
+
+    @escrita
     def limpar_historico_comandos(self) -> None:
         """
         Remove todos os comandos (histórico) de todos os atuadores,
         mas mantém os atuadores cadastrados.
         """
-        tree = self._load_tree()
-        root = tree.getroot()
-        atuadores_el = root.find("atuadores")
-
-        if atuadores_el is not None:
-            for a in atuadores_el.findall("atuador"):
-                comandos_el = a.find("comandos")
-                if comandos_el is not None:
-                    a.remove(comandos_el)
-
-        self._save_tree(tree)
-
+        self.segmentos.remover_comandos()
+        self.recentes.limpar("comando")
+        self.controle.limpar()
+        self._registrar_escrita_comandos()
 
     # LEITURAS / ALERTAS
 
@@ -373,152 +1100,507 @@ class XMLService:
         }
         Ordenado da leitura mais recente para a mais antiga.
         """
-        tree = self._load_tree()
-        root = tree.getroot()
+        return self.consultar_leituras()[0]
+
+    def consultar_leituras(
+        self,
+        sensor: str | None = None,
+        tipo: str | None = None,
+        status: str | set[str] | None = None,
+        desde: datetime | None = None,
+        ate: datetime | None = None,
+        limite: int | None = None,
+        cursor: Cursor | None = None,
+    ) -> tuple[list[dict], str | None]:
+        """
+        Leituras (formato de listar_leituras) filtradas por sensor, tipo,
+        status e intervalo, paginadas por cursor. Retorna a página e o
+        cursor da próxima (None na última). Sensor e tipo usam o índice do
+        histórico; só as leituras percorridas até completar a página
+        viram dict.
+        """
+        registros = self._registros_leituras(sensor, tipo, status, desde, fim_da_pagina(ate, cursor))
+        return paginar(registros, limite, cursor)
+
+    def iterar_leituras(
+        self,
+        sensor: str | None = None,
+        tipo: str | None = None,
+        status: str | set[str] | None = None,
+        desde: datetime | None = None,
+        ate: datetime | None = None,
+    ) -> Iterator[dict]:
+        """Mesmo que iterar_comandos, para as leituras de consultar_leituras."""
+        return (item for _, item in self._registros_leituras(sensor, tipo, status, desde, ate))
+
+    def _registros_leituras(self, sensor, tipo, status, desde, ate) -> Iterator[tuple[int, dict]]:
+        """(instante, dict) das leituras filtradas, da mais recente à mais antiga."""
+        status = {status} if isinstance(status, str) else status
+        codigos = None if status is None else {STATUS.index(s) for s in status}
+        with self._rw.leitura():
+            tabela = self._tabela_faixas()
+            refs = None
+            if sensor is not None or tipo is not None:
+                refs = [
+                    i for i, t in zip(tabela.ids, tabela.tipos)
+                    if (sensor is None or i == sensor) and (tipo is None or t == tipo)
+                ]
+            leituras = self.segmentos.percorrer("leitura", desde, ate, refs, reverso=True)
+
+        for tempo, l in leituras:
+            sensor_ref = l.get("sensorRef")
+            try:
+                valor_dec = Decimal(l.findtext("valor"))
+                codigo = tabela.classificar_um(sensor_ref, float(valor_dec))
+            except Exception:
+                valor_dec, codigo = None, SEM_FAIXA
+            # o dict (e a mensagem) só para as leituras que passam no filtro
+            if codigos is None or codigo in codigos:
+                yield tempo, self._leitura_para_dict(l, tabela, valor_dec, codigo)
+
+    @staticmethod
+    def _leitura_para_dict(l: etree._Element, tabela: TabelaFaixas, valor_dec, codigo: int) -> dict:
+        sensor_ref = l.get("sensorRef")
+        return {
+            "sensorId": sensor_ref,
+            "tipo": tabela.tipo(sensor_ref),
+            "unidade": l.get("unidade"),
+            "dataHora": l.findtext("dataHora"),
+            "valor": float(valor_dec) if valor_dec is not None else None,
+            "status": STATUS[codigo],
+            "mensagem": tabela.mensagem(sensor_ref, valor_dec, codigo),
+            "foraFaixa": codigo not in (DENTRO, SEM_FAIXA),
+        }
 
-        sensores_el = root.find("sensores")
-        sensores_map = {s.get("id"): s for s in sensores_el.findall("sensor")}
+    def registrar_leituras_lote(self, itens: list) -> list[dict]:
+        """
+        Recebe leituras de um gateway em lote:
+          { sensorId, dataHora, valor, unidade? }
+        Cada item é conferido contra o cadastro de sensores e contra o tipo
+        <leitura> do XSD (xs:dateTime / xs:decimal); os aceitos são gravados
+        de uma só vez. Sem `unidade`, usa a unidade cadastrada no sensor.
+        Retorna o resultado por item, na ordem recebida:
+          { indice, sensorId, aceita: bool, duplicada?, erro? }
+        Uma leitura já presente no histórico conta como aceita, com
+        `duplicada: true`, e não é gravada de novo.
+        Lança ItemInvalido (nada é gravado) se um campo vier com tipo JSON
+        errado (ex.: sensorId lista ou objeto).
+        """
+        self._conferir_tipos_lote(itens)
+        root = self._snapshot().getroot()
+        unidades = {
+            s.get("id"): s.findtext("unidade") or None
+            for s in root.iterfind("sensores/sensor")
+        }
 
-        leituras_el = root.find("leituras")
-        leituras = []
+        resultados = []
+        aceitas = []
+        for indice, item in enumerate(itens):
+            resultado = {"indice": indice, "sensorId": None, "aceita": False}
+            resultados.append(resultado)
 
-        for l in leituras_el.findall("leitura"):
-            sensor_ref = l.get("sensorRef")
-            unidade = l.get("unidade")
-            data_hora = l.findtext("dataHora")
-            valor_str = l.findtext("valor")
+            if not isinstance(item, dict):
+                resultado["erro"] = "Item deve ser um objeto."
+                continue
+            sensor_id = item.get("sensorId")
+            resultado["sensorId"] = sensor_id
+            if sensor_id not in unidades:
+                resultado["erro"] = f"Sensor não cadastrado: {sensor_id}"
+                continue
+            if "dataHora" not in item or "valor" not in item:
+                resultado["erro"] = "Campos obrigatórios: sensorId, dataHora, valor."
+                continue
 
-            sensor = sensores_map.get(sensor_ref)
-            tipo = sensor.findtext("tipo") if sensor is not None else None
+            valor = item["valor"]
 
-            status = "sem-faixa"
-            mensagem = "Faixa não configurada para esse tipo de sensor."
-            fora_faixa = False
+            leitura_el = etree.Element("leitura", sensorRef=str(sensor_id))
+            unidade = item.get("unidade") or unidades[sensor_id]
+            if unidade:
+                leitura_el.set("unidade", str(unidade))
+            etree.SubElement(leitura_el, "dataHora").text = str(item["dataHora"])
+            etree.SubElement(leitura_el, "valor").text = str(valor)
 
-            try:
-                valor_dec = Decimal(valor_str)
-                valor_float = float(valor_dec)
-            except Exception:
-                valor_dec = None
-                valor_float = None
-
-            faixa = FAIXAS.get(tipo)
-            if faixa and valor_dec is not None:
-                minimo, maximo = faixa
-                if valor_dec < minimo:
-                    status = "abaixo"
-                    mensagem = f"{tipo} abaixo da faixa ideal ({valor_dec} < {minimo})"
-                    fora_faixa = True
-                elif valor_dec > maximo:
-                    status = "acima"
-                    mensagem = f"{tipo} acima da faixa ideal ({valor_dec} > {maximo})"
-                    fora_faixa = True
-                else:
-                    status = "dentro"
-                    mensagem = "Dentro da faixa ideal."
-                    fora_faixa = False
+            erro = self.segmentos.erro_fragmento(leitura_el)
+            if erro is not None:
+                resultado["erro"] = erro
+                continue
 
-            leituras.append(
-                {
-                    "sensorId": sensor_ref,
-                    "tipo": tipo,
-                    "unidade": unidade,
-                    "dataHora": data_hora,
-                    "valor": valor_float,
-                    "status": status,
-                    "mensagem": mensagem,
-                    "foraFaixa": fora_faixa,
-                }
-            )
+            resultado["aceita"] = True
+            aceitas.append((leitura_el, resultado))
+
+        if aceitas:
+            # já conferidos item a item acima
+            duplicadas = self._anexar_historico([el for el, _ in aceitas], validar=False)
+            ids = {id(el) for el in duplicadas}
+            for el, resultado in aceitas:
+                if id(el) in ids:
+                    resultado["duplicada"] = True
+        return resultados
+
+    @staticmethod
+    def _conferir_tipos_lote(itens: list) -> None:
+        for indice, item in enumerate(itens):
+            if not isinstance(item, dict):
+                continue  # rejeitado no resultado do item
+            for campo, (tipos, descricao) in TIPOS_ITEM_LOTE.items():
+                valor = item.get(campo)
+                if valor is not None and (isinstance(valor, bool) or not isinstance(valor, tipos)):
+                    raise ItemInvalido(indice, f"Item {indice}: campo '{campo}' deve ser {descricao}.")
+
+    def registrar_quadros(self, dados: bytes) -> dict:
+        """
+        Mesmo que registrar_leituras_lote, para o quadro binário dos gateways
+        (ver binary_frame). O sensor é conferido uma vez por entrada do
+        dicionário do quadro; data (epoch) e valor (inteiro escalado) já são
+        válidos por construção.
+        Retorna { aceitas, duplicadas, rejeitadas, erros: [{ indice, sensorId, erro }] },
+        com `indice` contado desde o primeiro registro do primeiro quadro.
+        Lança ValueError se o quadro estiver malformado (nada é gravado).
+        """
+        quadros = list(decodificar_quadros(dados))
 
-        leituras.sort(key=lambda x: x["dataHora"] or "", reverse=True)
-        return leituras
+        root = self._snapshot().getroot()
+        unidades = {
+            s.get("id"): s.findtext("unidade") or None
+            for s in root.iterfind("sensores/sensor")
+        }
 
-    def limpar_leituras(self) -> None:
-        tree = self._load_tree()
-        root = tree.getroot()
-        leituras_el = root.find("leituras")
+        aceitas = []
+        erros = []
+        base = 0
+        for quadro in quadros:
+            conhecidos = [sensor_id in unidades for sensor_id in quadro.sensores]
+
+            for i, (idx, ms, valor) in enumerate(zip(quadro.indices, quadro.tempos, quadro.valores)):
+                sensor_id = quadro.sensores[idx]
+                if not conhecidos[idx]:
+                    erros.append({"indice": base + i, "sensorId": sensor_id,
+                                  "erro": f"Sensor não cadastrado: {sensor_id}"})
+                    continue
+                try:
+                    data_hora = formatar_data_hora(epoch_ms_para_datetime(ms))
+                except OverflowError:
+                    erros.append({"indice": base + i, "sensorId": sensor_id,
+                                  "erro": "dataHora fora da faixa."})
+                    continue
+
+                leitura_el = etree.Element("leitura", sensorRef=sensor_id)
+                if unidades[sensor_id]:
+                    leitura_el.set("unidade", unidades[sensor_id])
+                etree.SubElement(leitura_el, "dataHora").text = data_hora
+                etree.SubElement(leitura_el, "valor").text = valor_para_texto(valor, quadro.escala)
+                aceitas.append(leitura_el)
+            base += len(quadro.indices)
+
+        duplicadas = []
+        if aceitas:
+            duplicadas = self._anexar_historico(aceitas, validar=False)
+        return {
+            "aceitas": len(aceitas),
+            "duplicadas": len(duplicadas),
+            "rejeitadas": len(erros),
+            "erros": erros,
+        }
 
-        for l in list(leituras_el.findall("leitura")):
-            leituras_el.remove(l)
+    @escrita
+    def limpar_leituras(self) -> None:
+        self.segmentos.remover_leituras()
+        self.recentes.limpar("leitura")
+        self.buffer_sensores.limpar()
+        self.colunas.reconstruir([])
 
-        # placeholder mínimo
-        sensores_el = root.find("sensores")
-        primeiro_sensor = sensores_el.find("sensor")
-        sensor_id = primeiro_sensor.get("id")
+    def compactar_historico(self, antes: datetime | None = None) -> int:
+        """
+        Retenção: leituras e comandos anteriores a `antes` (por padrão, mais
+        antigos que Config.XML_RETENTION_DAYS) vão para o arquivo morto,
+        segmento a segmento, sem parar a ingestão (que só usa o journal).
+        A cópia colunar continua com as leituras arquivadas; dos agregados,
+        ficam as larguras de Config.XML_RETENTION_ROLLUPS, e os alertas do
+        período saem do índice. Retorna quantos registros foram arquivados.
+        """
+        if antes is None:
+            if Config.XML_RETENTION_DAYS is None:
+                return 0
+            antes = self._corte_retencao()
+        arquivados = self.segmentos.arquivar(antes)
+        self._podar_arquivados()
+        return arquivados
+
+    @escrita
+    def reconstruir_colunas(self) -> int:
+        """Refaz a cópia colunar das leituras; retorna quantas foram gravadas."""
+        return self._reconstruir_colunas()
+
+    def leituras_recentes(self, sensor_id: str, limite: int | None = None) -> list[dict] | None:
+        """
+        Últimas leituras de um sensor, da mais recente para a mais antiga,
+        direto do buffer em memória: [{dataHora, valor}]. None se o sensor
+        não estiver cadastrado.
+        """
+        sensores = self._snapshot().getroot().iterfind("sensores/sensor")
+        if not any(s.get("id") == sensor_id for s in sensores):
+            return None
+        # leituras gravadas por outros processos desde a última sincronização
+        self.buffer_sensores.sincronizar(self.colunas.colunas())
+        return [
+            {"dataHora": formatar_data_hora(epoch_ms_para_datetime(tempo)), "valor": valor}
+            for tempo, valor in self.buffer_sensores.recentes(sensor_id, limite)
+        ]
 
-        placeholder = etree.SubElement(leituras_el, "leitura", sensorRef=sensor_id)
-        etree.SubElement(placeholder, "dataHora").text = datetime.utcnow().isoformat() + "Z"
-        etree.SubElement(placeholder, "valor").text = "0.0"
+    def agregar_leituras(
+        self,
+        bucket: str,
+        sensor: str | None = None,
+        desde: datetime | None = None,
+        ate: datetime | None = None,
+    ) -> list[dict]:
+        """
+        Mínimo, máximo, média, quantidade e último valor das leituras por
+        bucket ("1m", "5m", "1h" ou "1d", alinhados em UTC), por sensor:
+        [{sensorId, bucket, series: [{inicio, quantidade, minimo, maximo,
+        media, ultimo}]}]. Sem sensor, todos os que têm leituras.
+        Vem dos agregados pré-calculados, sem reler o histórico; as
+        larguras finas só cobrem os últimos dias (XML_ROLLUPS_RETENTION).
+        """
+        if bucket not in self.rollups.larguras:
+            raise ValueError(f"Bucket inválido. Use: {', '.join(self.rollups.larguras)}.")
+
+        # leituras gravadas por outros processos desde a última sincronização
+        self.rollups.sincronizar(self.colunas.colunas())
+        inicio = epoch_ms(desde) if desde is not None else None
+        fim = epoch_ms(ate) if ate is not None else None
+        sensores = [sensor] if sensor is not None else self.rollups.sensores()
+        return [
+            {
+                "sensorId": s,
+                "bucket": bucket,
+                "series": [
+                    {
+                        "inicio": formatar_data_hora(epoch_ms_para_datetime(a.inicio)),
+                        "quantidade": a.quantidade,
+                        "minimo": a.minimo,
+                        "maximo": a.maximo,
+                        "media": a.media,
+                        "ultimo": a.ultimo_valor,
+                    }
+                    for a in self.rollups.consultar(bucket, s, inicio, fim)
+                ],
+            }
+            for s in sensores
+        ]
 
-        self._save_tree(tree)
+    def estado_sensores(self) -> list[dict]:
+        """
+        Última leitura e status de cada sensor cadastrado, a partir do
+        buffer em memória (O(sensores), sem tocar no histórico).
+        """
+        # leituras gravadas por outros processos desde a última sincronização
+        self.buffer_sensores.sincronizar(self.colunas.colunas())
+        ultimas = self.buffer_sensores.ultimas()
+        tabela = self._tabela_faixas()
+        # todas as últimas leituras classificadas de uma vez
+        com_leitura = [sensor_id for sensor_id in tabela.ids if sensor_id in ultimas]
+        codigos = dict(zip(com_leitura, tabela.classificar(
+            [ultimas[sensor_id][1] for sensor_id in com_leitura],
+            [tabela.indice(sensor_id) for sensor_id in com_leitura],
+        )))
+
+        estado = []
+        for s in self._snapshot().getroot().iterfind("sensores/sensor"):
+            sensor_id, tipo = s.get("id"), s.findtext("tipo")
+            item = {
+                "sensorId": sensor_id,
+                "tipo": tipo,
+                "unidade": s.findtext("unidade") or None,
+                "dataHora": None,
+                "valor": None,
+                "status": None,
+                "mensagem": "Sem leituras.",
+                "foraFaixa": False,
+            }
+            ultima = ultimas.get(sensor_id)
+            if ultima is not None:
+                tempo, valor = ultima
+                codigo = int(codigos[sensor_id])
+                item.update(
+                    dataHora=formatar_data_hora(epoch_ms_para_datetime(tempo)),
+                    valor=valor,
+                    status=STATUS[codigo],
+                    # repr do float reproduz o texto decimal gravado
+                    mensagem=tabela.mensagem(sensor_id, Decimal(repr(valor)), codigo),
+                    foraFaixa=codigo not in (DENTRO, SEM_FAIXA),
+                )
+            estado.append(item)
+        return estado
 
     def listar_alertas(self):
-        leituras = self.listar_leituras()
-        tree = self._load_tree()
-        root = tree.getroot()
-        sensores_el = root.find("sensores")
-        sensores_map = {s.get("id"): s for s in sensores_el.findall("sensor")}
-
-        alertas = []
-        for l in leituras:
-            sensor = sensores_map.get(l["sensorId"])
-            if not sensor:
-                continue
-            tipo = sensor.findtext("tipo")
-            faixa = FAIXAS.get(tipo)
-            if not faixa:
-                continue
-            minimo, maximo = faixa
-            valor = Decimal(str(l["valor"]))
+        return self.consultar_alertas()[0]
+
+    def consultar_alertas(
+        self,
+        sensor: str | None = None,
+        tipo: str | None = None,
+        status: str | None = None,
+        desde: datetime | None = None,
+        ate: datetime | None = None,
+        limite: int | None = None,
+        cursor: Cursor | None = None,
+    ) -> tuple[list[dict], str | None]:
+        """
+        Leituras fora da faixa ideal ("abaixo"/"acima") e as anomalias
+        recentes apontadas pelas estatísticas por sensor (com o campo
+        "anomalia": "desvio" ou "tendencia"), intercaladas por instante,
+        com os mesmos filtros e paginação de consultar_leituras. Vêm do
+        índice de alertas, classificadas na ingestão: o custo segue a
+        quantidade de alertas, não a de leituras. O status restringe a
+        um dos dois tipos.
+        """
+        registros = self._registros_alertas(sensor, tipo, status, desde, fim_da_pagina(ate, cursor))
+        return paginar(registros, limite, cursor)
+
+    def iterar_alertas(
+        self,
+        sensor: str | None = None,
+        tipo: str | None = None,
+        status: str | None = None,
+        desde: datetime | None = None,
+        ate: datetime | None = None,
+    ) -> Iterator[dict]:
+        """Mesmo que iterar_comandos, para os alertas de consultar_alertas."""
+        return (item for _, item in self._registros_alertas(sensor, tipo, status, desde, ate))
+
+    def _registros_alertas(self, sensor, tipo, status, desde, ate) -> Iterator[tuple[int, dict]]:
+        """(instante, dict) dos alertas de sensores cadastrados, do mais recente ao mais antigo."""
+        tabela = self._sincronizar_alertas()
+        refs = [
+            i for i, t in zip(tabela.ids, tabela.tipos)
+            if (sensor is None or i == sensor) and (tipo is None or t == tipo)
+        ]
+        inicio = epoch_ms(desde) if desde is not None else None
+        fim = epoch_ms(ate) if ate is not None else None
+        fora = {"abaixo", "acima"} if status is None else {status} & {"abaixo", "acima"}
+        tipos = set(ANOMALIAS) if status is None else {status} & set(ANOMALIAS)
+
+        fontes = []
+        if fora:
+            alertas = self.alertas.percorrer(inicio, fim, refs, fora)
+            fontes.append((a.tempo, self._alerta_para_dict(a, tabela)) for a in alertas)
+        if tipos:
+            anomalias = self.estatisticas.anomalias(inicio, fim, set(refs), tipos)
+            fontes.append((a.tempo, self._anomalia_para_dict(a, tabela)) for a in anomalias)
+        # as duas fontes já vêm do mais recente ao mais antigo
+        return heapq.merge(*fontes, key=itemgetter(0), reverse=True)
+
+    @staticmethod
+    def _alerta_para_dict(alerta, tabela: TabelaFaixas) -> dict:
+        # a mensagem só é montada para os alertas entregues
+        codigo = STATUS.index(alerta.status)
+        return {
+            "sensorId": alerta.sensor,
+            "tipo": tabela.tipo(alerta.sensor),
+            "dataHora": formatar_data_hora(epoch_ms_para_datetime(alerta.tempo)),
+            "valor": alerta.valor,
+            "mensagem": tabela.mensagem(alerta.sensor, Decimal(repr(alerta.valor)), codigo),
+        }
 
-            if valor < minimo:
-                msg = f"{tipo} abaixo da faixa ideal ({valor} < {minimo})"
-            elif valor > maximo:
-                msg = f"{tipo} acima da faixa ideal ({valor} > {maximo})"
-            else:
-                continue
+    @staticmethod
+    def _anomalia_para_dict(anomalia, tabela: TabelaFaixas) -> dict:
+        if anomalia.tipo == "desvio":
+            mensagem = "Leitura destoa da média móvel do sensor."
+        else:
+            mensagem = "Tendência de sair da faixa ideal no horizonte configurado."
+        return {
+            "sensorId": anomalia.sensor,
+            "tipo": tabela.tipo(anomalia.sensor),
+            "dataHora": formatar_data_hora(epoch_ms_para_datetime(anomalia.tempo)),
+            "valor": anomalia.valor,
+            "mensagem": mensagem,
+            "anomalia": anomalia.tipo,
+        }
 
-            alertas.append(
-                {
-                    "sensorId": l["sensorId"],
-                    "tipo": tipo,
-                    "dataHora": l["dataHora"],
-                    "valor": float(valor),
-                    "mensagem": msg,
-                }
-            )
+    def estatisticas_sensor(self, sensor_id: str) -> dict | None:
+        """
+        Estatísticas correntes do sensor, mantidas leitura a leitura:
+        amostras, média e desvio-padrão acumulados, EWMA e seu desvio,
+        taxa de variação por minuto, sinalizações atuais (desvio,
+        tendencia) e as anomalias recentes. None se o sensor não estiver
+        cadastrado; campos nulos se ainda não tiver leituras.
+        """
+        tabela = self._sincronizar_alertas()
+        if tabela.indice(sensor_id) < 0:
+            return None
+        estado = self.estatisticas.consultar(sensor_id)
+        faixa = tabela.faixa(sensor_id)
+        item = {
+            "sensorId": sensor_id,
+            "tipo": tabela.tipo(sensor_id),
+            "faixa": {"minimo": float(faixa.minimo), "maximo": float(faixa.maximo)} if faixa else None,
+        }
+        if estado is None:
+            return {**item, "amostras": 0, "anomalias": {a: False for a in ANOMALIAS}, "eventos": []}
+
+        ultimo = estado.pop("ultimoTempo")
+        eventos = estado.pop("eventos")
+        return {
+            **item,
+            **estado,
+            "ultimaDataHora": formatar_data_hora(epoch_ms_para_datetime(ultimo)) if ultimo is not None else None,
+            "eventos": [self._anomalia_para_dict(a, tabela) for a in eventos],
+        }
 
-        alertas.sort(key=lambda x: x["dataHora"], reverse=True)
-        return alertas
+    def listar_episodios(self, sensor: str | None = None, abertos: bool | None = None) -> list[dict]:
+        """
+        Episódios de alerta por sensor, do mais recente ao mais antigo:
+        [{sensorId, status, inicio, fim, leituras, extremo, aberto}]. Um
+        episódio começa na primeira leitura fora da faixa e termina na
+        próxima dentro dela (fim = None enquanto aberto).
+        """
+        self._sincronizar_alertas()
+
+        def data(tempo):
+            return formatar_data_hora(epoch_ms_para_datetime(tempo)) if tempo is not None else None
+
+        return [
+            {
+                "sensorId": e.sensor,
+                "status": e.status,
+                "inicio": data(e.inicio),
+                "fim": data(e.fim),
+                "leituras": e.leituras,
+                "extremo": e.extremo,
+                "aberto": e.aberto,
+            }
+            for e in self.alertas.episodios(sensor, abertos)
+        ]
 
     # SIMULAÇÃO DE CICLO (leituras + comandos)
 
     def simular_ciclo(self):
         """
-        Para cada sensor:
-          - gera uma nova leitura
-          - se fora da faixa, registra comando no primeiro atuador
-        Se falhar ao salvar no XML principal, grava leituras na fila offline.
+        Para cada sensor, gera uma nova leitura. As leituras do ciclo vão
+        para o controle dos atuadores (ControleAtuadores), que registra no
+        máximo um comando por atuador, e só quando o estado dele muda.
+        Se falhar ao salvar no histórico, grava leituras na fila offline.
         """
-        tree = self._load_tree()
+        tree = self._snapshot()
         root = tree.getroot()
 
         sensores_el = root.find("sensores")
-        leituras_el = root.find("leituras")
-        atuadores_el = root.find("atuadores")
+        tabela = self._tabela_faixas()
 
         agora_iso = datetime.utcnow().isoformat() + "Z"
         novas_leituras = []
+        leituras_els = []
+        comandos_els = []
 
         for sensor in sensores_el.findall("sensor"):
             sensor_id = sensor.get("id")
             tipo = sensor.findtext("tipo")
             unidade = sensor.findtext("unidade") or None
 
-            faixa = FAIXAS.get(tipo)
+            faixa = tabela.faixa(sensor_id)
             if faixa:
-                minimo, maximo = faixa
+                minimo, maximo, _ = faixa
                 if random.random() < 0.8:
                     valor = random.uniform(float(minimo), float(maximo))
                 else:
@@ -531,16 +1613,13 @@ class XMLService:
 
             valor_dec = Decimal(str(round(valor, 2)))
 
-            leitura_el = etree.SubElement(
-                leituras_el,
-                "leitura",
-                sensorRef=sensor_id,
-            )
+            leitura_el = etree.Element("leitura", sensorRef=sensor_id)
             if unidade:
                 leitura_el.set("unidade", unidade)
 
             etree.SubElement(leitura_el, "dataHora").text = agora_iso
             etree.SubElement(leitura_el, "valor").text = str(valor_dec)
+            leituras_els.append(leitura_el)
 
             novas_leituras.append(
                 {
@@ -552,28 +1631,21 @@ class XMLService:
                 }
             )
 
-            # comandos do atuador (histórico)
-            if faixa and atuadores_el is not None:
-                minimo, maximo = faixa
-                cmd_acao = None
-                if valor_dec < minimo:
-                    cmd_acao = "ligar"
-                elif valor_dec > maximo:
-                    cmd_acao = "desligar"
-
-                if cmd_acao:
-                    atuador = atuadores_el.find("atuador")
-                    if atuador is not None:
-                        comandos_el = atuador.find("comandos")
-                        if comandos_el is None:
-                            comandos_el = etree.SubElement(atuador, "comandos")
-                        cmd_el = etree.SubElement(comandos_el, "comando")
-                        etree.SubElement(cmd_el, "dataHora").text = agora_iso
-                        etree.SubElement(cmd_el, "acao").text = cmd_acao
-
-        # tenta salvar no XML principal, se falhar → fila offline
+        # comandos dos atuadores (histórico): só as mudanças de estado, a
+        # partir do estado atual (inclusive comandos de outros processos)
+        self._sincronizar_atuadores()
+        decisoes = self.controle.decidir(
+            tree, tabela, ((l["sensorId"], l["valor"]) for l in novas_leituras)
+        )
+        for atuador_id, acao in decisoes.items():
+            cmd_el = etree.Element("comando", atuadorRef=atuador_id)
+            etree.SubElement(cmd_el, "dataHora").text = agora_iso
+            etree.SubElement(cmd_el, "acao").text = acao
+            comandos_els.append(cmd_el)
+
+        # tenta salvar no histórico, se falhar → fila offline
         try:
-            self._save_tree(tree)
+            self._anexar_historico(leituras_els, comandos_els)
         except Exception:
             self.adicionar_pendentes(novas_leituras)
 
@@ -582,72 +1654,172 @@ class XMLService:
     # EXPORTAÇÃO DE LEITURAS EM XML (RF8)
 
     def exportar_leituras_filtradas(self, dt_inicio: datetime, dt_fim: datetime) -> bytes:
+        """O XML de exportar_leituras_xml num único bytes (exportações pequenas)."""
+        return b"".join(self.exportar_leituras_xml(dt_inicio, dt_fim))
+
+    def exportar_leituras(
+        self,
+        dt_inicio: datetime,
+        dt_fim: datetime,
+        formato: str = "xml",
+        sensor: str | None = None,
+        colunas: tuple[str, ...] | None = None,
+        compressao: str | None = None,
+    ) -> Iterator[bytes]:
         """
-        Monta um XML 'hidroponia' com leituras filtradas por [dt_inicio, dt_fim].
-        Meta / sensores / atuadores permanecem os mesmos.
+        Exportação em streaming das leituras de [dt_inicio, dt_fim] (e,
+        se informado, de um sensor) em blocos de bytes:
+          - "xml": documento 'hidroponia' (exportar_leituras_xml);
+          - "csv" / "ndjson": uma linha por leitura, com as `colunas`
+            escolhidas de COLUNAS_LEITURA (todas, por padrão).
+        Com compressao="gzip", o fluxo sai comprimido. Parâmetros
+        inválidos lançam ValueError já na chamada.
         """
-        tree = self._load_tree()
-        root = tree.getroot()
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato inválido. Use: {', '.join(FORMATOS)}.")
+        if compressao is not None and compressao not in COMPRESSOES:
+            raise ValueError(f"Compressão inválida. Use: {', '.join(COMPRESSOES)}.")
+
+        if formato == "xml":
+            if colunas is not None:
+                raise ValueError("A seleção de colunas vale só para csv e ndjson.")
+            blocos = self.exportar_leituras_xml(dt_inicio, dt_fim, sensor)
+        else:
+            blocos = SERIALIZADORES[formato](
+                self._linhas_exportacao(dt_inicio, dt_fim, sensor), colunas or COLUNAS_LEITURA
+            )
+        return comprimir_gzip(blocos) if compressao == "gzip" else blocos
+
+    def _linhas_exportacao(self, dt_inicio: datetime, dt_fim: datetime, sensor: str | None):
+        """Leituras do intervalo como tuplas na ordem de COLUNAS_LEITURA, sem montar XML."""
+        with self._rw.leitura():
+            root = self._snapshot().getroot()
+            leituras = self._historico_completo(
+                "leitura", dt_inicio, dt_fim, [sensor] if sensor is not None else None
+            )
+        sensores = {
+            s.get("id"): (s.findtext("tipo"), s.findtext("unidade") or "")
+            for s in root.iterfind("sensores/sensor")
+        }
+        for _, l in leituras:
+            sensor_id = l.get("sensorRef")
+            cadastro = sensores.get(sensor_id)
+            if cadastro is None:
+                continue  # como no XML: só sensores ainda cadastrados
+            tipo, unidade = cadastro
+            yield sensor_id, tipo, l.findtext("dataHora"), l.findtext("valor"), l.get("unidade") or unidade
+
+    def exportar_leituras_xml(
+        self, dt_inicio: datetime, dt_fim: datetime, sensor: str | None = None
+    ) -> Iterator[bytes]:
+        """
+        Gera, em blocos de bytes, um XML 'hidroponia' com leituras e
+        comandos filtrados por [dt_inicio, dt_fim] (leituras só de `sensor`,
+        se informado). Meta / sensores / atuadores permanecem os mesmos.
+        Inclui o que a retenção já moveu para o arquivo morto.
+
+        Streaming: cada registro é lido do histórico, validado contra o seu
+        tipo no XSD e escrito (etree.xmlfile) antes do próximo; nem a
+        árvore nem o documento de saída ficam inteiros em memória. A
+        estrutura (ordem, IDREFs) é garantida aqui, então o documento
+        completo continua válido pelo hidroponia.xsd.
+        """
+        with self._rw.leitura():
+            root = self._snapshot().getroot()
+            leituras = self._historico_completo(
+                "leitura", dt_inicio, dt_fim, [sensor] if sensor is not None else None
+            )
+            atuadores = [
+                (a, self._historico_completo("comando", dt_inicio, dt_fim, [a.get("id")]))
+                for a in root.iterfind("atuadores/atuador")
+            ]
 
-        # novo root
-        new_root = etree.Element("hidroponia", id=root.get("id"))
-
-        # copia meta
-        meta_src = root.find("meta")
-        meta_new = etree.SubElement(new_root, "meta")
-        for tag in ["nome", "local", "versao"]:
-            el = meta_src.find(tag)
-            if el is not None:
-                etree.SubElement(meta_new, tag).text = el.text
-
-        # copia sensores
-        sensores_src = root.find("sensores")
-        sensores_new = etree.SubElement(new_root, "sensores")
-        for s in sensores_src.findall("sensor"):
-            s_new = etree.SubElement(sensores_new, "sensor", id=s.get("id"))
-            for tag in ["tipo", "unidade", "modelo", "localizacao"]:
-                el = s.find(tag)
-                etree.SubElement(s_new, tag).text = el.text if el is not None else ""
-
-        # filtra leituras
-        leituras_src = root.find("leituras")
-        leituras_new = etree.SubElement(new_root, "leituras")
-
-        for l in leituras_src.findall("leitura"):
-            data_hora = l.findtext("dataHora")
-            try:
-                dt = datetime.fromisoformat(data_hora.replace("Z", "+00:00"))
-            except Exception:
-                continue
+        def validado(el: etree._Element) -> etree._Element:
+            self._schemas_exportacao[el.tag].assertValid(el)
+            return el
 
-            if dt_inicio <= dt <= dt_fim:
-                attrs = {"sensorRef": l.get("sensorRef")}
-                if l.get("unidade"):
-                    attrs["unidade"] = l.get("unidade")
-                l_new = etree.SubElement(leituras_new, "leitura", **attrs)
-                etree.SubElement(l_new, "dataHora").text = data_hora
-                etree.SubElement(l_new, "valor").text = l.findtext("valor")
-
-        # copia atuadores + comandos
-        atuadores_src = root.find("atuadores")
-        if atuadores_src is not None:
-            atuadores_new = etree.SubElement(new_root, "atuadores")
-            for a in atuadores_src.findall("atuador"):
-                a_new = etree.SubElement(atuadores_new, "atuador", id=a.get("id"))
-                etree.SubElement(a_new, "tipo").text = a.findtext("tipo")
-                comandos_src = a.find("comandos")
-                if comandos_src is not None:
-                    comandos_new = etree.SubElement(a_new, "comandos")
-                    for c in comandos_src.findall("comando"):
-                        c_new = etree.SubElement(comandos_new, "comando")
-                        etree.SubElement(c_new, "dataHora").text = c.findtext("dataHora")
-                        etree.SubElement(c_new, "acao").text = c.findtext("acao")
-
-        new_tree = etree.ElementTree(new_root)
-        self.schema.assertValid(new_tree)  # ainda compatível com o XSD
-        return etree.tostring(
-            new_root,
-            encoding="utf-8",
-            xml_declaration=True,
-            pretty_print=True,
-        )
+        def nova_leitura(l: etree._Element) -> etree._Element:
+            attrs = {"sensorRef": l.get("sensorRef")}
+            if l.get("unidade"):
+                attrs["unidade"] = l.get("unidade")
+            l_new = etree.Element("leitura", **attrs)
+            etree.SubElement(l_new, "dataHora").text = l.findtext("dataHora")
+            etree.SubElement(l_new, "valor").text = l.findtext("valor")
+            return validado(l_new)
+
+        def novo_comando(c: etree._Element) -> etree._Element:
+            c_new = etree.Element("comando")
+            etree.SubElement(c_new, "dataHora").text = c.findtext("dataHora")
+            etree.SubElement(c_new, "acao").text = c.findtext("acao")
+            return validado(c_new)
+
+        saida = BlocosSaida()
+        with etree.xmlfile(saida, encoding="utf-8") as xf:
+            xf.write_declaration()
+            with xf.element("hidroponia", id=root.get("id")):
+                # copia meta
+                meta = etree.Element("meta")
+                for tag in ["nome", "local", "versao"]:
+                    el = root.find(f"meta/{tag}")
+                    if el is not None:
+                        etree.SubElement(meta, tag).text = el.text
+                xf.write("\n  ", validado(meta))
+
+                # copia sensores
+                xf.write("\n  ")
+                sensor_ids = set()
+                with xf.element("sensores"):
+                    for s in root.iterfind("sensores/sensor"):
+                        s_new = etree.Element("sensor", id=s.get("id"))
+                        for tag in ["tipo", "unidade", "modelo", "localizacao"]:
+                            el = s.find(tag)
+                            etree.SubElement(s_new, tag).text = el.text if el is not None else ""
+                        if s.find("lote") is not None:
+                            etree.SubElement(s_new, "lote").text = s.findtext("lote")
+                        xf.write("\n    ", validado(s_new))
+                        sensor_ids.add(s.get("id"))
+                    xf.write("\n  ")
+                yield saida.retirar()
+
+                # leituras (só de sensores ainda cadastrados, por causa do IDREF)
+                leituras = (el for _, el in leituras if el.get("sensorRef") in sensor_ids)
+                primeira = next(leituras, None)
+                if primeira is not None:
+                    xf.write("\n  ")
+                    with xf.element("leituras"):
+                        for l in chain([primeira], leituras):
+                            xf.write("\n    ", nova_leitura(l))
+                            if saida.cheio():
+                                xf.flush()
+                                yield saida.retirar()
+                        xf.write("\n  ")
+
+                # atuadores + comandos do intervalo
+                if root.find("atuadores") is not None:
+                    xf.write("\n  ")
+                    with xf.element("atuadores"):
+                        for a, comandos in atuadores:
+                            a_new = etree.Element("atuador", id=a.get("id"))
+                            etree.SubElement(a_new, "tipo").text = a.findtext("tipo")
+                            for c in a.iterfind("controla"):
+                                etree.SubElement(a_new, "controla", sensorRef=c.get("sensorRef"))
+                            validado(a_new)
+                            xf.write("\n    ")
+                            with xf.element("atuador", id=a.get("id")):
+                                for filho in a_new:
+                                    xf.write("\n      ", filho)
+                                comandos = (el for _, el in comandos)
+                                primeiro = next(comandos, None)
+                                if primeiro is not None:
+                                    xf.write("\n      ")
+                                    with xf.element("comandos"):
+                                        for c in chain([primeiro], comandos):
+                                            xf.write("\n        ", novo_comando(c))
+                                            if saida.cheio():
+                                                xf.flush()
+                                                yield saida.retirar()
+                                        xf.write("\n      ")
+                                xf.write("\n    ")
+                        xf.write("\n  ")
+                xf.write("\n")
+        yield saida.retirar()
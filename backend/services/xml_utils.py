@@ -0,0 +1,83 @@
+import copy
+import os
+from datetime import datetime, timezone
+
+from lxml import etree
+
+XS_NS = "http://www.w3.org/2001/XMLSchema"
+
+
+def parse_data_hora(valor: str) -> datetime:
+    """
+    Converte um xs:dateTime em datetime com fuso (UTC quando não informado).
+    Lança ValueError se o texto não for uma data válida.
+    """
+    dt = datetime.fromisoformat(valor.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def formatar_data_hora(dt: datetime) -> str:
+    """Formato usado no XML: ISO 8601 em UTC com sufixo Z."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.isoformat() + "Z"
+
+
+def compilar_fragmento(xsd_doc: etree._ElementTree, nome: str) -> etree.XMLSchema:
+    """
+    Gera um schema cujo elemento raiz é a declaração `nome` do XSD
+    informado. IDREF vira NCName (o mesmo espaço léxico), pois a
+    referência é conferida à parte contra o conjunto de IDs do documento.
+    """
+    decl = xsd_doc.find(f".//{{{XS_NS}}}element[@name='{nome}']")
+    decl = copy.deepcopy(decl)
+    # declaração global não aceita minOccurs/maxOccurs
+    for attr in ("minOccurs", "maxOccurs"):
+        decl.attrib.pop(attr, None)
+    for attr in decl.iter(f"{{{XS_NS}}}attribute"):
+        if attr.get("type") == "xs:IDREF":
+            attr.set("type", "xs:NCName")
+
+    schema_el = etree.Element(
+        f"{{{XS_NS}}}schema",
+        nsmap={"xs": XS_NS},
+        elementFormDefault="qualified",
+    )
+    schema_el.append(decl)
+    return etree.XMLSchema(schema_el)
+
+
+def sincronizar_diretorio(diretorio: str) -> None:
+    """fsync do diretório, para que renames/remoções sobrevivam a uma queda."""
+    try:
+        fd = os.open(diretorio, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def escrever_xml(tree: etree._ElementTree, path: str) -> None:
+    """
+    Grava o XML de forma atômica: escreve num temporário, faz fsync e
+    renomeia por cima do destino. Uma queda no meio da escrita deixa o
+    arquivo antigo intacto.
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        tree.write(
+            f,
+            encoding="utf-8",
+            xml_declaration=True,
+            pretty_print=True,
+        )
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    sincronizar_diretorio(os.path.dirname(path) or ".")
@@ -1,5 +1,8 @@
 // frontend/static/js/dashboard.js
 
+// linhas exibidas nas tabelas de histórico (primeira página da API)
+const LIMITE_TABELA = 200;
+
 // HELPERS DE API
 
 async function apiGet(url) {
@@ -17,19 +20,14 @@ async function apiDelete(url) {
 }
 
 /**
- * POST genérico.
- * Se asDevice = true, manda o X-API-KEY do "gateway" (dispositivo).
+ * POST genérico (cadastros). As rotas de dispositivo (X-API-KEY) não são
+ * chamadas pelo navegador: a ingestão roda no agendador do servidor.
  */
-async function apiPost(url, body = {}, { asDevice = false } = {}) {
+async function apiPost(url, body = {}) {
   const headers = {
     "Content-Type": "application/json",
   };
 
-  if (asDevice) {
-    // MESMO VALOR definido em Config.DEVICE_API_KEY no backend
-    headers["X-API-KEY"] = "DEVICE-KEY";
-  }
-
   const resp = await fetch(url, {
     method: "POST",
     headers,
@@ -209,7 +207,7 @@ async function carregarAtuadores() {
       <td>${a.id}</td>
       <td>${a.tipo}</td>
       <td>${ultimo}</td>
-      <td>${(a.comandos || []).length}</td>
+      <td>${a.estado || "-"}</td>
     `;
     tbody.appendChild(tr);
   });
@@ -220,7 +218,9 @@ async function carregarComandos() {
   if (!tabela) return;
 
   const tbody = tabela.querySelector("tbody");
-  const { status, data } = await apiGet("/api/atuadores/comandos");
+  const { status, data } = await apiGet(
+    `/api/atuadores/comandos?limit=${LIMITE_TABELA}`
+  );
   if (status !== 200) return;
 
   tbody.innerHTML = "";
@@ -352,7 +352,8 @@ async function carregarLeituras() {
   if (!tabela) return;
 
   const tbody = tabela.querySelector("tbody");
-  const { status, data } = await apiGet("/api/leituras");
+  // só a primeira página (as mais recentes), não o histórico inteiro
+  const { status, data } = await apiGet(`/api/leituras?limit=${LIMITE_TABELA}`);
   if (status !== 200) return;
 
   tbody.innerHTML = "";
@@ -378,6 +379,36 @@ async function carregarLeituras() {
   });
 }
 
+// fora da faixa (abaixo/acima) ou anomalia apontada pelas estatísticas
+const NOMES_ANOMALIA = { desvio: "Desvio", tendencia: "Tendência" };
+
+async function carregarAlertas() {
+  const tabela = document.getElementById("tabela-alertas");
+  if (!tabela) return;
+
+  const tbody = tabela.querySelector("tbody");
+  const { status, data } = await apiGet(`/api/alertas?limit=${LIMITE_TABELA}`);
+  if (status !== 200) return;
+
+  tbody.innerHTML = "";
+
+  data.forEach((a) => {
+    const tr = document.createElement("tr");
+    tr.classList.add(a.anomalia ? "anomalia" : "fora-faixa");
+
+    tr.innerHTML = `
+      <td>${a.sensorId}</td>
+      <td>${a.tipo || "-"}</td>
+      <td>${formatValor(a.valor)}</td>
+      <td>${a.anomalia ? NOMES_ANOMALIA[a.anomalia] : "Fora da faixa"}</td>
+      <td>${a.mensagem}</td>
+      <td>${formatDataHora(a.dataHora)}</td>
+    `;
+
+    tbody.appendChild(tr);
+  });
+}
+
 function toIsoWithZFromLocal(localValue) {
   if (!localValue) return null;
   // datetime-local vem sem segundos, adiciono ":00Z"
@@ -410,6 +441,7 @@ function initAlertasPage() {
           statusSpan.classList.add("ok");
         }
         await carregarLeituras();
+        await carregarAlertas();
       } else {
         if (statusSpan) {
           statusSpan.textContent = data.error || "Erro ao limpar leituras.";
@@ -442,21 +474,14 @@ function initAlertasPage() {
     });
   }
 
-  // loop de simulação "tempo real"
-  async function tickSimulacao() {
-    // chama o "gateway" com X-API-KEY
-    await apiPost("/api/simulacao/tick", {}, { asDevice: true });
-    await apiPost("/api/sync-pendentes", {}, { asDevice: true });
-
-    await carregarLeituras();
-  }
-
-  // primeira carga
+  // a simulação e a fila offline rodam no agendador do servidor:
+  // a página só relê as leituras e os alertas periodicamente
   carregarLeituras();
-  tickSimulacao();
-
-  // intervalo periódico
-  setInterval(tickSimulacao, 10000);
+  carregarAlertas();
+  setInterval(() => {
+    carregarLeituras();
+    carregarAlertas();
+  }, 10000);
 }
 
 // BOOTSTRAP 
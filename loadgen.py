@@ -0,0 +1,45 @@
+"""
+Gerador de carga: cadastra uma frota sintética e grava o histórico dela pelo
+caminho real de ingestão (quadros binários), para testes de volume.
+
+    python loadgen.py --sensores 10000 --dias 7 --passo 300
+    python loadgen.py --sensores 2000 --dias 1 --passo 60 --taxa 20000
+"""
+
+import argparse
+import json
+import time
+
+from backend.services.load_generator import DIA_MS, GeradorCarga, executar_carga, frota, preparar_frota
+from backend.services.xml_service import XMLService
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Gera leituras sintéticas de uma frota de sensores.")
+    parser.add_argument("--sensores", type=int, default=10_000, help="tamanho da frota")
+    parser.add_argument("--dias", type=float, default=1.0, help="dias de histórico, terminando agora")
+    parser.add_argument("--passo", type=int, default=60, help="segundos entre leituras de um sensor")
+    parser.add_argument("--taxa", type=float, default=None, help="leituras/s (padrão: o mais rápido possível)")
+    parser.add_argument("--quadro", type=int, default=50_000, help="registros por quadro")
+    parser.add_argument("--picos", type=float, default=0.0, help="fração de leituras com desvio de meia faixa")
+    parser.add_argument("--prefixo", default="carga", help="prefixo dos IDs dos sensores")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    sensores = frota(args.sensores, args.prefixo)
+    fim = int(time.time() * 1000) // 1000 * 1000
+    inicio = fim - int(args.dias * DIA_MS)
+
+    service = XMLService()
+    try:
+        cadastrados = preparar_frota(service, sensores)
+        gerador = GeradorCarga(sensores, seed=args.seed, picos=args.picos)
+        metricas = executar_carga(service, gerador, inicio, fim, args.passo * 1000, args.taxa, args.quadro)
+    finally:
+        service.fechar()
+
+    print(json.dumps({"cadastrados": cadastrados, **metricas}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
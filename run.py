@@ -1,6 +1,13 @@
+from werkzeug.serving import is_running_from_reloader
+
 from backend import create_app
 
-app = create_app()
+DEBUG = True
+
+# `python run.py` em debug: o processo pai do reloader só vigia os arquivos
+# e reinicia o filho, que é quem serve (e roda o agendador). Importado por
+# um servidor WSGI (run:app), cada worker serve.
+app = create_app(servidor=__name__ != "__main__" or not DEBUG or is_running_from_reloader())
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    app.run(debug=DEBUG)
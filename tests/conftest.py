@@ -0,0 +1,94 @@
+import os
+import shutil
+
+import pytest
+
+from backend import create_app
+from backend.config import Config, XML_DIR
+from backend.services import (
+    alert_index, binary_frame, columnar, hot_window, load_generator, rollups, thresholds,
+)
+from backend.services.xml_service import XMLService
+
+# módulos com ramo NumPy (todos importam o `np` opcional de columnar)
+MODULOS_NUMPY = (columnar, binary_frame, thresholds, alert_index, rollups, hot_window, load_generator)
+
+
+@pytest.fixture(autouse=True)
+def xml_temporario(tmp_path, monkeypatch):
+    """
+    Roda cada teste sobre uma cópia dos arquivos de backend/xml,
+    para não alterar os dados versionados no repositório.
+    """
+    destino = tmp_path / "xml"
+    shutil.copytree(XML_DIR, destino)
+
+    for nome in dir(Config):
+        valor = getattr(Config, nome)
+        if (nome.endswith("_PATH") or nome.endswith("_DIR")) and isinstance(valor, str):
+            if os.path.commonpath([XML_DIR, valor]) == XML_DIR:
+                novo = os.path.join(destino, os.path.relpath(valor, XML_DIR))
+                monkeypatch.setattr(Config, nome, novo)
+
+    # sem simulação em segundo plano: os testes controlam as leituras
+    monkeypatch.setattr(Config, "SCHEDULER_SIMULATION_INTERVAL", None)
+    monkeypatch.setattr(Config, "SCHEDULER_SYNC_INTERVAL", None)
+
+    return destino
+
+
+@pytest.fixture(params=["numpy", "python"])
+def com_e_sem_numpy(request, monkeypatch):
+    """
+    Roda o teste pelos dois caminhos: com NumPy (pulado se não estiver
+    instalado) e sem, com `np = None` em todos os módulos que o usam.
+    """
+    if request.param == "numpy":
+        if columnar.np is None:
+            pytest.skip("NumPy não instalado")
+    else:
+        for modulo in MODULOS_NUMPY:
+            monkeypatch.setattr(modulo, "np", None)
+    return request.param
+
+
+@pytest.fixture
+def novo_servico(xml_temporario):
+    """
+    Cria XMLService sobre a cópia do teste e fecha todos no fim (threads
+    do escritor e do agendador, travas e arquivos abertos).
+    """
+    criados = []
+
+    def criar() -> XMLService:
+        service = XMLService()
+        criados.append(service)
+        return service
+
+    yield criar
+    for service in reversed(criados):
+        service.fechar()
+
+
+@pytest.fixture
+def client(xml_temporario):
+    """Cliente do app; o XMLService criado com ele (api.xml_service) é fechado no fim."""
+    from backend.controllers import api
+
+    app = create_app()
+    yield app.test_client()
+    api.xml_service.fechar()
+
+
+def pytest_terminal_summary(terminalreporter):
+    """Medidas registradas pelos testes (record_property "vazao ..."), no fim do relatório."""
+    medidas = [
+        (relatorio.nodeid, nome, valor)
+        for relatorio in terminalreporter.stats.get("passed", [])
+        for nome, valor in relatorio.user_properties
+        if nome.startswith("vazao")
+    ]
+    if medidas:
+        terminalreporter.section("vazão")
+        for nodeid, nome, valor in medidas:
+            terminalreporter.write_line(f"{nodeid}: {nome} = {valor}")
@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+
+from backend import create_app
+from backend.config import Config
+from backend.services.interprocess import TravaLider
+from backend.services.scheduler import Agendador
+
+
+def esperar(condicao, timeout=5.0):
+    limite = time.monotonic() + timeout
+    while not condicao():
+        assert time.monotonic() < limite, "condição não atingida"
+        time.sleep(0.01)
+
+
+def test_intervalos_falhas_e_estouros():
+    agendador = Agendador(jitter=0.2)
+    rapidas, lentas = [], []
+
+    def falha():
+        raise RuntimeError("quebrou")
+
+    agendador.adicionar("rapida", lambda: rapidas.append(time.monotonic()), 0.02)
+    agendador.adicionar("lenta", lambda: (lentas.append(1), time.sleep(0.06)), 0.02)
+    agendador.adicionar("falha", falha, 0.02)
+    agendador.start()
+    try:
+        esperar(lambda: len(lentas) >= 3 and agendador.metricas()["falha"]["falhas"] >= 3)
+    finally:
+        agendador.parar()
+
+    metricas = agendador.metricas()
+    # a que falha continua agendada; a lenta estoura sem rodar em rajada
+    assert metricas["falha"]["ultimoErro"] == "quebrou"
+    assert metricas["lenta"]["estouros"] >= 1
+    assert metricas["lenta"]["maximaDuracaoMs"] >= 60
+    assert metricas["rapida"]["execucoes"] == len(rapidas)
+    assert all(m["execucoes"] > 0 for m in metricas.values())
+
+
+def test_acordar_antecipa_e_exclusiva_respeita_a_trava(tmp_path):
+    path = str(tmp_path / "lider.lock")
+    outro = TravaLider(path)
+    assert outro.tentar()
+
+    agendador = Agendador(trava_lider=TravaLider(path))
+    rodou = threading.Event()
+    exclusivas = []
+    agendador.adicionar("manutencao", rodou.set, 3600)
+    agendador.adicionar("simulacao", lambda: exclusivas.append(1), 0.01, exclusiva=True)
+    agendador.start()
+    try:
+        agendador.acordar("manutencao")
+        assert rodou.wait(2)
+        esperar(lambda: agendador.metricas()["simulacao"]["ignoradas"] >= 2)
+        assert exclusivas == []
+
+        # o líder saiu: a próxima tentativa assume a trava
+        outro.liberar()
+        esperar(lambda: exclusivas)
+    finally:
+        agendador.parar()
+
+
+def test_servidor_simula_sem_navegador(monkeypatch, novo_servico):
+    # contagem antes de o agendador do app existir (sem ingestão agendada)
+    inicial = novo_servico()
+    antes = len(inicial.listar_leituras())
+    inicial.fechar()
+
+    monkeypatch.setattr(Config, "SCHEDULER_SIMULATION_INTERVAL", 0.05)
+    monkeypatch.setattr(Config, "SCHEDULER_SYNC_INTERVAL", 0.05)
+    client = create_app().test_client()
+    from backend.controllers import api
+
+    service = api.xml_service
+    try:
+        # as métricas contam a execução depois que ela termina
+        esperar(lambda: client.get("/api/agendador/metricas").get_json()["simulacao"]["execucoes"] >= 1)
+        metricas = client.get("/api/agendador/metricas").get_json()
+        assert metricas["simulacao"]["falhas"] == 0 and metricas["simulacao"]["ignoradas"] == 0
+        assert {"checkpoint", "estatisticas", "retencao", "sincronizacao"} <= set(metricas)
+        assert len(service.listar_leituras()) > antes
+    finally:
+        service.fechar()
+
+
+def test_processo_que_nao_serve_nao_cria_servico(monkeypatch):
+    from backend.controllers import api
+
+    monkeypatch.setattr(api, "xml_service", None)
+    create_app(servidor=False)
+    assert api.xml_service is None
+
+    # nem chegou a abrir a trava de líder
+    assert not os.path.exists(Config.SCHEDULER_LEADER_PATH)
+
+
+def test_lideranca_passa_para_quem_continua_servindo(novo_servico):
+    antigo, novo = novo_servico(), novo_servico()
+    antigo.agendar_ingestao(0.05, None)
+    esperar(lambda: antigo.metricas_agendador()["simulacao"]["execucoes"] >= 1)
+
+    novo.agendar_ingestao(0.05, None)
+    esperar(lambda: novo.metricas_agendador()["simulacao"]["ignoradas"] >= 2)
+    assert novo.metricas_agendador()["simulacao"]["execucoes"] == 0
+
+    # o antigo deixa de servir, mas continua vivo: solta a trava
+    antigo.suspender_ingestao()
+    esperar(lambda: novo.metricas_agendador()["simulacao"]["execucoes"] >= 1)
+    assert "simulacao" not in antigo.metricas_agendador()
+    assert not antigo.agendador.trava_lider.tentar() and novo.agendador.trava_lider.tentar()
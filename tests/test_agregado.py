@@ -0,0 +1,160 @@
+import time
+from array import array
+
+import pytest
+
+from backend.services.columnar import Colunas
+from backend.services import rollups as modulo_rollups
+from backend.services.rollups import Rollups
+
+pytestmark = pytest.mark.usefixtures("com_e_sem_numpy")
+
+
+def _colunas(linhas, nomes, geracao=1):
+    return Colunas(
+        memoryview(array("q", [t for t, _, _ in linhas])),
+        memoryview(array("i", [s for _, s, _ in linhas])),
+        memoryview(array("d", [v for _, _, v in linhas])),
+        nomes,
+        geracao,
+    )
+
+
+def test_rollups_incrementais_e_fora_de_ordem():
+    rollups = Rollups()
+    linhas = [(0, 0, 1.0), (30_000, 0, 3.0), (61_000, 0, 5.0)]
+    assert rollups.sincronizar(_colunas(linhas, ["a"])) == 3
+
+    # atrasada, no primeiro minuto; e uma do mesmo instante, gravada depois
+    linhas += [(10_000, 0, -1.0), (61_000, 0, 6.0)]
+    assert rollups.sincronizar(_colunas(linhas, ["a"])) == 2
+
+    minutos = rollups.consultar("1m", "a")
+    assert [(a.inicio, a.quantidade, a.minimo, a.maximo, a.ultimo_valor) for a in minutos] == [
+        (0, 3, -1.0, 3.0, 3.0),
+        (60_000, 2, 5.0, 6.0, 6.0),
+    ]
+    [hora] = rollups.consultar("1h", "a")
+    assert (hora.quantidade, hora.media, hora.ultimo_valor) == (5, 14.0 / 5, 6.0)
+    # o bucket que contém `inicio` entra inteiro
+    assert [a.inicio for a in rollups.consultar("1m", "a", 70_000)] == [60_000]
+
+    # armazém refeito: os agregados também
+    rollups.sincronizar(_colunas([(0, 0, 9.0)], ["b"], geracao=2))
+    assert rollups.sensores() == ["b"]
+
+
+def test_retencao_limita_o_detalhe_fino_em_memoria():
+    rollups = Rollups(retencao={"1m": 2 * 3_600_000})
+    hora = 3_600_000
+    linhas = [(h * hora, 0, float(h)) for h in range(6)]
+    rollups.sincronizar(_colunas(linhas, ["a"]))
+
+    # por minuto, só as 2 horas antes da leitura mais recente; por hora, tudo
+    assert [a.inicio for a in rollups.consultar("1m", "a")] == [3 * hora, 4 * hora, 5 * hora]
+    assert len(rollups.consultar("1h", "a")) == 6
+
+    # atrasada, de antes do corte: só entra nas larguras sem limite
+    rollups.sincronizar(_colunas(linhas + [(hora + 1, 0, 9.0)], ["a"]))
+    assert [a.inicio for a in rollups.consultar("1m", "a")] == [3 * hora, 4 * hora, 5 * hora]
+    assert rollups.consultar("1h", "a", hora, hora)[0].quantidade == 2
+
+
+def test_leitura_com_data_no_futuro_nao_apaga_o_presente():
+    rollups = Rollups(retencao={"1m": 2 * 3_600_000, "5m": 6 * 3_600_000})
+    agora = int(time.time() * 1000)
+    linhas = [(agora - 60_000, 0, 1.0), (agora, 0, 2.0)]
+    rollups.sincronizar(_colunas(linhas, ["a"]))
+
+    # relógio do sensor um ano adiantado
+    linhas.append((agora + 365 * 86_400_000, 0, 9.0))
+    rollups.sincronizar(_colunas(linhas, ["a"]))
+    linhas.append((agora + 1, 0, 3.0))
+    rollups.sincronizar(_colunas(linhas, ["a"]))
+
+    for bucket in ("1m", "5m"):
+        presente = rollups.consultar(bucket, "a", agora - 60_000, agora + 1)
+        assert sum(a.quantidade for a in presente) == 3
+
+
+def test_checkpoint_com_corte_no_futuro_recua(tmp_path, monkeypatch):
+    path = str(tmp_path / "agregados.bin")
+    agora = int(time.time() * 1000)
+    futuro = agora + 365 * 86_400_000
+    linhas = [(agora, 0, 1.0), (futuro, 0, 9.0)]
+    # checkpoint gravado sem o limite: o corte de 1m ficou um ano à frente
+    limite = modulo_rollups._limite_futuro
+    monkeypatch.setattr(modulo_rollups, "_limite_futuro", lambda: futuro)
+    antigo = Rollups(retencao={"1m": 3_600_000}, path=path)
+    antigo.sincronizar(_colunas(linhas, ["a"]))
+    antigo.salvar()
+    monkeypatch.setattr(modulo_rollups, "_limite_futuro", limite)
+
+    retomado = Rollups(retencao={"1m": 3_600_000}, path=path)
+    retomado.sincronizar(_colunas(linhas + [(agora + 1, 0, 2.0)], ["a"]))
+    assert [a.quantidade for a in retomado.consultar("1m", "a", agora, agora + 1)] == [1]
+
+
+def test_checkpoint_retoma_do_ponto_salvo(tmp_path):
+    path = str(tmp_path / "agregados.bin")
+    linhas = [(0, 0, 1.0), (30_000, 1, 3.0), (61_000, 0, 5.0)]
+    rollups = Rollups(retencao={"1m": 60_000}, path=path)
+    rollups.sincronizar(_colunas(linhas, ["a", "b"]))
+    rollups.salvar()
+
+    retomado = Rollups(retencao={"1m": 60_000}, path=path)
+    assert retomado.sensores() == ["a", "b"]
+    for bucket in ("1m", "1h"):
+        for sensor in ("a", "b"):
+            assert retomado.consultar(bucket, sensor) == rollups.consultar(bucket, sensor)
+
+    # só as linhas posteriores ao checkpoint são agregadas
+    assert retomado.sincronizar(_colunas(linhas + [(62_000, 0, 7.0)], ["a", "b"])) == 1
+    assert retomado.consultar("1m", "a")[-1].quantidade == 2
+
+    # checkpoint ilegível: começa do zero
+    with open(path, "r+b") as f:
+        f.truncate(40)
+    assert Rollups(path=path).sincronizar(_colunas(linhas, ["a", "b"])) == 3
+
+
+def test_agregado_confere_com_o_historico(client):
+    from backend.controllers import api
+
+    api.xml_service.registrar_leituras_lote(
+        [
+            {"sensorId": "s-ph-01", "dataHora": "2030-01-01T10:00:05Z", "valor": 6.0},
+            {"sensorId": "s-ph-01", "dataHora": "2030-01-01T10:04:59Z", "valor": 7.0},
+            {"sensorId": "s-ph-01", "dataHora": "2030-01-01T10:05:00Z", "valor": 5.0},
+        ]
+    )
+    resp = client.get(
+        "/api/leituras/agregado?sensorId=s-ph-01&bucket=5m&desde=2030-01-01T10:00:00Z"
+    )
+    assert resp.status_code == 200
+    [serie] = resp.get_json()
+    assert serie["series"] == [
+        {"inicio": "2030-01-01T10:00:00Z", "quantidade": 2, "minimo": 6.0,
+         "maximo": 7.0, "media": 6.5, "ultimo": 7.0},
+        {"inicio": "2030-01-01T10:05:00Z", "quantidade": 1, "minimo": 5.0,
+         "maximo": 5.0, "media": 5.0, "ultimo": 5.0},
+    ]
+
+    # por dia, todos os sensores: mesmas contagens e extremos do histórico
+    leituras = api.xml_service.listar_leituras()
+    agregados = client.get("/api/leituras/agregado?bucket=1d").get_json()
+    for item in agregados:
+        por_dia = {}
+        for l in leituras:
+            if l["sensorId"] == item["sensorId"]:
+                por_dia.setdefault(l["dataHora"][:10], []).append(l["valor"])
+        assert [(b["inicio"][:10], b["quantidade"], b["minimo"], b["maximo"])
+                for b in item["series"]] == [
+            (dia, len(v), min(v), max(v)) for dia, v in sorted(por_dia.items())
+        ]
+
+
+def test_agregado_parametros_invalidos(client):
+    assert client.get("/api/leituras/agregado").status_code == 400
+    assert client.get("/api/leituras/agregado?bucket=2m").status_code == 400
+    assert client.get("/api/leituras/agregado?bucket=1h&desde=ontem").status_code == 400
@@ -0,0 +1,131 @@
+import threading
+from array import array
+
+import pytest
+from lxml import etree
+
+from backend.services.alert_index import IndiceAlertas
+from backend.services.columnar import Colunas
+from backend.services.thresholds import compilar_faixas
+from backend.services.time_index import epoch_ms
+from backend.services.xml_utils import parse_data_hora
+
+pytestmark = pytest.mark.usefixtures("com_e_sem_numpy")
+
+
+XML = """
+<hidroponia id="h">
+  <sensores>
+    <sensor id="a"><tipo>pH</tipo><unidade/></sensor>
+    <sensor id="b"><tipo>pH</tipo><unidade/></sensor>
+  </sensores>
+  <faixas><faixa tipo="pH" minimo="1" maximo="7"/></faixas>
+</hidroponia>
+"""
+
+
+def _ms(data_hora: str) -> int:
+    return epoch_ms(parse_data_hora(data_hora))
+
+
+def _colunas(linhas, nomes, geracao=1):
+    return Colunas(
+        memoryview(array("q", [t for t, _, _ in linhas])),
+        memoryview(array("i", [s for _, s, _ in linhas])),
+        memoryview(array("d", [v for _, _, v in linhas])),
+        nomes,
+        geracao,
+    )
+
+
+def test_indice_equivale_a_classificar_as_leituras(client):
+    from backend.controllers import api
+
+    service = api.xml_service
+    esperados = [
+        (l["sensorId"], l["tipo"], _ms(l["dataHora"]), l["valor"], l["mensagem"])
+        for l in service.listar_leituras()
+        if l["foraFaixa"]
+    ]
+    assert esperados
+    # o índice guarda o instante com precisão de milissegundo
+    alertas = service.listar_alertas()
+    fora = [a for a in alertas if "anomalia" not in a]
+    assert [(a["sensorId"], a["tipo"], _ms(a["dataHora"]), a["valor"], a["mensagem"]) for a in fora] == esperados
+    assert client.get("/api/alertas?tipo=pH").get_json() == [a for a in alertas if a["tipo"] == "pH"]
+    # anomalias intercaladas por instante, do mais recente ao mais antigo
+    instantes = [_ms(a["dataHora"]) for a in alertas]
+    assert instantes == sorted(instantes, reverse=True)
+
+
+def test_episodios_por_sensor(client):
+    from backend.controllers import api
+
+    service = api.xml_service
+    valores = [3.0, 2.5, 6.0, 8.0, 9.5]
+    service.registrar_leituras_lote([
+        {"sensorId": "s-ph-01", "dataHora": f"2031-01-01T10:0{i}:00Z", "valor": v}
+        for i, v in enumerate(valores)
+    ])
+
+    resp = client.get("/api/alertas/episodios?sensorId=s-ph-01")
+    assert resp.status_code == 200
+    aberto, fechado = resp.get_json()[:2]
+    assert aberto == {
+        "sensorId": "s-ph-01", "status": "acima", "inicio": "2031-01-01T10:03:00Z",
+        "fim": None, "leituras": 2, "extremo": 9.5, "aberto": True,
+    }
+    assert fechado == {
+        "sensorId": "s-ph-01", "status": "abaixo", "inicio": "2031-01-01T10:00:00Z",
+        "fim": "2031-01-01T10:02:00Z", "leituras": 2, "extremo": 2.5, "aberto": False,
+    }
+
+    abertos = client.get("/api/alertas/episodios?aberto=true").get_json()
+    assert all(e["aberto"] for e in abertos) and aberto in abertos
+    assert client.get("/api/alertas/episodios?aberto=talvez").status_code == 400
+
+    # os alertas novos saem do índice, sem reler as leituras
+    alertas = client.get("/api/alertas?sensorId=s-ph-01&desde=2031-01-01").get_json()
+    assert [a["valor"] for a in alertas if "anomalia" not in a] == [9.5, 8.0, 2.5, 3.0]
+
+    service.limpar_leituras()
+    assert service.listar_alertas() == []
+    assert service.listar_episodios() == []
+
+
+def test_atrasadas_entram_em_ordem_de_uma_vez():
+    tabela = compilar_faixas(etree.fromstring(XML))
+    # em ordem, depois um lote só de atrasadas (mesmos instantes inclusive)
+    linhas = [(t, 0, 9.0) for t in (10, 20, 30, 40)]
+    linhas += [(25, 1, 0.5), (5, 0, 8.0), (20, 1, 0.1), (35, 0, 7.5), (20, 0, 8.5)]
+    indice = IndiceAlertas()
+    indice.sincronizar(_colunas(linhas[:4], ["a", "b"]), tabela)
+    indice.sincronizar(_colunas(linhas, ["a", "b"]), tabela)
+
+    assert [(a.tempo, a.sensor, a.valor) for a in reversed(list(indice.percorrer()))] == [
+        (5, "a", 8.0), (10, "a", 9.0), (20, "a", 9.0), (20, "b", 0.1), (20, "a", 8.5),
+        (25, "b", 0.5), (30, "a", 9.0), (35, "a", 7.5), (40, "a", 9.0),
+    ]
+
+
+def test_faixa_mudada_por_outro_processo_nao_reclassifica_na_consulta(monkeypatch, novo_servico):
+    service, outro = novo_servico(), novo_servico()
+    antes = [a for a in service.listar_alertas() if a["sensorId"] == "s-ph-01"]
+    assert antes
+
+    principal = threading.current_thread()
+    refeitos = []
+    original = IndiceAlertas.refeito
+
+    def refeito(self, colunas, tabela):
+        refeitos.append(threading.current_thread() is principal)
+        return original(self, colunas, tabela)
+
+    monkeypatch.setattr(IndiceAlertas, "refeito", refeito)
+    outro.definir_faixa({"sensorId": "s-ph-01", "minimo": -100, "maximo": 100})
+
+    # a consulta não espera a reclassificação: segue no índice anterior
+    service.listar_alertas()
+    assert True not in refeitos
+    service._reclassificar_alertas()
+    assert not [a for a in service.listar_alertas() if a["sensorId"] == "s-ph-01" and "anomalia" not in a]
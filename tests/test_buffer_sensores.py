@@ -0,0 +1,87 @@
+import pytest
+
+from backend.config import Config
+from backend.services.hot_window import JanelaRecente
+
+pytestmark = pytest.mark.usefixtures("com_e_sem_numpy")
+
+
+def test_janela_circular_guarda_as_ultimas_em_ordem():
+    janela = JanelaRecente(3)
+    for t in (10, 20, 30, 40):
+        janela.adicionar(t, t / 10)
+    assert janela.pares() == [(20, 2.0), (30, 3.0), (40, 4.0)]
+
+    janela.adicionar(35, 3.5)  # atrasada: entra no meio
+    janela.adicionar(5, 0.5)  # mais antiga que todas: ignorada
+    assert janela.ultimas() == [(40, 4.0), (35, 3.5), (30, 3.0)]
+    assert janela.ultimas(1) == [(40, 4.0)] and janela.ultima() == (40, 4.0)
+
+
+def test_lote_intercalado_da_o_mesmo_que_uma_a_uma():
+    lote = [(50, 5.0), (42, 4.2), (60, 6.0), (45, 4.5), (1, 0.1), (60, 6.1)]
+    uma_a_uma, de_uma_vez = JanelaRecente(4), JanelaRecente(4)
+    for janela in (uma_a_uma, de_uma_vez):
+        for t in (10, 20, 40):
+            janela.adicionar(t, t / 10)
+    for t, v in lote:
+        uma_a_uma.adicionar(t, v)
+    de_uma_vez.estender(lote)
+    assert de_uma_vez.pares() == uma_a_uma.pares() == [(45, 4.5), (50, 5.0), (60, 6.0), (60, 6.1)]
+
+
+def test_estado_e_recentes_vem_do_buffer(client):
+    from backend.controllers import api
+
+    itens = [
+        {"sensorId": "s-ph-01", "dataHora": f"2030-01-01T10:00:0{i}Z", "valor": 6 + i}
+        for i in range(3)
+    ]
+    api.xml_service.registrar_leituras_lote(itens)
+
+    recentes = client.get("/api/sensores/s-ph-01/recentes?limit=2").get_json()
+    assert recentes == [
+        {"dataHora": "2030-01-01T10:00:02Z", "valor": 8.0},
+        {"dataHora": "2030-01-01T10:00:01Z", "valor": 7.0},
+    ]
+    assert client.get("/api/sensores/s-nenhum/recentes").status_code == 404
+
+    estado = {s["sensorId"]: s for s in client.get("/api/sensores/estado").get_json()}
+    assert estado["s-ph-01"]["valor"] == 8.0
+    assert estado["s-ph-01"]["status"] == "acima"
+    assert estado["s-ph-01"]["dataHora"] == "2030-01-01T10:00:02Z"
+
+
+def test_buffer_e_recarregado_do_historico(monkeypatch, novo_servico):
+    monkeypatch.setattr(Config, "XML_RECENTES_POR_SENSOR", 4)
+    service = novo_servico()
+    ultimas = [l for l in service.listar_leituras() if l["sensorId"] == "s-ec-01"][:4]
+    service.fechar()
+
+    novo = novo_servico()
+    recentes = novo.leituras_recentes("s-ec-01")
+    assert [r["valor"] for r in recentes] == [l["valor"] for l in ultimas]
+    # o buffer guarda o instante em milissegundos
+    assert [r["dataHora"][:23] for r in recentes] == [l["dataHora"][:23] for l in ultimas]
+
+
+def test_buffer_acompanha_o_que_outro_processo_grava(monkeypatch, novo_servico):
+    monkeypatch.setattr(Config, "XML_RECENTES_POR_SENSOR", 2)
+    escritor, leitor = novo_servico(), novo_servico()
+
+    escritor.registrar_leituras_lote([
+        {"sensorId": "s-ph-01", "dataHora": f"2030-01-01T10:00:0{i}Z", "valor": 6 + i / 10}
+        for i in (1, 3, 2)
+    ])
+    assert [r["valor"] for r in leitor.leituras_recentes("s-ph-01")] == [6.3, 6.2]
+
+    # atrasada: mais antiga que as duas do buffer, não entra
+    escritor.registrar_leituras_lote([{"sensorId": "s-ph-01", "dataHora": "2030-01-01T09:00:00Z", "valor": 5}])
+    escritor.registrar_leituras_lote([{"sensorId": "s-ph-01", "dataHora": "2030-01-01T10:00:04Z", "valor": 7}])
+    estado = {s["sensorId"]: s for s in leitor.estado_sensores()}
+    assert estado["s-ph-01"]["valor"] == 7.0
+    assert [r["valor"] for r in leitor.leituras_recentes("s-ph-01")] == [7.0, 6.3]
+
+    # armazém refeito (limpeza) em outro processo: o buffer recomeça
+    escritor.limpar_leituras()
+    assert leitor.leituras_recentes("s-ph-01") == []
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from backend.config import Config
+from backend.services.columnar import ArmazemColunar
+
+pytestmark = pytest.mark.usefixtures("com_e_sem_numpy")
+
+
+def test_colunas_acompanham_o_historico(novo_servico):
+    service = novo_servico()
+    total = len(service.listar_leituras())
+    assert service.colunas.total() == total
+
+    service.registrar_leituras_lote(
+        [
+            {"sensorId": "s-ph-01", "dataHora": "2030-01-01T00:00:00Z", "valor": 6.25},
+            {"sensorId": "s-ec-01", "dataHora": "2030-01-01T00:00:00Z", "valor": 1.5},
+        ]
+    )
+    cols = service.colunas.colunas()
+    assert len(cols) == total + 2
+    assert cols.nomes[cols.sensores[-1]] == "s-ec-01"
+    assert list(cols.valores[-2:]) == [6.25, 1.5]
+
+    tempos, valores = service.colunas.varrer(inicio=cols.tempos[-1], sensor="s-ph-01")
+    assert list(valores) == [6.25]
+
+    service.limpar_leituras()
+    assert service.colunas.total() == 0
+
+
+def test_colunas_sao_refeitas_se_divergirem(novo_servico):
+    service = novo_servico()
+    esperado = service.colunas.total()
+    service.fechar()
+
+    # queda no meio de um append: uma coluna ficou maior que as outras
+    with open(os.path.join(Config.XML_COLUMNAR_DIR, "valores.f64"), "ab") as f:
+        f.write(b"\0" * 12)
+    assert ArmazemColunar(Config.XML_COLUMNAR_DIR).total() == esperado
+
+    # histórico com leituras que as colunas não têm: refeitas na inicialização
+    ArmazemColunar(Config.XML_COLUMNAR_DIR).reconstruir([])
+    novo = novo_servico()
+    assert novo.colunas.total() == esperado
+    assert sorted(novo.colunas.varrer()[1]) == sorted(l["valor"] for l in novo.listar_leituras())
@@ -0,0 +1,103 @@
+from lxml import etree
+
+from backend.services.actuator_control import ControleAtuadores, rotas_controle
+from backend.services.thresholds import compilar_faixas
+
+XML = """
+<hidroponia id="h">
+  <sensores>
+    <sensor id="ph"><tipo>pH</tipo><unidade/></sensor>
+    <sensor id="ec"><tipo>EC</tipo><unidade/></sensor>
+    <sensor id="t"><tipo>temperatura</tipo><unidade/></sensor>
+  </sensores>
+  <atuadores>
+    <atuador id="bomba"><tipo>bomba</tipo><controla sensorRef="ph"/><controla sensorRef="ec"/></atuador>
+    <atuador id="aquecedor"><tipo>aquecedor</tipo><controla sensorRef="t"/></atuador>
+  </atuadores>
+</hidroponia>
+"""
+
+
+def test_rotas_banda_morta_e_agrupamento():
+    documento = etree.ElementTree(etree.fromstring(XML))
+    tabela = compilar_faixas(documento.getroot())
+    assert rotas_controle(documento.getroot()) == {"ph": ["bomba"], "ec": ["bomba"], "t": ["aquecedor"]}
+
+    controle = ControleAtuadores(banda=0.1)
+    # pH 4.5 a 7.5 (banda 0.3): 4.3 ainda está na banda morta
+    assert controle.decidir(documento, tabela, [("ph", 4.3)]) == {}
+    assert controle.decidir(documento, tabela, [("ph", 4.1), ("t", 40)]) == {"bomba": "ligar", "aquecedor": "desligar"}
+    # pedidos opostos para o mesmo atuador no ciclo se anulam
+    assert controle.decidir(documento, tabela, [("ph", 4.1), ("ec", 3.5)]) == {}
+
+    ligar = etree.fromstring(
+        '<comando atuadorRef="bomba"><dataHora>2031-01-01T10:00:00Z</dataHora><acao>ligar</acao></comando>'
+    )
+    controle.registrar([ligar])
+    # histerese: já ligada, continua até um pedido contrário
+    assert controle.decidir(documento, tabela, [("ph", 4.0)]) == {}
+    assert controle.decidir(documento, tabela, [("ph", 6.0)]) == {}
+    assert controle.decidir(documento, tabela, [("ph", 8.0)]) == {"bomba": "desligar"}
+
+
+def test_simulacao_so_grava_mudancas_e_listagem_nao_le_historico(monkeypatch, novo_servico):
+    service = novo_servico()
+    service.limpar_historico_comandos()
+    for _ in range(30):
+        service.simular_ciclo()
+
+    comandos = list(reversed(service.listar_comandos()))
+    assert comandos
+    acoes = [c["acao"] for c in comandos if c["atuadorId"] == "a-bomba-01"]
+    # um comando por ciclo no máximo, e só quando o estado muda
+    assert len({c["dataHora"] for c in comandos}) == len(comandos)
+    assert all(a != b for a, b in zip(acoes, acoes[1:]))
+
+    def sem_historico(*args, **kwargs):
+        raise AssertionError("listar_atuadores percorreu o histórico")
+
+    with monkeypatch.context() as m:
+        m.setattr(service.segmentos, "percorrer", sem_historico)
+        m.setattr(service.segmentos, "iterar_comandos", sem_historico)
+        [atuador] = service.listar_atuadores()
+    assert atuador["ultimoComando"] == {"dataHora": comandos[-1]["dataHora"], "acao": comandos[-1]["acao"]}
+    assert atuador["estado"] == {"ligar": "ligado", "desligar": "desligado"}[comandos[-1]["acao"]]
+
+    # nova instância: o estado vem do índice do histórico
+    assert novo_servico().listar_atuadores() == [atuador]
+
+
+def test_cadastro_com_mapeamento(novo_servico):
+    service = novo_servico()
+    service.cadastrar_atuador({"id": "a-luz-01", "tipo": "iluminacao", "controla": ["s-temp-01"]})
+    assert service.listar_atuadores()[0]["controla"] == ["s-temp-01"]
+    assert service.controle.rotas(service._snapshot())["s-temp-01"] == ["a-luz-01"]
+
+    try:
+        service.cadastrar_atuador({"id": "a-x", "tipo": "x", "controla": ["nao-existe"]})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("sensor inexistente aceito")
+
+    # sem sensores, os mapeamentos saem junto e o XML continua válido
+    service.limpar_sensores()
+    service.validar_documento()
+    assert service.listar_atuadores()[0]["controla"] == []
+
+
+def test_estado_acompanha_comandos_de_outro_processo(novo_servico):
+    a, b = novo_servico(), novo_servico()
+    b.listar_atuadores()
+
+    # "a" apaga e volta a gravar comandos; "b" enxerga as duas mudanças
+    a.limpar_historico_comandos()
+    assert all(atuador["ultimoComando"] is None for atuador in b.listar_atuadores())
+
+    for _ in range(30):
+        a.simular_ciclo()
+        if a.listar_comandos():
+            break
+    assert a.listar_comandos()
+    assert b.listar_atuadores() == a.listar_atuadores()
+    assert b.controle.ultimo("a-bomba-01") == a.controle.ultimo("a-bomba-01")
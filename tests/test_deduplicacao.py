@@ -0,0 +1,101 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from lxml import etree
+
+from backend.config import Config
+from backend.controllers import api
+from backend.services.dedup import ChavesIdempotencia, IndiceRecentes
+from backend.services.xml_utils import formatar_data_hora
+
+
+def nova_leitura(sensor_ref, data_hora, valor="6.5"):
+    leitura = etree.Element("leitura", sensorRef=sensor_ref)
+    etree.SubElement(leitura, "dataHora").text = data_hora
+    etree.SubElement(leitura, "valor").text = valor
+    return leitura
+
+
+def agora_iso(segundos_atras=0):
+    return formatar_data_hora(datetime.now(timezone.utc) - timedelta(seconds=segundos_atras))
+
+
+def test_leitura_repetida_nao_e_gravada_de_novo(novo_servico):
+    service = novo_servico()
+    data_hora = agora_iso()
+    antes = len(service.listar_leituras())
+
+    assert service._anexar_historico([nova_leitura("s-ph-01", data_hora, "6.50")]) == []
+    repetidas = service._anexar_historico(
+        [
+            nova_leitura("s-ph-01", data_hora, "6.5"),
+            nova_leitura("s-ph-01", data_hora, "6.6"),
+            nova_leitura("s-ph-01", data_hora, "6.6"),
+        ]
+    )
+
+    assert [l.findtext("valor") for l in repetidas] == ["6.5", "6.6"]
+    assert len(service.listar_leituras()) == antes + 2
+
+
+def test_indice_e_recarregado_na_inicializacao(novo_servico):
+    service = novo_servico()
+    data_hora = agora_iso(60)
+    service._anexar_historico([nova_leitura("s-ph-01", data_hora)])
+    service.fechar()
+
+    service = novo_servico()
+    assert len(service._anexar_historico([nova_leitura("s-ph-01", data_hora)])) == 1
+
+
+def test_janela_descarta_chaves_antigas():
+    indice = IndiceRecentes(timedelta(hours=1), max_chaves=100)
+    antiga = nova_leitura("s-ph-01", "2025-12-01T08:00:00Z")
+    indice.reservar([antiga])
+    indice.reservar([nova_leitura("s-ph-01", "2025-12-01T10:00:00Z")])
+
+    assert len(indice) == 1
+    novos, duplicados, _ = indice.reservar([nova_leitura("s-ph-01", "2025-12-01T08:00:00Z")])
+    assert len(novos) == 1 and not duplicados
+
+
+def test_reenvio_com_chave_de_idempotencia_devolve_a_resposta_original(client):
+    headers = {"X-API-KEY": Config.DEVICE_API_KEY, "Idempotency-Key": "gw-01-lote-42"}
+    itens = [{"sensorId": "s-ph-01", "dataHora": agora_iso(), "valor": 6.1}]
+
+    primeira = client.post("/api/leituras/lote", json=itens, headers=headers)
+    segunda = client.post("/api/leituras/lote", json=itens, headers=headers)
+
+    assert primeira.status_code == segunda.status_code == 200
+    assert segunda.headers.get("Idempotent-Replay") == "true"
+    assert segunda.get_json() == primeira.get_json()
+    assert primeira.get_json()["duplicadas"] == 0
+
+
+def test_chave_em_andamento_de_processo_que_caiu_vence_no_prazo(tmp_path):
+    path = str(tmp_path / "idempotencia.log")
+    caiu = ChavesIdempotencia(path, ttl=3600, max_chaves=100, prazo=0.05)
+    assert caiu.iniciar("gw-01-lote-7") is None  # nunca conclui nem cancela
+
+    outro = ChavesIdempotencia(path, ttl=3600, max_chaves=100, prazo=0.05)
+    assert outro.iniciar("gw-01-lote-7") is outro.EM_ANDAMENTO
+    time.sleep(0.1)
+    assert outro.iniciar("gw-01-lote-7") is None
+
+
+def test_erro_ao_gravar_libera_a_chave(monkeypatch, client):
+    headers = {"X-API-KEY": Config.DEVICE_API_KEY, "Idempotency-Key": "gw-01-lote-43"}
+    itens = [{"sensorId": "s-ph-01", "dataHora": agora_iso(), "valor": 6.1}]
+
+    registrar = api._registrar_lote
+
+    def falhar(data, binario):
+        raise RuntimeError("falha inesperada")
+
+    monkeypatch.setattr(api, "_registrar_lote", falhar)
+    assert client.post("/api/leituras/lote", json=itens, headers=headers).status_code == 500
+    monkeypatch.setattr(api, "_registrar_lote", registrar)
+
+    reenvio = client.post("/api/leituras/lote", json=itens, headers=headers)
+    assert reenvio.status_code == 200
+    assert reenvio.headers.get("Idempotent-Replay") is None
@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+
+from backend.services.writer import EscritorUnico, FilaEscritaCheia
+
+TIMEOUT = 5
+
+
+def segurar(escritor: EscritorUnico) -> threading.Event:
+    """Ocupa o escritor com uma tarefa bloqueada; retorna o Event que a libera."""
+    comecou, liberar = threading.Event(), threading.Event()
+
+    def bloqueada():
+        comecou.set()
+        liberar.wait(TIMEOUT)
+
+    escritor.submeter(bloqueada)
+    assert comecou.wait(TIMEOUT), "o escritor não pegou a tarefa"
+    return liberar
+
+
+def test_cadastros_concorrentes_nao_perdem_atualizacoes(novo_servico):
+    service = novo_servico()
+    antes = len(service.listar_sensores())
+
+    def cadastrar(n):
+        service.cadastrar_sensor({"id": f"s-conc-{n:02d}", "tipo": "pH"})
+
+    threads = [threading.Thread(target=cadastrar, args=(n,)) for n in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(service.listar_sensores()) == antes + 20
+
+
+def test_gravacoes_concorrentes_sao_agrupadas_num_append(novo_servico):
+    service = novo_servico()
+    antes = len(service.listar_leituras())
+
+    chamadas = []
+    anexar = service.segmentos.anexar
+    service.segmentos.anexar = lambda *a, **kw: (chamadas.append(1), anexar(*a, **kw))[1]
+
+    # segura o escritor para as gravações se acumularem na fila
+    liberar = segurar(service._escritor)
+    enfileiradas = threading.Semaphore(0)
+    submeter = service._escritor.submeter
+
+    def contar(*args, **kwargs):
+        futuro = submeter(*args, **kwargs)
+        enfileiradas.release()
+        return futuro
+
+    service._escritor.submeter = contar
+
+    def enviar(n):
+        service.registrar_leituras_lote(
+            [{"sensorId": "s-ph-01", "dataHora": f"2025-12-01T10:00:{n:02d}Z", "valor": 6.5}]
+        )
+
+    threads = [threading.Thread(target=enviar, args=(n,)) for n in range(10)]
+    for t in threads:
+        t.start()
+    for _ in threads:
+        assert enfileiradas.acquire(timeout=TIMEOUT), "gravação não chegou à fila"
+    liberar.set()
+    for t in threads:
+        t.join()
+
+    assert len(service.listar_leituras()) == antes + 10
+    assert len(chamadas) == 1
+
+
+def test_fila_cheia_recusa_escritas():
+    escritor = EscritorUnico(tamanho_fila=1, max_lote=10)
+    escritor.start()
+    liberar = segurar(escritor)  # o escritor está bloqueado na primeira tarefa
+
+    escritor.submeter(lambda: None)
+    with pytest.raises(FilaEscritaCheia):
+        escritor.submeter(lambda: None)
+
+    liberar.set()
+    escritor.parar()
@@ -0,0 +1,74 @@
+import statistics
+
+import pytest
+
+from backend.config import Config
+from backend.services.sensor_stats import EstatisticasSensores
+
+
+def _leituras(sensor, valores, passo=1):
+    """Uma leitura a cada `passo` segundos, a partir de 2031-01-01T10:00:00Z."""
+    def data(i):
+        segundos = i * passo
+        return f"2031-01-01T{10 + segundos // 3600:02d}:{segundos // 60 % 60:02d}:{segundos % 60:02d}Z"
+    return [{"sensorId": sensor, "dataHora": data(i), "valor": v} for i, v in enumerate(valores)]
+
+
+def test_estatisticas_e_desvio(client):
+    from backend.controllers import api
+
+    service = api.xml_service
+    assert client.post("/api/sensores", json={"id": "s-est", "tipo": "pH"}).status_code == 201
+    vazio = client.get("/api/sensores/s-est/estatisticas").get_json()
+    assert vazio["amostras"] == 0 and vazio["anomalias"] == {"desvio": False, "tendencia": False}
+
+    valores = [6.0 + 0.05 * (i % 3) for i in range(30)] + [7.2]
+    service.registrar_leituras_lote(_leituras("s-est", valores, passo=60))
+
+    est = client.get("/api/sensores/s-est/estatisticas").get_json()
+    assert est["amostras"] == len(valores)
+    assert est["media"] == pytest.approx(statistics.mean(valores))
+    assert est["desvioPadrao"] == pytest.approx(statistics.stdev(valores))
+    assert est["anomalias"]["desvio"] and not est["anomalias"]["tendencia"]
+    assert [e["valor"] for e in est["eventos"]] == [7.2]
+
+    alertas = client.get("/api/alertas?status=desvio&sensorId=s-est").get_json()
+    assert [(a["valor"], a["anomalia"]) for a in alertas] == [(7.2, "desvio")]
+    # a listagem padrão (a da página de alertas) já traz a anomalia
+    assert client.get("/api/alertas?sensorId=s-est").get_json() == alertas
+    assert client.get("/api/alertas?sensorId=s-est&status=acima").get_json() == []
+    assert client.get("/api/alertas?status=qualquer").status_code == 400
+    assert client.get("/api/sensores/nao-existe/estatisticas").status_code == 404
+
+
+def test_tendencia_antes_de_sair_da_faixa(client):
+    from backend.controllers import api
+
+    service = api.xml_service
+    service.cadastrar_sensor({"id": "s-ec", "tipo": "EC"})
+    # EC caindo devagar, ainda dentro da faixa (0.5 a 3.0)
+    valores = [2.0 - 0.01 * i for i in range(60)]
+    service.registrar_leituras_lote(_leituras("s-ec", valores))
+    assert all(not l["foraFaixa"] for l in service.listar_leituras() if l["sensorId"] == "s-ec")
+
+    est = service.estatisticas_sensor("s-ec")
+    assert est["taxaPorMinuto"] == pytest.approx(-0.6, rel=0.05)
+    assert est["anomalias"]["tendencia"]
+    [tendencia] = client.get("/api/alertas?status=tendencia&sensorId=s-ec").get_json()
+    assert tendencia["anomalia"] == "tendencia"
+
+
+def test_checkpoint_retoma_sem_reler(client):
+    from backend.controllers import api
+
+    service = api.xml_service
+    service.registrar_leituras_lote(_leituras("s-ph-01", [6.0, 6.1, 6.2]))
+    antes = service.estatisticas_sensor("s-ph-01")
+    service.estatisticas.salvar()
+
+    retomada = EstatisticasSensores(Config.XML_STATS_PATH)
+    colunas = service.colunas.colunas()
+    assert retomada._lidas == len(colunas)
+    assert retomada.sincronizar(colunas, service._tabela_faixas()) == []
+    assert retomada.consultar("s-ph-01")["media"] == antes["media"]
+    assert retomada.consultar("s-ph-01")["ewma"] == antes["ewma"]
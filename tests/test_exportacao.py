@@ -0,0 +1,74 @@
+from lxml import etree
+
+from backend.services import export
+
+
+def test_exportacao_xml_em_blocos_valida(client, monkeypatch):
+    from backend.controllers import api
+
+    monkeypatch.setattr(export, "TAMANHO_BLOCO", 512)
+    api.xml_service.registrar_leituras_lote(
+        [
+            {"sensorId": "s-ph-01", "dataHora": f"2030-01-01T10:00:{i:02d}Z", "valor": 6 + i / 100}
+            for i in range(50)
+        ]
+    )
+
+    resp = client.get("/api/exportar/xml?inicio=2000-01-01&fim=2040-01-01")
+    assert resp.status_code == 200
+    assert resp.is_streamed
+    blocos = list(resp.response)
+    assert len(blocos) > 2
+
+    root = etree.fromstring(b"".join(blocos))
+    api.xml_service.schema.assertValid(etree.ElementTree(root))
+    leituras = root.findall("leituras/leitura")
+    assert len(leituras) == len(api.xml_service.listar_leituras())
+    datas = [l.findtext("dataHora") for l in leituras]
+    assert datas == sorted(datas)
+
+
+def test_exportacao_de_intervalo_vazio(client):
+    resp = client.get("/api/exportar/xml?inicio=1990-01-01&fim=1990-01-02")
+    root = etree.fromstring(resp.get_data())
+    assert root.find("leituras") is None
+    assert root.findall("atuadores/atuador")  # atuadores continuam, sem comandos
+    assert root.find("atuadores/atuador/comandos") is None
+
+
+def test_exportacao_csv_ndjson_e_gzip(client):
+    import csv
+    import gzip
+    import io
+    import json
+
+    from backend.controllers import api
+
+    ph = [l for l in api.xml_service.listar_leituras() if l["sensorId"] == "s-ph-01"]
+    ph.reverse()  # a listagem vem da mais recente para a mais antiga
+    base = "/api/exportar?inicio=2000-01-01&fim=2040-01-01&sensorId=s-ph-01"
+
+    resp = client.get(base + "&formato=csv&colunas=dataHora,valor")
+    assert resp.mimetype == "text/csv"
+    linhas = list(csv.reader(io.StringIO(resp.get_data(as_text=True))))
+    assert linhas[0] == ["dataHora", "valor"]
+    assert [float(v) for _, v in linhas[1:]] == [l["valor"] for l in ph]
+
+    resp = client.get(base + "&formato=ndjson&compressao=gzip")
+    assert resp.mimetype == "application/gzip"
+    assert "leituras_filtradas.ndjson.gz" in resp.headers["Content-Disposition"]
+    objetos = [json.loads(l) for l in gzip.decompress(resp.get_data()).splitlines()]
+    assert [o["valor"] for o in objetos] == [l["valor"] for l in ph]
+    assert set(objetos[0]) == {"sensorId", "tipo", "dataHora", "valor", "unidade"}
+    assert objetos[0]["tipo"] == "pH"
+
+    xml = gzip.decompress(client.get(base + "&compressao=gzip").get_data())
+    assert len(etree.fromstring(xml).findall("leituras/leitura")) == len(ph)
+
+
+def test_exportacao_parametros_invalidos(client):
+    base = "/api/exportar?inicio=2000-01-01&fim=2040-01-01"
+    assert client.get(base + "&formato=parquet").status_code == 400
+    assert client.get(base + "&compressao=zip").status_code == 400
+    assert client.get(base + "&formato=csv&colunas=valor,umidade").status_code == 400
+    assert client.get(base + "&colunas=valor").status_code == 400  # xml não tem colunas
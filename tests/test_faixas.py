@@ -0,0 +1,91 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+from lxml import etree
+
+from backend.models.hidroponia import Leitura, Sensor
+from backend.services.alert_service import avaliar_leitura
+from backend.services.thresholds import ABAIXO, ACIMA, DENTRO, SEM_FAIXA, compilar_faixas
+
+pytestmark = pytest.mark.usefixtures("com_e_sem_numpy")
+
+
+XML = """
+<hidroponia id="h">
+  <sensores>
+    <sensor id="a"><tipo>pH</tipo><unidade/><lote>L1</lote></sensor>
+    <sensor id="b"><tipo>pH</tipo><unidade/><lote>L2</lote></sensor>
+    <sensor id="c"><tipo>pH</tipo><unidade/></sensor>
+    <sensor id="d"><tipo>vento</tipo><unidade/></sensor>
+  </sensores>
+  <faixas>
+    <faixa sensorRef="a" minimo="1" maximo="2"/>
+    <faixa tipo="pH" lote="L1" minimo="3" maximo="4"/>
+    <faixa tipo="pH" lote="L2" minimo="5" maximo="6"/>
+    <faixa tipo="pH" minimo="6" maximo="7"/>
+  </faixas>
+</hidroponia>
+"""
+
+
+def test_tabela_resolve_e_classifica_em_lote():
+    tabela = compilar_faixas(etree.fromstring(XML))
+    assert [(f.minimo, f.origem) if f else None for f in tabela.faixas] == [
+        (1, "sensor"), (5, "lote"), (6, "tipo"), None,
+    ]
+
+    sensores = ["a", "a", "b", "c", "d", "desconhecido"]
+    valores = [0.5, 1.5, 6.5, 6.5, 1.0, 1.0]
+    codigos = tabela.classificar(valores, [tabela.indice(s) for s in sensores])
+    assert list(codigos) == [ABAIXO, DENTRO, ACIMA, DENTRO, SEM_FAIXA, SEM_FAIXA]
+    assert tabela.classificar_um("b", 4.0) == ABAIXO
+    assert tabela.mensagem("b", "4.0", ABAIXO) == "pH abaixo da faixa ideal (4.0 < 5)"
+
+    # avaliar_leitura usa a mesma tabela (aqui, a faixa do sensor, não a padrão do pH)
+    agora = datetime.now(timezone.utc)
+    avaliacao = avaliar_leitura(Sensor("a", "pH", ""), Leitura("a", agora, Decimal("5.0")), tabela)
+    assert avaliacao == {"status": "acima", "alerta": "pH acima da faixa ideal (5.0 > 2)"}
+    avaliacao = avaliar_leitura(Sensor("d", "vento", ""), Leitura("d", agora, Decimal("9")), tabela)
+    assert avaliacao == {"status": "sem-faixa", "alerta": None}
+
+
+def test_faixas_configuradas_valem_para_leituras_e_alertas(client):
+    from backend.controllers import api
+
+    service = api.xml_service
+    ph = [l for l in service.listar_leituras() if l["sensorId"] == "s-ph-01"]
+    assert any(l["foraFaixa"] for l in ph)
+
+    # faixa larga para o tipo: nenhuma leitura de pH fora
+    assert client.post("/api/faixas", json={"tipo": "pH", "minimo": -100, "maximo": 100}).status_code == 201
+    assert not any(l["foraFaixa"] for l in service.listar_leituras() if l["tipo"] == "pH")
+    assert client.get("/api/alertas?tipo=pH&status=abaixo").get_json() == []
+    assert client.get("/api/alertas?tipo=pH&status=acima").get_json() == []
+
+    # a do sensor prevalece sobre a do tipo
+    assert client.post("/api/faixas", json={"sensorId": "s-ph-01", "minimo": 5, "maximo": 6}).status_code == 201
+    esperados = [l for l in service.listar_leituras() if l["sensorId"] == "s-ph-01" and not 5 <= l["valor"] <= 6]
+    alertas = client.get("/api/alertas?sensorId=s-ph-01").get_json()
+    assert [a["valor"] for a in alertas if "anomalia" not in a] == [l["valor"] for l in esperados]
+
+    faixas = client.get("/api/faixas").get_json()
+    assert len(faixas["configuradas"]) == 2
+    [efetiva] = [f for f in faixas["efetivas"] if f["sensorId"] == "s-ph-01"]
+    assert (efetiva["minimo"], efetiva["maximo"], efetiva["origem"]) == (5.0, 6.0, "sensor")
+
+    for invalida in (
+        {"minimo": 1, "maximo": 2},
+        {"tipo": "pH", "minimo": 3, "maximo": 2},
+        {"sensorId": "nao-existe", "minimo": 1, "maximo": 2},
+        {"tipo": "pH", "minimo": "abc", "maximo": 2},
+    ):
+        assert client.post("/api/faixas", json=invalida).status_code == 400
+
+    # sem sensores, as faixas por sensor saem junto (IDREF) e o XML continua válido
+    assert client.delete("/api/sensores").status_code == 200
+    service.validar_documento()
+    assert [f["tipo"] for f in client.get("/api/faixas").get_json()["configuradas"]] == ["pH"]
+
+    assert client.delete("/api/faixas").status_code == 200
+    assert client.get("/api/faixas").get_json()["configuradas"] == []
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from lxml import etree
+
+from backend.config import Config
+from backend.services.offline_queue import FilaOffline
+from backend.services.xml_utils import formatar_data_hora
+
+
+def nova_leitura(sensor_ref, data_hora, valor="6.5"):
+    leitura = etree.Element("leitura", sensorRef=sensor_ref)
+    etree.SubElement(leitura, "dataHora").text = data_hora
+    etree.SubElement(leitura, "valor").text = valor
+    return leitura
+
+
+def pendente(sensor_id, idade: timedelta, valor=6.5):
+    return {
+        "sensorId": sensor_id,
+        "dataHora": formatar_data_hora(datetime.now(timezone.utc) - idade),
+        "valor": valor,
+    }
+
+
+def test_sincronizacao_em_lotes_com_corte_de_24h(monkeypatch, novo_servico):
+    monkeypatch.setattr(Config, "XML_PENDING_SYNC_BATCH", 3)
+    service = novo_servico()
+    antes = len(service.listar_leituras())
+
+    service.adicionar_pendentes(
+        [pendente("s-ph-01", timedelta(minutes=i)) for i in range(7)]
+        + [pendente("s-ph-01", timedelta(hours=30))]
+        + [pendente("s-removido", timedelta(minutes=1))]
+    )
+    assert service.metricas_pendentes()["registros"] == 9
+
+    assert service.sincronizar_pendentes() == 7
+    assert len(service.listar_leituras()) == antes + 7
+    metricas = service.metricas_pendentes()
+    assert metricas["registros"] == 0
+    assert metricas["consumidas"] == 9
+    assert service.sincronizar_pendentes() == 0
+
+
+def test_posicao_do_consumidor_sobrevive_a_reinicio(tmp_path):
+    parser = etree.XMLParser()
+    fila = FilaOffline(str(tmp_path), parser, max_bytes=1 << 20, segmento_bytes=200)
+    for i in range(10):
+        fila.adicionar([nova_leitura("s-ph-01", f"2025-12-01T10:00:{i:02d}Z")])
+    assert fila.metricas()["segmentos"] > 1
+
+    vistos = []
+
+    def processar_e_parar(lote):
+        vistos.extend(l.findtext("dataHora") for l in lote)
+        if len(vistos) > 4:
+            raise RuntimeError("queda do histórico")
+
+    with pytest.raises(RuntimeError):
+        fila.drenar(processar_e_parar, tamanho_lote=4)
+    fila.fechar()
+
+    fila = FilaOffline(str(tmp_path), parser, max_bytes=1 << 20, segmento_bytes=200)
+    assert fila.registros() == 6
+
+    restantes = []
+    fila.drenar(lambda lote: restantes.extend(l.findtext("dataHora") for l in lote), 4)
+    assert restantes == [f"2025-12-01T10:00:{i:02d}Z" for i in range(4, 10)]
+    assert len(list(tmp_path.glob("*.fila"))) == 1
+
+
+def test_limite_de_tamanho_descarta_as_mais_antigas(tmp_path):
+    fila = FilaOffline(str(tmp_path), etree.XMLParser(), max_bytes=1000, segmento_bytes=300)
+    for i in range(60):
+        fila.adicionar([nova_leitura("s-ph-01", f"2025-12-01T10:{i:02d}:00Z")])
+
+    metricas = fila.metricas()
+    assert metricas["bytes"] <= 1000 + 300
+    assert metricas["descartadasPorLimite"] > 0
+    assert metricas["registros"] + metricas["descartadasPorLimite"] == 60
+
+    restantes = []
+    fila.drenar(lambda lote: restantes.extend(l.findtext("dataHora") for l in lote), 100)
+    assert len(restantes) == metricas["registros"]
+    assert restantes[-1] == "2025-12-01T10:59:00Z"
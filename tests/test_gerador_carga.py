@@ -0,0 +1,72 @@
+from array import array
+from datetime import datetime, timezone
+
+import pytest
+
+from backend.services import load_generator
+from backend.services.binary_frame import codificar_colunas, codificar_quadro, decodificar_quadros
+from backend.services.load_generator import DIA_MS, GeradorCarga, executar_carga, frota, preparar_frota
+
+pytestmark = pytest.mark.usefixtures("com_e_sem_numpy")
+
+INICIO = int(datetime(2031, 3, 1, tzinfo=timezone.utc).timestamp() * 1000)
+HORA_MS = 3_600_000
+
+
+def test_colunas_e_tuplas_geram_o_mesmo_quadro():
+    leituras = [("a", INICIO, 6.5), ("b", INICIO, -1.25), ("a", INICIO + 1000, 7)]
+    quadro = codificar_colunas(
+        ["a", "b"], array("H", [0, 1, 0]), array("q", [INICIO, INICIO, INICIO + 1000]), [650, -125, 700]
+    )
+    assert quadro == codificar_quadro(leituras)
+    [decodificado] = decodificar_quadros(quadro)
+    assert list(decodificado.valores) == [650, -125, 700]
+
+
+def test_perfis_diurnos_deriva_e_semente(monkeypatch):
+    sensores = frota(10)
+    # um dia, de hora em hora, sem ruído para olhar só a forma
+    monkeypatch.setitem(load_generator.PERFIS, "temperatura", load_generator.PERFIS["temperatura"]._replace(ruido=0))
+    gerador = GeradorCarga(sensores, seed=7)
+    tempos = [INICIO + h * HORA_MS for h in range(24)]
+    valores = list(gerador.valores(tempos))
+    coluna = {s["tipo"]: [valores[h * 10 + i] for h in range(24)] for i, s in enumerate(sensores[:5])}
+
+    # temperatura: máximo à tarde, mínimo de madrugada
+    pico = coluna["temperatura"].index(max(coluna["temperatura"]))
+    assert 13 <= pico <= 17
+    assert 1 <= coluna["temperatura"].index(min(coluna["temperatura"])) <= 5
+    # luz: zero à noite, positiva ao meio-dia
+    assert coluna["luminosidade"][0] == 0 and coluna["luminosidade"][12] > 50_000
+    assert all(0 <= v <= 100 for v in coluna["nível"])
+    assert all(4.5 <= v <= 7.5 for v in coluna["pH"])
+
+    # nível cai dia a dia até o reabastecimento
+    dias = [INICIO + d * DIA_MS for d in range(10)]
+    nivel = [list(gerador.valores([t]))[3] for t in dias]
+    quedas = sum(b < a for a, b in zip(nivel, nivel[1:]))
+    assert quedas >= 6 and max(nivel) - min(nivel) > 20
+
+    assert list(GeradorCarga(sensores, seed=7).valores(tempos)) == valores
+
+
+def test_frota_grava_pelo_caminho_de_ingestao(novo_servico):
+    service = novo_servico()
+    sensores = frota(300, "teste")
+    assert preparar_frota(service, sensores) == 300
+    assert preparar_frota(service, sensores) == 0
+    antes = service.colunas.total()
+
+    gerador = GeradorCarga(sensores, seed=1, picos=0.01)
+    fim = INICIO + DIA_MS // 2
+    metricas = executar_carga(service, gerador, INICIO, fim, 30 * 60_000, registros_por_quadro=2_000)
+
+    assert metricas["registros"] == metricas["aceitas"] == 300 * 24
+    assert metricas["quadros"] == 4 and metricas["rejeitadas"] == 0
+    assert service.colunas.total() == antes + 300 * 24
+    assert service.buffer_sensores.ultimas()["teste-00042"][0] == fim - 30 * 60_000
+
+    # de novo: o mesmo histórico é reconhecido como duplicado
+    repetida = executar_carga(service, GeradorCarga(sensores, seed=1, picos=0.01), INICIO, fim, 30 * 60_000)
+    assert repetida["duplicadas"] == 300 * 24
+    assert service.colunas.total() == antes + 300 * 24
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+
+from lxml import etree
+
+from backend.services import time_index
+from backend.services.time_index import IndiceTempo, epoch_ms
+
+
+def _leitura(sensor: str, dt: datetime) -> etree._Element:
+    el = etree.Element("leitura", sensorRef=sensor)
+    etree.SubElement(el, "dataHora").text = dt.isoformat().replace("+00:00", "Z")
+    etree.SubElement(el, "valor").text = "6.5"
+    return el
+
+
+def test_indice_ordena_e_busca_por_intervalo_e_sensor():
+    base = datetime(2025, 12, 1, tzinfo=timezone.utc)
+    elementos = [
+        _leitura("s-a", base + timedelta(minutes=10)),
+        _leitura("s-b", base + timedelta(minutes=5)),
+        _leitura("s-a", base + timedelta(minutes=1)),  # atrasada
+    ]
+    indice = IndiceTempo("sensorRef")
+    indice.estender(elementos[:2])
+    copia = indice.copia()
+    copia.estender(elementos[2:])
+
+    # a cópia não altera o índice original
+    assert [p for _, p in indice.intervalo()] == [1, 0]
+    assert [p for _, p in copia.intervalo()] == [2, 1, 0]
+
+    inicio, fim = epoch_ms(base + timedelta(minutes=2)), epoch_ms(base + timedelta(minutes=10))
+    assert [p for _, p in copia.intervalo(inicio, fim)] == [1, 0]
+    assert [p for _, p in copia.intervalo(ref="s-a")] == [2, 0]
+    assert list(copia.intervalo(ref="s-x")) == []
+
+
+def test_consulta_por_intervalo_so_le_o_trecho_pedido(monkeypatch, novo_servico):
+    service = novo_servico()
+    base = datetime(2025, 12, 1, tzinfo=timezone.utc)
+    itens = [
+        {
+            "sensorId": "s-ph-01",
+            "dataHora": (base + timedelta(minutes=i)).isoformat().replace("+00:00", "Z"),
+            "valor": 6.0 + i / 100,
+        }
+        for i in range(500)
+    ]
+    service.registrar_leituras_lote(itens)
+    service.segmentos.checkpoint()
+
+    inicio, fim = base + timedelta(minutes=100), base + timedelta(minutes=159)
+    # primeira consulta monta o índice do segmento
+    assert len(list(service.segmentos.iterar_leituras(inicio, fim))) == 60
+
+    lidas = []
+    original = time_index.tempo_elemento
+    monkeypatch.setattr(time_index, "tempo_elemento", lambda el: lidas.append(el) or original(el))
+
+    datas = [l.findtext("dataHora") for l in service.segmentos.iterar_leituras(inicio, fim)]
+    assert datas == sorted(datas) and len(datas) == 60
+    assert lidas == []  # nenhuma data reparseada: tudo pelo índice
+
+    # checkpoint acrescenta ao índice só os registros novos
+    service.registrar_leituras_lote(
+        [{"sensorId": "s-ph-01", "dataHora": "2025-12-01T02:00:30Z", "valor": 7.0}]
+    )
+    service.segmentos.checkpoint()
+    assert len(lidas) == 1
+    assert len(list(service.segmentos.iterar_leituras(inicio, fim, sensor="s-ph-01"))) == 61
@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+
+from lxml import etree
+
+from backend.config import Config
+from backend.services.journal import Journal
+
+
+def nova_leitura(sensor_ref, data_hora, valor="6.5"):
+    leitura = etree.Element("leitura", sensorRef=sensor_ref)
+    etree.SubElement(leitura, "dataHora").text = data_hora
+    etree.SubElement(leitura, "valor").text = valor
+    return leitura
+
+
+def test_journal_e_reaplicado_apos_queda(novo_servico):
+    service = novo_servico()
+    antes = len(service.listar_leituras())
+    service._anexar_historico([nova_leitura("s-ph-01", "2025-12-01T10:00:00Z", "6.7")])
+
+    # sem checkpoint: o registro está só no journal, mas já aparece nas leituras
+    assert service.segmentos.registros_pendentes() == 1
+    assert len(service.listar_leituras()) == antes + 1
+    service.agendador.parar()  # "queda": nada de checkpoint final
+
+    novo = novo_servico()
+    assert novo.segmentos.registros_pendentes() == 0
+    assert len(novo.listar_leituras()) == antes + 1
+    assert os.path.getsize(Config.XML_JOURNAL_PATH) == 0
+
+
+def test_final_corrompido_do_journal_e_descartado(tmp_path):
+    parser = etree.XMLParser()
+    path = str(tmp_path / "journal.log")
+    journal = Journal(path, parser)
+    journal.anexar([nova_leitura("s-ph-01", "2025-12-01T10:00:00Z")], [])
+    journal.fechar()
+
+    tamanho = os.path.getsize(path)
+    with open(path, "ab") as f:
+        f.write(b"2 0badc0de <lote lsn=")  # gravação interrompida
+
+    journal = Journal(path, parser)
+    assert len(journal.lotes()) == 1
+    assert os.path.getsize(path) == tamanho
+    assert journal.anexar([nova_leitura("s-ph-01", "2025-12-01T10:00:01Z")], []) == 2
+
+
+def test_commit_em_grupo_com_varias_threads(tmp_path, monkeypatch):
+    parser = etree.XMLParser()
+    journal = Journal(str(tmp_path / "journal.log"), parser)
+
+    fsyncs = []
+    fsync_original = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: (fsyncs.append(fd), fsync_original(fd)))
+
+    def produtor(n):
+        for i in range(20):
+            journal.anexar([nova_leitura("s-ph-01", f"2025-12-01T10:{n:02d}:{i:02d}Z")], [])
+
+    threads = [threading.Thread(target=produtor, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    lsns = [int(lote.get("lsn")) for lote in journal.lotes()]
+    assert lsns == list(range(1, 161))
+    assert len(fsyncs) <= 160
+
+    journal.fechar()
+    assert len(Journal(str(tmp_path / "journal.log"), parser).lotes()) == 160
+
+
+def test_lsn_continua_acima_do_que_outro_processo_incorporou(tmp_path):
+    parser = etree.XMLParser()
+    path = str(tmp_path / "journal.log")
+    aplicado = [0]
+    a = Journal(path, parser, lsn_aplicado=lambda: aplicado[0])
+    b = Journal(path, parser, lsn_aplicado=lambda: aplicado[0])
+
+    for i in range(3):
+        a.anexar([nova_leitura("s-ph-01", f"2025-12-01T10:00:0{i}Z")], [])
+    # checkpoint de "a": os três lotes vão para os segmentos e saem do arquivo
+    aplicado[0] = 3
+    a.descartar_ate(3)
+
+    # "b" nunca leu esses lotes: mesmo assim não reusa os LSNs já aplicados
+    assert b.anexar([nova_leitura("s-ph-01", "2025-12-01T10:00:03Z")], []) == 4
+    assert [int(lote.get("lsn")) for lote in a.lotes()] == [4]
+    a.fechar()
+    b.fechar()
+
+
+def test_descarte_espera_o_lider_sem_travar(tmp_path, monkeypatch):
+    parser = etree.XMLParser()
+    journal = Journal(str(tmp_path / "journal.log"), parser)
+    journal.anexar([nova_leitura("s-ph-01", "2025-12-01T10:00:00Z")], [])
+
+    # o líder demora a pegar a trava; o checkpoint chega nesse meio-tempo
+    liderando = threading.Event()
+    gravar = journal._gravar
+
+    def gravar_devagar(pendentes):
+        liderando.set()
+        time.sleep(0.2)
+        return gravar(pendentes)
+
+    monkeypatch.setattr(journal, "_gravar", gravar_devagar)
+    threads = [
+        threading.Thread(
+            target=journal.anexar, args=([nova_leitura("s-ph-01", "2025-12-01T10:00:01Z")], []), daemon=True
+        ),
+        threading.Thread(target=lambda: (liderando.wait(), journal.descartar_ate(1)), daemon=True),
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+    assert not any(t.is_alive() for t in threads)
+    assert [int(lote.get("lsn")) for lote in journal.lotes()] == [2]
+    journal.fechar()
@@ -0,0 +1,119 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+from backend.config import Config
+from backend.services.binary_frame import (
+    CONTENT_TYPE,
+    codificar_quadro,
+    decodificar_quadros,
+    epoch_ms_para_datetime,
+    valor_para_texto,
+)
+
+URL = "/api/leituras/lote"
+
+
+def test_lote_exige_autenticacao_de_dispositivo(client):
+    resp = client.post(URL, json=[])
+    assert resp.status_code == 401
+
+
+def test_lote_aceita_e_rejeita_por_item(client):
+    from backend.controllers import api
+
+    antes = len(api.xml_service.listar_leituras())
+    itens = [
+        {"sensorId": "s-ph-01", "dataHora": "2025-12-01T10:00:00Z", "valor": 6.4},
+        {"sensorId": "s-inexistente", "dataHora": "2025-12-01T10:00:00Z", "valor": 6.4},
+        {"sensorId": "s-ph-01", "dataHora": "ontem", "valor": 6.4},
+        {"sensorId": "s-ph-01", "dataHora": "2025-12-01T10:00:01Z", "valor": "seis"},
+        {"sensorId": "s-ph-01", "dataHora": "2025-12-01T10:00:02Z", "valor": "6.50"},
+        {"sensorId": "s-ph-01"},
+    ]
+
+    resp = client.post(URL, json=itens, headers={"X-API-KEY": Config.DEVICE_API_KEY})
+
+    assert resp.status_code == 200
+    corpo = resp.get_json()
+    assert corpo["aceitas"] == 2
+    assert corpo["rejeitadas"] == 4
+    assert [r["aceita"] for r in corpo["resultados"]] == [True, False, False, False, True, False]
+    assert all("erro" in r for r in corpo["resultados"] if not r["aceita"])
+    assert len(api.xml_service.listar_leituras()) == antes + 2
+
+
+@pytest.mark.parametrize("campo,valor", [("sensorId", ["s-ph-01"]), ("sensorId", {"id": 1}),
+                                         ("dataHora", 1700000000), ("valor", True), ("unidade", 7)])
+def test_lote_com_campo_de_tipo_errado_e_recusado(client, campo, valor):
+    from backend.controllers import api
+
+    antes = len(api.xml_service.listar_leituras())
+    itens = [
+        {"sensorId": "s-ph-01", "dataHora": "2025-12-01T10:00:00Z", "valor": 6.4},
+        {"sensorId": "s-ph-01", "dataHora": "2025-12-01T10:00:05Z", "valor": 6.5, campo: valor},
+    ]
+
+    resp = client.post(URL, json=itens, headers={"X-API-KEY": Config.DEVICE_API_KEY})
+
+    assert resp.status_code == 400
+    assert resp.get_json()["indice"] == 1 and campo in resp.get_json()["error"]
+    assert len(api.xml_service.listar_leituras()) == antes
+
+
+def test_lote_acima_do_limite_e_recusado(client, monkeypatch):
+    monkeypatch.setattr(Config, "API_LOTE_MAX_LEITURAS", 2)
+    itens = [{"sensorId": "s-ph-01", "dataHora": "2025-12-01T10:00:00Z", "valor": 6}] * 3
+
+    resp = client.post(
+        URL, json={"leituras": itens}, headers={"X-API-KEY": Config.DEVICE_API_KEY}
+    )
+    assert resp.status_code == 413
+
+
+def test_lote_binario_usa_o_mesmo_armazenamento(client):
+    from backend.controllers import api
+
+    corpo = codificar_quadro(
+        [
+            ("s-ph-01", datetime(2025, 12, 1, 10, 0, 0), Decimal("6.25")),
+            ("s-ph-01", datetime(2025, 12, 1, 10, 0, 1, 500000), 7),
+        ]
+    ) + codificar_quadro([("s-inexistente", 0, 1.5)], escala=1)
+
+    resp = client.post(
+        URL,
+        data=corpo,
+        content_type=CONTENT_TYPE,
+        headers={"X-API-KEY": Config.DEVICE_API_KEY},
+    )
+
+    assert resp.status_code == 200
+    corpo = resp.get_json()
+    assert corpo["aceitas"] == 2
+    assert corpo["erros"] == [
+        {"indice": 2, "sensorId": "s-inexistente", "erro": "Sensor não cadastrado: s-inexistente"}
+    ]
+    novas = [
+        (l["dataHora"], l["valor"])
+        for l in api.xml_service.listar_leituras()
+        if l["dataHora"].startswith("2025-12-01T10:00:0")
+    ]
+    assert sorted(novas) == [("2025-12-01T10:00:00Z", 6.25), ("2025-12-01T10:00:01.500000Z", 7.0)]
+
+
+def test_quadro_binario_ida_e_volta():
+    quadro = codificar_quadro(
+        [("s-a", datetime(2025, 12, 1, tzinfo=timezone.utc), "-0.05"), ("s-b", 1, 1200)],
+        escala=2,
+    )
+    [decodificado] = decodificar_quadros(quadro)
+
+    assert decodificado.sensores == ["s-a", "s-b"]
+    assert list(decodificado.indices) == [0, 1]
+    assert epoch_ms_para_datetime(decodificado.tempos[0]) == datetime(2025, 12, 1, tzinfo=timezone.utc)
+    assert [valor_para_texto(v, decodificado.escala) for v in decodificado.valores] == ["-0.05", "1200.00"]
+
+    with pytest.raises(ValueError):
+        list(decodificar_quadros(quadro[:-1]))
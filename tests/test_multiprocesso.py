@@ -0,0 +1,149 @@
+import multiprocessing
+import time
+from datetime import datetime, timedelta, timezone
+
+from backend.config import Config
+from backend.services.xml_service import XMLService
+
+LEITURAS_POR_WORKER = 300
+TAMANHO_LOTE = 50
+
+
+def _configurar(caminhos: dict) -> None:
+    for nome, valor in caminhos.items():
+        setattr(Config, nome, valor)
+
+
+def _itens(worker: int) -> list[dict]:
+    inicio = datetime(2025, 12, 1, tzinfo=timezone.utc) + timedelta(hours=worker)
+    return [
+        {
+            "sensorId": "s-ph-01",
+            "dataHora": (inicio + timedelta(seconds=i)).isoformat().replace("+00:00", "Z"),
+            "valor": 6.5,
+        }
+        for i in range(LEITURAS_POR_WORKER)
+    ]
+
+
+def _worker(caminhos: dict, worker: int, pronto, largada) -> tuple[int, int, float]:
+    """
+    Processo "worker": envia suas leituras em lotes; retorna (novas,
+    duplicadas, segundos gastos nos envios).
+    """
+    _configurar(caminhos)
+    service = XMLService()
+    try:
+        itens = _itens(worker)
+        pronto.release()
+        largada.wait()
+        t0 = time.perf_counter()
+        novas = duplicadas = 0
+        for i in range(0, len(itens), TAMANHO_LOTE):
+            resultados = service.registrar_leituras_lote(itens[i:i + TAMANHO_LOTE])
+            assert all(r["aceita"] for r in resultados), resultados
+            repetidas = sum(1 for r in resultados if r.get("duplicada"))
+            duplicadas += repetidas
+            novas += len(resultados) - repetidas
+        return novas, duplicadas, time.perf_counter() - t0
+    finally:
+        service.fechar()
+
+
+def _worker_lote_com_chave(caminhos: dict, chave: str, itens: list) -> dict:
+    """Processo "worker": envia um lote pela API com Idempotency-Key."""
+    _configurar(caminhos)
+    from backend import create_app
+    from backend.controllers import api
+
+    app = create_app()
+    try:
+        resposta = app.test_client().post(
+            "/api/leituras/lote",
+            json=itens,
+            headers={"X-API-KEY": Config.DEVICE_API_KEY, "Idempotency-Key": chave},
+        )
+        assert resposta.status_code == 200
+        return resposta.get_json()
+    finally:
+        api.xml_service.fechar()
+
+
+def _caminhos() -> dict:
+    """Configuração do teste (caminhos da cópia temporária, agendador desligado) para os workers."""
+    return {
+        nome: getattr(Config, nome)
+        for nome in dir(Config)
+        if nome.endswith("_PATH") or nome.endswith("_DIR") or nome.startswith("SCHEDULER_")
+    }
+
+
+def _rodar(mundos: list[int]) -> list[tuple[int, int, float]]:
+    """Roda um worker por item de `mundos` (o horário das leituras dele), todos ao mesmo tempo."""
+    caminhos = _caminhos()
+    ctx = multiprocessing.get_context("spawn")
+    gerenciador = ctx.Manager()
+    pronto = gerenciador.Semaphore(0)
+    largada = gerenciador.Event()
+
+    with ctx.Pool(len(mundos)) as pool:
+        pendentes = [
+            pool.apply_async(_worker, (caminhos, w, pronto, largada)) for w in mundos
+        ]
+        for _ in mundos:
+            pronto.acquire()
+        largada.set()
+        resultados = [p.get(timeout=120) for p in pendentes]
+    gerenciador.shutdown()
+    return resultados
+
+
+def _vazao(resultados: list[tuple[int, int, float]]) -> float:
+    """Leituras/s do conjunto: todas as enviadas, pelo tempo do worker mais lento."""
+    return len(resultados) * LEITURAS_POR_WORKER / max(segundos for _, _, segundos in resultados)
+
+
+def test_workers_concorrentes_nao_perdem_leituras(novo_servico, record_property):
+    antes = len(novo_servico().listar_leituras())
+
+    um = _rodar([0])
+    assert len(novo_servico().listar_leituras()) == antes + LEITURAS_POR_WORKER
+
+    quatro = _rodar([1, 2, 3, 4])
+    assert len(novo_servico().listar_leituras()) == antes + 5 * LEITURAS_POR_WORKER
+
+    # escalabilidade de 1 para N workers (no resumo do pytest, ver conftest)
+    record_property("vazao 1 worker (leituras/s)", round(_vazao(um)))
+    record_property("vazao 4 workers (leituras/s)", round(_vazao(quatro)))
+
+
+def test_duplicatas_sao_descartadas_entre_processos(novo_servico):
+    service = novo_servico()
+    antes = len(service.listar_leituras())
+
+    # os 4 workers mandam as mesmas leituras: só uma cópia de cada é gravada
+    resultados = _rodar([0, 0, 0, 0])
+    assert sum(novas for novas, _, _ in resultados) == LEITURAS_POR_WORKER
+    assert sum(duplicadas for _, duplicadas, _ in resultados) == 3 * LEITURAS_POR_WORKER
+    assert len(novo_servico().listar_leituras()) == antes + LEITURAS_POR_WORKER
+
+    # e um serviço aberto antes deles também as reconhece
+    repetidas = service.registrar_leituras_lote(_itens(0)[:TAMANHO_LOTE])
+    assert all(r.get("duplicada") for r in repetidas)
+
+
+def test_reenvio_em_outro_processo_devolve_a_resposta_original(client):
+    itens = [{"sensorId": "s-ph-01", "dataHora": "2025-12-02T08:00:00Z", "valor": 6.2}]
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        original = pool.apply(_worker_lote_com_chave, (_caminhos(), "gw-07-lote-3", itens))
+
+    reenvio = client.post(
+        "/api/leituras/lote",
+        json=itens,
+        headers={"X-API-KEY": Config.DEVICE_API_KEY, "Idempotency-Key": "gw-07-lote-3"},
+    )
+    assert reenvio.status_code == 200
+    assert reenvio.headers.get("Idempotent-Replay") == "true"
+    assert reenvio.get_json() == original
+    assert original["aceitas"] == 1 and original["duplicadas"] == 0
@@ -0,0 +1,68 @@
+import pytest
+
+from backend.services.pagination import Cursor, codificar_cursor
+
+
+def _todas_as_paginas(client, url: str) -> list:
+    itens, cursor = [], None
+    while True:
+        resp = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        assert resp.status_code == 200
+        pagina = resp.get_json()
+        itens.extend(pagina)
+        cursor = resp.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return itens
+        assert pagina
+
+
+@pytest.mark.parametrize("url,limite", [("/api/leituras", 7), ("/api/atuadores/comandos", 3)])
+def test_paginas_cobrem_a_lista_inteira(client, url, limite):
+    # o histórico de exemplo tem vários registros com o mesmo dataHora
+    completa = client.get(url).get_json()
+    assert "X-Next-Cursor" not in client.get(url).headers
+
+    paginado = _todas_as_paginas(client, f"{url}?limit={limite}")
+    assert paginado == completa
+
+
+def test_filtros_de_leituras(client):
+    from backend.controllers import api
+
+    todas = api.xml_service.listar_leituras()
+    ph = [l for l in todas if l["sensorId"] == "s-ph-01"]
+    assert ph
+
+    resp = client.get("/api/leituras?sensorId=s-ph-01&limit=1000")
+    assert resp.get_json() == ph
+
+    resp = client.get("/api/leituras?tipo=pH&status=acima")
+    assert resp.get_json() == [l for l in ph if l["status"] == "acima"]
+
+    meio = ph[len(ph) // 2]["dataHora"]
+    resp = client.get(f"/api/leituras?sensorId=s-ph-01&ate={meio}")
+    assert resp.get_json() == [l for l in ph if l["dataHora"] <= meio]
+
+    alertas = client.get("/api/alertas?status=abaixo").get_json()
+    assert alertas == [a for a in api.xml_service.listar_alertas() if "abaixo" in a["mensagem"]]
+
+
+def test_parametros_invalidos(client):
+    assert client.get("/api/leituras?limit=0").status_code == 400
+    assert client.get("/api/leituras?cursor=xyz").status_code == 400
+    for tempo in (10**20, -(10**20)):
+        cursor = codificar_cursor(Cursor(tempo, 0))
+        assert client.get(f"/api/leituras?cursor={cursor}").status_code == 400
+        assert client.get(f"/api/atuadores/comandos?cursor={cursor}").status_code == 400
+    assert client.get("/api/leituras?status=talvez").status_code == 400
+    assert client.get("/api/alertas?desde=ontem").status_code == 400
+
+
+@pytest.mark.parametrize("url", ["/api/leituras", "/api/alertas", "/api/atuadores/comandos"])
+def test_lista_completa_em_streaming(client, url):
+    resp = client.get(url)
+    assert resp.is_streamed
+    assert resp.get_json() == _todas_as_paginas(client, f"{url}?limit=5")
+
+    vazia = client.get(f"{url}?desde=2999-01-01")
+    assert vazia.is_streamed and vazia.get_json() == []
@@ -1,16 +1,19 @@
 import time
+from datetime import datetime, timedelta, timezone
 
-from backend.services.xml_service import XMLService
+from lxml import etree
 
+from backend.config import Config
 
-def test_simulacao_performance():
+
+def test_simulacao_performance(novo_servico):
     """
     Teste acadêmico de desempenho (RNF1):
     roda 100 ciclos de simulação e espera que termine em < 2 segundos.
     Isso significa que, para um conjunto pequeno de sensores, o sistema
     consegue processar ~100 leituras/s com validação via XSD.
     """
-    service = XMLService()
+    service = novo_servico()
 
     start = time.perf_counter()
     num_ciclos = 100
@@ -20,3 +23,35 @@ def test_simulacao_performance():
 
     elapsed = time.perf_counter() - start
     assert elapsed < 2.0, f"Simulação demorou {elapsed:.3f}s (esperado < 2s)"
+
+
+def gerar_historico(path: str, quantidade: int) -> None:
+    """Acrescenta `quantidade` leituras ao XML (formato de arquivo único)."""
+    tree = etree.parse(path)
+    leituras_el = tree.getroot().find("leituras")
+    inicio = datetime(2025, 11, 1, tzinfo=timezone.utc)
+
+    for i in range(quantidade):
+        leitura = etree.SubElement(leituras_el, "leitura", sensorRef="s-ph-01")
+        data_hora = inicio + timedelta(seconds=10 * i)
+        etree.SubElement(leitura, "dataHora").text = data_hora.isoformat().replace("+00:00", "Z")
+        etree.SubElement(leitura, "valor").text = "6.5"
+
+    tree.write(path, encoding="utf-8", xml_declaration=True)
+
+
+def test_simulacao_performance_historico_grande(novo_servico):
+    """
+    Mesmo orçamento do teste anterior (100 ciclos < 2 s), mas com
+    100 mil leituras já armazenadas: o custo de cada ciclo não pode
+    crescer com o tamanho do histórico.
+    """
+    gerar_historico(Config.XML_DATA_PATH, 100_000)
+    service = novo_servico()
+
+    start = time.perf_counter()
+    for _ in range(100):
+        service.simular_ciclo()
+
+    elapsed = time.perf_counter() - start
+    assert elapsed < 2.0, f"Simulação demorou {elapsed:.3f}s (esperado < 2s)"
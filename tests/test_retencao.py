@@ -0,0 +1,81 @@
+import gzip
+import os
+from datetime import datetime, timezone
+
+from lxml import etree
+
+from backend.config import Config
+
+
+def _leituras(dia: str, n: int) -> list[dict]:
+    return [
+        {"sensorId": "s-ph-01", "dataHora": f"{dia}T10:{i:02d}:00Z", "valor": 6 + i / 10}
+        for i in range(n)
+    ]
+
+
+def test_retencao_arquiva_segmentos_antigos(novo_servico):
+    service = novo_servico()
+    service.registrar_leituras_lote(_leituras("2020-01-01", 3) + _leituras("2030-01-01", 2))
+    total = len(service.listar_leituras())
+    colunas = service.colunas.total()
+
+    corte = datetime(2029, 1, 1, tzinfo=timezone.utc)
+    arquivados = service.compactar_historico(corte)
+    assert arquivados > 0
+    assert all(s["fim"] >= "2029" for s in service.segmentos.segmentos())
+    assert all(l["dataHora"] >= "2029" for l in service.listar_leituras())
+    assert service.compactar_historico(corte) == 0
+
+    # arquivos compactados e válidos pelo XSD dos segmentos
+    entradas = service.segmentos.arquivo.entradas()
+    assert sum(e["leituras"] + e["comandos"] for e in entradas) == arquivados
+    for e in entradas:
+        with gzip.open(os.path.join(Config.XML_ARCHIVE_DIR, e["arquivo"])) as f:
+            service.segmentos.schema.assertValid(etree.parse(f))
+
+    # a exportação ainda enxerga o que foi arquivado
+    xml = service.exportar_leituras_filtradas(
+        datetime(2020, 1, 1, tzinfo=timezone.utc), datetime(2020, 1, 2, tzinfo=timezone.utc)
+    )
+    assert len(etree.fromstring(xml).findall("leituras/leitura")) == 3
+
+    # agregados: por hora ficam, por minuto saem do período arquivado
+    [ph] = service.agregar_leituras("1h", "s-ph-01", ate=corte)
+    assert any(b["inicio"] == "2020-01-01T10:00:00Z" and b["quantidade"] == 3 for b in ph["series"])
+    assert service.agregar_leituras("1m", "s-ph-01", ate=corte)[0]["series"] == []
+    service.fechar()
+
+    # a cópia colunar continua com as arquivadas e não é refeita à toa
+    novo = novo_servico()
+    assert novo.colunas.total() == colunas
+    assert len(novo.listar_leituras()) + novo.segmentos.arquivo.total("leituras") == total
+
+    novo.limpar_leituras()
+    assert novo.segmentos.arquivo.total("leituras") == 0
+
+
+def test_arquivo_morto_e_lido_em_ordem_com_atrasos_e_sobreposicao(novo_servico, monkeypatch):
+    monkeypatch.setattr(Config, "XML_SEGMENT_MAX_RECORDS", 4)
+    service = novo_servico()
+    # dois lotes do mesmo dia: o segundo tem atrasados, que sobrepõem o primeiro segmento
+    service.registrar_leituras_lote([_leituras("2020-01-01", 10)[i] for i in (0, 2, 4, 6)])
+    service.registrar_leituras_lote([_leituras("2020-01-01", 10)[i] for i in (9, 1, 5, 3)])
+    service.registrar_leituras_lote(_leituras("2020-01-03", 3))
+    service.segmentos.checkpoint()
+    corte = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    assert len(service.segmentos.segmentos(fim=corte)) == 3
+
+    service.compactar_historico(corte)
+    assert not service.segmentos.segmentos(fim=corte)
+
+    tempos = [t for t, _ in service.segmentos.arquivo.percorrer("leitura")]
+    assert len(tempos) == 11 and tempos == sorted(tempos)
+
+    inicio = datetime(2020, 1, 1, 10, 2, tzinfo=timezone.utc)
+    fim = datetime(2020, 1, 1, 10, 5, tzinfo=timezone.utc)
+    trecho = service.segmentos.arquivo.percorrer("leitura", inicio, fim, refs=["s-ph-01"])
+    assert [el.findtext("dataHora") for _, el in trecho] == [
+        f"2020-01-01T10:{m:02d}:00Z" for m in (2, 3, 4, 5)
+    ]
+    assert list(service.segmentos.arquivo.percorrer("leitura", refs=["s-ec-01"])) == []
@@ -0,0 +1,106 @@
+from datetime import datetime, timezone
+
+from lxml import etree
+
+from backend.config import Config
+from backend.services.xml_utils import formatar_data_hora, parse_data_hora
+
+
+def nova_leitura(sensor_ref, data_hora, valor="6.5"):
+    leitura = etree.Element("leitura", sensorRef=sensor_ref)
+    etree.SubElement(leitura, "dataHora").text = data_hora
+    etree.SubElement(leitura, "valor").text = valor
+    return leitura
+
+
+def test_arquivo_unico_e_importado_para_segmentos(novo_servico):
+    original = etree.parse(Config.XML_DATA_PATH).getroot()
+    qtd_leituras = len(original.findall("leituras/leitura"))
+    qtd_comandos = len(original.findall("atuadores/atuador/comandos/comando"))
+
+    service = novo_servico()
+
+    nucleo = etree.parse(Config.XML_DATA_PATH).getroot()
+    assert nucleo.find("leituras") is None
+    assert nucleo.find("atuadores/atuador/comandos") is None
+    assert len(service.listar_leituras()) == qtd_leituras
+    assert len(service.listar_comandos()) == qtd_comandos
+    assert len(service.listar_sensores()) == len(original.findall("sensores/sensor"))
+
+
+def test_segmento_quebra_por_dia_e_por_quantidade(monkeypatch, novo_servico):
+    monkeypatch.setattr(Config, "XML_SEGMENT_MAX_RECORDS", 10)
+    service = novo_servico()
+    service.limpar_leituras()
+    service.limpar_historico_comandos()
+
+    leituras = [nova_leitura("s-ph-01", f"2025-12-01T10:00:{i:02d}Z") for i in range(25)]
+    leituras += [nova_leitura("s-ph-01", "2025-12-02T08:00:00Z")]
+    service._anexar_historico(leituras)
+    service.segmentos.checkpoint()
+
+    segmentos = service.segmentos.segmentos()
+    assert [s["dia"] for s in segmentos] == ["2025-12-01"] * 3 + ["2025-12-02"]
+    assert [s["leituras"] for s in segmentos] == [10, 10, 5, 1]
+    assert segmentos[0]["inicio"] == "2025-12-01T10:00:00Z"
+    assert segmentos[2]["fim"] == "2025-12-01T10:00:24Z"
+
+
+def test_exportacao_abre_apenas_segmentos_do_intervalo(novo_servico):
+    service = novo_servico()
+    service._anexar_historico(
+        [
+            nova_leitura("s-ph-01", "2025-12-01T10:00:00Z", "6.1"),
+            nova_leitura("s-ph-01", "2025-12-05T10:00:00Z", "6.2"),
+        ]
+    )
+    service.fechar()  # checkpoint final
+
+    service = novo_servico()
+    # a inicialização já lê o fim do histórico (buffer de leituras recentes)
+    service.segmentos._caches.clear()
+
+    xml = service.exportar_leituras_filtradas(
+        parse_data_hora("2025-12-05T00:00:00Z"), parse_data_hora("2025-12-05T23:59:59Z")
+    )
+
+    root = etree.fromstring(xml)
+    assert [l.findtext("valor") for l in root.iterfind("leituras/leitura")] == ["6.2"]
+    assert list(service.segmentos._caches) == ["20251205-0001.xml"]
+
+
+def test_segmentos_sao_abertos_sob_demanda_e_limitados(monkeypatch, novo_servico):
+    monkeypatch.setattr(Config, "XML_SEGMENT_CACHE_MAX", 3)
+    service = novo_servico()
+    agora = datetime.now(timezone.utc)
+    leituras = [nova_leitura("s-ph-01", f"2025-12-{d:02d}T10:00:00Z", f"6.{d % 10}") for d in range(1, 11)]
+    service._anexar_historico(leituras + [nova_leitura("s-ph-01", formatar_data_hora(agora))])
+    service.segmentos.checkpoint()
+
+    # no máximo 3 segmentos em memória, mais o do dia atual
+    hoje = agora.strftime("%Y%m%d")
+    assert len(service.segmentos._caches) <= 4
+    assert any(a.startswith(hoje) for a in service.segmentos._caches)
+
+    # um percurso longo só abre cada segmento quando chega nele
+    service.segmentos._caches.clear()
+    percurso = service.segmentos.iterar_leituras(
+        parse_data_hora("2025-12-01T00:00:00Z"), parse_data_hora("2025-12-31T23:59:59Z")
+    )
+    assert next(percurso).findtext("dataHora") == "2025-12-01T10:00:00Z"
+    assert list(service.segmentos._caches) == ["20251201-0001.xml"]
+    assert [l.findtext("dataHora")[:10] for l in percurso] == [f"2025-12-{d:02d}" for d in range(2, 11)]
+    assert len(service.segmentos._caches) <= 3
+
+
+def test_checkpoint_durante_percurso_nao_duplica_registros(novo_servico):
+    service = novo_servico()
+    service._anexar_historico([nova_leitura("s-ph-01", "2025-12-01T10:00:00Z", "6.1")])
+    service.segmentos.checkpoint()
+    service._anexar_historico([nova_leitura("s-ph-01", "2025-12-01T11:00:00Z", "6.2")])
+
+    # capturado antes do checkpoint, o segmento só é aberto depois dele
+    percurso = service.segmentos.iterar_leituras(parse_data_hora("2025-12-01T00:00:00Z"))
+    service.segmentos._caches.clear()
+    assert service.segmentos.checkpoint() == 1
+    assert [l.findtext("valor") for l in percurso] == ["6.1", "6.2"]
@@ -0,0 +1,88 @@
+import pytest
+from lxml import etree
+
+from backend.config import Config
+
+
+class SchemaEspiao:
+    """Envolve um XMLSchema contando validações de documentos `raiz`."""
+
+    def __init__(self, schema, raiz=None):
+        self.schema = schema
+        self.raiz = raiz
+        self.chamadas = 0
+
+    def assertValid(self, tree):
+        if self.raiz is None or tree.getroot().tag == self.raiz:
+            self.chamadas += 1
+        self.schema.assertValid(tree)
+
+
+def test_escritas_de_append_nao_validam_documento_inteiro(novo_servico):
+    service = novo_servico()
+    service.simular_ciclo()
+    service.segmentos.checkpoint()  # cria o segmento do dia (validado inteiro)
+
+    espiao = SchemaEspiao(service.schema)
+    espiao_seg = SchemaEspiao(service.segmentos.schema, "segmento")
+    service.schema = espiao
+    service.segmentos.schema = espiao_seg
+
+    for _ in range(5):
+        service.simular_ciclo()
+    service.cadastrar_sensor({"id": "s-ec-02", "tipo": "EC"})
+    service.cadastrar_atuador({"id": "a-luz-01", "tipo": "iluminacao"})
+    service.segmentos.checkpoint()
+
+    assert espiao.chamadas == 0
+    assert espiao_seg.chamadas == 0
+    service.validar_documento()
+    assert espiao.chamadas == 1
+
+
+def test_modo_completo_valida_documento_inteiro(monkeypatch, novo_servico):
+    monkeypatch.setattr(Config, "XML_VALIDATION_MODE", "completa")
+    service = novo_servico()
+    service.simular_ciclo()
+    service.segmentos.checkpoint()
+    espiao = SchemaEspiao(service.segmentos.schema, "segmento")
+    service.segmentos.schema = espiao
+
+    service.simular_ciclo()
+    service.segmentos.checkpoint()
+
+    assert espiao.chamadas == 1
+
+
+def nova_leitura(sensor_ref, data_hora, valor):
+    leitura = etree.Element("leitura", sensorRef=sensor_ref)
+    etree.SubElement(leitura, "dataHora").text = data_hora
+    etree.SubElement(leitura, "valor").text = valor
+    return leitura
+
+
+def test_fragmento_invalido_e_rejeitado(novo_servico):
+    service = novo_servico()
+    service.simular_ciclo()
+    antes = len(service.listar_leituras())
+
+    leitura = nova_leitura("s-ph-01", "2025-11-19T03:00:00Z", "seis")
+
+    with pytest.raises(etree.DocumentInvalid):
+        service._anexar_historico([leitura])
+    assert len(service.listar_leituras()) == antes
+
+
+def test_sensor_ref_desconhecido_e_rejeitado(novo_servico):
+    service = novo_servico()
+    leitura = nova_leitura("s-inexistente", "2025-11-19T03:00:00Z", "6.5")
+
+    with pytest.raises(etree.DocumentInvalid):
+        service._anexar_historico([leitura])
+
+
+def test_id_de_atuador_nao_pode_repetir_id_de_sensor(novo_servico):
+    service = novo_servico()
+
+    with pytest.raises(etree.DocumentInvalid):
+        service.cadastrar_atuador({"id": "s-ph-01", "tipo": "bomba"})
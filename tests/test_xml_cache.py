@@ -0,0 +1,110 @@
+import itertools
+import os
+import zlib
+
+from lxml import etree
+
+from backend.services.interprocess import SLOTS_VERSAO, ContadorVersoes
+
+
+def contar_parses(monkeypatch):
+    chamadas = []
+    parse_original = etree.parse
+
+    def parse(*args, **kwargs):
+        chamadas.append(args[0])
+        return parse_original(*args, **kwargs)
+
+    monkeypatch.setattr(etree, "parse", parse)
+    return chamadas
+
+
+def test_leituras_repetidas_nao_reparseiam(monkeypatch, novo_servico):
+    service = novo_servico()
+    service.listar_leituras()
+
+    chamadas = contar_parses(monkeypatch)
+    for _ in range(5):
+        service.listar_sensores()
+        service.listar_leituras()
+        service.listar_atuadores()
+        service.listar_comandos()
+        service.listar_alertas()
+
+    assert chamadas == []
+
+
+def test_escrita_atualiza_cache_e_outras_instancias(novo_servico):
+    service = novo_servico()
+    outra = novo_servico()
+    outra.listar_sensores()
+
+    service.cadastrar_sensor({"id": "s-novo", "tipo": "EC"})
+
+    assert any(s["id"] == "s-novo" for s in service.listar_sensores())
+    assert any(s["id"] == "s-novo" for s in outra.listar_sensores())
+
+
+def test_alteracao_externa_invalida_cache(novo_servico):
+    service = novo_servico()
+    antes = len(service.listar_sensores())
+
+    tree = etree.parse(service.data_path)
+    sensores_el = tree.getroot().find("sensores")
+    sensores_el.remove(sensores_el[0])
+    tree.write(service.data_path, encoding="utf-8", xml_declaration=True)
+    os.utime(service.data_path, ns=(0, 0))
+
+    assert len(service.listar_sensores()) == antes - 1
+
+
+def test_escrita_nao_altera_snapshot_em_uso(novo_servico):
+    service = novo_servico()
+    snapshot = service._snapshot()
+    qtd = len(snapshot.getroot().find("sensores"))
+
+    service.cadastrar_sensor({"id": "s-temp-02", "tipo": "temperatura"})
+
+    assert len(snapshot.getroot().find("sensores")) == qtd
+    assert len(service._snapshot().getroot().find("sensores")) == qtd + 1
+
+
+def test_caminhos_com_mesmo_hash_tem_contadores_proprios(tmp_path):
+    # dois nomes que cairiam no mesmo contador pelo hash
+    def slot(nome):
+        return zlib.crc32(str(tmp_path / nome).encode("utf-8")) % SLOTS_VERSAO
+
+    vistos = {}
+    for i in itertools.count():
+        nome = f"arquivo{i}.xml"
+        if slot(nome) in vistos:
+            a, b = str(tmp_path / vistos[slot(nome)]), str(tmp_path / nome)
+            break
+        vistos[slot(nome)] = nome
+
+    contador = ContadorVersoes(str(tmp_path / "versoes.bin"))
+    outro_processo = ContadorVersoes(str(tmp_path / "versoes.bin"))
+    try:
+        antes = contador.ler(b)
+        contador.incrementar(a, 2)
+        assert contador.ler(b) == antes
+        # o registro é o mesmo para quem abre o arquivo depois
+        assert outro_processo.ler(a) == contador.ler(a) == 2
+        outro_processo.incrementar(b, 2)
+        assert contador.ler(b) == antes + 2
+    finally:
+        contador.fechar()
+        outro_processo.fechar()
+
+
+def test_contadores_esgotados_caem_no_hash(tmp_path):
+    contador = ContadorVersoes(str(tmp_path / "versoes.bin"), slots=2)
+    try:
+        a, b, c = (str(tmp_path / nome) for nome in "abc")
+        contador.incrementar(a, 2)
+        contador.incrementar(b, 2)
+        assert contador.ler(a) == contador.ler(b) == 2
+        # sem contador livre, "c" divide um dos dois
+        assert contador.incrementar(c, 2) == 4
+    finally:
+        contador.fechar()